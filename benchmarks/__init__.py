@@ -0,0 +1 @@
+"""قياسات أداء المنصة ومقارنتها بخطوط الأساس المخزنة"""
@@ -0,0 +1,65 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+# إضافة جذر المشروع إلى sys.path ليعمل الاستيراد من src
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import FIRST_NAMES, LAST_NAMES, SPECIALIZATIONS
+from src.routes.arabic_text import normalize, tokenize, index_text
+
+# كلمات بأشكال متنوعة (همزات، تاء مربوطة، ألف مقصورة، تشكيل وتطويل) لتمثيل نصوص المستخدمين
+VARIANT_WORDS = [
+    'مُسْتَشْفَى', 'إستشارة', 'آلام', 'الأطـــفال', 'عيادة', 'مستشفي', 'أخصائيّة', 'الإسعاف', 'ضغطُ الدم',
+    'السكّري', 'مُتابعة', 'وصفة', 'تحاليل', 'الأشعة', 'ألم في الصدر', 'صداعٌ', 'حُمّى', '١٢٣', 'Clinic'
+]
+
+def synthetic_text(megabytes, seed=5):
+    """نص عشوائي بحجم تقريبي megabytes (UTF-8) من الأسماء والتخصصات والكلمات المتغيرة"""
+    rng = random.Random(seed)
+    vocabulary = FIRST_NAMES + LAST_NAMES + SPECIALIZATIONS + VARIANT_WORDS
+    target = int(megabytes * 1024 * 1024)
+    lines, size = [], 0
+    while size < target:
+        line = ' '.join(rng.choice(vocabulary) for _ in range(12))
+        lines.append(line)
+        size += len(line.encode('utf-8')) + 1
+    return lines, size
+
+def measure(name, function, lines, size):
+    started = time.perf_counter()
+    for line in lines:
+        function(line)
+    elapsed = time.perf_counter() - started
+    return {
+        'operation': name, 'megabytes': round(size / 1024 / 1024, 2),
+        'seconds': round(elapsed, 3), 'mb_per_second': round(size / 1024 / 1024 / elapsed, 2)
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='قياس سرعة توحيد النص العربي وتقطيعه وتجذيعه')
+    parser.add_argument('--megabytes', type=float, default=20)
+    parser.add_argument('--json', dest='json_path', help='حفظ النتائج بصيغة JSON')
+    args = parser.parse_args(argv)
+
+    lines, size = synthetic_text(args.megabytes)
+    results = [
+        measure('normalize', normalize, lines, size),
+        measure('tokenize', tokenize, lines, size),
+        measure('tokenize+stem', lambda line: tokenize(line, stemming=True), lines, size),
+        measure('index_text', index_text, lines, size)
+    ]
+    for item in results:
+        print(f"{item['operation']:<14} {item['megabytes']}MB time={item['seconds']}s "
+              f"rate={item['mb_per_second']}MB/s")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
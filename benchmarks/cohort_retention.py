@@ -0,0 +1,95 @@
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import datetime, timedelta
+
+# إضافة جذر المشروع إلى sys.path ليعمل الاستيراد من src
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from benchmarks.harness import create_app
+from src.models.user import db, User, Consultation
+from src.routes.cohort_engine import cohort_engine, retention_matrix, week_of, FETCH_CHUNK_ROWS
+
+INSERT_BATCH = 50000
+
+def synthetic_arrays(users, events, days=365, seed=11):
+    """مصفوفات تسجيل ونشاط عشوائية (المعرفات مرتبة وأرقام الأيام منذ 1970)"""
+    rng = np.random.default_rng(seed)
+    first_day = 19000
+    user_ids = np.arange(1, users + 1, dtype=np.int64)
+    signup_days = rng.integers(first_day, first_day + days, users)
+    event_users = rng.integers(1, users + 1, events)
+    # النشاط بعد التسجيل بتوزيع أسي (معظم العودة في الأسابيع الأولى)
+    event_days = signup_days[event_users - 1] + rng.exponential(30, events).astype(np.int64)
+    return user_ids, signup_days, event_users, event_days, first_day, first_day + days - 1
+
+def run_arrays(users, events, weeks, chunk_rows=FETCH_CHUNK_ROWS):
+    """زمن حساب المصفوفة فقط على مصفوفات جاهزة مقسمة إلى دفعات بحجم دفعات القراءة"""
+    user_ids, signup_days, event_users, event_days, first_day, last_day = synthetic_arrays(users, events)
+    chunks = ((event_users[i:i + chunk_rows], event_days[i:i + chunk_rows]) for i in range(0, events, chunk_rows))
+    started = time.perf_counter()
+    sizes, matrix = retention_matrix(
+        user_ids, signup_days, chunks, weeks, int(week_of(first_day)), int(week_of(last_day))
+    )
+    elapsed = time.perf_counter() - started
+    return {
+        'mode': 'arrays', 'users': users, 'events': events, 'weeks': weeks, 'cohorts': int((sizes > 0).sum()),
+        'seconds': round(elapsed, 3), 'events_per_second': round(events / elapsed)
+    }
+
+def run_database(users, events, weeks):
+    """الزمن الكامل من قاعدة بيانات SQLite في الذاكرة (القراءة على دفعات ثم الحساب)"""
+    user_ids, signup_days, event_users, event_days, first_day, last_day = synthetic_arrays(users, events)
+    epoch = datetime(1970, 1, 1)
+    app = create_app()
+    with app.app_context():
+        for offset in range(0, users, INSERT_BATCH):
+            db.session.execute(User.__table__.insert(), [
+                {'id': int(user_ids[i]), 'username': f'user_{i}', 'email': f'user_{i}@example.com',
+                 'user_type': 'patient', 'created_at': epoch + timedelta(days=int(signup_days[i]))}
+                for i in range(offset, min(offset + INSERT_BATCH, users))
+            ])
+        for offset in range(0, events, INSERT_BATCH):
+            db.session.execute(Consultation.__table__.insert(), [
+                {'user_id': int(event_users[i]), 'status': 'completed',
+                 'request_date': epoch + timedelta(days=int(event_days[i]), hours=9)}
+                for i in range(offset, min(offset + INSERT_BATCH, events))
+            ])
+        db.session.commit()
+
+        started = time.perf_counter()
+        result = cohort_engine.compute(epoch + timedelta(days=first_day), epoch + timedelta(days=last_day),
+                                       weeks=weeks, use_cache=False)
+        elapsed = time.perf_counter() - started
+    return {
+        'mode': 'database', 'users': users, 'events': events, 'weeks': weeks, 'cohorts': len(result['cohorts']),
+        'seconds': round(elapsed, 3), 'events_per_second': round(events / elapsed)
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='قياس سرعة حساب مصفوفات الاحتفاظ بالدفعات')
+    parser.add_argument('--events', type=int, default=10000000, help='عدد صفوف النشاط للحساب على المصفوفات')
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--weeks', type=int, default=12)
+    parser.add_argument('--db-events', type=int, default=0,
+                        help='عدد صفوف الاستشارات للقياس الكامل من قاعدة البيانات (0 لتخطيه)')
+    parser.add_argument('--json', dest='json_path', help='حفظ النتائج بصيغة JSON')
+    args = parser.parse_args(argv)
+
+    results = [run_arrays(args.users, args.events, args.weeks)]
+    if args.db_events:
+        results.append(run_database(max(args.db_events // 10, 1), args.db_events, args.weeks))
+    for item in results:
+        print(f"{item['mode']:<8} users={item['users']:<8} events={item['events']:<9} cohorts={item['cohorts']} "
+              f"time={item['seconds']}s rate={item['events_per_second']}/s")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+# إضافة جذر المشروع إلى sys.path ليعمل الاستيراد من src
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import create_app, FIRST_NAMES, LAST_NAMES, SPECIALIZATIONS
+from src.models.user import db, DoctorProfile, DoctorReview
+from src.routes.doctor_aggregates import doctor_aggregates
+from src.routes.search_index import search_index
+
+INSERT_BATCH = 20000
+# الحالات المقاسة: (الوصف، معاملات /api/doctors/search)
+CASES = [
+    ('rating desc', {'sort_by': 'rating'}),
+    ('min_rating 4', {'min_rating': 4}),
+    ('min_rating 4 by rating', {'min_rating': 4, 'sort_by': 'rating'}),
+    ('fee asc', {'sort_by': 'fee', 'order': 'asc'}),
+    ('experience desc', {'sort_by': 'experience'}),
+    ('reviews desc', {'sort_by': 'reviews'}),
+]
+
+def seed_doctors(start, count, reviews_per_doctor, rng):
+    """إضافة count طبيباً بمراجعاتهم بالإدخال المجمع بدءاً من المعرف start"""
+    for offset in range(start, start + count, INSERT_BATCH):
+        rows = []
+        for i in range(offset, min(offset + INSERT_BATCH, start + count)):
+            rows.append({
+                'id': i + 1, 'user_id': i + 1,
+                'full_name': f'د. {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                'specialization': rng.choice(SPECIALIZATIONS),
+                'years_of_experience': rng.randint(1, 40),
+                'consultation_fee': float(rng.randrange(50, 500, 10)),
+                'available_for_consultation': rng.random() < 0.8
+            })
+        db.session.execute(DoctorProfile.__table__.insert(), rows)
+        reviews = []
+        for row in rows:
+            reviews.extend(
+                {'doctor_id': row['id'], 'patient_id': 1, 'rating': rng.randint(1, 5),
+                 'is_approved': rng.random() < 0.9}
+                for _ in range(rng.randint(0, reviews_per_doctor * 2))
+            )
+        if reviews:
+            db.session.execute(DoctorReview.__table__.insert(), reviews)
+    db.session.commit()
+    doctor_aggregates.rebuild()
+    search_index.rebuild()
+
+def timed(client, params, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        response = client.get('/api/doctors/search', query_string=params)
+    assert response.status_code == 200, response.get_json()
+    return (time.perf_counter() - started) / repeat
+
+def run(sizes, per_page, pages, repeat, reviews_per_doctor=3, seed=13):
+    """زمن الصفحة لكل حالة عند كل حجم من sizes (الأطباء يضافون تدريجياً لنفس القاعدة)"""
+    app = create_app()
+    client = app.test_client()
+    rng = random.Random(seed)
+    results = []
+    with app.app_context():
+        seeded = 0
+        for size in sorted(sizes):
+            seed_doctors(seeded, size - seeded, reviews_per_doctor, rng)
+            seeded = size
+            for name, params in CASES:
+                for page in pages:
+                    seconds = timed(client, {**params, 'page': page, 'per_page': per_page}, repeat)
+                    results.append({'doctors': size, 'case': name, 'page': page,
+                                    'ms': round(seconds * 1000, 2)})
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='قياس زمن صفحة البحث عن الأطباء مع الفلترة والترتيب في SQL')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 50000, 100000])
+    parser.add_argument('--per-page', type=int, default=20)
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 50])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', dest='json_path', help='حفظ النتائج بصيغة JSON')
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.per_page, args.pages, args.repeat)
+    for item in results:
+        print(f"{item['doctors']:<8} {item['case']:<24} page={item['page']:<4} {item['ms']}ms")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,270 @@
+import os
+import sys
+import json
+import random
+from datetime import datetime, timedelta
+
+# إضافة جذر المشروع إلى sys.path ليعمل الاستيراد من src
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from src.models.user import (
+    db, User, DoctorProfile, DoctorLicense, DoctorReview, Consultation, Appointment, Payment
+)
+
+# أحجام البيانات المعتمدة في القياسات
+DATASET_SIZES = {
+    'quick': {
+        'doctors': 40,
+        'patients': 200,
+        'reviews_per_doctor': 5,
+        'consultations_per_doctor': 10,
+        'appointments_per_doctor': 6
+    },
+    'full': {
+        'doctors': 2000,
+        'patients': 10000,
+        'reviews_per_doctor': 20,
+        'consultations_per_doctor': 25,
+        'appointments_per_doctor': 10
+    }
+}
+
+SPECIALIZATIONS = [
+    'أمراض القلب', 'طب الأطفال', 'الأمراض الجلدية', 'طب العظام', 'الطب النفسي',
+    'طب الأعصاب', 'النساء والولادة', 'طب العيون', 'الأنف والأذن والحنجرة', 'الطب العام'
+]
+FIRST_NAMES = ['أحمد', 'سارة', 'محمد', 'فاطمة', 'علي', 'مريم', 'خالد', 'نورة', 'يوسف', 'ليلى']
+LAST_NAMES = ['العمري', 'الحسني', 'القحطاني', 'الشمري', 'الزهراني', 'الغامدي', 'المطيري', 'الدوسري']
+LANGUAGES = ['العربية', 'الإنجليزية', 'الفرنسية']
+CONSULTATION_STATUSES = ['completed', 'completed', 'pending', 'ongoing', 'cancelled']
+CONSULTATION_TYPES = ['video', 'audio', 'text', None]
+PAYMENT_METHODS = ['credit_card', 'bank_transfer', 'mobile_wallet', None]
+
+def create_app(database_uri='sqlite:///:memory:'):
+    """إنشاء تطبيق بنفس تسجيل المخططات في src/main.py مع قاعدة بيانات قابلة للتحديد"""
+    from src.routes.user_management import user_bp
+    from src.routes.medical_records import medical_records_bp
+    from src.routes.ai_service import ai_bp
+    from src.routes.consultations import consultation_bp
+    from src.routes.field_teams import field_teams_bp
+    from src.routes.pharmacy import pharmacy_bp
+    from src.routes.appointments import appointments_bp
+    from src.routes.payment import payment_bp
+    from src.routes.notifications import notifications_bp
+    from src.routes.doctor_management import doctor_management_bp
+    from src.routes.review_system import review_system_bp
+    from src.routes.push_notifications import push_notifications_bp
+    from src.routes.advanced_appointments import advanced_appointments_bp
+    from src.routes.analytics_reports import analytics_reports_bp
+    from src.routes.advanced_search import advanced_search_bp
+    from src.routes.permissions_system import permissions_system_bp
+    from src.routes.export_import import export_import_bp
+    from src.routes.performance_cache import performance_cache_bp
+
+    app = Flask(__name__)
+    app.config['TESTING'] = True
+    app.config['SECRET_KEY'] = 'benchmark-secret-key'
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    app.register_blueprint(user_bp, url_prefix="/users")
+    app.register_blueprint(medical_records_bp, url_prefix="/medical_records")
+    app.register_blueprint(ai_bp, url_prefix="/ai")
+    app.register_blueprint(consultation_bp, url_prefix="/consultations")
+    app.register_blueprint(field_teams_bp, url_prefix="/field_teams")
+    app.register_blueprint(pharmacy_bp, url_prefix="/pharmacy")
+    app.register_blueprint(appointments_bp, url_prefix="/appointments")
+    app.register_blueprint(payment_bp, url_prefix="/payment")
+    app.register_blueprint(notifications_bp, url_prefix="/notifications")
+    app.register_blueprint(doctor_management_bp, url_prefix="/api/doctors")
+    app.register_blueprint(review_system_bp, url_prefix="/api/reviews")
+    app.register_blueprint(push_notifications_bp, url_prefix="/api/push_notifications")
+    app.register_blueprint(advanced_appointments_bp, url_prefix="/api/advanced_appointments")
+    app.register_blueprint(analytics_reports_bp, url_prefix="/api/analytics")
+    app.register_blueprint(advanced_search_bp, url_prefix="/api/search")
+    app.register_blueprint(permissions_system_bp, url_prefix="/api/permissions")
+    app.register_blueprint(export_import_bp, url_prefix="/api/export-import")
+    app.register_blueprint(performance_cache_bp, url_prefix="/api/cache")
+
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+
+    return app
+
+def seed_platform(doctors=40, patients=200, reviews_per_doctor=5, consultations_per_doctor=10,
+                  appointments_per_doctor=6, seed=42, now=None):
+    """إنشاء بيانات تجريبية حتمية للقياسات والاختبارات (يتطلب سياق التطبيق)"""
+    rng = random.Random(seed)
+    now = now or datetime.now().replace(second=0, microsecond=0)
+    today = now.replace(hour=0, minute=0)
+
+    # المستخدمون: المرضى أولاً ثم الأطباء
+    patient_ids = list(range(1, patients + 1))
+    doctor_user_ids = list(range(patients + 1, patients + doctors + 1))
+
+    users = []
+    for user_id in patient_ids:
+        users.append({
+            'id': user_id,
+            'username': f'patient{user_id}',
+            'email': f'patient{user_id}@example.com',
+            'password_hash': 'benchmark',
+            'user_type': 'patient',
+            'kyc_verified': rng.random() < 0.6,
+            'is_active': rng.random() < 0.9,
+            'created_at': today - timedelta(days=rng.randint(0, 365), minutes=rng.randint(0, 1439))
+        })
+    for user_id in doctor_user_ids:
+        users.append({
+            'id': user_id,
+            'username': f'doctor{user_id}',
+            'email': f'doctor{user_id}@example.com',
+            'password_hash': 'benchmark',
+            'user_type': 'doctor',
+            'kyc_verified': True,
+            'is_active': True,
+            'created_at': today - timedelta(days=rng.randint(30, 730))
+        })
+    db.session.bulk_insert_mappings(User, users)
+
+    # ملفات الأطباء وتراخيصهم
+    profiles = []
+    licenses = []
+    for index, user_id in enumerate(doctor_user_ids, start=1):
+        specialization = SPECIALIZATIONS[index % len(SPECIALIZATIONS)]
+        full_name = f"د. {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+        profiles.append({
+            'id': index,
+            'user_id': user_id,
+            'full_name': full_name,
+            'specialization': specialization,
+            'years_of_experience': rng.randint(1, 35),
+            'bio': f'{full_name} استشاري {specialization} بخبرة في تشخيص وعلاج الحالات المزمنة',
+            'consultation_fee': float(rng.choice([50, 75, 100, 150, 200, 300])),
+            'available_for_consultation': rng.random() < 0.85,
+            'languages': json.dumps(rng.sample(LANGUAGES, rng.randint(1, 2)), ensure_ascii=False),
+            'working_hours': json.dumps({}),
+            'created_at': today - timedelta(days=rng.randint(30, 730)),
+            'updated_at': today
+        })
+        licenses.append({
+            'id': index,
+            'doctor_id': index,
+            'license_type': 'medical_license',
+            'license_number': f'LIC-{index:06d}',
+            'issuing_authority': 'الهيئة الصحية',
+            'issue_date': (today - timedelta(days=1000)).date(),
+            'verification_status': 'verified' if index % 2 else 'pending',
+            'is_active': index % 2 == 1,
+            'created_at': today - timedelta(days=1000)
+        })
+    db.session.bulk_insert_mappings(DoctorProfile, profiles)
+    db.session.bulk_insert_mappings(DoctorLicense, licenses)
+
+    # المراجعات
+    reviews = []
+    for profile in profiles:
+        for _ in range(reviews_per_doctor):
+            reviews.append({
+                'id': len(reviews) + 1,
+                'doctor_id': profile['id'],
+                'patient_id': rng.choice(patient_ids),
+                'rating': rng.randint(1, 5),
+                'review_text': 'تجربة جيدة مع الطبيب',
+                'is_approved': rng.random() < 0.8,
+                'created_at': today - timedelta(days=rng.randint(0, 180)),
+                'updated_at': today
+            })
+    db.session.bulk_insert_mappings(DoctorReview, reviews)
+
+    # الاستشارات والمدفوعات
+    consultations = []
+    payments = []
+    for profile in profiles:
+        for _ in range(consultations_per_doctor):
+            request_date = today - timedelta(days=rng.randint(0, 120), minutes=rng.randint(0, 1439))
+            status = rng.choice(CONSULTATION_STATUSES)
+            completed_at = request_date + timedelta(hours=rng.randint(1, 72)) if status == 'completed' else None
+            consultation_id = len(consultations) + 1
+            consultations.append({
+                'id': consultation_id,
+                'user_id': rng.choice(patient_ids),
+                'doctor_id': profile['user_id'],
+                'status': status,
+                'consultation_type': rng.choice(CONSULTATION_TYPES),
+                'request_date': request_date,
+                'doctor_notes': 'متابعة الأعراض بعد أسبوع',
+                'consultation_fee': profile['consultation_fee'],
+                'completed_at': completed_at
+            })
+            if completed_at:
+                payments.append({
+                    'id': len(payments) + 1,
+                    'payment_id': f'PAY-{consultation_id:08d}',
+                    'user_id': consultations[-1]['user_id'],
+                    'consultation_id': consultation_id,
+                    'amount': profile['consultation_fee'],
+                    'payment_type': 'consultation',
+                    'payment_method': rng.choice(PAYMENT_METHODS),
+                    'status': 'completed',
+                    'created_at': request_date,
+                    'completed_at': completed_at
+                })
+    db.session.bulk_insert_mappings(Consultation, consultations)
+    db.session.bulk_insert_mappings(Payment, payments)
+
+    # المواعيد القادمة (بما فيها مواعيد تحتاج تذكيراً خلال 24 ساعة وخلال ساعة)
+    appointments = []
+    for profile in profiles:
+        for slot in range(appointments_per_doctor):
+            if slot == 0:
+                appointment_date = now + timedelta(hours=24)
+            elif slot == 1:
+                appointment_date = now + timedelta(hours=1)
+            else:
+                day = today + timedelta(days=rng.randint(0, 13))
+                appointment_date = day + timedelta(hours=rng.randint(9, 16), minutes=rng.choice([0, 30]))
+            appointments.append({
+                'id': len(appointments) + 1,
+                'user_id': rng.choice(patient_ids),
+                'doctor_id': profile['user_id'],
+                'appointment_date': appointment_date,
+                'appointment_type': 'video',
+                'status': 'scheduled' if slot < 2 else rng.choice(['scheduled', 'confirmed']),
+                'reminder_sent': False,
+                'created_at': today - timedelta(days=rng.randint(0, 30))
+            })
+    db.session.bulk_insert_mappings(Appointment, appointments)
+
+    db.session.commit()
+
+    # الإدخال المجمع يتجاوز أحداث ORM، لذلك يعاد بناء جداول التجميع اليومية ورسوم النشاط وتجميعات الأطباء
+    # وفهارس البحث (المشغلات فهرستها بالنص الخام دون توحيد)
+    from src.routes.analytics_rollups import rollup_manager
+    from src.routes.activity_sketches import activity_sketches
+    from src.routes.doctor_aggregates import doctor_aggregates
+    from src.routes.search_cache import search_cache
+    from src.routes.search_index import search_index
+    rollup_manager.rebuild()
+    activity_sketches.rebuild()
+    doctor_aggregates.rebuild()
+    search_index.rebuild()
+    search_cache.invalidate()
+
+    return {
+        'now': now,
+        'patient_ids': patient_ids,
+        'doctor_user_ids': doctor_user_ids,
+        'doctor_ids': [profile['id'] for profile in profiles],
+        'specializations': SPECIALIZATIONS,
+        'counts': {
+            'users': len(users),
+            'doctors': len(profiles),
+            'reviews': len(reviews),
+            'consultations': len(consultations),
+            'payments': len(payments),
+            'appointments': len(appointments)
+        }
+    }
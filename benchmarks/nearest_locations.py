@@ -0,0 +1,107 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import numpy as np
+
+# إضافة جذر المشروع إلى sys.path ليعمل الاستيراد من src
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import create_app
+from src.models.user import db, Pharmacy
+from src.routes.geo_index import location_index, EARTH_RADIUS_KM
+
+INSERT_BATCH = 20000
+# حدود اليمن تقريباً، ومراكز مدن تتكثف حولها نصف النقاط (انحراف معياري بالدرجات)
+BOUNDS = ((12.5, 19.0), (42.5, 53.0))
+CITIES = [(15.35, 44.21), (12.79, 45.03), (14.54, 49.12), (13.58, 44.02), (14.80, 42.95)]
+CITY_SPREAD = 0.08
+
+def random_point(rng, clustered):
+    if clustered:
+        latitude, longitude = rng.choice(CITIES)
+        return rng.gauss(latitude, CITY_SPREAD), rng.gauss(longitude, CITY_SPREAD)
+    return rng.uniform(*BOUNDS[0]), rng.uniform(*BOUNDS[1])
+
+def seed_pharmacies(count, rng):
+    """count صيدلية نصفها موزع على البلد ونصفها متكثف في المدن (إدخال مجمع)"""
+    points = []
+    for offset in range(0, count, INSERT_BATCH):
+        rows = []
+        for i in range(offset, min(offset + INSERT_BATCH, count)):
+            latitude, longitude = random_point(rng, i % 2 == 0)
+            points.append((latitude, longitude))
+            rows.append({'id': i + 1, 'name': f'صيدلية {i + 1}', 'latitude': latitude,
+                         'longitude': longitude, 'is_active': True})
+        db.session.execute(Pharmacy.__table__.insert(), rows)
+    db.session.commit()
+    return np.radians(np.array(points))
+
+def brute_force(points, latitude, longitude, k):
+    """أقرب k بالمرور على كل النقاط بـ numpy (للمقارنة والتحقق)"""
+    phi, lam = np.radians(latitude), np.radians(longitude)
+    a = (np.sin((points[:, 0] - phi) / 2) ** 2
+         + np.cos(phi) * np.cos(points[:, 0]) * np.sin((points[:, 1] - lam) / 2) ** 2)
+    nearest = np.argpartition(a, k)[:k]
+    nearest = nearest[np.argsort(a[nearest], kind='stable')]
+    return [int(i) + 1 for i in nearest], 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a[nearest]))
+
+def latencies(function, queries):
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        function(*query)
+        timings.append((time.perf_counter() - started) * 1e6)
+    timings.sort()
+    return {'p50_us': round(timings[len(timings) // 2], 1), 'p95_us': round(timings[int(len(timings) * 0.95)], 1)}
+
+def run(points, queries, k, radius_km, seed=21):
+    """زمن بناء الفهرس من القاعدة وزمن أقرب k والبحث في نصف قطر مقارنة بالمرور على كل النقاط"""
+    app = create_app()
+    rng = random.Random(seed)
+    results = []
+    with app.app_context():
+        coordinates = seed_pharmacies(points, rng)
+        started = time.perf_counter()
+        location_index.warm()
+        build_ms = round((time.perf_counter() - started) * 1000, 1)
+
+        for area in ('uniform', 'city'):
+            sample = [random_point(rng, area == 'city') for _ in range(queries)]
+            mismatches = 0
+            for latitude, longitude in sample[:100]:
+                expected, _ = brute_force(coordinates, latitude, longitude, k)
+                found = [item_id for item_id, _ in location_index.nearest('pharmacies', latitude, longitude, k)]
+                mismatches += found != expected
+            results.append({
+                'points': points, 'area': area, 'build_ms': build_ms, 'mismatches': mismatches,
+                'nearest': latencies(lambda lat, lon: location_index.nearest('pharmacies', lat, lon, k), sample),
+                'within': latencies(lambda lat, lon: location_index.within('pharmacies', lat, lon, radius_km, k),
+                                    sample),
+                'brute_force': latencies(lambda lat, lon: brute_force(coordinates, lat, lon, k), sample[:200])
+            })
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='قياس البحث عن أقرب الصيدليات في الفهرس المكاني')
+    parser.add_argument('--points', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--radius-km', type=float, default=10)
+    parser.add_argument('--json', dest='json_path', help='حفظ النتائج بصيغة JSON')
+    args = parser.parse_args(argv)
+
+    results = run(args.points, args.queries, args.k, args.radius_km)
+    for item in results:
+        print(f"{item['points']:<8} {item['area']:<8} build={item['build_ms']}ms mismatches={item['mismatches']} "
+              f"nearest={item['nearest']} within={item['within']} brute_force={item['brute_force']}")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
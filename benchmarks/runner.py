@@ -0,0 +1,243 @@
+import os
+import sys
+import json
+import time
+import fnmatch
+import argparse
+import platform
+import statistics
+import tracemalloc
+from datetime import datetime
+
+from benchmarks.harness import create_app, seed_platform, DATASET_SIZES
+from benchmarks.scenarios import SCENARIOS
+from src.routes.performance_cache import count_queries
+
+BASELINES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+# حدود المقارنة الافتراضية: التأخير يسمح بنسبة مئوية + هامش ضوضاء مبني على تشتت خط الأساس
+DEFAULT_THRESHOLDS = {
+    'latency_relative': 0.25,   # 25% زيادة مسموحة
+    'latency_absolute_ms': 2.0,  # أقل هامش بالمللي ثانية
+    'noise_factor': 3.0,        # مضاعف الانحراف المطلق الوسيط (MAD) لخط الأساس
+    'memory_relative': 0.20,
+    'memory_absolute_kb': 64.0,
+    'queries_absolute': 0       # عدد الاستعلامات حتمي: أي زيادة تعتبر تراجعاً
+}
+
+LATENCY_METRICS = ('p50', 'p95')
+
+def percentile(values, fraction):
+    """حساب النسبة المئوية بالاستيفاء الخطي"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def _check_response(result, scenario_name):
+    status_code = getattr(result, 'status_code', None)
+    if status_code is not None and status_code >= 400:
+        raise RuntimeError(f'السيناريو {scenario_name} أعاد الحالة {status_code}')
+
+def measure_scenario(name, call, iterations=30, warmup=3):
+    """تنفيذ السيناريو وقياس التأخير وعدد الاستعلامات وذروة الذاكرة"""
+    for _ in range(warmup):
+        _check_response(call(), name)
+
+    timings = []
+    query_counts = []
+    for _ in range(iterations):
+        with count_queries(keep_statements=False) as counter:
+            start = time.perf_counter()
+            result = call()
+            timings.append((time.perf_counter() - start) * 1000)
+        _check_response(result, name)
+        query_counts.append(counter.count)
+
+    # قياس الذاكرة في تشغيل منفصل لأن tracemalloc يبطئ التنفيذ
+    tracemalloc.start()
+    try:
+        call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    median = statistics.median(timings)
+    return {
+        'iterations': iterations,
+        'latency_ms': {
+            'p50': round(percentile(timings, 0.50), 4),
+            'p95': round(percentile(timings, 0.95), 4),
+            'p99': round(percentile(timings, 0.99), 4),
+            'mean': round(statistics.fmean(timings), 4),
+            'mad': round(statistics.median(abs(t - median) for t in timings), 4)
+        },
+        'queries_per_request': max(query_counts),
+        'peak_memory_kb': round(peak / 1024, 2)
+    }
+
+def compare_results(baseline, current, thresholds=None):
+    """مقارنة نتيجة جديدة بخط الأساس وإرجاع قائمة الفحوصات"""
+    limits = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+    checks = []
+
+    base_latency = baseline['latency_ms']
+    noise = limits['noise_factor'] * base_latency.get('mad', 0.0)
+    for metric in LATENCY_METRICS:
+        base_value = base_latency[metric]
+        allowed = base_value * (1 + limits['latency_relative']) + max(limits['latency_absolute_ms'], noise)
+        checks.append({
+            'metric': f'latency_ms.{metric}',
+            'baseline': base_value,
+            'current': current['latency_ms'][metric],
+            'limit': round(allowed, 4),
+            'passed': current['latency_ms'][metric] <= allowed
+        })
+
+    allowed_queries = baseline['queries_per_request'] + limits['queries_absolute']
+    checks.append({
+        'metric': 'queries_per_request',
+        'baseline': baseline['queries_per_request'],
+        'current': current['queries_per_request'],
+        'limit': allowed_queries,
+        'passed': current['queries_per_request'] <= allowed_queries
+    })
+
+    allowed_memory = baseline['peak_memory_kb'] * (1 + limits['memory_relative']) + limits['memory_absolute_kb']
+    checks.append({
+        'metric': 'peak_memory_kb',
+        'baseline': baseline['peak_memory_kb'],
+        'current': current['peak_memory_kb'],
+        'limit': round(allowed_memory, 2),
+        'passed': current['peak_memory_kb'] <= allowed_memory
+    })
+
+    return checks
+
+def baseline_path(profile, scenario_name, baselines_dir=BASELINES_DIR):
+    return os.path.join(baselines_dir, profile, f'{scenario_name}.json')
+
+def load_baseline(profile, scenario_name, baselines_dir=BASELINES_DIR):
+    path = baseline_path(profile, scenario_name, baselines_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def save_baseline(profile, scenario_name, result, database_uri, baselines_dir=BASELINES_DIR):
+    path = baseline_path(profile, scenario_name, baselines_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    payload = {
+        'scenario': scenario_name,
+        'profile': profile,
+        'recorded_at': datetime.now().isoformat(timespec='seconds'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'database': database_uri.split(':', 1)[0]
+        },
+        'dataset': DATASET_SIZES[profile],
+        'metrics': result
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write('\n')
+    return path
+
+def select_scenarios(patterns):
+    """اختيار السيناريوهات المطابقة لأنماط الأسماء (مثل doctors_search.*)"""
+    if not patterns:
+        return list(SCENARIOS.values())
+    return [s for name, s in SCENARIOS.items() if any(fnmatch.fnmatch(name, p) for p in patterns)]
+
+def run(profile='quick', patterns=None, database_uri='sqlite:///:memory:', iterations=30, warmup=3,
+        update_baseline=False, thresholds=None, baselines_dir=BASELINES_DIR):
+    """تشغيل السيناريوهات المختارة ومقارنتها بخطوط الأساس"""
+    scenarios = select_scenarios(patterns)
+    if not scenarios:
+        raise ValueError('لا توجد سيناريوهات مطابقة')
+
+    app = create_app(database_uri)
+    report = {'profile': profile, 'database': database_uri, 'scenarios': [], 'passed': True}
+
+    with app.app_context():
+        fixture = seed_platform(**DATASET_SIZES[profile])
+        client = app.test_client()
+
+        for item in scenarios:
+            call = item.build(client, fixture)
+            result = measure_scenario(item.name, call, iterations=iterations, warmup=warmup)
+            entry = {'scenario': item.name, 'description': item.description, 'result': result}
+
+            baseline = load_baseline(profile, item.name, baselines_dir)
+            if update_baseline:
+                entry['status'] = 'BASELINE_UPDATED'
+                entry['baseline_path'] = save_baseline(profile, item.name, result, database_uri, baselines_dir)
+            elif baseline is None:
+                entry['status'] = 'NEW'
+            else:
+                entry['checks'] = compare_results(baseline['metrics'], result, thresholds)
+                entry['status'] = 'PASS' if all(c['passed'] for c in entry['checks']) else 'FAIL'
+                if entry['status'] == 'FAIL':
+                    report['passed'] = False
+
+            report['scenarios'].append(entry)
+
+    return report
+
+def format_report(report):
+    """تنسيق التقرير كنص مقروء"""
+    lines = [f"Performance report — profile={report['profile']} database={report['database']}"]
+    for entry in report['scenarios']:
+        result = entry['result']
+        lines.append(
+            f"[{entry['status']}] {entry['scenario']}: "
+            f"p50={result['latency_ms']['p50']:.2f}ms p95={result['latency_ms']['p95']:.2f}ms "
+            f"queries={result['queries_per_request']} peak={result['peak_memory_kb']:.1f}KB"
+        )
+        for check in entry.get('checks', []):
+            if not check['passed']:
+                lines.append(
+                    f"    {check['metric']}: {check['current']} > limit {check['limit']} (baseline {check['baseline']})"
+                )
+    lines.append('RESULT: ' + ('PASS' if report['passed'] else 'FAIL'))
+    return '\n'.join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='تشغيل قياسات الأداء ومقارنتها بخطوط الأساس المخزنة')
+    parser.add_argument('--profile', choices=sorted(DATASET_SIZES), default='quick', help='حجم البيانات')
+    parser.add_argument('--scenario', action='append', dest='patterns', help='نمط اسم السيناريو (يمكن تكراره)')
+    parser.add_argument('--database-uri', default='sqlite:///:memory:', help='قاعدة البيانات المستخدمة للقياس')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--update-baseline', action='store_true', help='حفظ النتائج كخط أساس جديد')
+    parser.add_argument('--json', dest='json_path', help='حفظ التقرير الكامل بصيغة JSON')
+    parser.add_argument('--list', action='store_true', help='عرض السيناريوهات المتاحة')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, item in SCENARIOS.items():
+            print(f'{name}: {item.description}')
+        return 0
+
+    report = run(
+        profile=args.profile,
+        patterns=args.patterns,
+        database_uri=args.database_uri,
+        iterations=args.iterations,
+        warmup=args.warmup,
+        update_baseline=args.update_baseline
+    )
+
+    print(format_report(report))
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    return 0 if report['passed'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
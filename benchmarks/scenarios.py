@@ -0,0 +1,78 @@
+from datetime import timedelta
+
+# سجل السيناريوهات المتاحة للقياس
+SCENARIOS = {}
+
+class Scenario:
+    """سيناريو قياس: يبني دالة تنفذ طلباً واحداً على بيانات مجهزة مسبقاً"""
+
+    def __init__(self, name, description, build):
+        self.name = name
+        self.description = description
+        self.build = build
+
+def scenario(name, description):
+    """ديكوريتر لتسجيل سيناريو قياس جديد"""
+    def decorator(build):
+        SCENARIOS[name] = Scenario(name, description, build)
+        return build
+    return decorator
+
+@scenario('doctors_search.first_page', 'الصفحة الأولى من /api/doctors/search بدون فلاتر')
+def doctors_search_first_page(client, fixture):
+    return lambda: client.get('/api/doctors/search?page=1&per_page=20')
+
+@scenario('doctors_search.deep_page', 'صفحة متأخرة من /api/doctors/search')
+def doctors_search_deep_page(client, fixture):
+    last_page = max(1, len(fixture['doctor_ids']) // 20)
+    return lambda: client.get(f'/api/doctors/search?page={last_page}&per_page=20')
+
+@scenario('doctors_search.term', 'البحث النصي في /api/doctors/search')
+def doctors_search_term(client, fixture):
+    term = fixture['specializations'][0]
+    return lambda: client.get('/api/doctors/search', query_string={'search_term': term, 'per_page': 20})
+
+@scenario('doctors_search.filters', 'البحث مع فلاتر التخصص والسعر والتقييم')
+def doctors_search_filters(client, fixture):
+    params = {
+        'specialization': fixture['specializations'][1],
+        'max_fee': 200,
+        'min_rating': 3,
+        'available_only': 'true',
+        'per_page': 20
+    }
+    return lambda: client.get('/api/doctors/search', query_string=params)
+
+@scenario('availability.engine_day', 'حساب الأوقات المتاحة ليوم واحد عبر SmartScheduler مباشرة')
+def availability_engine_day(client, fixture):
+    from src.routes.advanced_appointments import smart_scheduler
+    doctor_id = fixture['doctor_ids'][0]
+    day = (fixture['now'] + timedelta(days=1)).date()
+    return lambda: smart_scheduler.get_doctor_availability(doctor_id, day)
+
+@scenario('availability.week_endpoint', 'الأوقات المتاحة لأسبوع عبر /api/advanced_appointments/availability')
+def availability_week_endpoint(client, fixture):
+    doctor_id = fixture['doctor_ids'][0]
+    return lambda: client.get(f'/api/advanced_appointments/availability/{doctor_id}?days_ahead=7')
+
+@scenario('analytics.consultations_year', 'تحليلات الاستشارات لفترة سنة عبر /api/analytics/consultations')
+def analytics_consultations_year(client, fixture):
+    start_date = (fixture['now'] - timedelta(days=365)).isoformat()
+    return lambda: client.get('/api/analytics/consultations', query_string={'start_date': start_date})
+
+@scenario('analytics.kpi', 'مؤشرات الأداء الرئيسية عبر /api/analytics/kpi')
+def analytics_kpi(client, fixture):
+    return lambda: client.get('/api/analytics/kpi?current_period=30')
+
+@scenario('analytics.doctor_performance', 'تقرير أداء جميع الأطباء عبر /api/analytics/doctors/performance')
+def analytics_doctor_performance(client, fixture):
+    def call():
+        # الاستجابة مبثوثة: قراءة الجسم كاملاً كما يفعل الخادم
+        response = client.get('/api/analytics/doctors/performance?sort_by=revenue')
+        response.get_data()
+        return response
+    return call
+
+@scenario('analytics.financial', 'التحليلات المالية مع أعلى الأطباء إيراداً عبر /api/analytics/financial')
+def analytics_financial(client, fixture):
+    return lambda: client.get('/api/analytics/financial?top_n=10')
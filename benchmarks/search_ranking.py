@@ -0,0 +1,93 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+
+# إضافة جذر المشروع إلى sys.path ليعمل الاستيراد من src
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import create_app, FIRST_NAMES, LAST_NAMES, SPECIALIZATIONS
+from src.models.user import db, DoctorProfile, DoctorReview
+from src.routes.search_index import search_index
+from src.routes.search_ranking import doctor_ranker
+from src.routes.doctor_aggregates import doctor_aggregates
+
+INSERT_BATCH = 20000
+BIO_WORDS = ['تشخيص', 'علاج', 'الحالات', 'المزمنة', 'جراحة', 'المناظير', 'متابعة', 'الأطفال', 'كبار', 'السن']
+QUERIES = ['أحمد', 'القلب', 'استشاري', 'طب الأطفال', 'علاج المزمنة']
+
+def seed_doctors(count, reviews_per_doctor=2, seed=9):
+    """ملفات أطباء عشوائية مع مراجعات بالإدخال المجمع (المشغلات تفهرسها في FTS5، والتجميعات يعاد حسابها)"""
+    rng = random.Random(seed)
+    for offset in range(0, count, INSERT_BATCH):
+        rows = []
+        for i in range(offset, min(offset + INSERT_BATCH, count)):
+            specialization = rng.choice(SPECIALIZATIONS)
+            rows.append({
+                'id': i + 1, 'user_id': i + 1,
+                'full_name': f'د. {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                'specialization': specialization,
+                'bio': f"استشاري {specialization} {' '.join(rng.sample(BIO_WORDS, 5))}",
+                'consultation_fee': 100.0,
+                'available_for_consultation': rng.random() < 0.8
+            })
+        db.session.execute(DoctorProfile.__table__.insert(), rows)
+        db.session.execute(DoctorReview.__table__.insert(), [
+            {'doctor_id': row['id'], 'patient_id': 1, 'rating': rng.randint(1, 5), 'is_approved': True}
+            for row in rows for _ in range(reviews_per_doctor)
+        ])
+    db.session.commit()
+    doctor_aggregates.rebuild()
+    search_index.rebuild()
+
+def timed(function, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - started) / repeat, result
+
+def run(doctors, per_page, repeat):
+    app = create_app()
+    results = []
+    with app.app_context():
+        started = time.perf_counter()
+        seed_doctors(doctors)
+        print(f'seeded {doctors} doctors in {time.perf_counter() - started:.1f}s')
+        for query in QUERIES:
+            # خط الأساس: المطابقات بترتيب المعرف (paginate) دون حساب الصلة
+            baseline, _ = timed(lambda: DoctorProfile.query.filter(search_index.condition('doctors', query))
+                                .order_by(DoctorProfile.id).paginate(page=1, per_page=per_page, error_out=False),
+                                repeat)
+            for page in (1, 10):
+                seconds, ranked = timed(lambda: doctor_ranker.rank(query, page=page, per_page=per_page), repeat)
+                plain, _ = timed(lambda: doctor_ranker.rank(query, page=page, per_page=per_page, boosts=False),
+                                 repeat)
+                results.append({
+                    'query': query, 'page': page, 'matches': ranked.total,
+                    'ranked_ms': round(seconds * 1000, 2), 'bm25_only_ms': round(plain * 1000, 2),
+                    'id_order_ms': round(baseline * 1000, 2)
+                })
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='قياس زمن ترتيب نتائج البحث عن الأطباء (BM25 + كومة أفضل k)')
+    parser.add_argument('--doctors', type=int, default=100000)
+    parser.add_argument('--per-page', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', dest='json_path', help='حفظ النتائج بصيغة JSON')
+    args = parser.parse_args(argv)
+
+    results = run(args.doctors, args.per_page, args.repeat)
+    for item in results:
+        print(f"{item['query']:<14} page={item['page']:<3} matches={item['matches']:<7} "
+              f"ranked={item['ranked_ms']}ms bm25={item['bm25_only_ms']}ms id-order={item['id_order_ms']}ms")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
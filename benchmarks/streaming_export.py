@@ -0,0 +1,107 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+from datetime import datetime, timedelta
+
+# إضافة جذر المشروع إلى sys.path ليعمل الاستيراد من src
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.harness import create_app
+from src.models.user import db, User
+from src.routes.tabular_stream import iter_query_rows, iter_xlsx, iter_csv
+
+# أعمدة التصدير المقاسة (نفس أعمدة تصدير المستخدمين)
+USER_COLUMNS = [
+    ('ID', lambda user: user.id),
+    ('اسم المستخدم', lambda user: user.username),
+    ('البريد الإلكتروني', lambda user: user.email),
+    ('نوع المستخدم', lambda user: user.user_type),
+    ('نشط', lambda user: 'نعم' if user.is_active else 'لا'),
+    ('تاريخ التسجيل', lambda user: user.created_at.strftime('%Y-%m-%d %H:%M:%S'))
+]
+INSERT_BATCH = 20000
+
+def seed_users(total):
+    """إدراج total مستخدم على دفعات عبر insert بالجملة"""
+    start = datetime(2024, 1, 1)
+    user_types = ('patient', 'patient', 'patient', 'doctor')
+    for offset in range(0, total, INSERT_BATCH):
+        db.session.execute(User.__table__.insert(), [
+            {
+                'username': f'user_{i}',
+                'email': f'user_{i}@example.com',
+                'user_type': user_types[i % len(user_types)],
+                'created_at': start + timedelta(minutes=i),
+                'is_active': i % 7 != 0,
+                'kyc_verified': i % 3 == 0
+            }
+            for i in range(offset, min(offset + INSERT_BATCH, total))
+        ])
+    db.session.commit()
+
+def measure_writer(name, make_chunks, rows):
+    """قياس زمن الكتابة وذروة الذاكرة وحجم الملف عند استهلاك الأجزاء دون تجميعها"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    size = 0
+    try:
+        for chunk in make_chunks():
+            size += len(chunk)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    elapsed = time.perf_counter() - started
+    return {
+        'writer': name,
+        'rows': rows,
+        'seconds': round(elapsed, 2),
+        'rows_per_second': round(rows / elapsed) if elapsed else None,
+        'peak_memory_kb': round(peak / 1024, 1),
+        'output_mb': round(size / 1024 / 1024, 2)
+    }
+
+def run(row_counts, writers=('csv', 'xlsx'), batch_size=1000):
+    """تشغيل القياس لكل حجم: الذاكرة يجب أن تبقى ثابتة تقريباً مع زيادة عدد الصفوف"""
+    results = []
+    for rows in row_counts:
+        app = create_app()
+        with app.app_context():
+            seed_users(rows)
+            headers = [title for title, _ in USER_COLUMNS]
+
+            def user_rows():
+                return iter_query_rows(User.query.order_by(User.id), USER_COLUMNS, batch_size)
+
+            makers = {
+                'csv': lambda: iter_csv(headers, user_rows()),
+                'xlsx': lambda: iter_xlsx([('المستخدمين', headers, user_rows())])
+            }
+            for name in writers:
+                results.append(measure_writer(name, makers[name], rows))
+                db.session.expunge_all()
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='قياس ذاكرة وسرعة كتابة Excel/CSV المتدفقة')
+    parser.add_argument('--rows', type=int, action='append', dest='row_counts',
+                        help='عدد الصفوف (يمكن تكراره، الافتراضي 10000 و 100000 و 1000000)')
+    parser.add_argument('--writer', choices=('csv', 'xlsx'), action='append', dest='writers')
+    parser.add_argument('--batch-size', type=int, default=1000, help='حجم دفعة yield_per')
+    parser.add_argument('--json', dest='json_path', help='حفظ النتائج بصيغة JSON')
+    args = parser.parse_args(argv)
+
+    results = run(args.row_counts or [10000, 100000, 1000000], args.writers or ('csv', 'xlsx'), args.batch_size)
+    for item in results:
+        print(f"{item['writer']:<5} rows={item['rows']:<8} time={item['seconds']}s "
+              f"rate={item['rows_per_second']}/s peak={item['peak_memory_kb']}KB size={item['output_mb']}MB")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,6 +6,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from flask import Flask, send_from_directory, jsonify
 from flask_cors import CORS
 from src.models.user import db
+from src.models.schema_upgrade import upgrade_database
 from src.routes.user_management import user_bp
 from src.routes.medical_records import medical_records_bp
 from src.routes.ai_service import ai_bp
@@ -24,6 +25,7 @@ from src.routes.advanced_search import advanced_search_bp
 from src.routes.permissions_system import permissions_system_bp
 from src.routes.export_import import export_import_bp
 from src.routes.performance_cache import performance_cache_bp
+from src.routes.suggestion_index import suggestion_index
 from datetime import datetime
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
@@ -58,6 +60,8 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
 with app.app_context():
     db.create_all()  # Create database tables if they don't exist
+    upgrade_database()  # الأعمدة والفهارس الجديدة في الجداول الموجودة (create_all لا يضيفها)
+    suggestion_index.warm()  # فهرس اقتراحات البحث في ذاكرة العامل
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
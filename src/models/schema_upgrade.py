@@ -0,0 +1,56 @@
+from sqlalchemy import inspect, literal
+from src.models.user import db
+
+def _column_ddl(column, dialect):
+    """تعريف العمود لـ ALTER TABLE ADD COLUMN: NOT NULL يتطلب قيمة افتراضية للصفوف الموجودة"""
+    parts = [dialect.identifier_preparer.quote(column.name), column.type.compile(dialect=dialect)]
+    default = None
+    if column.server_default is not None:
+        default = str(column.server_default.arg.compile(dialect=dialect)) \
+            if hasattr(column.server_default.arg, 'compile') else f"'{column.server_default.arg}'"
+    elif column.default is not None and column.default.is_scalar:
+        default = str(literal(column.default.arg).compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    if default is not None:
+        parts.append(f'DEFAULT {default}')
+        if not column.nullable:
+            parts.append('NOT NULL')
+    return ' '.join(parts)
+
+def upgrade_schema(connection):
+    """إضافة الأعمدة والفهارس الناقصة في الجداول الموجودة (create_all لا يعدل جدولاً موجوداً)
+
+    يعيد {'columns': ['الجدول.العمود'], 'indexes': ['الاسم']} بما أضيف.
+    """
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    added = {'columns': [], 'indexes': []}
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in columns:
+                continue
+            connection.exec_driver_sql(
+                f'ALTER TABLE {connection.dialect.identifier_preparer.quote(table.name)} '
+                f'ADD COLUMN {_column_ddl(column, connection.dialect)}'
+            )
+            added['columns'].append(f'{table.name}.{column.name}')
+
+        indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(connection)
+                added['indexes'].append(index.name)
+    return added
+
+def upgrade_database():
+    """ترقية قاعدة البيانات الحالية ثم إعادة حساب الأعمدة المشتقة المضافة (يتطلب سياق التطبيق)"""
+    with db.engine.begin() as connection:
+        added = upgrade_schema(connection)
+    # أعمدة تقييم الأطباء مشتقة من المراجعات فتعاد تعبئتها بدل القيمة الافتراضية 0
+    if any(name.startswith('doctor_profile.') for name in added['columns']):
+        # استيراد متأخر لتفادي الاستيراد الدائري مع المسارات
+        from src.routes.doctor_aggregates import doctor_aggregates
+        doctor_aggregates.rebuild()
+    return added
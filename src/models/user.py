@@ -43,6 +43,9 @@ class DoctorProfile(db.Model):
     available_for_consultation = db.Column(db.Boolean, default=True)
     languages = db.Column(db.Text)  # JSON array of languages
     working_hours = db.Column(db.Text)  # JSON object with working hours
+    # تجميعات مخزنة للمراجعات (تحدثها doctor_aggregates): متوسط التقييم المعتمد وعدد كل المراجعات
+    average_rating = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+    total_reviews = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -51,10 +54,25 @@ class DoctorProfile(db.Model):
     licenses = db.relationship('DoctorLicense', backref='doctor', lazy='dynamic')
     reviews = db.relationship('DoctorReview', backref='doctor', lazy='dynamic')
     
+    # فهارس الترتيب في البحث: id ضمن الفهرس يجعل ORDER BY ... , id LIMIT مسحاً للفهرس دون فرز
+    __table_args__ = (
+        db.Index('ix_doctor_profile_rating', 'average_rating', 'id'),
+        db.Index('ix_doctor_profile_reviews', 'total_reviews', 'id'),
+        db.Index('ix_doctor_profile_fee', 'consultation_fee', 'id'),
+        db.Index('ix_doctor_profile_experience', 'years_of_experience', 'id'),
+    )
+    
     def __repr__(self):
         return f'<DoctorProfile {self.full_name}>'
     
-    def to_dict(self):
+    def to_dict(self, statistics=None):
+        # يمكن تمرير إحصائيات محسوبة مسبقاً لتجنب ثلاثة استعلامات لكل طبيب
+        if statistics is None:
+            statistics = {
+                'average_rating': self.get_average_rating(),
+                'total_reviews': self.reviews.count(),
+                'license_status': self.get_license_status()
+            }
         return {
             'id': self.id,
             'user_id': self.user_id,
@@ -70,10 +88,60 @@ class DoctorProfile(db.Model):
             'available_for_consultation': self.available_for_consultation,
             'languages': json.loads(self.languages) if self.languages else [],
             'working_hours': json.loads(self.working_hours) if self.working_hours else {},
-            'average_rating': self.get_average_rating(),
-            'total_reviews': self.reviews.count(),
-            'license_status': self.get_license_status()
+            'average_rating': statistics['average_rating'],
+            'total_reviews': statistics['total_reviews'],
+            'license_status': statistics['license_status']
+        }
+    
+    @staticmethod
+    def get_statistics_for(doctor_ids):
+        """حساب التقييم وعدد المراجعات وحالة الترخيص لمجموعة أطباء باستعلامين مجمعين"""
+        doctor_ids = list(doctor_ids)
+        statistics = {
+            doctor_id: {'average_rating': 0.0, 'total_reviews': 0, 'license_status': 'pending'}
+            for doctor_id in doctor_ids
         }
+        if not doctor_ids:
+            return statistics
+        
+        approved = db.case((DoctorReview.is_approved == True, DoctorReview.rating))
+        review_rows = db.session.query(
+            DoctorReview.doctor_id,
+            db.func.count(DoctorReview.id),
+            db.func.avg(approved)
+        ).filter(DoctorReview.doctor_id.in_(doctor_ids)).group_by(DoctorReview.doctor_id).all()
+        
+        for doctor_id, total_reviews, average_rating in review_rows:
+            statistics[doctor_id]['total_reviews'] = total_reviews
+            statistics[doctor_id]['average_rating'] = float(average_rating) if average_rating is not None else 0.0
+        
+        for doctor_id in DoctorProfile.get_verified_ids(doctor_ids):
+            statistics[doctor_id]['license_status'] = 'verified'
+        
+        return statistics
+    
+    @staticmethod
+    def get_stored_statistics_for(doctors):
+        """نفس إحصائيات get_statistics_for من التجميعات المخزنة في ملفات الأطباء (استعلام واحد للتراخيص)"""
+        doctors = list(doctors)
+        verified = DoctorProfile.get_verified_ids(doctor.id for doctor in doctors) if doctors else set()
+        return {
+            doctor.id: {
+                'average_rating': doctor.average_rating or 0.0,
+                'total_reviews': doctor.total_reviews or 0,
+                'license_status': 'verified' if doctor.id in verified else 'pending'
+            }
+            for doctor in doctors
+        }
+    
+    @staticmethod
+    def get_verified_ids(doctor_ids):
+        """معرفات الأطباء الذين لديهم ترخيص فعال"""
+        licensed_rows = db.session.query(DoctorLicense.doctor_id).filter(
+            DoctorLicense.doctor_id.in_(list(doctor_ids)),
+            DoctorLicense.is_active == True
+        ).distinct().all()
+        return {doctor_id for (doctor_id,) in licensed_rows}
     
     def get_average_rating(self):
         """حساب متوسط التقييم"""
@@ -139,6 +207,11 @@ class DoctorReview(db.Model):
     # العلاقات
     patient = db.relationship('User', foreign_keys=[patient_id], backref='reviews_given')
     
+    # فهرس يغطي متوسط تقييم الطبيب (تعزيز الترتيب وفلتر أقل تقييم) دون قراءة صفوف المراجعات
+    __table_args__ = (
+        db.Index('ix_doctor_review_doctor_approved_rating', 'doctor_id', 'is_approved', 'rating'),
+    )
+    
     def __repr__(self):
         return f'<DoctorReview {self.id}>'
     
@@ -292,6 +365,12 @@ class Payment(db.Model):
     processed_at = db.Column(db.DateTime)
     completed_at = db.Column(db.DateTime)
     
+    # فهارس التحليلات المالية: فلترة المدفوعات المكتملة بالفترة وربطها بالاستشارات
+    __table_args__ = (
+        db.Index('ix_payment_status_completed_at', 'status', 'completed_at'),
+        db.Index('ix_payment_consultation_id', 'consultation_id'),
+    )
+    
     def __repr__(self):
         return f"<Payment {self.payment_id}>"
 
@@ -326,3 +405,96 @@ class PharmacyNotification(db.Model):
     def __repr__(self):
         return f"<PharmacyNotification {self.id}>"
 
+class Pharmacy(db.Model):
+    """صيدلية شريكة وموقعها (إشعارات توفر الدواء تذهب إلى الأقرب للمريض)"""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(200), nullable=False)
+    phone = db.Column(db.String(20))
+    address = db.Column(db.Text)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<Pharmacy {self.name}>"
+
+class FieldTeamMember(db.Model):
+    """عضو فريق ميداني: آخر موقع معروف وإتاحته لتعيين الطلبات"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, unique=True)
+    name = db.Column(db.String(100), nullable=False)
+    phone = db.Column(db.String(20))
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    is_available = db.Column(db.Boolean, default=True)
+    current_request_id = db.Column(db.String(100))  # الطلب المعين له حالياً، يحرره إكماله أو إلغاؤه فقط
+    location_updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<FieldTeamMember {self.name}>"
+
+class ConsultationDailyRollup(db.Model):
+    """تجميع يومي للاستشارات على مستوى (اليوم، الطبيب، الحالة، النوع)"""
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    doctor_id = db.Column(db.Integer)  # معرف مستخدم الطبيب كما في Consultation.doctor_id
+    status = db.Column(db.String(50))
+    consultation_type = db.Column(db.String(50))
+    total = db.Column(db.Integer, default=0)
+    revenue = db.Column(db.Float, default=0.0)
+    response_hours = db.Column(db.Float, default=0.0)  # مجموع ساعات الاستجابة
+    responses = db.Column(db.Integer, default=0)  # عدد الاستشارات التي لها وقت استجابة
+
+    def __repr__(self):
+        return f"<ConsultationDailyRollup {self.day} {self.doctor_id}>"
+
+class PaymentDailyRollup(db.Model):
+    """تجميع يومي للمدفوعات المكتملة على مستوى (اليوم، طريقة الدفع، نوع الدفع)"""
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, index=True)  # يوم completed_at
+    payment_method = db.Column(db.String(50))
+    payment_type = db.Column(db.String(50))
+    total = db.Column(db.Integer, default=0)
+    amount = db.Column(db.Float, default=0.0)
+
+    def __repr__(self):
+        return f"<PaymentDailyRollup {self.day} {self.payment_method}>"
+
+class UserDailyRollup(db.Model):
+    """تجميع يومي للتسجيلات على مستوى (اليوم، نوع المستخدم)"""
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    user_type = db.Column(db.String(20))
+    total = db.Column(db.Integer, default=0)
+    active = db.Column(db.Integer, default=0)
+    verified = db.Column(db.Integer, default=0)
+
+    def __repr__(self):
+        return f"<UserDailyRollup {self.day} {self.user_type}>"
+
+class ActivitySketch(db.Model):
+    """رسم HyperLogLog يومي لعدد الكيانات النشطة (مرضى، أطباء، حاجزون) قابل للدمج بين الأيام"""
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    metric = db.Column(db.String(50), nullable=False)
+    precision = db.Column(db.Integer, nullable=False)
+    registers = db.Column(db.LargeBinary, nullable=False)  # السجلات مضغوطة بـ zlib
+    estimate = db.Column(db.Integer, default=0)  # العدد التقريبي لليوم وحده
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('metric', 'day', name='uq_activity_sketch_metric_day'),
+    )
+
+    def __repr__(self):
+        return f"<ActivitySketch {self.metric} {self.day}>"
+
+class RollupWatermark(db.Model):
+    """آخر معرف تمت معالجته لكل مصدر تجميع (للتحديث اللاحق للإدخالات المجمعة)"""
+    source = db.Column(db.String(50), primary_key=True)
+    last_id = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<RollupWatermark {self.source} {self.last_id}>"
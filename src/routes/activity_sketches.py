@@ -0,0 +1,455 @@
+import zlib
+import time
+import threading
+from datetime import datetime, date, timedelta
+import numpy as np
+from sqlalchemy import event, func, and_, or_, case, select, delete, insert, update, inspect
+from sqlalchemy.orm import Session
+from src.models.user import db, Consultation, Appointment, ActivitySketch
+from src.routes.analytics_rollups import day_of, read_watermark, write_watermark, RECOMPUTE_CHUNK_DAYS
+
+# 2^14 سجل: خطأ معياري ~0.8% و 16KB لكل رسم قبل الضغط
+DEFAULT_PRECISION = 14
+
+# نوافذ المؤشرات بالأيام (تنتهي باليوم المطلوب شاملاً)
+WINDOWS = {'dau': 1, 'wau': 7, 'mau': 30}
+
+def _hash64(values):
+    """تجزئة splitmix64 لمصفوفة معرفات صحيحة (توزيع منتظم على 64 بت)"""
+    z = np.asarray(values, dtype=np.int64).astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+def _bit_length(values):
+    """عدد البتات اللازمة لكل قيمة (بدقة كاملة دون تحويل إلى float)"""
+    values = values.copy()
+    lengths = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = values >= (np.uint64(1) << np.uint64(shift))
+        lengths[big] += shift
+        values[big] >>= np.uint64(shift)
+    return lengths + (values > 0)
+
+class HyperLogLog:
+    """عداد تقريبي للقيم المميزة: سجلات uint8 تدمج بأخذ الحد الأقصى"""
+
+    def __init__(self, precision=DEFAULT_PRECISION, registers=None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = registers if registers is not None else np.zeros(self.size, dtype=np.uint8)
+
+    @staticmethod
+    def positions(values, precision):
+        """(رقم السجل، الرتبة) لكل قيمة"""
+        hashed = _hash64(values)
+        width = 64 - precision
+        index = (hashed >> np.uint64(width)).astype(np.int64)
+        rest = hashed & np.uint64((1 << width) - 1)
+        rank = (width - _bit_length(rest) + 1).astype(np.uint8)
+        return index, rank
+
+    def add_many(self, values):
+        if len(values):
+            index, rank = self.positions(values, self.precision)
+            np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError('لا يمكن دمج رسوم بدقة مختلفة')
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        return estimate_cardinality(self.registers)
+
+    def to_bytes(self):
+        return zlib.compress(self.registers.tobytes())
+
+    @classmethod
+    def from_bytes(cls, data, precision):
+        registers = np.frombuffer(zlib.decompress(data), dtype=np.uint8).copy()
+        return cls(precision, registers)
+
+def estimate_cardinality(registers):
+    """تقدير HyperLogLog مع العد الخطي للأعداد الصغيرة (تجزئة 64 بت لا تحتاج تصحيح المدى الكبير)"""
+    size = registers.shape[-1]
+    alpha = 0.7213 / (1 + 1.079 / size)
+    estimate = alpha * size * size / np.sum(np.ldexp(1.0, -registers.astype(np.int64)), axis=-1)
+    zeros = np.count_nonzero(registers == 0, axis=-1)
+    small = (estimate <= 2.5 * size) & (zeros > 0)
+    linear = size * np.log(size / np.maximum(zeros, 1))
+    return np.rint(np.where(small, linear, estimate)).astype(np.int64)
+
+class ActivityMetric:
+    """كيانات مميزة نشطة يومياً: entity_column في صفوف model حسب يوم date_column"""
+
+    def __init__(self, name, model, date_column, entity_column, filters=None):
+        self.name = name
+        self.model = model
+        self.date_column = date_column
+        self.entity_column = entity_column
+        self.filters = filters or (lambda: [])
+        self.tracked = [date_column.key, entity_column.key]
+
+    def raw_conditions(self):
+        return [self.date_column.isnot(None), self.entity_column.isnot(None)] + self.filters()
+
+    @property
+    def watermark_name(self):
+        return f'sketch:{self.name}'
+
+def _as_date(value):
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value.date() if isinstance(value, datetime) else value
+
+def _day_range(first, last):
+    return (datetime.combine(first, datetime.min.time()),
+            datetime.combine(last + timedelta(days=1), datetime.min.time()))
+
+class ActivitySketchManager:
+    """رسوم HyperLogLog يومية مخزنة للمستخدمين النشطين وقراءة DAU/WAU/MAU منها
+
+    كل يوم يخزن رسماً واحداً لكل مقياس؛ عدد المميزين في أي نطاق أيام هو تقدير اتحاد رسومها (أقصى السجلات)
+    دون المرور على الجدول الخام. الصيانة مثل جداول التجميع اليومية: عند flush تدمج كيانات الصفوف الجديدة
+    في رسم يومها ويعاد بناء الأيام المتأثرة بالحذف والتعديل، و catch_up بآخر معرف معالج للإدخالات المجمعة،
+    و rebuild كامل. exact=True يعدّ من الجدول الخام للتدقيق.
+    """
+
+    def __init__(self, precision=DEFAULT_PRECISION, catch_up_interval=60):
+        self.precision = precision
+        self.catch_up_interval = catch_up_interval
+        self.metrics = {}
+        self._checked = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def metrics_for(self, model):
+        return [metric for metric in self.metrics.values() if metric.model is model]
+
+    # ---------- البناء والتحديث ----------
+
+    def build(self, metric, pairs_days, pairs_entities):
+        """رسوم الأيام من أزواج (اليوم، الكيان) دفعة واحدة: {اليوم: HyperLogLog}"""
+        if not len(pairs_days):
+            return {}
+        days, day_index = np.unique(np.asarray(pairs_days, dtype='datetime64[D]'), return_inverse=True)
+        registers = np.zeros((len(days), 1 << self.precision), dtype=np.uint8)
+        index, rank = HyperLogLog.positions(np.asarray(pairs_entities), self.precision)
+        np.maximum.at(registers, (day_index, index), rank)
+        return {
+            day.astype(date): HyperLogLog(self.precision, registers[i])
+            for i, day in enumerate(days)
+        }
+
+    def recompute_days(self, metric, days, connection=None):
+        """إعادة بناء رسوم أيام محددة من الجدول الخام"""
+        connection = connection if connection is not None else db.session
+        dialect = connection.get_bind().dialect.name if connection is db.session else connection.dialect.name
+        days = sorted(set(days))
+        day = day_of(metric.date_column, dialect)
+        for i in range(0, len(days), RECOMPUTE_CHUNK_DAYS):
+            chunk = days[i:i + RECOMPUTE_CHUNK_DAYS]
+            ranges = or_(*[
+                and_(metric.date_column >= low, metric.date_column < high)
+                for low, high in (_day_range(d, d) for d in chunk)
+            ])
+            rows = connection.execute(
+                select(day, metric.entity_column).where(*metric.raw_conditions(), ranges).distinct()
+            ).all()
+            sketches = self.build(metric, [_as_date(row[0]) for row in rows], [row[1] for row in rows])
+            connection.execute(delete(ActivitySketch).where(
+                ActivitySketch.metric == metric.name, ActivitySketch.day.in_(chunk)
+            ))
+            self._insert(connection, metric, sketches)
+
+    def _insert(self, connection, metric, sketches):
+        if not sketches:
+            return
+        counts = estimate_cardinality(np.stack([sketch.registers for sketch in sketches.values()]))
+        now = datetime.utcnow()
+        connection.execute(insert(ActivitySketch), [
+            {
+                'day': day, 'metric': metric.name, 'precision': self.precision,
+                'registers': sketch.to_bytes(), 'estimate': int(count), 'updated_at': now
+            }
+            for (day, sketch), count in zip(sketches.items(), counts)
+        ])
+
+    def add_entities(self, metric, added, connection):
+        """دمج كيانات صفوف جديدة في رسوم أيامها المخزنة {اليوم: [المعرفات]} دون قراءة الجدول الخام
+
+        الدمج في HyperLogLog أخذ الحد الأقصى للسجلات، فنتيجة الإضافة تطابق إعادة البناء الكاملة لليوم.
+        اليوم بلا رسم يدرج، والرسم الذي لم تتغير سجلاته لا يعاد كتابته.
+        """
+        days = sorted(added)
+        stored = {
+            _as_date(row.day): row for row in connection.execute(
+                select(ActivitySketch.id, ActivitySketch.day, ActivitySketch.precision, ActivitySketch.registers)
+                .where(ActivitySketch.metric == metric.name, ActivitySketch.day.in_(days))
+                .with_for_update()
+            )
+        }
+        new_sketches, rebuild_days, now = {}, [], datetime.utcnow()
+        for day in days:
+            row = stored.get(day)
+            if row is None:
+                new_sketches[day] = HyperLogLog(self.precision).add_many(added[day])
+                continue
+            if row.precision != self.precision:
+                rebuild_days.append(day)
+                continue
+            sketch = HyperLogLog.from_bytes(row.registers, row.precision)
+            before = sketch.registers.copy()
+            if np.array_equal(sketch.add_many(added[day]).registers, before):
+                continue
+            connection.execute(update(ActivitySketch).where(ActivitySketch.id == row.id).values(
+                registers=sketch.to_bytes(), estimate=int(sketch.count()), updated_at=now
+            ))
+        self._insert(connection, metric, new_sketches)
+        if rebuild_days:
+            self.recompute_days(metric, rebuild_days, connection)
+
+    def changes(self, session):
+        """التغييرات المعلقة في الجلسة لكل مقياس: (كيانات مضافة {اليوم: [المعرفات]}، أيام يعاد بناؤها)
+
+        الصفوف الجديدة تضاف إلى رسم يومها تراكمياً؛ الحذف وتغيير اليوم أو الكيان لا يمكن طرحه من رسم
+        HyperLogLog فيعاد بناء الأيام المتأثرة من الجدول الخام.
+        """
+        added, recompute = {}, {}
+        for obj in session.new:
+            for metric in self.metrics_for(type(obj)):
+                value = getattr(obj, metric.date_column.key)
+                entity = getattr(obj, metric.entity_column.key)
+                if value is None or entity is None:
+                    continue
+                if metric.filters():
+                    # الشروط الإضافية تعبيرات SQL لا تقيم على الكائن
+                    recompute.setdefault(metric.name, set()).add(_as_date(value))
+                else:
+                    added.setdefault(metric.name, {}).setdefault(_as_date(value), []).append(entity)
+
+        for obj in session.deleted:
+            for metric in self.metrics_for(type(obj)):
+                value = getattr(obj, metric.date_column.key)
+                if value is not None:
+                    recompute.setdefault(metric.name, set()).add(_as_date(value))
+
+        for obj in session.dirty:
+            for metric in self.metrics_for(type(obj)):
+                state = inspect(obj)
+                if not any(state.attrs[name].history.has_changes() for name in metric.tracked):
+                    continue
+                days = recompute.setdefault(metric.name, set())
+                value = getattr(obj, metric.date_column.key)
+                if value is not None:
+                    days.add(_as_date(value))
+                for old_value in state.attrs[metric.date_column.key].history.deleted:
+                    if old_value is not None:
+                        days.add(_as_date(old_value))
+        return added, recompute
+
+    def catch_up(self):
+        """إعادة بناء رسوم الأيام التي أضيفت لها صفوف بعد آخر معرف معالج (في معاملة مستقلة عن جلسة الطلب)"""
+        processed = {}
+        with db.engine.begin() as connection:
+            dialect = connection.dialect.name
+            for metric in self.metrics.values():
+                last_id = read_watermark(connection, metric.watermark_name)
+                max_id = connection.execute(select(func.max(metric.model.id))).scalar() or 0
+                if max_id <= (last_id or 0):
+                    processed[metric.name] = 0
+                    continue
+
+                days = [
+                    _as_date(value) for (value,) in connection.execute(
+                        select(day_of(metric.date_column, dialect)).where(
+                            metric.model.id > (last_id or 0), *metric.raw_conditions()
+                        ).distinct()
+                    )
+                ]
+                self.recompute_days(metric, days, connection)
+                write_watermark(connection, metric.watermark_name, max_id, exists=last_id is not None)
+                processed[metric.name] = len(days)
+
+        self._mark_checked()
+        return processed
+
+    def rebuild(self):
+        """إعادة بناء كل الرسوم من الجداول الخام (استعلام واحد لكل مقياس)"""
+        rows_written = {}
+        with db.engine.begin() as connection:
+            dialect = connection.dialect.name
+            for metric in self.metrics.values():
+                connection.execute(delete(ActivitySketch).where(ActivitySketch.metric == metric.name))
+                rows = connection.execute(
+                    select(day_of(metric.date_column, dialect), metric.entity_column)
+                    .where(*metric.raw_conditions()).distinct()
+                ).all()
+                sketches = self.build(metric, [_as_date(row[0]) for row in rows], [row[1] for row in rows])
+                self._insert(connection, metric, sketches)
+
+                exists = read_watermark(connection, metric.watermark_name) is not None
+                max_id = connection.execute(select(func.max(metric.model.id))).scalar() or 0
+                write_watermark(connection, metric.watermark_name, max_id, exists)
+                rows_written[metric.name] = len(sketches)
+
+        self._mark_checked()
+        return rows_written
+
+    def _mark_checked(self):
+        with self._lock:
+            self._checked[id(db.engine)] = time.monotonic()
+
+    def ensure_fresh(self):
+        """تشغيل catch_up عند القراءة إذا مضى أكثر من catch_up_interval ثانية على آخر تحقق (فشله لا يفشل القراءة)"""
+        now = time.monotonic()
+        with self._lock:
+            last = self._checked.get(id(db.engine))
+            if last is not None and now - last < self.catch_up_interval:
+                return
+            self._checked[id(db.engine)] = now
+        try:
+            self.catch_up()
+        except Exception:
+            with self._lock:
+                self._checked.pop(id(db.engine), None)
+
+    # ---------- القراءة ----------
+
+    def _validate(self, names):
+        for name in names:
+            if name not in self.metrics:
+                raise ValueError(f'مقياس نشاط غير مسجل: {name}')
+
+    def load(self, names, first_day, last_day):
+        """سجلات الأيام [first_day, last_day] لكل مقياس كمصفوفة (أيام × سجلات)، الأيام بلا نشاط أصفار"""
+        self._validate(names)
+        self.ensure_fresh()
+        span = (last_day - first_day).days + 1
+        matrices = {name: np.zeros((span, 1 << self.precision), dtype=np.uint8) for name in names}
+        rows = db.session.query(
+            ActivitySketch.metric, ActivitySketch.day, ActivitySketch.precision, ActivitySketch.registers
+        ).filter(
+            ActivitySketch.metric.in_(names), ActivitySketch.day >= first_day, ActivitySketch.day <= last_day
+        )
+        for name, day, precision, registers in rows:
+            if precision != self.precision:
+                raise ValueError(f'دقة الرسم المخزن ({precision}) تختلف عن الحالية؛ أعد البناء')
+            matrices[name][(day - first_day).days] = HyperLogLog.from_bytes(registers, precision).registers
+        return matrices
+
+    def unique(self, name, first_day, last_day, exact=False):
+        """عدد الكيانات المميزة في الأيام [first_day, last_day]"""
+        if exact:
+            return self.exact_unique(name, first_day, last_day)
+        matrix = self.load([name], first_day, last_day)[name]
+        return int(estimate_cardinality(matrix.max(axis=0)))
+
+    def exact_unique(self, name, first_day, last_day):
+        self._validate([name])
+        metric = self.metrics[name]
+        low, high = _day_range(first_day, last_day)
+        return db.session.query(func.count(func.distinct(metric.entity_column))).filter(
+            *metric.raw_conditions(), metric.date_column >= low, metric.date_column < high
+        ).scalar() or 0
+
+    def summary(self, names=None, day=None, exact=False):
+        """DAU/WAU/MAU لكل مقياس حتى اليوم day (شاملاً) في استعلام واحد"""
+        names = list(names or self.metrics)
+        self._validate(names)
+        day = day or date.today()
+        longest = max(WINDOWS.values())
+
+        if exact:
+            counts = self._exact_windows(names, day)
+        else:
+            matrices = self.load(names, day - timedelta(days=longest - 1), day)
+            counts = {
+                name: {
+                    window: int(estimate_cardinality(matrix[longest - days:].max(axis=0)))
+                    for window, days in WINDOWS.items()
+                }
+                for name, matrix in matrices.items()
+            }
+        for values in counts.values():
+            values['stickiness'] = round(values['dau'] / values['mau'] * 100, 2) if values['mau'] else 0
+        return counts
+
+    def _exact_windows(self, names, day):
+        """العد الدقيق لكل النوافذ بـ COUNT(DISTINCT CASE ...) لكل مقياس"""
+        counts = {}
+        for name in names:
+            metric = self.metrics[name]
+            end = _day_range(day, day)[1]
+            columns = [
+                func.count(func.distinct(case(
+                    (metric.date_column >= end - timedelta(days=days), metric.entity_column)
+                ))).label(window)
+                for window, days in WINDOWS.items()
+            ]
+            row = db.session.query(*columns).filter(
+                *metric.raw_conditions(),
+                metric.date_column >= end - timedelta(days=max(WINDOWS.values())),
+                metric.date_column < end
+            ).one()
+            counts[name] = dict(row._mapping)
+        return counts
+
+    def rolling(self, name, window, first_day, last_day, exact=False):
+        """عدد المميزين في نافذة متحركة بطول window يوماً تنتهي بكل يوم من [first_day, last_day]"""
+        if window <= 0:
+            raise ValueError('طول النافذة يجب أن يكون موجباً')
+        days = (last_day - first_day).days + 1
+        if exact:
+            return {
+                (first_day + timedelta(days=i)).isoformat(): self.exact_unique(
+                    name, first_day + timedelta(days=i - window + 1), first_day + timedelta(days=i)
+                )
+                for i in range(days)
+            }
+        matrix = self.load([name], first_day - timedelta(days=window - 1), last_day)[name]
+        # اتحاد كل نافذة = أقصى سجلاتها؛ المصفوفة بالترتيب الزمني فالنافذة i هي الصفوف [i, i + window)
+        unions = np.stack([matrix[i:i + window].max(axis=0) for i in range(days)])
+        counts = estimate_cardinality(unions)
+        return {(first_day + timedelta(days=i)).isoformat(): int(counts[i]) for i in range(days)}
+
+# إنشاء مثيل من مدير رسوم النشاط مع المقاييس الافتراضية
+activity_sketches = ActivitySketchManager()
+
+activity_sketches.register(ActivityMetric(
+    'active_patients', Consultation, Consultation.request_date, Consultation.user_id
+))
+activity_sketches.register(ActivityMetric(
+    'active_doctors', Consultation, Consultation.request_date, Consultation.doctor_id
+))
+activity_sketches.register(ActivityMetric(
+    'bookers', Appointment, Appointment.created_at, Appointment.user_id
+))
+
+def _keep_previous_date(target, value, oldvalue, initiator):
+    """لا يغير القيمة؛ يكفي تسجيله مع active_history لتحميل القيمة السابقة"""
+
+for _column in {metric.date_column for metric in activity_sketches.metrics.values()}:
+    event.listen(_column, 'set', _keep_previous_date, active_history=True)
+
+@event.listens_for(Session, 'after_flush')
+def _update_sketches(session, flush_context):
+    """تحديث رسوم الأيام المتأثرة ضمن نفس المعاملة: دمج الإضافات وإعادة بناء أيام الحذف والتعديل"""
+    added, recompute = activity_sketches.changes(session)
+    if not added and not recompute:
+        return
+    connection = session.connection()
+    for name, days in recompute.items():
+        if days:
+            activity_sketches.recompute_days(activity_sketches.metrics[name], days, connection)
+    for name, entities in added.items():
+        # الأيام المعاد بناؤها تشمل صفوفها الجديدة (بعد flush) فلا تدمج مرة أخرى
+        entities = {day: ids for day, ids in entities.items() if day not in recompute.get(name, ())}
+        if entities:
+            activity_sketches.add_entities(activity_sketches.metrics[name], entities, connection)
@@ -4,6 +4,7 @@ from datetime import datetime, timedelta, time
 import json
 from sqlalchemy import and_, or_
 import calendar
+from src.routes.search_index import search_index
 
 advanced_appointments_bp = Blueprint("advanced_appointments", __name__)
 
@@ -291,7 +292,7 @@ def search_appointments():
         query = DoctorProfile.query.filter_by(available_for_consultation=True)
         
         if specialization:
-            query = query.filter(DoctorProfile.specialization.ilike(f'%{specialization}%'))
+            query = query.filter(search_index.condition('doctors', specialization, ['specialization']))
         
         if max_fee:
             query = query.filter(DoctorProfile.consultation_fee <= max_fee)
@@ -463,46 +464,58 @@ def send_appointment_reminders():
         
         reminders_sent = 0
         
+        # جلب ملفات الأطباء المعنيين باستعلام واحد بدلاً من استعلام لكل موعد
+        doctor_user_ids = {a.doctor_id for a in appointments_24h + appointments_1h if a.doctor_id}
+        doctors_by_user = {
+            doctor.user_id: doctor
+            for doctor in DoctorProfile.query.filter(DoctorProfile.user_id.in_(doctor_user_ids)).all()
+        } if doctor_user_ids else {}
+        
+        # تجميع الإشعارات وإدراجها دفعة واحدة بدلاً من إدراج كل إشعار على حدة
+        notifications = []
+        now_utc = datetime.utcnow()
+        
         # إرسال تذكيرات 24 ساعة
         for appointment in appointments_24h:
-            doctor = DoctorProfile.query.filter_by(user_id=appointment.doctor_id).first()
+            doctor = doctors_by_user.get(appointment.doctor_id)
             
             # تذكير للمريض
-            patient_notification = Notification(
-                user_id=appointment.user_id,
-                message=f"تذكير: لديك موعد غداً مع د. {doctor.full_name if doctor else 'الطبيب'} في {appointment.appointment_date.strftime('%H:%M')}",
-                notification_type='appointment_reminder',
-                priority='high'
-            )
+            notifications.append({
+                'user_id': appointment.user_id,
+                'message': f"تذكير: لديك موعد غداً مع د. {doctor.full_name if doctor else 'الطبيب'} في {appointment.appointment_date.strftime('%H:%M')}",
+                'notification_type': 'appointment_reminder',
+                'priority': 'high',
+                'timestamp': now_utc
+            })
             
             # تذكير للطبيب
-            doctor_notification = Notification(
-                user_id=appointment.doctor_id,
-                message=f"تذكير: لديك موعد غداً في {appointment.appointment_date.strftime('%H:%M')}",
-                notification_type='appointment_reminder',
-                priority='normal'
-            )
-            
-            db.session.add(patient_notification)
-            db.session.add(doctor_notification)
+            notifications.append({
+                'user_id': appointment.doctor_id,
+                'message': f"تذكير: لديك موعد غداً في {appointment.appointment_date.strftime('%H:%M')}",
+                'notification_type': 'appointment_reminder',
+                'priority': 'normal',
+                'timestamp': now_utc
+            })
             
             appointment.reminder_sent = True
             reminders_sent += 2
         
         # إرسال تذكيرات ساعة واحدة
         for appointment in appointments_1h:
-            doctor = DoctorProfile.query.filter_by(user_id=appointment.doctor_id).first()
-            
-            urgent_notification = Notification(
-                user_id=appointment.user_id,
-                message=f"تذكير عاجل: موعدك مع د. {doctor.full_name if doctor else 'الطبيب'} خلال ساعة في {appointment.appointment_date.strftime('%H:%M')}",
-                notification_type='appointment_reminder',
-                priority='urgent'
-            )
+            doctor = doctors_by_user.get(appointment.doctor_id)
             
-            db.session.add(urgent_notification)
+            notifications.append({
+                'user_id': appointment.user_id,
+                'message': f"تذكير عاجل: موعدك مع د. {doctor.full_name if doctor else 'الطبيب'} خلال ساعة في {appointment.appointment_date.strftime('%H:%M')}",
+                'notification_type': 'appointment_reminder',
+                'priority': 'urgent',
+                'timestamp': now_utc
+            })
             reminders_sent += 1
         
+        if notifications:
+            db.session.bulk_insert_mappings(Notification, notifications)
+        
         db.session.commit()
         
         return jsonify({
@@ -1,216 +1,443 @@
-from flask import Blueprint, request, jsonify
-from src.models.user import db, User, DoctorProfile, Consultation, DoctorReview
+from flask import Blueprint, request, jsonify, session
+from src.models.user import db, User, DoctorProfile, DoctorLicense, Consultation, DoctorReview
 from sqlalchemy import or_, and_, func
+from sqlalchemy.orm import joinedload
 from datetime import datetime, timedelta
+import json
 import re
+import click
+from functools import partial
+from src.routes.search_index import search_index
+from src.routes.suggestion_index import suggestion_index
+from src.routes.search_ranking import doctor_ranker, normalize_boosts
+from src.routes.search_facets import doctor_facets, parse_facets
+from src.routes.search_fanout import search_fanout, section_timeouts
+from src.routes.search_telemetry import search_telemetry, WINDOWS
+from src.routes.search_cache import search_cache, canonical_query
 
 advanced_search_bp = Blueprint('advanced_search', __name__)
 
+def get_doctor_names(doctor_user_ids):
+    """جلب أسماء الأطباء لمجموعة معرفات مستخدمين باستعلام واحد"""
+    doctor_user_ids = {doctor_id for doctor_id in doctor_user_ids if doctor_id}
+    if not doctor_user_ids:
+        return {}
+    
+    rows = db.session.query(DoctorProfile.user_id, DoctorProfile.full_name).filter(
+        DoctorProfile.user_id.in_(doctor_user_ids)
+    ).all()
+    return dict(rows)
+
+class SearchParams:
+    """معاملات طلب البحث المتقدم المشتركة بين الأقسام (تقرأ مرة قبل توزيع الأقسام على الخيوط)"""
+
+    def __init__(self, data):
+        self.query = data.get('query', '').strip()
+        self.search_type = data.get('type', 'all')  # all, doctors, patients, consultations, reviews
+        self.filters = data.get('filters', {})
+        self.page = max(int(data.get('page', 1)), 1)
+        self.per_page = max(int(data.get('per_page', 20)), 1)
+        self.stemming = bool(data.get('stemming', True))  # التجذيع الخفيف: "القلب" تطابق "قلب" و"قلبي"
+        self.sort = data.get('sort', 'relevance')  # relevance, id
+        self.facets = parse_facets(data.get('facets'))  # true أو قائمة: specialization, fee, rating, language, availability
+        self.boosts = data.get('boosts')
+        self.lazy_totals = data.get('totals') == 'lazy'  # lazy: دون استعلامات COUNT (الأعداد من /search/totals)
+
+    def sections(self):
+        if self.search_type == 'all':
+            return list(SEARCH_SECTIONS)
+        return [self.search_type] if self.search_type in SEARCH_SECTIONS else []
+
+# فلاتر كل قسم في مفتاح ذاكرة النتائج بعد توحيد قيمها (الفلاتر الفارغة وغير المستخدمة لا تدخل فيه)
+SECTION_FILTERS = {
+    'doctors': {'specialization': str, 'min_rating': float, 'min_experience': int, 'verified_only': bool},
+    'patients': {'verified_only': bool},
+    'consultations': {'status': str, 'consultation_type': str,
+                      'date_range': lambda value: [value['start'], value['end']]},
+    'reviews': {'min_rating': int, 'verified_only': bool}
+}
+
+# فهارس النص الكامل التي تمر بها كل مطابقة القسم (المرضى والمراجعات تطابق أسماء المستخدمين بـ LIKE)
+SECTION_FTS = {'doctors': ('doctors',), 'consultations': ('consultations',)}
+
+# الكيانات التي تحدد نتائج كل قسم وترتيبها (تغييرها يبطل نتائجه المخزنة)
+SECTION_ENTITIES = {
+    'doctors': ('doctors', 'licenses', 'reviews'),
+    'patients': ('users',),
+    'consultations': ('consultations',),
+    'reviews': ('reviews', 'doctors', 'users')
+}
+
+def section_cache_key(name, params):
+    """الصيغة الموحدة لبحث القسم: النص الموحد وفلاتر القسم مرتبة والترتيب (دون الصفحة وحجمها)"""
+    filters = {
+        key: convert(params.filters[key])
+        for key, convert in SECTION_FILTERS[name].items() if params.filters.get(key)
+    }
+    fts = SECTION_FTS.get(name)
+    if fts and all(search_index.available(index) for index in fts):
+        text = canonical_query(params.query, params.stemming)
+    else:
+        text = params.query
+    key = {'query': text, 'stemming': params.stemming, 'filters': filters}
+    if name == 'doctors' and params.sort == 'relevance' and doctor_ranker.available():
+        key['boosts'] = normalize_boosts(params.boosts)
+    return key
+
+def cached_page(name, params, fetch_ids, count):
+    """معرفات الصفحة وبيانات التصفح من الترتيب المخزن؛ مع totals=lazy لا يحسب العدد"""
+    return search_cache.page(
+        name, section_cache_key(name, params), SECTION_ENTITIES[name], params.page, params.per_page,
+        fetch_ids, None if params.lazy_totals else count
+    )
+
+def load_in_order(model, ids, *options):
+    """صفوف المعرفات بترتيبها باستعلام واحد"""
+    if not ids:
+        return []
+    rows = {row.id: row for row in model.query.options(*options).filter(model.id.in_(ids))}
+    return [rows[row_id] for row_id in ids if row_id in rows]
+
+def paginate_section(name, query, params, *options):
+    """عناصر صفحة القسم: معرفات query المرتب من ذاكرة النتائج ثم صفوفها بخيارات التحميل options"""
+    model = query.column_descriptions[0]['entity']
+
+    def fetch_ids(offset, limit, with_total):
+        # العدد الكلي كدالة نافذة في استعلام المعرفات نفسه بدل استعلام COUNT منفصل
+        columns = [model.id, func.count().over()] if with_total else [model.id]
+        rows = query.with_entities(*columns).offset(offset).limit(limit).all()
+        return [row[0] for row in rows], (rows[0][1] if with_total and rows else None)
+
+    ids, pagination = cached_page(name, params, fetch_ids, partial(count_section, name, params))
+    return load_in_order(model, ids, *options), pagination
+
+def doctor_criteria(params):
+    """شروط فلاتر الأطباء (تطبق مع المطابقة النصية أو داخل استعلام الترتيب)"""
+    filters = params.filters
+    criteria = []
+    if filters.get('specialization'):
+        criteria.append(DoctorProfile.specialization == filters['specialization'])
+
+    if filters.get('min_rating'):
+        criteria.append(DoctorProfile.average_rating >= float(filters['min_rating']))
+
+    if filters.get('min_experience'):
+        criteria.append(DoctorProfile.years_of_experience >= int(filters['min_experience']))
+
+    if filters.get('verified_only'):
+        criteria.append(DoctorProfile.licenses.any(DoctorLicense.is_active == True))
+    return criteria
+
+def doctors_query(params, criteria=None):
+    criteria = doctor_criteria(params) if criteria is None else criteria
+    return DoctorProfile.query.filter(
+        search_index.condition('doctors', params.query, stemming=params.stemming), *criteria
+    )
+
+def search_doctors_section(params):
+    """البحث في الأطباء"""
+    criteria = doctor_criteria(params)
+    if params.sort == 'relevance' and doctor_ranker.available():
+        # الترتيب حسب الصلة (BM25 بأوزان الحقول مع تعزيز التقييم والإتاحة)
+        ids, pagination = cached_page(
+            'doctors', params,
+            lambda offset, limit, with_total: doctor_ranker.ranked_ids(
+                params.query, criteria, offset, limit, params.boosts, params.stemming, with_total
+            ),
+            lambda: doctor_ranker.count(params.query, criteria, params.stemming)
+        )
+        doctors = load_in_order(DoctorProfile, ids)
+    else:
+        doctors, pagination = paginate_section(
+            'doctors', doctors_query(params, criteria).order_by(DoctorProfile.id), params
+        )
+    statistics = DoctorProfile.get_stored_statistics_for(doctors)
+
+    section = {
+        'items': [{
+            'id': doctor.id,
+            'name': doctor.full_name,
+            'specialization': doctor.specialization,
+            'rating': statistics[doctor.id]['average_rating'],
+            'experience_years': doctor.years_of_experience,
+            'consultation_price': doctor.consultation_fee,
+            'is_verified': statistics[doctor.id]['license_status'] == 'verified',
+            'is_available': doctor.available_for_consultation,
+            'profile_image': doctor.profile_image,
+            'languages': json.loads(doctor.languages) if doctor.languages else []
+        } for doctor in doctors],
+        **pagination
+    }
+
+    if params.facets:
+        # أعداد الواجهات لنفس البحث والفلاتر باستعلام واحد
+        section['facets'] = doctor_facets(
+            [search_index.condition('doctors', params.query, stemming=params.stemming)] + criteria, params.facets
+        )
+    return section
+
+def patients_query(params):
+    patients_query = User.query.filter(
+        and_(
+            User.user_type == 'patient',
+            search_index.condition('users', params.query, stemming=params.stemming)
+        )
+    )
+
+    # تطبيق الفلاتر
+    if params.filters.get('verified_only'):
+        patients_query = patients_query.filter(User.kyc_verified == True)
+    return patients_query
+
+def search_patients_section(params):
+    """البحث في المرضى"""
+    patients, pagination = paginate_section('patients', patients_query(params).order_by(User.id), params)
+    return {
+        'items': [{
+            'id': patient.id,
+            'name': patient.username,
+            'email': patient.email,
+            'kyc_verified': patient.kyc_verified,
+            'is_active': patient.is_active,
+            'created_at': patient.created_at.isoformat() if patient.created_at else None
+        } for patient in patients],
+        **pagination
+    }
+
+def consultations_query(params):
+    filters = params.filters
+    consultations_query = Consultation.query.filter(
+        search_index.condition('consultations', params.query, stemming=params.stemming)
+    )
+
+    # تطبيق الفلاتر
+    if filters.get('status'):
+        consultations_query = consultations_query.filter(Consultation.status == filters['status'])
+
+    if filters.get('consultation_type'):
+        consultations_query = consultations_query.filter(Consultation.consultation_type == filters['consultation_type'])
+
+    if filters.get('date_range'):
+        start_date = datetime.strptime(filters['date_range']['start'], '%Y-%m-%d')
+        end_date = datetime.strptime(filters['date_range']['end'], '%Y-%m-%d')
+        consultations_query = consultations_query.filter(
+            and_(
+                Consultation.request_date >= start_date,
+                Consultation.request_date <= end_date
+            )
+        )
+    return consultations_query
+
+def search_consultations_section(params):
+    """البحث في الاستشارات"""
+    consultations, pagination = paginate_section(
+        'consultations', consultations_query(params).order_by(Consultation.id), params,
+        joinedload(Consultation.patient)
+    )
+    doctor_names = get_doctor_names(c.doctor_id for c in consultations)
+
+    return {
+        'items': [{
+            'id': consultation.id,
+            'patient_name': consultation.patient.username if consultation.patient else 'غير محدد',
+            'doctor_name': doctor_names.get(consultation.doctor_id, 'غير محدد'),
+            'doctor_notes': consultation.doctor_notes,
+            'prescription': consultation.prescription,
+            'status': consultation.status,
+            'consultation_type': consultation.consultation_type,
+            'created_at': consultation.request_date.isoformat() if consultation.request_date else None,
+            'amount': consultation.consultation_fee
+        } for consultation in consultations],
+        **pagination
+    }
+
+def reviews_query(params):
+    reviews_query = DoctorReview.query.filter(
+        or_(
+            search_index.condition('reviews', params.query, stemming=params.stemming),
+            DoctorReview.doctor.has(search_index.condition('doctors', params.query, ['full_name'], params.stemming)),
+            DoctorReview.patient.has(search_index.condition('users', params.query, ['username'], params.stemming))
+        )
+    )
+
+    # تطبيق الفلاتر
+    if params.filters.get('min_rating'):
+        reviews_query = reviews_query.filter(DoctorReview.rating >= int(params.filters['min_rating']))
+
+    if params.filters.get('verified_only'):
+        reviews_query = reviews_query.filter(DoctorReview.is_approved == True)
+    return reviews_query
+
+def search_reviews_section(params):
+    """البحث في المراجعات"""
+    reviews, pagination = paginate_section(
+        'reviews', reviews_query(params).order_by(DoctorReview.id), params,
+        joinedload(DoctorReview.patient),
+        joinedload(DoctorReview.doctor)
+    )
+
+    return {
+        'items': [{
+            'id': review.id,
+            'patient_name': 'مجهول' if review.is_anonymous else (review.patient.username if review.patient else 'غير محدد'),
+            'doctor_name': review.doctor.full_name if review.doctor else 'غير محدد',
+            'rating': review.rating,
+            'comment': review.review_text,
+            'is_verified': review.is_approved,
+            'created_at': review.created_at.isoformat() if review.created_at else None
+        } for review in reviews],
+        **pagination
+    }
+
+def count_section(name, params):
+    """العدد الكلي لقسم واحد بنفس شروط البحث"""
+    return SECTION_QUERIES[name](params).order_by(None).count()
+
+# أقسام البحث بترتيب الاستجابة، واستعلام الشروط لكل قسم (للأعداد المؤجلة)
+SEARCH_SECTIONS = {
+    'doctors': search_doctors_section,
+    'patients': search_patients_section,
+    'consultations': search_consultations_section,
+    'reviews': search_reviews_section
+}
+SECTION_QUERIES = {
+    'doctors': doctors_query,
+    'patients': patients_query,
+    'consultations': consultations_query,
+    'reviews': reviews_query
+}
+
+def read_search_request():
+    """قراءة الطلب والتحقق منه؛ يعيد (المعاملات، المهل، استجابة الخطأ)"""
+    try:
+        params = SearchParams(request.get_json())
+        timeouts = section_timeouts(request.get_json().get('timeout'), SEARCH_SECTIONS)
+    except (TypeError, ValueError) as e:
+        return None, None, (jsonify({'status': 'error', 'message': f'معاملات غير صالحة: {str(e)}'}), 400)
+
+    if not params.query:
+        return None, None, (jsonify({
+            'status': 'error',
+            'message': 'يرجى إدخال كلمة البحث'
+        }), 400)
+
+    if params.sort not in ('relevance', 'id'):
+        return None, None, (jsonify({
+            'status': 'error',
+            'message': f'ترتيب غير مدعوم: {params.sort}'
+        }), 400)
+    return params, timeouts, None
+
+def fanout_response(outcome, data):
+    """استجابة النتائج الجزئية: أخطاء التحقق 400، وفشل كل الأقسام يرفع الخطأ الأول"""
+    for error in outcome.errors.values():
+        if isinstance(error, ValueError):
+            return jsonify({'status': 'error', 'message': str(error)}), 400
+    if outcome.errors and not outcome.results and not outcome.timed_out:
+        raise next(iter(outcome.errors.values()))
+
+    response = {'status': 'success', 'data': data}
+    if outcome.partial:
+        response['partial'] = True
+        response['timed_out'] = outcome.timed_out
+        response['failed'] = {name: str(error) for name, error in outcome.errors.items()}
+    response['timings_ms'] = outcome.elapsed_ms
+    return response
+
 @advanced_search_bp.route('/search', methods=['POST'])
 def advanced_search():
-    """البحث المتقدم عبر جميع الأقسام"""
+    """البحث المتقدم عبر جميع الأقسام (الأقسام تنفذ بالتوازي ولكل منها مهلة)"""
     try:
-        data = request.get_json()
-        query = data.get('query', '').strip()
-        search_type = data.get('type', 'all')  # all, doctors, patients, consultations, reviews
-        filters = data.get('filters', {})
-        page = data.get('page', 1)
-        per_page = data.get('per_page', 20)
-        
-        if not query:
-            return jsonify({
-                'status': 'error',
-                'message': 'يرجى إدخال كلمة البحث'
-            }), 400
-        
-        results = {}
-        
-        # البحث في الأطباء
-        if search_type in ['all', 'doctors']:
-            doctors_query = Doctor.query.filter(
-                or_(
-                    Doctor.name.contains(query),
-                    Doctor.specialization.contains(query),
-                    Doctor.bio.contains(query),
-                    Doctor.qualifications.contains(query)
-                )
-            )
-            
-            # تطبيق الفلاتر
-            if filters.get('specialization'):
-                doctors_query = doctors_query.filter(Doctor.specialization == filters['specialization'])
-            
-            if filters.get('min_rating'):
-                doctors_query = doctors_query.filter(Doctor.rating >= float(filters['min_rating']))
-            
-            if filters.get('min_experience'):
-                doctors_query = doctors_query.filter(Doctor.experience_years >= int(filters['min_experience']))
-            
-            if filters.get('verified_only'):
-                doctors_query = doctors_query.filter(Doctor.is_verified == True)
-            
-            doctors = doctors_query.paginate(
-                page=page, per_page=per_page, error_out=False
-            )
-            
-            results['doctors'] = {
-                'items': [{
-                    'id': doctor.id,
-                    'name': doctor.name,
-                    'specialization': doctor.specialization,
-                    'rating': doctor.rating,
-                    'experience_years': doctor.experience_years,
-                    'consultation_price': doctor.consultation_price,
-                    'is_verified': doctor.is_verified,
-                    'is_available': doctor.is_available,
-                    'profile_image': doctor.profile_image,
-                    'languages': doctor.languages.split(',') if doctor.languages else []
-                } for doctor in doctors.items],
-                'total': doctors.total,
-                'pages': doctors.pages,
-                'current_page': doctors.page
-            }
-        
-        # البحث في المرضى
-        if search_type in ['all', 'patients']:
-            patients_query = User.query.filter(
-                and_(
-                    User.user_type == 'patient',
-                    or_(
-                        User.full_name.contains(query),
-                        User.email.contains(query),
-                        User.phone.contains(query)
-                    )
-                )
-            )
-            
-            # تطبيق الفلاتر
-            if filters.get('age_range'):
-                age_min, age_max = map(int, filters['age_range'].split('-'))
-                patients_query = patients_query.filter(
-                    and_(User.age >= age_min, User.age <= age_max)
-                )
-            
-            if filters.get('gender'):
-                patients_query = patients_query.filter(User.gender == filters['gender'])
-            
-            patients = patients_query.paginate(
-                page=page, per_page=per_page, error_out=False
-            )
-            
-            results['patients'] = {
-                'items': [{
-                    'id': patient.id,
-                    'name': patient.full_name,
-                    'email': patient.email,
-                    'phone': patient.phone,
-                    'age': patient.age,
-                    'gender': patient.gender,
-                    'created_at': patient.created_at.isoformat() if patient.created_at else None
-                } for patient in patients.items],
-                'total': patients.total,
-                'pages': patients.pages,
-                'current_page': patients.page
-            }
-        
-        # البحث في الاستشارات
-        if search_type in ['all', 'consultations']:
-            consultations_query = Consultation.query.filter(
-                or_(
-                    Consultation.symptoms.contains(query),
-                    Consultation.diagnosis.contains(query),
-                    Consultation.notes.contains(query)
-                )
-            )
-            
-            # تطبيق الفلاتر
-            if filters.get('status'):
-                consultations_query = consultations_query.filter(Consultation.status == filters['status'])
-            
-            if filters.get('consultation_type'):
-                consultations_query = consultations_query.filter(Consultation.consultation_type == filters['consultation_type'])
-            
-            if filters.get('date_range'):
-                start_date = datetime.strptime(filters['date_range']['start'], '%Y-%m-%d')
-                end_date = datetime.strptime(filters['date_range']['end'], '%Y-%m-%d')
-                consultations_query = consultations_query.filter(
-                    and_(
-                        Consultation.created_at >= start_date,
-                        Consultation.created_at <= end_date
-                    )
-                )
-            
-            consultations = consultations_query.paginate(
-                page=page, per_page=per_page, error_out=False
-            )
-            
-            results['consultations'] = {
-                'items': [{
-                    'id': consultation.id,
-                    'patient_name': consultation.patient.full_name if consultation.patient else 'غير محدد',
-                    'doctor_name': consultation.doctor.name if consultation.doctor else 'غير محدد',
-                    'symptoms': consultation.symptoms,
-                    'diagnosis': consultation.diagnosis,
-                    'status': consultation.status,
-                    'consultation_type': consultation.consultation_type,
-                    'created_at': consultation.created_at.isoformat() if consultation.created_at else None,
-                    'amount': consultation.amount
-                } for consultation in consultations.items],
-                'total': consultations.total,
-                'pages': consultations.pages,
-                'current_page': consultations.page
-            }
-        
-        # البحث في المراجعات
-        if search_type in ['all', 'reviews']:
-            reviews_query = Review.query.filter(
-                or_(
-                    Review.comment.contains(query),
-                    Review.doctor.has(Doctor.name.contains(query)),
-                    Review.patient.has(User.full_name.contains(query))
-                )
-            )
-            
-            # تطبيق الفلاتر
-            if filters.get('min_rating'):
-                reviews_query = reviews_query.filter(Review.rating >= int(filters['min_rating']))
-            
-            if filters.get('verified_only'):
-                reviews_query = reviews_query.filter(Review.is_verified == True)
-            
-            reviews = reviews_query.paginate(
-                page=page, per_page=per_page, error_out=False
-            )
-            
-            results['reviews'] = {
-                'items': [{
-                    'id': review.id,
-                    'patient_name': review.patient.full_name if review.patient else 'غير محدد',
-                    'doctor_name': review.doctor.name if review.doctor else 'غير محدد',
-                    'rating': review.rating,
-                    'comment': review.comment,
-                    'is_verified': review.is_verified,
-                    'created_at': review.created_at.isoformat() if review.created_at else None
-                } for review in reviews.items],
-                'total': reviews.total,
-                'pages': reviews.pages,
-                'current_page': reviews.page
-            }
-        
+        params, timeouts, error = read_search_request()
+        if error:
+            return error
+        search_telemetry.record(params.query, session.get('user_id'))
+
+        outcome = search_fanout.run(
+            {name: partial(SEARCH_SECTIONS[name], params) for name in params.sections()}, timeouts
+        )
+        results = {name: outcome.results[name] for name in params.sections() if name in outcome.results}
+        response = fanout_response(outcome, results)
+        if isinstance(response, tuple):
+            return response
+
         return jsonify({
-            'status': 'success',
-            'data': results,
-            'query': query,
-            'search_type': search_type,
-            'total_results': sum([r.get('total', 0) for r in results.values()])
+            **response,
+            'query': params.query,
+            'search_type': params.search_type,
+            'total_results': None if params.lazy_totals else sum([r.get('total', 0) for r in results.values()])
         })
-        
+
     except Exception as e:
         return jsonify({
             'status': 'error',
             'message': f'خطأ في البحث: {str(e)}'
         }), 500
 
+@advanced_search_bp.route('/search/totals', methods=['POST'])
+def advanced_search_totals():
+    """الأعداد الكلية لأقسام البحث بنفس معاملات /search (تكمل نتائج totals=lazy)"""
+    try:
+        params, timeouts, error = read_search_request()
+        if error:
+            return error
+
+        outcome = search_fanout.run(
+            {name: partial(count_section, name, params) for name in params.sections()}, timeouts
+        )
+        totals = {name: outcome.results[name] for name in params.sections() if name in outcome.results}
+        response = fanout_response(outcome, {'totals': totals, 'total_results': sum(totals.values())})
+        if isinstance(response, tuple):
+            return response
+        return jsonify(response)
+
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'خطأ في حساب أعداد البحث: {str(e)}'
+        }), 500
+
+@advanced_search_bp.route('/index', methods=['GET'])
+def search_index_status():
+    """حالة فهارس النص الكامل"""
+    try:
+        return jsonify({
+            'status': 'success',
+            'data': search_index.status()
+        })
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'message': f'خطأ في قراءة حالة الفهارس: {str(e)}'
+        }), 500
+
+@advanced_search_bp.route('/index/rebuild', methods=['POST'])
+def rebuild_search_index():
+    """إعادة بناء فهارس النص الكامل من الجداول الأصلية"""
+    try:
+        data = request.get_json(silent=True) or {}
+        try:
+            counts = search_index.rebuild(data.get('indexes'))
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        return jsonify({
+            'status': 'success',
+            'data': counts
+        })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'status': 'error',
+            'message': f'خطأ في إعادة بناء الفهارس: {str(e)}'
+        }), 500
+
+@advanced_search_bp.cli.command('rebuild-index')
+@click.argument('indexes', nargs=-1)
+def rebuild_search_index_command(indexes):
+    """flask advanced_search rebuild-index [doctors consultations reviews]"""
+    for name, count in search_index.rebuild(list(indexes) or None).items():
+        click.echo(f'{name}: {count}')
+
 @advanced_search_bp.route('/suggestions', methods=['GET'])
 def search_suggestions():
     """اقتراحات البحث التلقائية"""
@@ -223,52 +450,12 @@ def search_suggestions():
                 'data': []
             })
         
-        suggestions = []
-        
-        # اقتراحات من أسماء الأطباء
-        doctors = Doctor.query.filter(
-            Doctor.name.contains(query)
-        ).limit(5).all()
-        
-        for doctor in doctors:
-            suggestions.append({
-                'type': 'doctor',
-                'text': doctor.name,
-                'subtitle': doctor.specialization,
-                'id': doctor.id
-            })
-        
-        # اقتراحات من التخصصات
-        specializations = db.session.query(Doctor.specialization).filter(
-            Doctor.specialization.contains(query)
-        ).distinct().limit(5).all()
-        
-        for spec in specializations:
-            suggestions.append({
-                'type': 'specialization',
-                'text': spec[0],
-                'subtitle': 'تخصص طبي',
-                'id': None
-            })
-        
-        # اقتراحات من الأعراض الشائعة
-        common_symptoms = [
-            'صداع', 'حمى', 'سعال', 'ألم في الصدر', 'ضيق تنفس',
-            'ألم في البطن', 'غثيان', 'دوخة', 'ألم في الظهر', 'أرق'
-        ]
-        
-        matching_symptoms = [s for s in common_symptoms if query.lower() in s.lower()]
-        for symptom in matching_symptoms[:3]:
-            suggestions.append({
-                'type': 'symptom',
-                'text': symptom,
-                'subtitle': 'عرض طبي',
-                'id': None
-            })
+        # فهرس البادئات في ذاكرة العامل: لا استعلامات لكل ضغطة مفتاح
+        suggestions = suggestion_index.suggest(query)
         
         return jsonify({
             'status': 'success',
-            'data': suggestions[:10]  # أقصى 10 اقتراحات
+            'data': suggestions
         })
         
     except Exception as e:
@@ -281,9 +468,9 @@ def search_suggestions():
 def get_search_filters():
     """الحصول على قائمة الفلاتر المتاحة"""
     try:
-        # التخصصات المتاحة
-        specializations = db.session.query(Doctor.specialization).distinct().all()
-        specializations = [s[0] for s in specializations if s[0]]
+        # التخصصات المتاحة مع أعداد الأطباء في كل واجهة
+        facets = doctor_facets()
+        specializations = [item['value'] for item in facets['specialization']]
         
         # حالات الاستشارات
         consultation_statuses = ['pending', 'ongoing', 'completed', 'cancelled']
@@ -314,6 +501,7 @@ def get_search_filters():
             'status': 'success',
             'data': {
                 'specializations': specializations,
+                'facets': facets,
                 'consultation_statuses': consultation_statuses,
                 'consultation_types': consultation_types,
                 'age_ranges': age_ranges,
@@ -330,16 +518,11 @@ def get_search_filters():
 
 @advanced_search_bp.route('/recent', methods=['GET'])
 def get_recent_searches():
-    """الحصول على عمليات البحث الأخيرة"""
+    """الحصول على عمليات البحث الأخيرة للمستخدم الحالي (من حلقته في قياس البحث)"""
     try:
-        # في التطبيق الحقيقي، يمكن حفظ عمليات البحث في قاعدة البيانات
-        # هنا سنعيد قائمة افتراضية
-        recent_searches = [
-            {'query': 'أطباء القلب', 'timestamp': '2024-01-15T10:30:00'},
-            {'query': 'صداع مزمن', 'timestamp': '2024-01-14T15:20:00'},
-            {'query': 'د. أحمد محمد', 'timestamp': '2024-01-13T09:45:00'},
-            {'query': 'استشارة نفسية', 'timestamp': '2024-01-12T14:10:00'}
-        ]
+        limit = request.args.get('limit', 10, type=int)
+        user_id = session.get('user_id')
+        recent_searches = search_telemetry.recent_for(user_id, limit) if user_id is not None else []
         
         return jsonify({
             'status': 'success',
@@ -354,18 +537,18 @@ def get_recent_searches():
 
 @advanced_search_bp.route('/popular', methods=['GET'])
 def get_popular_searches():
-    """الحصول على عمليات البحث الشائعة"""
+    """الحصول على عمليات البحث الشائعة في النافذة (hour أو day) من رسوم قياس البحث"""
     try:
-        # قائمة بعمليات البحث الشائعة
+        window = request.args.get('window', 'day')
+        limit = request.args.get('limit', 8, type=int)
+        if window not in WINDOWS:
+            return jsonify({
+                'status': 'error',
+                'message': f'نافذة غير مدعومة: {window}'
+            }), 400
         popular_searches = [
-            {'query': 'أطباء القلب', 'count': 1250},
-            {'query': 'استشارة نفسية', 'count': 980},
-            {'query': 'أطباء الأطفال', 'count': 875},
-            {'query': 'أمراض جلدية', 'count': 720},
-            {'query': 'صداع', 'count': 650},
-            {'query': 'ألم في الظهر', 'count': 580},
-            {'query': 'استشارة عامة', 'count': 520},
-            {'query': 'أطباء العظام', 'count': 480}
+            {'query': item['query'], 'count': item['count']}
+            for item in search_telemetry.popular(window, limit)
         ]
         
         return jsonify({
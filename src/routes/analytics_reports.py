@@ -1,12 +1,9 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, Response, request, jsonify, stream_with_context, current_app, url_for
 from src.models.user import db, User, DoctorProfile, Consultation, Appointment, Payment, DoctorReview, ServiceReview, Notification
-from datetime import datetime, timedelta
-from sqlalchemy import func, and_, or_, extract
+from datetime import datetime, date, timedelta
+from sqlalchemy import func, and_, or_, case, select
+from src.routes.analytics_rollups import rollup_manager
 import json
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from io import BytesIO
 import base64
 import os
 from reportlab.lib.pagesizes import letter, A4
@@ -16,14 +13,64 @@ from reportlab.lib.units import inch
 from reportlab.lib import colors
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
-import matplotlib
-matplotlib.use('Agg')  # استخدام backend غير تفاعلي
+from src.routes.chart_renderer import chart_renderer, ChartRendererBusy
+from src.routes.report_jobs import report_jobs, REPORT_FORMATS
+from src.routes.tabular_stream import write_xlsx, iter_file, stream_file
+from src.routes.kpi_engine import kpi_engine, growth_rate
+from src.routes.timeseries import timeseries_engine, TimeSeries
+from src.routes.activity_sketches import activity_sketches
+from src.routes.cohort_engine import cohort_engine, DATA_SOURCES
+from src.routes.columnar_snapshots import snapshot_store
+from src.routes.snapshot_analytics import snapshot_analytics
+from src.routes.range_cache import range_cache, RangeComputation, add_total
 
 analytics_reports_bp = Blueprint("analytics_reports", __name__)
 
-# إعداد الخطوط العربية
-plt.rcParams['font.family'] = ['DejaVu Sans', 'Arial Unicode MS', 'Tahoma']
-sns.set_style("whitegrid")
+# الحقول المسموح الترتيب بها في تقرير أداء الأطباء
+DOCTOR_PERFORMANCE_SORTS = (
+    'total_consultations', 'completed_consultations', 'completion_rate', 'total_appointments',
+    'completed_appointments', 'avg_rating', 'total_reviews', 'revenue', 'avg_response_time_hours'
+)
+
+# مؤشرات لوحة /kpi (تحسب معاً في استعلام واحد)
+DASHBOARD_KPIS = (
+    'consultations', 'revenue', 'new_users', 'avg_consultation_value', 'customer_satisfaction', 'retention_rate'
+)
+MAX_KPI_PERIODS = 24
+
+def _accumulate_consultations(totals, row):
+    """إضافة صف تجميع استشارات (يوم، نوع، حالة) إلى مجاميع الجزء"""
+    add_total(totals, 'total', row.total)
+    add_total(totals, 'status', row.status, row.total)
+    add_total(totals, 'types', row.consultation_type or 'غير محدد', row.total)
+    add_total(totals, 'daily', row.period, row.total)
+    add_total(totals, 'revenue', row.revenue)
+    add_total(totals, 'response_hours', row.response_hours)
+    add_total(totals, 'responses', row.responses)
+
+def _accumulate_users(totals, row):
+    """إضافة صف تجميع تسجيلات (يوم، نوع المستخدم) إلى مجاميع الجزء"""
+    add_total(totals, 'total', row.total)
+    add_total(totals, 'active', row.active)
+    add_total(totals, 'verified', row.verified)
+    add_total(totals, 'types', row.user_type, row.total)
+    add_total(totals, 'monthly', row.period[:7], row.total)
+
+range_cache.register(RangeComputation(
+    'consultation_analytics', ['consultation'],
+    lambda start, end, inclusive_end: rollup_manager.aggregate_statement(
+        'consultation', start, end, dimensions=['consultation_type', 'status'], period='%Y-%m-%d',
+        inclusive_end=inclusive_end
+    ),
+    _accumulate_consultations
+))
+range_cache.register(RangeComputation(
+    'user_analytics', ['user'],
+    lambda start, end, inclusive_end: rollup_manager.aggregate_statement(
+        'user', start, end, dimensions=['user_type'], period='%Y-%m-%d', inclusive_end=inclusive_end
+    ),
+    _accumulate_users
+))
 
 class AnalyticsEngine:
     """محرك التحليلات المتقدم"""
@@ -34,49 +81,37 @@ class AnalyticsEngine:
     def get_consultation_analytics(self, start_date=None, end_date=None):
         """تحليلات الاستشارات"""
         try:
-            query = Consultation.query
-            
-            if start_date:
-                query = query.filter(Consultation.request_date >= start_date)
-            if end_date:
-                query = query.filter(Consultation.request_date <= end_date)
-            
-            consultations = query.all()
+            # مجاميع الأيام والأشهر المغلقة من ذاكرة الفترات، واليوم الحالي والأطراف الجزئية تحسب الآن
+            rollup_manager.ensure_fresh()
+            totals = range_cache.get('consultation_analytics', start_date, end_date)
             
             # الإحصائيات الأساسية
-            total_consultations = len(consultations)
-            completed_consultations = len([c for c in consultations if c.status == 'completed'])
-            pending_consultations = len([c for c in consultations if c.status == 'pending'])
-            cancelled_consultations = len([c for c in consultations if c.status == 'cancelled'])
+            total_consultations = totals.get('total', 0)
+            status_counts = totals.get('status', {})
+            consultation_types = totals.get('types', {})
+            daily_distribution = totals.get('daily', {})
+            total_revenue = totals.get('revenue', 0)
+            response_hours = totals.get('response_hours', 0)
+            responses = totals.get('responses', 0)
+            
+            completed_consultations = status_counts.get('completed', 0)
+            pending_consultations = status_counts.get('pending', 0)
+            cancelled_consultations = status_counts.get('cancelled', 0)
             
             # معدل الإكمال
             completion_rate = (completed_consultations / total_consultations * 100) if total_consultations > 0 else 0
             
-            # التوزيع حسب النوع
-            consultation_types = {}
-            for consultation in consultations:
-                type_name = consultation.consultation_type or 'غير محدد'
-                consultation_types[type_name] = consultation_types.get(type_name, 0) + 1
-            
-            # التوزيع الزمني (يومي)
-            daily_distribution = {}
-            for consultation in consultations:
-                date_key = consultation.request_date.strftime('%Y-%m-%d')
-                daily_distribution[date_key] = daily_distribution.get(date_key, 0) + 1
-            
             # متوسط وقت الاستجابة
-            response_times = []
-            for consultation in consultations:
-                if consultation.completed_at and consultation.request_date:
-                    response_time = (consultation.completed_at - consultation.request_date).total_seconds() / 3600
-                    response_times.append(response_time)
-            
-            avg_response_time = sum(response_times) / len(response_times) if response_times else 0
+            avg_response_time = response_hours / responses if responses else 0
             
             # الإيرادات
-            total_revenue = sum([c.consultation_fee or 0 for c in consultations])
             avg_consultation_fee = total_revenue / total_consultations if total_consultations > 0 else 0
             
+            # التوزيع اليومي مكتمل الأيام حتى اليوم عند غياب نهاية الفترة (الأيام بلا استشارات أصفار)
+            daily_distribution = TimeSeries.from_totals(
+                'consultations', daily_distribution, 'day', start_date, end_date or datetime.now()
+            ).to_dict()
+            
             return {
                 'total_consultations': total_consultations,
                 'completed_consultations': completed_consultations,
@@ -93,131 +128,177 @@ class AnalyticsEngine:
         except Exception as e:
             return {'error': f'خطأ في تحليل الاستشارات: {str(e)}'}
     
-    def get_doctor_performance_analytics(self, doctor_id=None, start_date=None, end_date=None):
+    def doctor_performance_query(self, doctor_id=None, start_date=None, end_date=None, sort_by=None, descending=True):
+        """استعلام واحد يربط مجاميع الاستشارات والمواعيد والتقييمات بكل طبيب مع الترتيب في قاعدة البيانات"""
+        # الاستشارات من التجميعات اليومية على مستوى (الطبيب، الحالة)
+        consultations = rollup_manager.aggregate_statement(
+            'consultation', start_date, end_date, dimensions=['doctor_id', 'status']
+        ).subquery()
+        consultation_stats = select(
+            consultations.c.doctor_id,
+            func.sum(consultations.c.total).label('total'),
+            func.sum(case((consultations.c.status == 'completed', consultations.c.total), else_=0)).label('completed'),
+            func.sum(consultations.c.revenue).label('revenue'),
+            func.sum(consultations.c.response_hours).label('response_hours'),
+            func.sum(consultations.c.responses).label('responses')
+        ).group_by(consultations.c.doctor_id).subquery()
+        
+        # المواعيد
+        appointment_filters = []
+        if start_date:
+            appointment_filters.append(Appointment.appointment_date >= start_date)
+        if end_date:
+            appointment_filters.append(Appointment.appointment_date <= end_date)
+        appointment_stats = select(
+            Appointment.doctor_id,
+            func.count(Appointment.id).label('total'),
+            func.sum(case((Appointment.status == 'completed', 1), else_=0)).label('completed')
+        ).where(*appointment_filters).group_by(Appointment.doctor_id).subquery()
+        
+        # التقييمات المعتمدة
+        review_stats = select(
+            DoctorReview.doctor_id,
+            func.count(DoctorReview.id).label('total'),
+            func.avg(DoctorReview.rating).label('average')
+        ).where(DoctorReview.is_approved == True).group_by(DoctorReview.doctor_id).subquery()
+        
+        total_consultations = func.coalesce(consultation_stats.c.total, 0)
+        completed_consultations = func.coalesce(consultation_stats.c.completed, 0)
+        responses = func.coalesce(consultation_stats.c.responses, 0)
+        metrics = {
+            'total_consultations': total_consultations,
+            'completed_consultations': completed_consultations,
+            'completion_rate': case(
+                (total_consultations > 0, completed_consultations * 100.0 / total_consultations), else_=0
+            ),
+            'total_appointments': func.coalesce(appointment_stats.c.total, 0),
+            'completed_appointments': func.coalesce(appointment_stats.c.completed, 0),
+            'avg_rating': func.coalesce(review_stats.c.average, 0),
+            'total_reviews': func.coalesce(review_stats.c.total, 0),
+            'revenue': func.coalesce(consultation_stats.c.revenue, 0),
+            'response_hours': func.coalesce(consultation_stats.c.response_hours, 0),
+            'responses': responses,
+            'avg_response_time_hours': case(
+                (responses > 0, consultation_stats.c.response_hours / responses), else_=0
+            )
+        }
+        
+        query = db.session.query(DoctorProfile, *[expression.label(name) for name, expression in metrics.items()]) \
+            .outerjoin(consultation_stats, consultation_stats.c.doctor_id == DoctorProfile.user_id) \
+            .outerjoin(appointment_stats, appointment_stats.c.doctor_id == DoctorProfile.user_id) \
+            .outerjoin(review_stats, review_stats.c.doctor_id == DoctorProfile.id)
+        
+        if doctor_id:
+            query = query.filter(DoctorProfile.id == doctor_id)
+        
+        if sort_by:
+            ranking = metrics[sort_by]
+            query = query.order_by(ranking.desc() if descending else ranking.asc(), DoctorProfile.id)
+        else:
+            query = query.order_by(DoctorProfile.id)
+        
+        return query
+    
+    def iter_doctor_performance(self, doctor_id=None, start_date=None, end_date=None, sort_by=None,
+                                descending=True, limit=None, offset=0, batch_size=500, source='database'):
+        """توليد تحليلات أداء الأطباء على دفعات دون تحميل التقرير كاملاً في الذاكرة
+
+        source='snapshot' يحسبها من اللقطات العمودية دون استعلام على قاعدة البيانات التشغيلية.
+        """
+        if sort_by and sort_by not in DOCTOR_PERFORMANCE_SORTS:
+            raise ValueError(f'حقل الترتيب غير مدعوم: {sort_by}')
+        if source not in DATA_SOURCES:
+            raise ValueError(f'مصدر بيانات غير مدعوم: {source}')
+        if source == 'snapshot':
+            yield from snapshot_analytics.doctor_performance(
+                doctor_id, start_date, end_date, sort_by, descending, limit, offset
+            )
+            return
+        
+        rollup_manager.ensure_fresh()
+        query = self.doctor_performance_query(doctor_id, start_date, end_date, sort_by, descending)
+        if offset:
+            query = query.offset(offset)
+        if limit:
+            query = query.limit(limit)
+        
+        batch = []
+        for row in query.yield_per(batch_size):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield from self._format_doctor_performance(batch)
+                batch = []
+        if batch:
+            yield from self._format_doctor_performance(batch)
+    
+    def _format_doctor_performance(self, rows):
+        # إحصائيات to_dict لكل الدفعة باستعلامين
+        statistics = DoctorProfile.get_statistics_for(row.DoctorProfile.id for row in rows)
+        for row in rows:
+            doctor = row.DoctorProfile
+            total_consultations = row.total_consultations
+            completed_consultations = row.completed_consultations
+            yield {
+                'doctor': doctor.to_dict(statistics[doctor.id]),
+                'total_consultations': total_consultations,
+                'completed_consultations': completed_consultations,
+                'completion_rate': (completed_consultations / total_consultations * 100) if total_consultations > 0 else 0,
+                'total_appointments': row.total_appointments,
+                'completed_appointments': row.completed_appointments,
+                'avg_rating': round(float(row.avg_rating), 2),
+                'total_reviews': row.total_reviews,
+                'revenue': row.revenue,
+                'avg_response_time_hours': round(row.response_hours / row.responses, 2) if row.responses else 0
+            }
+    
+    def get_doctor_performance_analytics(self, doctor_id=None, start_date=None, end_date=None, sort_by=None,
+                                         descending=True, limit=None, offset=0, source='database'):
         """تحليلات أداء الأطباء"""
         try:
-            query = DoctorProfile.query
-            
-            if doctor_id:
-                query = query.filter_by(id=doctor_id)
-            
-            doctors = query.all()
-            doctor_analytics = []
-            
-            for doctor in doctors:
-                # الاستشارات
-                consultation_query = Consultation.query.filter_by(doctor_id=doctor.user_id)
-                
-                if start_date:
-                    consultation_query = consultation_query.filter(Consultation.request_date >= start_date)
-                if end_date:
-                    consultation_query = consultation_query.filter(Consultation.request_date <= end_date)
-                
-                consultations = consultation_query.all()
-                
-                # المواعيد
-                appointment_query = Appointment.query.filter_by(doctor_id=doctor.user_id)
-                
-                if start_date:
-                    appointment_query = appointment_query.filter(Appointment.appointment_date >= start_date)
-                if end_date:
-                    appointment_query = appointment_query.filter(Appointment.appointment_date <= end_date)
-                
-                appointments = appointment_query.all()
-                
-                # التقييمات
-                reviews = DoctorReview.query.filter_by(doctor_id=doctor.id, is_approved=True).all()
-                
-                # حساب المؤشرات
-                total_consultations = len(consultations)
-                completed_consultations = len([c for c in consultations if c.status == 'completed'])
-                total_appointments = len(appointments)
-                completed_appointments = len([a for a in appointments if a.status == 'completed'])
-                
-                avg_rating = sum([r.rating for r in reviews]) / len(reviews) if reviews else 0
-                total_reviews = len(reviews)
-                
-                # الإيرادات
-                revenue = sum([c.consultation_fee or 0 for c in consultations])
-                
-                # معدل الاستجابة
-                response_times = []
-                for consultation in consultations:
-                    if consultation.completed_at and consultation.request_date:
-                        response_time = (consultation.completed_at - consultation.request_date).total_seconds() / 3600
-                        response_times.append(response_time)
-                
-                avg_response_time = sum(response_times) / len(response_times) if response_times else 0
-                
-                doctor_analytics.append({
-                    'doctor': doctor.to_dict(),
-                    'total_consultations': total_consultations,
-                    'completed_consultations': completed_consultations,
-                    'completion_rate': (completed_consultations / total_consultations * 100) if total_consultations > 0 else 0,
-                    'total_appointments': total_appointments,
-                    'completed_appointments': completed_appointments,
-                    'avg_rating': round(avg_rating, 2),
-                    'total_reviews': total_reviews,
-                    'revenue': revenue,
-                    'avg_response_time_hours': round(avg_response_time, 2)
-                })
-            
-            return doctor_analytics
+            return list(self.iter_doctor_performance(
+                doctor_id, start_date, end_date, sort_by, descending, limit, offset, source=source
+            ))
             
         except Exception as e:
             return {'error': f'خطأ في تحليل أداء الأطباء: {str(e)}'}
     
-    def get_financial_analytics(self, start_date=None, end_date=None):
+    def get_financial_analytics(self, start_date=None, end_date=None, top_n=5, doctors_offset=0):
         """التحليلات المالية"""
         try:
-            query = Payment.query.filter_by(status='completed')
-            
-            if start_date:
-                query = query.filter(Payment.completed_at >= start_date)
-            if end_date:
-                query = query.filter(Payment.completed_at <= end_date)
-            
-            payments = query.all()
+            # التوزيع حسب النوع والطريقة واليوم من التجميعات اليومية (الشهري مشتق من اليومي)
+            rollup_manager.ensure_fresh()
+            rows = rollup_manager.aggregate(
+                'payment', start_date, end_date,
+                dimensions=['payment_type', 'payment_method'], period='%Y-%m-%d'
+            )
             
             # الإحصائيات الأساسية
-            total_revenue = sum([p.amount for p in payments])
-            total_transactions = len(payments)
-            avg_transaction_value = total_revenue / total_transactions if total_transactions > 0 else 0
-            
-            # التوزيع حسب نوع الدفع
+            total_revenue = 0
+            total_transactions = 0
             payment_types = {}
-            for payment in payments:
-                payment_types[payment.payment_type] = payment_types.get(payment.payment_type, 0) + payment.amount
-            
-            # التوزيع حسب طريقة الدفع
             payment_methods = {}
-            for payment in payments:
-                method = payment.payment_method or 'غير محدد'
-                payment_methods[method] = payment_methods.get(method, 0) + payment.amount
-            
-            # التوزيع الزمني (شهري)
+            daily_revenue = {}
             monthly_revenue = {}
-            for payment in payments:
-                if payment.completed_at:
-                    month_key = payment.completed_at.strftime('%Y-%m')
-                    monthly_revenue[month_key] = monthly_revenue.get(month_key, 0) + payment.amount
             
-            # أعلى الأطباء إيراداً
-            doctor_revenues = {}
-            for payment in payments:
-                if payment.consultation_id:
-                    consultation = Consultation.query.get(payment.consultation_id)
-                    if consultation and consultation.doctor_id:
-                        doctor_revenues[consultation.doctor_id] = doctor_revenues.get(consultation.doctor_id, 0) + payment.amount
+            for row in rows:
+                total_revenue += row.amount
+                total_transactions += row.total
+                
+                # التوزيع حسب نوع الدفع
+                payment_types[row.payment_type] = payment_types.get(row.payment_type, 0) + row.amount
+                
+                # التوزيع حسب طريقة الدفع
+                method = row.payment_method or 'غير محدد'
+                payment_methods[method] = payment_methods.get(method, 0) + row.amount
+                
+                # التوزيع الزمني (يومي وشهري)
+                daily_revenue[row.period] = daily_revenue.get(row.period, 0) + row.amount
+                month_key = row.period[:7]
+                monthly_revenue[month_key] = monthly_revenue.get(month_key, 0) + row.amount
+            
+            avg_transaction_value = total_revenue / total_transactions if total_transactions > 0 else 0
             
-            top_earning_doctors = []
-            for doctor_id, revenue in sorted(doctor_revenues.items(), key=lambda x: x[1], reverse=True)[:5]:
-                doctor_profile = DoctorProfile.query.filter_by(user_id=doctor_id).first()
-                if doctor_profile:
-                    top_earning_doctors.append({
-                        'doctor': doctor_profile.to_dict(),
-                        'revenue': revenue
-                    })
+            top_earning_doctors, doctors_total = self.get_doctor_revenues(start_date, end_date, top_n, doctors_offset)
             
             return {
                 'total_revenue': total_revenue,
@@ -225,46 +306,83 @@ class AnalyticsEngine:
                 'avg_transaction_value': round(avg_transaction_value, 2),
                 'payment_types': payment_types,
                 'payment_methods': payment_methods,
+                'daily_revenue': daily_revenue,
                 'monthly_revenue': monthly_revenue,
-                'top_earning_doctors': top_earning_doctors
+                'top_earning_doctors': top_earning_doctors,
+                'doctor_revenue_pagination': {
+                    'offset': doctors_offset,
+                    'limit': top_n,
+                    'total': doctors_total
+                }
             }
             
         except Exception as e:
             return {'error': f'خطأ في التحليلات المالية: {str(e)}'}
     
-    def get_user_analytics(self, start_date=None, end_date=None):
+    def get_doctor_revenues(self, start_date=None, end_date=None, limit=5, offset=0):
+        """إيرادات الأطباء مرتبة تنازلياً مع ملفاتهم في استعلام ربط واحد"""
+        filters = [Payment.status == 'completed']
+        if start_date:
+            filters.append(Payment.completed_at >= start_date)
+        if end_date:
+            filters.append(Payment.completed_at <= end_date)
+        
+        revenues = select(
+            Consultation.doctor_id,
+            func.sum(Payment.amount).label('revenue'),
+            func.count(Payment.id).label('transactions'),
+            func.min(Payment.id).label('first_payment')
+        ).join(Consultation, Payment.consultation_id == Consultation.id).where(
+            *filters, Consultation.doctor_id.isnot(None)
+        ).group_by(Consultation.doctor_id).subquery()
+        
+        rows = db.session.query(
+            DoctorProfile, revenues.c.revenue, revenues.c.transactions, func.count().over().label('doctors_total')
+        ).join(revenues, revenues.c.doctor_id == DoctorProfile.user_id).order_by(
+            revenues.c.revenue.desc(), revenues.c.first_payment
+        ).offset(offset).limit(limit).all()
+        
+        if rows:
+            doctors_total = rows[0].doctors_total
+        else:
+            doctors_total = db.session.query(func.count()).select_from(revenues) \
+                .join(DoctorProfile, revenues.c.doctor_id == DoctorProfile.user_id).scalar()
+        
+        statistics = DoctorProfile.get_statistics_for(row.DoctorProfile.id for row in rows)
+        doctors = [
+            {
+                'doctor': row.DoctorProfile.to_dict(statistics[row.DoctorProfile.id]),
+                'revenue': row.revenue,
+                'transactions': row.transactions
+            }
+            for row in rows
+        ]
+        return doctors, doctors_total
+    
+    def get_user_analytics(self, start_date=None, end_date=None, exact=False):
         """تحليلات المستخدمين"""
         try:
-            query = User.query
-            
-            if start_date:
-                query = query.filter(User.created_at >= start_date)
-            if end_date:
-                query = query.filter(User.created_at <= end_date)
-            
-            users = query.all()
+            rollup_manager.ensure_fresh()
+            totals = range_cache.get('user_analytics', start_date, end_date)
             
             # الإحصائيات الأساسية
-            total_users = len(users)
-            active_users = len([u for u in users if u.is_active])
-            verified_users = len([u for u in users if u.kyc_verified])
-            
-            # التوزيع حسب نوع المستخدم
-            user_types = {}
-            for user in users:
-                user_types[user.user_type] = user_types.get(user.user_type, 0) + 1
-            
-            # معدل النمو الشهري
-            monthly_registrations = {}
-            for user in users:
-                month_key = user.created_at.strftime('%Y-%m')
-                monthly_registrations[month_key] = monthly_registrations.get(month_key, 0) + 1
+            total_users = totals.get('total', 0)
+            active_users = totals.get('active', 0)
+            verified_users = totals.get('verified', 0)
+            user_types = totals.get('types', {})
+            monthly_registrations = totals.get('monthly', {})
             
-            # نشاط المستخدمين (آخر 30 يوم)
-            thirty_days_ago = datetime.now() - timedelta(days=30)
-            recent_consultations = Consultation.query.filter(Consultation.request_date >= thirty_days_ago).all()
-            active_patients = len(set([c.user_id for c in recent_consultations]))
-            active_doctors = len(set([c.doctor_id for c in recent_consultations if c.doctor_id]))
+            # نشاط المستخدمين (آخر 30 يوم): تقدير من الرسوم اليومية، أو عد دقيق من الجدول الخام للتدقيق
+            if exact:
+                thirty_days_ago = datetime.now() - timedelta(days=30)
+                active_patients, active_doctors = db.session.query(
+                    func.count(func.distinct(Consultation.user_id)),
+                    func.count(func.distinct(Consultation.doctor_id))
+                ).filter(Consultation.request_date >= thirty_days_ago).one()
+            else:
+                activity = activity_sketches.summary(['active_patients', 'active_doctors'])
+                active_patients = activity['active_patients']['mau']
+                active_doctors = activity['active_doctors']['mau']
             
             return {
                 'total_users': total_users,
@@ -280,47 +398,154 @@ class AnalyticsEngine:
         except Exception as e:
             return {'error': f'خطأ في تحليلات المستخدمين: {str(e)}'}
     
-    def generate_chart(self, chart_type, data, title, filename):
-        """إنشاء الرسوم البيانية"""
-        try:
-            plt.figure(figsize=(12, 8))
+    def build_report(self, target, report_type='comprehensive', format_type='pdf', start_date=None, end_date=None,
+                     progress=None, source='database'):
+        """كتابة ملف التقرير الشامل في target (ملف ثنائي مفتوح)؛ يعيد (نوع المحتوى، اسم الملف)
+
+        source='snapshot' يبني التقرير من اللقطات العمودية فقط دون لمس قاعدة البيانات التشغيلية.
+        """
+        if format_type not in REPORT_FORMATS:
+            raise ValueError(f'صيغة التقرير غير مدعومة: {format_type}')
+        if source not in DATA_SOURCES:
+            raise ValueError(f'مصدر بيانات غير مدعوم: {source}')
+        progress = progress or (lambda percent, stage: None)
+        start_date = datetime.fromisoformat(start_date) if start_date else datetime.now() - timedelta(days=30)
+        end_date = datetime.fromisoformat(end_date) if end_date else datetime.now()
+        engine = snapshot_analytics if source == 'snapshot' else None
+        
+        # جمع البيانات
+        progress(10, 'تحليلات الاستشارات')
+        consultation_analytics = (engine.consultation_analytics if engine else self.get_consultation_analytics)(
+            start_date, end_date
+        )
+        progress(30, 'التحليلات المالية')
+        financial_analytics = (engine.financial_analytics if engine else self.get_financial_analytics)(
+            start_date, end_date
+        )
+        progress(50, 'تحليلات المستخدمين')
+        user_analytics = (engine.user_analytics if engine else self.get_user_analytics)(start_date, end_date)
+        # أداء الأطباء كاملاً لتقرير JSON فقط؛ Excel يقرأه على دفعات أثناء الكتابة
+        progress(70, 'أداء الأطباء')
+        doctor_performance = (
+            list(self.iter_doctor_performance(None, start_date, end_date, source=source))
+            if format_type == 'json' else None
+        )
+        
+        report_data = {
+            'report_info': {
+                'type': report_type,
+                'source': source,
+                'generated_at': datetime.now().isoformat(),
+                'period': {
+                    'start_date': start_date.isoformat(),
+                    'end_date': end_date.isoformat()
+                }
+            },
+            'consultation_analytics': consultation_analytics,
+            'financial_analytics': financial_analytics,
+            'user_analytics': user_analytics,
+            'doctor_performance': doctor_performance
+        }
+        
+        progress(90, 'إنشاء الملف')
+        content_type, extension = REPORT_FORMATS[format_type]
+        filename = f'healthcare_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}'
+        
+        if format_type == 'json':
+            target.write(json.dumps(report_data, ensure_ascii=False, default=str).encode('utf-8'))
+        
+        elif format_type == 'excel':
+            # إنشاء ملف Excel بوضع الكتابة فقط (الصفوف تُقرأ من مؤشر الخادم)
+            summary_rows = [
+                ['إجمالي الاستشارات', consultation_analytics.get('total_consultations', 0)],
+                ['الاستشارات المكتملة', consultation_analytics.get('completed_consultations', 0)],
+                ['إجمالي الإيرادات', financial_analytics.get('total_revenue', 0)],
+                ['إجمالي المستخدمين', user_analytics.get('total_users', 0)]
+            ]
+            doctor_rows = (
+                [doc['doctor']['full_name'], doc['doctor']['specialization'], doc['total_consultations'],
+                 doc['completion_rate'], doc['avg_rating'], doc['revenue']]
+                for doc in self.iter_doctor_performance(None, start_date, end_date, source=source)
+            )
+            write_xlsx([
+                ('الملخص', ['المؤشر', 'القيمة'], summary_rows),
+                ('أداء الأطباء', ['اسم الطبيب', 'التخصص', 'عدد الاستشارات', 'معدل الإكمال', 'التقييم', 'الإيرادات'],
+                 doctor_rows)
+            ], target)
+        
+        elif format_type == 'pdf':
+            # إنشاء تقرير PDF
+            doc = SimpleDocTemplate(target, pagesize=A4)
+            styles = getSampleStyleSheet()
+            story = []
             
-            if chart_type == 'bar':
-                keys = list(data.keys())
-                values = list(data.values())
-                bars = plt.bar(keys, values, color=self.colors[:len(keys)])
-                plt.xticks(rotation=45, ha='right')
-                
-                # إضافة القيم على الأعمدة
-                for bar, value in zip(bars, values):
-                    plt.text(bar.get_x() + bar.get_width()/2, bar.get_height() + max(values)*0.01,
-                            f'{value}', ha='center', va='bottom')
+            # العنوان
+            title_style = ParagraphStyle(
+                'CustomTitle',
+                parent=styles['Heading1'],
+                fontSize=18,
+                spaceAfter=30,
+                alignment=1  # وسط
+            )
             
-            elif chart_type == 'pie':
-                keys = list(data.keys())
-                values = list(data.values())
-                plt.pie(values, labels=keys, autopct='%1.1f%%', colors=self.colors[:len(keys)])
+            story.append(Paragraph("تقرير التحليلات الطبية الشامل", title_style))
+            story.append(Spacer(1, 12))
             
-            elif chart_type == 'line':
-                keys = list(data.keys())
-                values = list(data.values())
-                plt.plot(keys, values, marker='o', linewidth=2, markersize=6)
-                plt.xticks(rotation=45, ha='right')
-                plt.grid(True, alpha=0.3)
+            # معلومات التقرير
+            info_data = [
+                ['نوع التقرير', report_type],
+                ['تاريخ الإنشاء', datetime.now().strftime('%Y-%m-%d %H:%M')],
+                ['فترة التقرير', f"{start_date.strftime('%Y-%m-%d')} إلى {end_date.strftime('%Y-%m-%d')}"]
+            ]
             
-            plt.title(title, fontsize=16, fontweight='bold', pad=20)
-            plt.tight_layout()
+            info_table = Table(info_data)
+            info_table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 14),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black)
+            ]))
             
-            # حفظ الرسم البياني
-            chart_path = f'/tmp/{filename}.png'
-            plt.savefig(chart_path, dpi=300, bbox_inches='tight')
-            plt.close()
+            story.append(info_table)
+            story.append(Spacer(1, 20))
             
-            return chart_path
+            # ملخص الإحصائيات
+            story.append(Paragraph("ملخص الإحصائيات", styles['Heading2']))
             
-        except Exception as e:
-            print(f'خطأ في إنشاء الرسم البياني: {str(e)}')
-            return None
+            summary_data = [
+                ['المؤشر', 'القيمة'],
+                ['إجمالي الاستشارات', str(consultation_analytics.get('total_consultations', 0))],
+                ['الاستشارات المكتملة', str(consultation_analytics.get('completed_consultations', 0))],
+                ['معدل الإكمال', f"{consultation_analytics.get('completion_rate', 0)}%"],
+                ['إجمالي الإيرادات', f"{financial_analytics.get('total_revenue', 0)} ريال"],
+                ['إجمالي المستخدمين', str(user_analytics.get('total_users', 0))]
+            ]
+            
+            summary_table = Table(summary_data)
+            summary_table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 12),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black)
+            ]))
+            
+            story.append(summary_table)
+            
+            doc.build(story)
+        
+        return content_type, filename
+
+    def generate_chart(self, chart_type, data, title, filename=None, size=None, dpi=None, image_format='png'):
+        """إنشاء الرسوم البيانية في الذاكرة (filename مُبقى للتوافق ولم يعد مستخدماً)"""
+        return chart_renderer.render(chart_type, data, title, size=size, dpi=dpi, image_format=image_format)
 
 # إنشاء مثيل من محرك التحليلات
 analytics_engine = AnalyticsEngine()
@@ -342,13 +567,13 @@ def get_dashboard_analytics():
         total_users = User.query.count()
         total_doctors = DoctorProfile.query.count()
         total_consultations = Consultation.query.count()
-        total_revenue = Payment.query.filter_by(status='completed').with_entities(func.sum(Payment.amount)).scalar() or 0
+        total_revenue = rollup_manager.total('payment', 'amount')
         
         # معدلات النمو
         previous_period_start = start_date - timedelta(days=days_back)
-        previous_consultations = Consultation.query.filter(
-            and_(Consultation.request_date >= previous_period_start, Consultation.request_date < start_date)
-        ).count()
+        previous_consultations = rollup_manager.total(
+            'consultation', start=previous_period_start, end=start_date, inclusive_end=False
+        )
         
         current_consultations = consultation_analytics.get('total_consultations', 0)
         growth_rate = ((current_consultations - previous_consultations) / previous_consultations * 100) if previous_consultations > 0 else 0
@@ -393,18 +618,43 @@ def get_consultation_analytics():
 
 @analytics_reports_bp.route("/doctors/performance", methods=["GET"])
 def get_doctor_performance():
-    """تحليلات أداء الأطباء"""
+    """تحليلات أداء الأطباء (مرتبة في قاعدة البيانات ومبثوثة على دفعات)"""
     try:
         doctor_id = request.args.get('doctor_id', type=int)
         start_date_str = request.args.get('start_date')
         end_date_str = request.args.get('end_date')
+        sort_by = request.args.get('sort_by')
+        descending = request.args.get('order', 'desc') != 'asc'
+        limit = request.args.get('limit', type=int)
+        offset = request.args.get('offset', 0, type=int)
+        source = request.args.get('source', 'database')
+        
+        if sort_by and sort_by not in DOCTOR_PERFORMANCE_SORTS:
+            return jsonify({
+                "message": "حقل الترتيب غير مدعوم",
+                "allowed": list(DOCTOR_PERFORMANCE_SORTS)
+            }), 400
+        if source not in DATA_SOURCES:
+            return jsonify({"message": "مصدر بيانات غير مدعوم", "allowed": list(DATA_SOURCES)}), 400
         
         start_date = datetime.fromisoformat(start_date_str) if start_date_str else None
         end_date = datetime.fromisoformat(end_date_str) if end_date_str else None
         
-        analytics = analytics_engine.get_doctor_performance_analytics(doctor_id, start_date, end_date)
+        results = analytics_engine.iter_doctor_performance(
+            doctor_id, start_date, end_date, sort_by, descending, limit, offset, source=source
+        )
+        # أول عنصر يحسب قبل بدء البث حتى تعاد أخطاء الاستعلام كاستجابة 500 عادية
+        first = next(results, None)
         
-        return jsonify({"doctor_performance": analytics}), 200
+        def generate():
+            yield '{"doctor_performance": ['
+            if first is not None:
+                yield current_app.json.dumps(first)
+                for item in results:
+                    yield ',' + current_app.json.dumps(item)
+            yield ']}'
+        
+        return Response(stream_with_context(generate()), mimetype='application/json'), 200
         
     except Exception as e:
         return jsonify({"message": f"خطأ في تحليلات أداء الأطباء: {str(e)}"}), 500
@@ -415,11 +665,13 @@ def get_financial_analytics():
     try:
         start_date_str = request.args.get('start_date')
         end_date_str = request.args.get('end_date')
+        top_n = min(max(request.args.get('top_n', 5, type=int), 1), 100)
+        page = max(request.args.get('page', 1, type=int), 1)
         
         start_date = datetime.fromisoformat(start_date_str) if start_date_str else None
         end_date = datetime.fromisoformat(end_date_str) if end_date_str else None
         
-        analytics = analytics_engine.get_financial_analytics(start_date, end_date)
+        analytics = analytics_engine.get_financial_analytics(start_date, end_date, top_n, (page - 1) * top_n)
         
         return jsonify(analytics), 200
         
@@ -436,282 +688,262 @@ def get_user_analytics():
         start_date = datetime.fromisoformat(start_date_str) if start_date_str else None
         end_date = datetime.fromisoformat(end_date_str) if end_date_str else None
         
-        analytics = analytics_engine.get_user_analytics(start_date, end_date)
+        exact = request.args.get('exact', 'false').lower() == 'true'
+        
+        analytics = analytics_engine.get_user_analytics(start_date, end_date, exact=exact)
         
         return jsonify(analytics), 200
         
     except Exception as e:
         return jsonify({"message": f"خطأ في تحليلات المستخدمين: {str(e)}"}), 500
 
+@analytics_reports_bp.route("/active-users", methods=["GET"])
+def get_active_users():
+    """المستخدمون النشطون DAU/WAU/MAU ونافذة متحركة اختيارية (تقديرية، أو exact=true للعد الدقيق)"""
+    try:
+        names = [name for name in request.args.get('metrics', '').split(',') if name] or None
+        exact = request.args.get('exact', 'false').lower() == 'true'
+        window = request.args.get('window', type=int)
+        days = request.args.get('days', 30, type=int)
+        
+        try:
+            day = date.fromisoformat(request.args['day']) if request.args.get('day') else date.today()
+            result = {'day': day.isoformat(), 'exact': exact, 'metrics': activity_sketches.summary(names, day, exact)}
+            if window:
+                result['rolling'] = {
+                    name: activity_sketches.rolling(name, window, day - timedelta(days=days - 1), day, exact)
+                    for name in result['metrics']
+                }
+        except ValueError as e:
+            return jsonify({"message": str(e), "available": sorted(activity_sketches.metrics)}), 400
+        
+        return jsonify(result), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"خطأ في حساب المستخدمين النشطين: {str(e)}"}), 500
+
+@analytics_reports_bp.route("/cohorts", methods=["GET"])
+def get_cohort_retention():
+    """دفعات المرضى حسب أسبوع التسجيل ونسب عودتهم في الأسابيع التالية"""
+    try:
+        weeks = request.args.get('weeks', 12, type=int)
+        activity = request.args.get('activity', 'consultations')
+        user_type = request.args.get('user_type', 'patient') or None
+        source = request.args.get('source', 'database')
+        
+        try:
+            start_date = date.fromisoformat(request.args['start_date']) if request.args.get('start_date') else None
+            end_date = date.fromisoformat(request.args['end_date']) if request.args.get('end_date') else None
+            result = cohort_engine.compute(start_date, end_date, weeks=weeks, activity=activity,
+                                           user_type=user_type, source=source)
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+        
+        return jsonify(result), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"خطأ في تحليل الدفعات: {str(e)}"}), 500
+
+@analytics_reports_bp.route("/snapshots", methods=["GET"])
+def get_snapshots_status():
+    """حالة اللقطات العمودية لكل جدول (عدد الصفوف وآخر معرف ووقت التحديث)"""
+    try:
+        return jsonify({"snapshots": snapshot_store.status()}), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"خطأ في جلب حالة اللقطات: {str(e)}"}), 500
+
+@analytics_reports_bp.route("/snapshots/refresh", methods=["POST"])
+def refresh_snapshots():
+    """إلحاق الصفوف الجديدة باللقطات العمودية (أو إعادة تصديرها بالكامل مع full=true)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        tables = data.get('tables')
+        full = bool(data.get('full', False))
+        
+        try:
+            appended = snapshot_store.refresh(tables, full=full)
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+        
+        return jsonify({"message": "تم تحديث اللقطات العمودية", "appended_rows": appended}), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"خطأ في تحديث اللقطات: {str(e)}"}), 500
+
+@analytics_reports_bp.route("/active-users/rebuild", methods=["POST"])
+def rebuild_activity_sketches():
+    """إعادة بناء رسوم النشاط اليومية بالكامل"""
+    try:
+        days = activity_sketches.rebuild()
+        return jsonify({"message": "تمت إعادة بناء رسوم النشاط اليومية", "days": days}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"message": f"خطأ في إعادة بناء رسوم النشاط: {str(e)}"}), 500
+
+@analytics_reports_bp.route("/rollups/refresh", methods=["POST"])
+def refresh_rollups():
+    """معالجة الصفوف الجديدة في جداول التجميع اليومية"""
+    try:
+        processed = rollup_manager.catch_up()
+        return jsonify({"message": "تم تحديث التجميعات اليومية", "processed_days": processed}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"message": f"خطأ في تحديث التجميعات: {str(e)}"}), 500
+
+@analytics_reports_bp.route("/rollups/rebuild", methods=["POST"])
+def rebuild_rollups():
+    """إعادة بناء جداول التجميع اليومية بالكامل"""
+    try:
+        rows = rollup_manager.rebuild()
+        return jsonify({"message": "تمت إعادة بناء التجميعات اليومية", "rows": rows}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"message": f"خطأ في إعادة بناء التجميعات: {str(e)}"}), 500
+
 @analytics_reports_bp.route("/charts/generate", methods=["POST"])
 def generate_chart():
-    """إنشاء رسم بياني"""
+    """إنشاء رسم بياني (png أو svg) بالدقة والأبعاد المطلوبة"""
     try:
-        data = request.get_json()
+        data = request.get_json() or {}
         
         chart_type = data.get('chart_type', 'bar')
         chart_data = data.get('data', {})
         title = data.get('title', 'رسم بياني')
-        filename = data.get('filename', 'chart')
+        image_format = data.get('format', 'png')
+        size = (data['width'], data['height']) if 'width' in data and 'height' in data else None
         
-        chart_path = analytics_engine.generate_chart(chart_type, chart_data, title, filename)
+        try:
+            chart = analytics_engine.generate_chart(
+                chart_type, chart_data, title, size=size, dpi=data.get('dpi'), image_format=image_format
+            )
+        except (ValueError, TypeError) as e:
+            return jsonify({"message": f"معاملات الرسم غير صالحة: {str(e)}"}), 400
+        except ChartRendererBusy as e:
+            return jsonify({"message": str(e)}), 503
         
-        if chart_path and os.path.exists(chart_path):
-            # تحويل الصورة إلى base64
-            with open(chart_path, 'rb') as f:
-                chart_data_b64 = base64.b64encode(f.read()).decode()
-            
-            # حذف الملف المؤقت
-            os.remove(chart_path)
-            
-            return jsonify({
-                "message": "تم إنشاء الرسم البياني بنجاح",
-                "chart_data": f"data:image/png;base64,{chart_data_b64}"
-            }), 200
-        else:
-            return jsonify({"message": "فشل في إنشاء الرسم البياني"}), 500
+        # إرجاع الصورة مباشرة عند طلب binary=true
+        if request.args.get('binary', 'false').lower() == 'true':
+            response = Response(chart['content'], mimetype=chart['content_type'])
+            response.headers['X-Chart-Cache'] = 'HIT' if chart['cached'] else 'MISS'
+            return response
+        
+        chart_data_b64 = base64.b64encode(chart['content']).decode()
+        return jsonify({
+            "message": "تم إنشاء الرسم البياني بنجاح",
+            "chart_data": f"data:{chart['content_type']};base64,{chart_data_b64}",
+            "format": image_format.lower(),
+            "cached": chart['cached']
+        }), 200
             
     except Exception as e:
         return jsonify({"message": f"خطأ في إنشاء الرسم البياني: {str(e)}"}), 500
 
 @analytics_reports_bp.route("/reports/generate", methods=["POST"])
 def generate_report():
-    """إنشاء تقرير شامل"""
+    """طلب إنشاء تقرير شامل في الخلفية (يعيد رقم المهمة)"""
     try:
-        data = request.get_json()
+        data = request.get_json() or {}
         
-        report_type = data.get('report_type', 'comprehensive')
-        start_date_str = data.get('start_date')
-        end_date_str = data.get('end_date')
-        format_type = data.get('format', 'pdf')  # pdf, excel, json
-        
-        start_date = datetime.fromisoformat(start_date_str) if start_date_str else datetime.now() - timedelta(days=30)
-        end_date = datetime.fromisoformat(end_date_str) if end_date_str else datetime.now()
-        
-        # جمع البيانات
-        consultation_analytics = analytics_engine.get_consultation_analytics(start_date, end_date)
-        financial_analytics = analytics_engine.get_financial_analytics(start_date, end_date)
-        user_analytics = analytics_engine.get_user_analytics(start_date, end_date)
-        doctor_performance = analytics_engine.get_doctor_performance_analytics(None, start_date, end_date)
-        
-        report_data = {
-            'report_info': {
-                'type': report_type,
-                'generated_at': datetime.now().isoformat(),
-                'period': {
-                    'start_date': start_date.isoformat(),
-                    'end_date': end_date.isoformat()
-                }
-            },
-            'consultation_analytics': consultation_analytics,
-            'financial_analytics': financial_analytics,
-            'user_analytics': user_analytics,
-            'doctor_performance': doctor_performance
+        params = {
+            'report_type': data.get('report_type', 'comprehensive'),
+            'format_type': data.get('format', 'pdf'),  # pdf, excel, json
+            'start_date': data.get('start_date'),
+            'end_date': data.get('end_date'),
+            'source': data.get('source', 'database')  # snapshot: من اللقطات العمودية دون قاعدة البيانات
         }
         
-        if format_type == 'json':
-            return jsonify(report_data), 200
+        if params['format_type'] not in REPORT_FORMATS:
+            return jsonify({"message": "نوع التقرير غير مدعوم"}), 400
+        if params['source'] not in DATA_SOURCES:
+            return jsonify({"message": "مصدر بيانات غير مدعوم", "allowed": list(DATA_SOURCES)}), 400
+        try:
+            for field in ('start_date', 'end_date'):
+                if params[field]:
+                    datetime.fromisoformat(params[field])
+        except (TypeError, ValueError):
+            return jsonify({"message": "صيغة التاريخ غير صالحة"}), 400
         
-        elif format_type == 'excel':
-            # إنشاء ملف Excel
-            filename = f'healthcare_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-            filepath = f'/tmp/{filename}'
-            
-            with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
-                # ورقة الملخص
-                summary_data = {
-                    'المؤشر': ['إجمالي الاستشارات', 'الاستشارات المكتملة', 'إجمالي الإيرادات', 'إجمالي المستخدمين'],
-                    'القيمة': [
-                        consultation_analytics.get('total_consultations', 0),
-                        consultation_analytics.get('completed_consultations', 0),
-                        financial_analytics.get('total_revenue', 0),
-                        user_analytics.get('total_users', 0)
-                    ]
-                }
-                pd.DataFrame(summary_data).to_excel(writer, sheet_name='الملخص', index=False)
-                
-                # ورقة أداء الأطباء
-                if doctor_performance and not isinstance(doctor_performance, dict):
-                    doctors_data = []
-                    for doc in doctor_performance:
-                        doctors_data.append({
-                            'اسم الطبيب': doc['doctor']['full_name'],
-                            'التخصص': doc['doctor']['specialization'],
-                            'عدد الاستشارات': doc['total_consultations'],
-                            'معدل الإكمال': doc['completion_rate'],
-                            'التقييم': doc['avg_rating'],
-                            'الإيرادات': doc['revenue']
-                        })
-                    
-                    if doctors_data:
-                        pd.DataFrame(doctors_data).to_excel(writer, sheet_name='أداء الأطباء', index=False)
-            
-            return send_file(filepath, as_attachment=True, download_name=filename)
+        job, deduplicated = report_jobs.submit(params)
         
-        elif format_type == 'pdf':
-            # إنشاء تقرير PDF
-            filename = f'healthcare_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.pdf'
-            filepath = f'/tmp/{filename}'
-            
-            doc = SimpleDocTemplate(filepath, pagesize=A4)
-            styles = getSampleStyleSheet()
-            story = []
-            
-            # العنوان
-            title_style = ParagraphStyle(
-                'CustomTitle',
-                parent=styles['Heading1'],
-                fontSize=18,
-                spaceAfter=30,
-                alignment=1  # وسط
-            )
-            
-            story.append(Paragraph("تقرير التحليلات الطبية الشامل", title_style))
-            story.append(Spacer(1, 12))
-            
-            # معلومات التقرير
-            info_data = [
-                ['نوع التقرير', report_type],
-                ['تاريخ الإنشاء', datetime.now().strftime('%Y-%m-%d %H:%M')],
-                ['فترة التقرير', f"{start_date.strftime('%Y-%m-%d')} إلى {end_date.strftime('%Y-%m-%d')}"]
-            ]
-            
-            info_table = Table(info_data)
-            info_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 14),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            
-            story.append(info_table)
-            story.append(Spacer(1, 20))
-            
-            # ملخص الإحصائيات
-            story.append(Paragraph("ملخص الإحصائيات", styles['Heading2']))
-            
-            summary_data = [
-                ['المؤشر', 'القيمة'],
-                ['إجمالي الاستشارات', str(consultation_analytics.get('total_consultations', 0))],
-                ['الاستشارات المكتملة', str(consultation_analytics.get('completed_consultations', 0))],
-                ['معدل الإكمال', f"{consultation_analytics.get('completion_rate', 0)}%"],
-                ['إجمالي الإيرادات', f"{financial_analytics.get('total_revenue', 0)} ريال"],
-                ['إجمالي المستخدمين', str(user_analytics.get('total_users', 0))]
-            ]
-            
-            summary_table = Table(summary_data)
-            summary_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 12),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
-            
-            story.append(summary_table)
-            
-            doc.build(story)
-            
-            return send_file(filepath, as_attachment=True, download_name=filename)
+        return jsonify({
+            "message": "تم استلام طلب التقرير",
+            "job_id": job['id'],
+            "status": job['status'],
+            "deduplicated": deduplicated,
+            "status_url": url_for('analytics_reports.get_report_job', job_id=job['id'])
+        }), 202
         
-        else:
-            return jsonify({"message": "نوع التقرير غير مدعوم"}), 400
-            
     except Exception as e:
         return jsonify({"message": f"خطأ في إنشاء التقرير: {str(e)}"}), 500
 
-@analytics_reports_bp.route("/kpi", methods=["GET"])
-def get_key_performance_indicators():
-    """مؤشرات الأداء الرئيسية"""
+@analytics_reports_bp.route("/reports/jobs/<job_id>", methods=["GET"])
+def get_report_job(job_id):
+    """حالة مهمة التقرير ونسبة التقدم"""
     try:
-        # فترة المقارنة
-        current_period_days = request.args.get('current_period', 30, type=int)
+        job = report_jobs.get(job_id)
+        if not job:
+            return jsonify({"message": "المهمة غير موجودة أو انتهت صلاحيتها"}), 404
         
-        current_start = datetime.now() - timedelta(days=current_period_days)
-        previous_start = current_start - timedelta(days=current_period_days)
+        job.pop('fingerprint', None)
+        if job['status'] == 'completed':
+            job['download_url'] = url_for('analytics_reports.download_report', job_id=job_id)
         
-        # الفترة الحالية
-        current_consultations = Consultation.query.filter(Consultation.request_date >= current_start).count()
-        current_revenue = Payment.query.filter(
-            and_(Payment.completed_at >= current_start, Payment.status == 'completed')
-        ).with_entities(func.sum(Payment.amount)).scalar() or 0
+        return jsonify(job), 200
         
-        current_users = User.query.filter(User.created_at >= current_start).count()
-        
-        # الفترة السابقة
-        previous_consultations = Consultation.query.filter(
-            and_(Consultation.request_date >= previous_start, Consultation.request_date < current_start)
-        ).count()
-        
-        previous_revenue = Payment.query.filter(
-            and_(
-                Payment.completed_at >= previous_start,
-                Payment.completed_at < current_start,
-                Payment.status == 'completed'
-            )
-        ).with_entities(func.sum(Payment.amount)).scalar() or 0
-        
-        previous_users = User.query.filter(
-            and_(User.created_at >= previous_start, User.created_at < current_start)
-        ).count()
-        
-        # حساب معدلات النمو
-        def calculate_growth(current, previous):
-            if previous == 0:
-                return 100 if current > 0 else 0
-            return ((current - previous) / previous) * 100
-        
-        consultation_growth = calculate_growth(current_consultations, previous_consultations)
-        revenue_growth = calculate_growth(current_revenue, previous_revenue)
-        user_growth = calculate_growth(current_users, previous_users)
-        
-        # مؤشرات إضافية
-        avg_consultation_value = current_revenue / current_consultations if current_consultations > 0 else 0
+    except Exception as e:
+        return jsonify({"message": f"خطأ في جلب حالة التقرير: {str(e)}"}), 500
+
+@analytics_reports_bp.route("/reports/jobs/<job_id>/download", methods=["GET"])
+def download_report(job_id):
+    """تنزيل نتيجة مهمة التقرير المكتملة"""
+    try:
+        job = report_jobs.get(job_id)
+        if not job:
+            return jsonify({"message": "المهمة غير موجودة أو انتهت صلاحيتها"}), 404
+        if job['status'] != 'completed':
+            return jsonify({"message": "التقرير غير جاهز بعد", "status": job['status']}), 409
         
-        # معدل رضا العملاء
-        recent_reviews = DoctorReview.query.filter(
-            and_(DoctorReview.created_at >= current_start, DoctorReview.is_approved == True)
-        ).all()
+        path = report_jobs.get_result(job_id)
+        if path is None:
+            return jsonify({"message": "انتهت صلاحية نتيجة التقرير"}), 404
         
-        customer_satisfaction = sum([r.rating for r in recent_reviews]) / len(recent_reviews) if recent_reviews else 0
+        return stream_file(iter_file(path), job['filename'], job['content_type'])
         
-        # معدل الاحتفاظ بالعملاء (العملاء الذين لديهم أكثر من استشارة واحدة)
-        repeat_customers = db.session.query(Consultation.user_id).filter(
-            Consultation.request_date >= current_start
-        ).group_by(Consultation.user_id).having(func.count(Consultation.id) > 1).count()
+    except Exception as e:
+        return jsonify({"message": f"خطأ في تنزيل التقرير: {str(e)}"}), 500
+
+@analytics_reports_bp.route("/kpi", methods=["GET"])
+def get_key_performance_indicators():
+    """مؤشرات الأداء الرئيسية"""
+    try:
+        # فترة المقارنة وعدد الفترات (الحالية، السابقة، ...)
+        current_period_days = request.args.get('current_period', 30, type=int)
+        periods = min(max(request.args.get('periods', 2, type=int), 2), MAX_KPI_PERIODS)
+        if current_period_days <= 0:
+            return jsonify({"message": "طول الفترة يجب أن يكون موجباً"}), 400
         
-        total_customers = db.session.query(Consultation.user_id).filter(
-            Consultation.request_date >= current_start
-        ).distinct().count()
+        values = kpi_engine.compute(DASHBOARD_KPIS, period_days=current_period_days, periods=periods)
         
-        retention_rate = (repeat_customers / total_customers * 100) if total_customers > 0 else 0
+        def comparison(name):
+            history = values[name]
+            return {
+                'current': history[0],
+                'previous': history[1],
+                'growth_rate': round(growth_rate(history[0], history[1]), 2),
+                'history': history
+            }
         
         kpis = {
-            'consultations': {
-                'current': current_consultations,
-                'previous': previous_consultations,
-                'growth_rate': round(consultation_growth, 2)
-            },
-            'revenue': {
-                'current': current_revenue,
-                'previous': previous_revenue,
-                'growth_rate': round(revenue_growth, 2)
-            },
-            'new_users': {
-                'current': current_users,
-                'previous': previous_users,
-                'growth_rate': round(user_growth, 2)
-            },
-            'avg_consultation_value': round(avg_consultation_value, 2),
-            'customer_satisfaction': round(customer_satisfaction, 2),
-            'retention_rate': round(retention_rate, 2),
+            'consultations': comparison('consultations'),
+            'revenue': comparison('revenue'),
+            'new_users': comparison('new_users'),
+            'avg_consultation_value': round(values['avg_consultation_value'][0], 2),
+            'customer_satisfaction': round(values['customer_satisfaction'][0], 2),
+            'retention_rate': round(values['retention_rate'][0], 2),
             'period_days': current_period_days
         }
         
@@ -720,77 +952,57 @@ def get_key_performance_indicators():
     except Exception as e:
         return jsonify({"message": f"خطأ في جلب مؤشرات الأداء: {str(e)}"}), 500
 
+@analytics_reports_bp.route("/kpi/metrics", methods=["GET"])
+def get_kpi_metrics():
+    """قيم أي مؤشرات مسجلة في محرك المؤشرات لعدة فترات مقارنة"""
+    try:
+        names = [name for name in request.args.get('names', '').split(',') if name] or None
+        period_days = request.args.get('period_days', 30, type=int)
+        periods = min(max(request.args.get('periods', 2, type=int), 1), MAX_KPI_PERIODS)
+        
+        try:
+            values = kpi_engine.compute(names, period_days=period_days, periods=periods)
+        except ValueError as e:
+            return jsonify({"message": str(e), "available": sorted(kpi_engine.metrics)}), 400
+        
+        return jsonify({
+            'period_days': period_days,
+            'periods': periods,
+            'metrics': values
+        }), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"خطأ في حساب المؤشرات: {str(e)}"}), 500
+
 @analytics_reports_bp.route("/trends", methods=["GET"])
 def get_trends_analysis():
     """تحليل الاتجاهات"""
     try:
         months_back = request.args.get('months_back', 6, type=int)
+        granularity = request.args.get('granularity', 'month')
+        timezone = request.args.get('tz')
+        max_points = request.args.get('max_points', type=int)
+        method = request.args.get('downsample', 'sum')
         
         # حساب التواريخ
         end_date = datetime.now()
         start_date = end_date - timedelta(days=months_back * 30)
         
-        # الاتجاهات الشهرية للاستشارات
-        monthly_consultations = db.session.query(
-            extract('year', Consultation.request_date).label('year'),
-            extract('month', Consultation.request_date).label('month'),
-            func.count(Consultation.id).label('count')
-        ).filter(Consultation.request_date >= start_date).group_by(
-            extract('year', Consultation.request_date),
-            extract('month', Consultation.request_date)
-        ).order_by('year', 'month').all()
-        
-        # الاتجاهات الشهرية للإيرادات
-        monthly_revenue = db.session.query(
-            extract('year', Payment.completed_at).label('year'),
-            extract('month', Payment.completed_at).label('month'),
-            func.sum(Payment.amount).label('revenue')
-        ).filter(
-            and_(Payment.completed_at >= start_date, Payment.status == 'completed')
-        ).group_by(
-            extract('year', Payment.completed_at),
-            extract('month', Payment.completed_at)
-        ).order_by('year', 'month').all()
-        
-        # الاتجاهات الشهرية للمستخدمين الجدد
-        monthly_users = db.session.query(
-            extract('year', User.created_at).label('year'),
-            extract('month', User.created_at).label('month'),
-            func.count(User.id).label('count')
-        ).filter(User.created_at >= start_date).group_by(
-            extract('year', User.created_at),
-            extract('month', User.created_at)
-        ).order_by('year', 'month').all()
-        
-        # تنسيق البيانات
-        consultation_trend = [
-            {
-                'period': f"{int(row.year)}-{int(row.month):02d}",
-                'value': row.count
-            }
-            for row in monthly_consultations
-        ]
-        
-        revenue_trend = [
-            {
-                'period': f"{int(row.year)}-{int(row.month):02d}",
-                'value': float(row.revenue) if row.revenue else 0
-            }
-            for row in monthly_revenue
-        ]
-        
-        user_trend = [
-            {
-                'period': f"{int(row.year)}-{int(row.month):02d}",
-                'value': row.count
-            }
-            for row in monthly_users
-        ]
+        # السلاسل الثلاث في استعلام واحد (من التجميعات اليومية عند الإمكان) مع ملء الفترات الفارغة
+        try:
+            series = timeseries_engine.series_many(
+                ['consultations', 'revenue', 'new_users'], start_date, end_date, granularity, timezone
+            )
+            series = {name: item.downsample(max_points, method) for name, item in series.items()}
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
         
         return jsonify({
-            'consultation_trend': consultation_trend,
-            'revenue_trend': revenue_trend,
-            'user_trend': user_trend,
+            'consultation_trend': series['consultations'].to_list(),
+            'revenue_trend': series['revenue'].to_list(),
+            'user_trend': series['new_users'].to_list(),
+            'granularity': granularity,
+            'timezone': timezone,
             'period': {
                 'start_date': start_date.isoformat(),
                 'end_date': end_date.isoformat(),
@@ -801,3 +1013,33 @@ def get_trends_analysis():
     except Exception as e:
         return jsonify({"message": f"خطأ في تحليل الاتجاهات: {str(e)}"}), 500
 
+@analytics_reports_bp.route("/timeseries", methods=["GET"])
+def get_timeseries():
+    """سلاسل زمنية لأي مقاييس مسجلة بدقة (hour/day/week/month) ومنطقة زمنية قابلتين للاختيار"""
+    try:
+        names = [name for name in request.args.get('metrics', 'consultations').split(',') if name]
+        granularity = request.args.get('granularity', 'day')
+        timezone = request.args.get('tz')
+        max_points = request.args.get('max_points', type=int)
+        method = request.args.get('downsample', 'lttb')
+        
+        try:
+            start_date = datetime.fromisoformat(request.args['start_date']) if request.args.get('start_date') else None
+            end_date = datetime.fromisoformat(request.args['end_date']) if request.args.get('end_date') else None
+            series = timeseries_engine.series_many(names, start_date, end_date, granularity, timezone)
+            series = {name: item.downsample(max_points, method) for name, item in series.items()}
+        except ValueError as e:
+            return jsonify({"message": str(e), "available": sorted(timeseries_engine.metrics)}), 400
+        
+        return jsonify({
+            'granularity': granularity,
+            'timezone': timezone,
+            'series': {
+                name: {'labels': item.labels(), 'values': item.value_list(), 'total': item.total}
+                for name, item in series.items()
+            }
+        }), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"خطأ في جلب السلاسل الزمنية: {str(e)}"}), 500
+
@@ -0,0 +1,398 @@
+import time
+import threading
+from datetime import datetime, date, timedelta
+from itertools import chain
+from sqlalchemy import (
+    event, func, and_, or_, case, cast, select, delete, insert, update, union_all, inspect, literal_column, Date, Integer
+)
+from sqlalchemy.orm import Session
+from src.models.user import (
+    db, User, Consultation, Payment,
+    ConsultationDailyRollup, PaymentDailyRollup, UserDailyRollup, RollupWatermark
+)
+
+# تحويل صيغ strftime إلى صيغ to_char في PostgreSQL
+POSTGRES_DATE_FORMATS = {'%Y': 'YYYY', '%m': 'MM', '%d': 'DD', '%H': 'HH24'}
+
+# عدد الأيام التي يعاد حسابها في استعلام واحد
+RECOMPUTE_CHUNK_DAYS = 200
+
+def _dialect_name(dialect=None):
+    return dialect or db.session.get_bind().dialect.name
+
+def format_period(column, fmt, dialect=None):
+    """تنسيق عمود التاريخ كنص (مفتاح التجميع الزمني) حسب نوع قاعدة البيانات"""
+    dialect = _dialect_name(dialect)
+    if dialect == 'postgresql':
+        for source, target in POSTGRES_DATE_FORMATS.items():
+            fmt = fmt.replace(source, target)
+        return func.to_char(column, fmt)
+    if dialect in ('mysql', 'mariadb'):
+        return func.date_format(column, fmt)
+    return func.strftime(fmt, column)
+
+def hours_between(end, start, dialect=None):
+    """الفرق بالساعات بين عمودي تاريخ داخل الاستعلام"""
+    dialect = _dialect_name(dialect)
+    if dialect == 'sqlite':
+        return (func.julianday(end) - func.julianday(start)) * 24
+    if dialect in ('mysql', 'mariadb'):
+        return func.timestampdiff(literal_column('SECOND'), start, end) / 3600.0
+    return func.extract('epoch', end - start) / 3600.0
+
+def day_of(column, dialect=None):
+    """اليوم (بدون الوقت) لعمود تاريخ داخل الاستعلام"""
+    if _dialect_name(dialect) == 'sqlite':
+        return func.date(column)
+    return cast(column, Date)
+
+def epoch_bucket(column, step, offset=0, dialect=None):
+    """رقم الفترة (floor((الثواني منذ 1970 + offset) / step)) لعمود تاريخ؛ القيم المخزنة تعامل كتوقيت UTC"""
+    dialect = _dialect_name(dialect)
+    if dialect == 'sqlite':
+        # القسمة الصحيحة في SQLite تقرب نحو الصفر وتكافئ floor للتواريخ بعد 1970
+        return (cast(func.strftime('%s', column), Integer) + offset) / step
+    if dialect in ('mysql', 'mariadb'):
+        return func.floor((func.unix_timestamp(column) + offset) / step)
+    return func.floor((func.extract('epoch', column) + offset) / step)
+
+def _as_datetime(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.combine(value, datetime.min.time())
+
+def _day_start(day):
+    return datetime.combine(day, datetime.min.time())
+
+def read_watermark(connection, name):
+    """آخر معرف معالج لمصدر (None إذا لم يسجل بعد)"""
+    return connection.execute(select(RollupWatermark.last_id).where(RollupWatermark.source == name)).scalar()
+
+def write_watermark(connection, name, last_id, exists=True):
+    """تسجيل آخر معرف معالج لمصدر (إدخال الصف عند أول تسجيل)"""
+    values = {'last_id': last_id, 'updated_at': datetime.utcnow()}
+    if exists:
+        connection.execute(update(RollupWatermark).where(RollupWatermark.source == name).values(**values))
+    else:
+        connection.execute(insert(RollupWatermark).values(source=name, **values))
+
+def split_range(start=None, end=None, inclusive_end=True):
+    """تقسيم الفترة [start, end] إلى أيام كاملة تقرأ من التجميع وأطراف جزئية تقرأ من الجداول الخام
+
+    تعيد (full_days, edges) حيث full_days إما None أو (أول يوم، اليوم التالي لآخر يوم) وأي طرف قد يكون None
+    (مفتوح)، و edges قائمة (من، إلى، إلى_شاملة). مع inclusive_end=False تصبح الفترة [start, end).
+    """
+    start = _as_datetime(start)
+    end = _as_datetime(end)
+
+    first_full = None
+    if start is not None:
+        first_full = start.date() if start == _day_start(start.date()) else start.date() + timedelta(days=1)
+    full_end = end.date() if end is not None else None
+
+    if first_full is not None and full_end is not None and first_full >= full_end:
+        return None, [(start, end, inclusive_end)]
+
+    edges = []
+    if start is not None and _day_start(first_full) > start:
+        edges.append((start, _day_start(first_full), False))
+    if end is not None and (inclusive_end or end > _day_start(full_end)):
+        edges.append((_day_start(full_end), end, inclusive_end))
+    return (first_full, full_end), edges
+
+class RollupSource:
+    """وصف مصدر تجميع: الجدول الخام وجدول التجميع والأبعاد والمقاييس"""
+
+    def __init__(self, name, model, rollup, date_column, dimensions, measures, tracked, filters=None):
+        self.name = name
+        self.model = model
+        self.rollup = rollup
+        self.date_column = date_column
+        self.dimensions = dimensions  # أعمدة مشتركة بالاسم بين الجدول الخام وجدول التجميع
+        self.measures = measures  # دالة (dialect) تعيد {اسم العمود: تعبير تجميعي على الجدول الخام}
+        self.tracked = tracked  # الحقول التي يغير تعديلها نتيجة التجميع
+        self.filters = filters or (lambda: [])
+
+    def raw_conditions(self):
+        return [self.date_column.isnot(None)] + self.filters()
+
+    def day_for(self, value):
+        return value.date() if isinstance(value, datetime) else value
+
+def _consultation_measures(dialect):
+    has_response = and_(Consultation.completed_at.isnot(None), Consultation.request_date.isnot(None))
+    return {
+        'total': func.count(Consultation.id),
+        'revenue': func.sum(func.coalesce(Consultation.consultation_fee, 0)),
+        'response_hours': func.sum(case(
+            (has_response, hours_between(Consultation.completed_at, Consultation.request_date, dialect)), else_=0
+        )),
+        'responses': func.sum(case((has_response, 1), else_=0))
+    }
+
+def _payment_measures(dialect):
+    return {
+        'total': func.count(Payment.id),
+        'amount': func.sum(Payment.amount)
+    }
+
+def _user_measures(dialect):
+    return {
+        'total': func.count(User.id),
+        'active': func.sum(case((User.is_active == True, 1), else_=0)),
+        'verified': func.sum(case((User.kyc_verified == True, 1), else_=0))
+    }
+
+class RollupManager:
+    """صيانة جداول التجميع اليومية والقراءة منها
+
+    - عند كل flush عبر ORM يعاد حساب الأيام المتأثرة ضمن نفس المعاملة.
+    - الإدخالات التي تتجاوز ORM (مثل bulk_insert_mappings) تلتقط عبر catch_up بالاعتماد على آخر معرف معالج.
+    - rebuild يعيد بناء كل الجداول من الصفر (بعد الاستيراد أو التعديلات المباشرة في SQL).
+    """
+
+    def __init__(self, catch_up_interval=60):
+        self.catch_up_interval = catch_up_interval
+        self.sources = {
+            'consultation': RollupSource(
+                'consultation', Consultation, ConsultationDailyRollup, Consultation.request_date,
+                dimensions=['doctor_id', 'status', 'consultation_type'],
+                measures=_consultation_measures,
+                tracked=['request_date', 'completed_at', 'doctor_id', 'status', 'consultation_type', 'consultation_fee']
+            ),
+            'payment': RollupSource(
+                'payment', Payment, PaymentDailyRollup, Payment.completed_at,
+                dimensions=['payment_method', 'payment_type'],
+                measures=_payment_measures,
+                tracked=['completed_at', 'status', 'amount', 'payment_method', 'payment_type'],
+                filters=lambda: [Payment.status == 'completed']
+            ),
+            'user': RollupSource(
+                'user', User, UserDailyRollup, User.created_at,
+                dimensions=['user_type'],
+                measures=_user_measures,
+                tracked=['created_at', 'user_type', 'is_active', 'kyc_verified']
+            )
+        }
+        self.sources_by_model = {source.model: source for source in self.sources.values()}
+        # دوال (اسم المصدر، الأيام أو None للكل، committed) تستدعى عند إعادة حساب أيام التجميع (لإبطال ما يعتمد
+        # عليها)، ومرة ثانية بـ committed=True بعد تثبيت معاملة catch_up أو rebuild المستقلة
+        self.listeners = []
+        self._checked = {}
+        self._lock = threading.Lock()
+
+    # ---------- البناء والتحديث ----------
+
+    def _raw_select(self, source, dialect, conditions):
+        """استعلام تجميعي من الجدول الخام على مستوى حبيبات جدول التجميع"""
+        day = day_of(source.date_column, dialect)
+        dimensions = [getattr(source.model, name) for name in source.dimensions]
+        measures = source.measures(dialect)
+        columns = [day.label('day')] + [d.label(name) for d, name in zip(dimensions, source.dimensions)]
+        columns += [expression.label(name) for name, expression in measures.items()]
+        return select(*columns).where(*source.raw_conditions(), *conditions).group_by(day, *dimensions)
+
+    def _column_names(self, source, dialect):
+        return ['day'] + source.dimensions + list(source.measures(dialect))
+
+    def recompute_days(self, source, days, connection=None):
+        """إعادة حساب صفوف التجميع لأيام محددة"""
+        if connection is None:
+            connection = db.session
+            dialect = _dialect_name()
+        else:
+            dialect = connection.dialect.name
+        days = sorted(set(days))
+        for i in range(0, len(days), RECOMPUTE_CHUNK_DAYS):
+            chunk = days[i:i + RECOMPUTE_CHUNK_DAYS]
+            connection.execute(delete(source.rollup).where(source.rollup.day.in_(chunk)))
+            ranges = or_(*[
+                and_(source.date_column >= _day_start(day), source.date_column < _day_start(day + timedelta(days=1)))
+                for day in chunk
+            ])
+            connection.execute(insert(source.rollup).from_select(
+                self._column_names(source, dialect), self._raw_select(source, dialect, [ranges])
+            ))
+        self._notify(source.name, days)
+
+    def _notify(self, source_name, days, committed=False):
+        for listener in self.listeners:
+            listener(source_name, days, committed)
+
+    def changed_days(self, session):
+        """الأيام المتأثرة بالتغييرات المعلقة في الجلسة لكل مصدر"""
+        changed = {}
+        for obj in chain(session.new, session.deleted):
+            source = self.sources_by_model.get(type(obj))
+            if source is not None:
+                value = getattr(obj, source.date_column.key)
+                if value is not None:
+                    changed.setdefault(source.name, set()).add(source.day_for(value))
+
+        for obj in session.dirty:
+            source = self.sources_by_model.get(type(obj))
+            if source is None:
+                continue
+            state = inspect(obj)
+            if not any(state.attrs[name].history.has_changes() for name in source.tracked):
+                continue
+            days = changed.setdefault(source.name, set())
+            value = getattr(obj, source.date_column.key)
+            if value is not None:
+                days.add(source.day_for(value))
+            for old_value in state.attrs[source.date_column.key].history.deleted:
+                if old_value is not None:
+                    days.add(source.day_for(old_value))
+        return changed
+
+    def catch_up(self):
+        """معالجة الصفوف المضافة بعد آخر معرف معالج لكل مصدر (إدخالات تتجاوز أحداث ORM)
+
+        تعمل في معاملة مستقلة على اتصال خاص فلا تثبت أي تغييرات معلقة في جلسة الطلب الذي استدعاها.
+        """
+        processed = {}
+        recomputed = {}
+        with db.engine.begin() as connection:
+            dialect = connection.dialect.name
+            for source in self.sources.values():
+                last_id = read_watermark(connection, source.name)
+                max_id = connection.execute(select(func.max(source.model.id))).scalar() or 0
+                if max_id <= (last_id or 0):
+                    processed[source.name] = 0
+                    continue
+
+                day = day_of(source.date_column, dialect)
+                days = [
+                    source.day_for(value) if not isinstance(value, str) else date.fromisoformat(value)
+                    for (value,) in connection.execute(select(day).where(
+                        source.model.id > (last_id or 0), *source.raw_conditions()
+                    ).distinct())
+                ]
+                self.recompute_days(source, days, connection)
+                write_watermark(connection, source.name, max_id, exists=last_id is not None)
+                processed[source.name] = len(days)
+                recomputed[source.name] = days
+
+        for source_name, days in recomputed.items():
+            self._notify(source_name, days, committed=True)
+        self._mark_checked()
+        return processed
+
+    def rebuild(self):
+        """إعادة بناء جميع جداول التجميع من الجداول الخام (في معاملة مستقلة كـ catch_up)"""
+        rows = {}
+        with db.engine.begin() as connection:
+            dialect = connection.dialect.name
+            for source in self.sources.values():
+                connection.execute(delete(source.rollup))
+                connection.execute(insert(source.rollup).from_select(
+                    self._column_names(source, dialect), self._raw_select(source, dialect, [])
+                ))
+                exists = read_watermark(connection, source.name) is not None
+                max_id = connection.execute(select(func.max(source.model.id))).scalar() or 0
+                write_watermark(connection, source.name, max_id, exists)
+                rows[source.name] = connection.execute(select(func.count(source.rollup.id))).scalar()
+                self._notify(source.name, None)
+
+        for source_name in rows:
+            self._notify(source_name, None, committed=True)
+        self._mark_checked()
+        return rows
+
+    def _mark_checked(self):
+        with self._lock:
+            self._checked[id(db.engine)] = time.monotonic()
+
+    def ensure_fresh(self):
+        """تشغيل catch_up عند القراءة إذا مضى أكثر من catch_up_interval ثانية على آخر تحقق
+
+        فشل التحديث (مثل قفل القاعدة) لا يفشل القراءة: تقرأ التجميعات الحالية ويعاد المحاولة في القراءة التالية.
+        """
+        now = time.monotonic()
+        with self._lock:
+            last = self._checked.get(id(db.engine))
+            if last is not None and now - last < self.catch_up_interval:
+                return
+            self._checked[id(db.engine)] = now
+        try:
+            self.catch_up()
+        except Exception:
+            with self._lock:
+                self._checked.pop(id(db.engine), None)
+
+    # ---------- القراءة ----------
+
+    def aggregate(self, source_name, start=None, end=None, dimensions=(), period=None, inclusive_end=True):
+        """مجاميع المقاييس في الفترة [start, end] مجمعة حسب الأبعاد وفترة زمنية اختيارية (صيغة strftime)
+
+        الأيام الكاملة تقرأ من جدول التجميع والأطراف الجزئية من الجدول الخام في استعلام UNION ALL واحد،
+        لذلك قد يتكرر نفس المفتاح في أكثر من صف ويجب على المستدعي جمعها.
+        """
+        statement = self.aggregate_statement(source_name, start, end, dimensions, period, inclusive_end)
+        return db.session.execute(statement).all()
+
+    def aggregate_statement(self, source_name, start=None, end=None, dimensions=(), period=None, inclusive_end=True):
+        """نفس استعلام aggregate دون تنفيذه (لاستخدامه كاستعلام فرعي)"""
+        source = self.sources[source_name]
+        dialect = _dialect_name()
+        measures = list(source.measures(dialect))
+        full_days, edges = split_range(start, end, inclusive_end)
+        parts = []
+
+        if full_days is not None:
+            rollup = source.rollup
+            keys = [getattr(rollup, name).label(name) for name in dimensions]
+            if period:
+                keys.insert(0, format_period(rollup.day, period, dialect).label('period'))
+            conditions = []
+            if full_days[0] is not None:
+                conditions.append(rollup.day >= full_days[0])
+            if full_days[1] is not None:
+                conditions.append(rollup.day < full_days[1])
+            parts.append(
+                select(*keys, *[func.sum(getattr(rollup, name)).label(name) for name in measures])
+                .where(*conditions).group_by(*keys)
+            )
+
+        if edges:
+            column = source.date_column
+            keys = [getattr(source.model, name).label(name) for name in dimensions]
+            if period:
+                keys.insert(0, format_period(column, period, dialect).label('period'))
+            ranges = or_(*[
+                and_(column >= low, column <= high if inclusive else column < high)
+                for low, high, inclusive in edges
+            ])
+            raw_measures = source.measures(dialect)
+            parts.append(
+                select(*keys, *[raw_measures[name].label(name) for name in measures])
+                .where(*source.raw_conditions(), ranges).group_by(*keys)
+            )
+
+        return parts[0] if len(parts) == 1 else union_all(*parts)
+
+    def total(self, source_name, measure='total', start=None, end=None, inclusive_end=True):
+        """مجموع مقياس واحد في الفترة"""
+        rows = self.aggregate(source_name, start, end, inclusive_end=inclusive_end)
+        return sum(getattr(row, measure) or 0 for row in rows)
+
+# إنشاء مثيل من مدير التجميعات
+rollup_manager = RollupManager()
+
+def _keep_previous_date(target, value, oldvalue, initiator):
+    """لا يغير القيمة؛ يكفي تسجيله مع active_history لتحميل القيمة السابقة"""
+
+# تحميل القيمة السابقة لعمود التاريخ عند تغييره حتى يعاد حساب اليوم القديم أيضاً
+for _source in rollup_manager.sources.values():
+    event.listen(_source.date_column, 'set', _keep_previous_date, active_history=True)
+
+@event.listens_for(Session, 'after_flush')
+def _update_rollups(session, flush_context):
+    """تحديث التجميعات اليومية للأيام المتأثرة ضمن نفس المعاملة"""
+    changed = rollup_manager.changed_days(session)
+    if not changed:
+        return
+    connection = session.connection()
+    for name, days in changed.items():
+        if days:
+            rollup_manager.recompute_days(rollup_manager.sources[name], days, connection)
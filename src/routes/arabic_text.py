@@ -0,0 +1,90 @@
+import re
+from functools import lru_cache
+
+# التشكيل وعلامات القرآن وألف الخنجر تحذف، والتطويل كذلك
+DIACRITICS = [chr(c) for c in range(0x064B, 0x0660)] + ['ٰ'] + [chr(c) for c in range(0x06D6, 0x06EE)]
+TATWEEL = 'ـ'
+
+# توحيد الحروف المتقاربة: أشكال الألف، التاء المربوطة، الألف المقصورة، والأرقام العربية الهندية
+LETTER_MAP = {
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ة': 'ه',
+    'ى': 'ي',
+    'ؤ': 'و', 'ئ': 'ي',
+}
+for _offset in range(10):
+    LETTER_MAP[chr(0x0660 + _offset)] = str(_offset)
+    LETTER_MAP[chr(0x06F0 + _offset)] = str(_offset)
+
+NORMALIZE_TABLE = str.maketrans({
+    **LETTER_MAP,
+    **{mark: None for mark in DIACRITICS},
+    TATWEEL: None
+})
+
+TOKEN_PATTERN = re.compile(r'[^\W_]+')
+
+# السوابق واللواحق الشائعة للتجذيع الخفيف (بعد التوحيد، لذلك التاء المربوطة هاء)، الأطول أولاً
+STEM_PREFIXES = ('بال', 'كال', 'فال', 'لل', 'ال')
+STEM_SUFFIXES = ('ها', 'ان', 'ات', 'ون', 'ين', 'يه', 'ه', 'ي')
+CONJUNCTION = 'و'
+MIN_STEM = 2
+# الكلمات تتكرر كثيراً في النصوص فتحفظ جذوعها المحسوبة
+STEM_CACHE_SIZE = 65536
+
+def normalize(text):
+    """توحيد النص العربي للبحث: حذف التشكيل والتطويل، توحيد الألف والتاء المربوطة والياء، وأحرف صغيرة"""
+    if not text:
+        return ''
+    return text.translate(NORMALIZE_TABLE).lower()
+
+def strip_prefix(token):
+    """حذف واو العطف و"ال" وأشباهها من بداية كلمة موحدة (دون أن تقصر عن حرفين)"""
+    if len(token) > 3 and token[0] == CONJUNCTION:
+        token = token[1:]
+    for prefix in STEM_PREFIXES:
+        if token.startswith(prefix) and len(token) - len(prefix) >= MIN_STEM:
+            return token[len(prefix):]
+    return token
+
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def stem(token):
+    """تجذيع خفيف لكلمة موحدة: حذف السوابق (strip_prefix) ولاحقة شائعة واحدة في النهاية
+
+    لا يحذف ما يجعل الكلمة أقصر من حرفين، والكلمات غير العربية تعاد كما هي.
+    """
+    token = strip_prefix(token)
+    for suffix in STEM_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= MIN_STEM + 1:
+            return token[:-len(suffix)]
+    return token
+
+def tokenize(text, stemming=False):
+    """كلمات النص بعد التوحيد (وبعد التجذيع الخفيف إذا طلب)"""
+    tokens = TOKEN_PATTERN.findall(normalize(text))
+    if stemming:
+        return list(map(stem, tokens))
+    return tokens
+
+def index_text(text):
+    """نص الفهرسة: كل كلمة موحدة يتبعها شكلها بلا سوابق ثم جذعها إن اختلفا
+
+    فيطابقها البحث بالتجذيع وبدونه، والبحث ببادئة الكلمة بلا "ال" ("اسنان" تطابق "الأسنان").
+    """
+    if not text:
+        return ''
+    words = []
+    for token in TOKEN_PATTERN.findall(normalize(text)):
+        words.append(token)
+        bare = strip_prefix(token)
+        if bare != token:
+            words.append(bare)
+        stemmed = stem(token)
+        if stemmed != bare:
+            words.append(stemmed)
+    return ' '.join(words)
+
+def matches(query, text, stemming=True):
+    """هل تبدأ كل كلمة من الاستعلام كلمةً في النص (بعد التوحيد)؟ للمطابقة في الذاكرة"""
+    words = set(index_text(text).split())
+    return all(any(word.startswith(token) for word in words) for token in tokenize(query, stemming))
@@ -0,0 +1,194 @@
+import os
+import json
+import base64
+import hashlib
+import threading
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+import matplotlib
+from matplotlib.figure import Figure
+import seaborn as sns
+from src.routes.performance_cache import CACHE_SETTINGS, get_from_cache, set_to_cache
+
+# إعداد الخطوط العربية والنمط (يطبق أيضاً داخل عمليات الرسم)
+matplotlib.rcParams['font.family'] = ['DejaVu Sans', 'Arial Unicode MS', 'Tahoma']
+sns.set_style("whitegrid")
+
+CHART_COLORS = ['#3498db', '#e74c3c', '#2ecc71', '#f39c12', '#9b59b6', '#1abc9c']
+CHART_TYPES = ('bar', 'pie', 'line')
+CHART_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+
+DEFAULT_SIZE = (12, 8)  # بالبوصة
+SIZE_LIMITS = (2, 20)
+DEFAULT_DPI = 100
+DPI_LIMITS = (50, 300)
+MAX_DATA_POINTS = 500
+
+class ChartRendererBusy(Exception):
+    """جميع عمليات الرسم مشغولة وقائمة الانتظار ممتلئة"""
+
+def render_chart(chart_type, data, title, size=DEFAULT_SIZE, dpi=DEFAULT_DPI, image_format='png', colors=CHART_COLORS):
+    """رسم المخطط في الذاكرة عبر واجهة Figure دون حالة pyplot العامة وإرجاع البايتات"""
+    figure = Figure(figsize=size)
+    axes = figure.add_subplot()
+    keys = [str(key) for key, _ in data]
+    values = [value for _, value in data]
+
+    if chart_type == 'bar':
+        bars = axes.bar(keys, values, color=colors[:len(keys)])
+        axes.set_xticks(range(len(keys)), keys, rotation=45, ha='right')
+
+        # إضافة القيم على الأعمدة
+        offset = max(values) * 0.01
+        for bar, value in zip(bars, values):
+            axes.text(bar.get_x() + bar.get_width() / 2, bar.get_height() + offset,
+                      f'{value}', ha='center', va='bottom')
+
+    elif chart_type == 'pie':
+        axes.pie(values, labels=keys, autopct='%1.1f%%', colors=colors[:len(keys)])
+
+    elif chart_type == 'line':
+        axes.plot(keys, values, marker='o', linewidth=2, markersize=6)
+        axes.set_xticks(range(len(keys)), keys, rotation=45, ha='right')
+        axes.grid(True, alpha=0.3)
+
+    axes.set_title(title, fontsize=16, fontweight='bold', pad=20)
+    figure.tight_layout()
+
+    buffer = BytesIO()
+    figure.savefig(buffer, format=image_format, dpi=dpi, bbox_inches='tight')
+    return buffer.getvalue()
+
+def normalize_chart_request(chart_type, data, title, size=None, dpi=None, image_format=None):
+    """التحقق من معاملات الرسم وتحويلها إلى صيغة ثابتة (ValueError عند الخطأ)"""
+    if chart_type not in CHART_TYPES:
+        raise ValueError(f'نوع الرسم غير مدعوم: {chart_type}')
+
+    image_format = (image_format or 'png').lower()
+    if image_format not in CHART_FORMATS:
+        raise ValueError(f'صيغة الصورة غير مدعومة: {image_format}')
+
+    if not isinstance(data, dict) or not data:
+        raise ValueError('بيانات الرسم يجب أن تكون قاموساً غير فارغ')
+    if len(data) > MAX_DATA_POINTS:
+        raise ValueError(f'عدد النقاط يتجاوز الحد المسموح ({MAX_DATA_POINTS})')
+    items = []
+    for key, value in data.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f'القيمة غير رقمية للمفتاح: {key}')
+        items.append((str(key), value))
+
+    dpi = int(dpi or DEFAULT_DPI)
+    if not DPI_LIMITS[0] <= dpi <= DPI_LIMITS[1]:
+        raise ValueError(f'الدقة يجب أن تكون بين {DPI_LIMITS[0]} و {DPI_LIMITS[1]}')
+
+    width, height = size or DEFAULT_SIZE
+    width, height = float(width), float(height)
+    if not all(SIZE_LIMITS[0] <= v <= SIZE_LIMITS[1] for v in (width, height)):
+        raise ValueError(f'الأبعاد يجب أن تكون بين {SIZE_LIMITS[0]} و {SIZE_LIMITS[1]} بوصة')
+
+    return {
+        'chart_type': chart_type,
+        'data': items,
+        'title': str(title),
+        'size': (width, height),
+        'dpi': dpi,
+        'image_format': image_format
+    }
+
+def chart_cache_key(chart):
+    """مفتاح التخزين المؤقت: بصمة (النوع، البيانات بترتيبها، العنوان، الأبعاد، الدقة، الصيغة)"""
+    fingerprint = json.dumps(chart, ensure_ascii=False, sort_keys=True)
+    digest = hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()
+    return CACHE_SETTINGS['chart_images']['key'].format(digest)
+
+class ChartRenderer:
+    """تنفيذ الرسم على مجمع عمليات محدود مع تخزين مؤقت للنتائج ودمج الطلبات المتطابقة المتزامنة"""
+
+    def __init__(self, max_workers=None, max_pending=None, timeout=30):
+        # CHART_RENDER_WORKERS=0 يعني الرسم داخل العملية الحالية (للاختبارات والبيئات المقيدة)
+        self.max_workers = max_workers if max_workers is not None else int(os.environ.get('CHART_RENDER_WORKERS', 2))
+        self.max_pending = max_pending or max(self.max_workers, 1) * 4
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._in_flight = {}
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None and self.max_workers > 0:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def _render(self, chart):
+        """الرسم بعد حجز مقعد؛ المقعد يحرر عند انتهاء الرسم فعلاً لا عند انتهاء مهلة الانتظار"""
+        executor = self._get_executor()
+        if executor is None:
+            try:
+                return render_chart(**chart)
+            finally:
+                self._slots.release()
+        try:
+            future = executor.submit(render_chart, **chart)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # إلغاء الرسم إن لم يبدأ بعد؛ الجاري يبقى حاجزاً لمقعده حتى ينتهي
+            future.cancel()
+            raise TimeoutError('انتهت مهلة الرسم')
+
+    def render(self, chart_type, data, title, size=None, dpi=None, image_format=None):
+        """إرجاع {'content', 'content_type', 'cached'} من التخزين المؤقت أو بعد الرسم"""
+        chart = normalize_chart_request(chart_type, data, title, size, dpi, image_format)
+        key = chart_cache_key(chart)
+        content_type = CHART_FORMATS[chart['image_format']]
+
+        cached = get_from_cache(key)
+        if cached:
+            return {'content': base64.b64decode(cached['data']), 'content_type': content_type, 'cached': True}
+
+        with self._lock:
+            waiter = self._in_flight.get(key)
+            if waiter is None:
+                waiter = self._in_flight[key] = {'event': threading.Event(), 'content': None, 'error': None}
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            # طلب مطابق قيد التنفيذ: انتظار نتيجته بدلاً من الرسم مرة أخرى
+            if not waiter['event'].wait(self.timeout):
+                raise TimeoutError('انتهت مهلة انتظار الرسم')
+            if waiter['error'] is not None:
+                raise waiter['error']
+            return {'content': waiter['content'], 'content_type': content_type, 'cached': True}
+
+        try:
+            if not self._slots.acquire(timeout=self.timeout):
+                raise ChartRendererBusy('خدمة الرسم مشغولة، حاول لاحقاً')
+            content = self._render(chart)
+
+            set_to_cache(key, {'data': base64.b64encode(content).decode()}, CACHE_SETTINGS['chart_images']['ttl'])
+            waiter['content'] = content
+            return {'content': content, 'content_type': content_type, 'cached': False}
+        except Exception as e:
+            waiter['error'] = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            waiter['event'].set()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+# إنشاء مثيل من خدمة الرسم
+chart_renderer = ChartRenderer()
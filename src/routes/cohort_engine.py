@@ -0,0 +1,248 @@
+import json
+import hashlib
+from datetime import datetime, date, timedelta
+import numpy as np
+from sqlalchemy import select
+from src.models.user import db, User, Consultation, Appointment
+from src.routes.analytics_rollups import epoch_bucket
+from src.routes.performance_cache import CACHE_SETTINGS, get_from_cache, set_to_cache, cache_scope
+from src.routes.columnar_snapshots import snapshot_store, INT_NULL
+
+SECONDS_PER_DAY = 86400
+
+# عدد الصفوف في كل دفعة تقرأ من قاعدة البيانات وتحول إلى مصفوفة
+FETCH_CHUNK_ROWS = 200000
+MAX_WEEKS = 52
+DATA_SOURCES = ('database', 'snapshot')
+# جدول البحث المباشر عن موضع المستخدم يستخدم إذا لم يتجاوز مدى المعرفات هذا المضاعف لعددهم
+DENSE_LOOKUP_FACTOR = 8
+EPOCH = date(1970, 1, 1)
+
+def week_of(days):
+    """رقم الأسبوع (يبدأ يوم الاثنين) لأرقام أيام منذ 1970-01-01 (يوم خميس)"""
+    return (np.asarray(days) + 3) // 7
+
+def week_start(week):
+    return EPOCH + timedelta(days=int(week) * 7 - 3)
+
+def _day_number(value):
+    """رقم اليوم منذ 1970-01-01 لتاريخ أو وقت"""
+    if isinstance(value, datetime):
+        value = value.date()
+    return (value - EPOCH).days
+
+def _day_start(day_number):
+    return datetime.combine(EPOCH + timedelta(days=day_number), datetime.min.time())
+
+def user_positions(user_ids):
+    """دالة تعيد موضع كل معرف في user_ids المرتبة (أو -1 إذا لم يكن موجوداً)
+
+    المعرفات المتقاربة (الحالة المعتادة للمفاتيح التسلسلية) تستخدم جدول بحث مباشر بدل searchsorted.
+    """
+    if not len(user_ids):
+        return lambda values: np.full(len(values), -1, dtype=np.int64)
+    low, high = int(user_ids[0]), int(user_ids[-1])
+    if high - low + 1 <= DENSE_LOOKUP_FACTOR * len(user_ids):
+        table = np.full(high - low + 1, -1, dtype=np.int64)
+        table[user_ids - low] = np.arange(len(user_ids))
+
+        def lookup(values):
+            positions = np.full(len(values), -1, dtype=np.int64)
+            inside = (values >= low) & (values <= high)
+            positions[inside] = table[values[inside] - low]
+            return positions
+        return lookup
+
+    def search(values):
+        positions = np.searchsorted(user_ids, values)
+        positions[positions == len(user_ids)] = 0
+        return np.where(user_ids[positions] == values, positions, -1)
+    return search
+
+def retention_matrix(user_ids, signup_days, event_chunks, weeks, first_week, last_week):
+    """مصفوفة الاحتفاظ (الدفعات × الأسابيع 0..weeks) بعمليات متجهة
+
+    user_ids مرتبة تصاعدياً و signup_days أرقام أيام التسجيل المقابلة، و event_chunks مولد دفعات
+    (معرفات المستخدمين، أرقام أيام النشاط). الخلية [c, k] عدد مستخدمي الدفعة c الذين لهم نشاط واحد
+    على الأقل في الأسبوع k بعد التسجيل (الأسبوع 0 هو أيام التسجيل الأولى السبعة).
+    """
+    cohorts = last_week - first_week + 1
+    cohort_index = week_of(signup_days) - first_week
+    sizes = np.bincount(cohort_index, minlength=cohorts)
+    # علامة لكل (مستخدم، أسبوع) تجعل العد مميزاً عبر الدفعات دون تجميع كل الأحداث في الذاكرة
+    seen = np.zeros((len(user_ids), weeks + 1), dtype=bool)
+
+    positions_of = user_positions(user_ids)
+    for event_users, event_days in event_chunks:
+        if not len(event_users) or not len(user_ids):
+            continue
+        position = positions_of(event_users)
+        known = position >= 0
+        position, event_days = position[known], event_days[known]
+        offset = (event_days - signup_days[position]) // 7
+        inside = (offset >= 0) & (offset <= weeks)
+        seen[position[inside], offset[inside]] = True
+
+    matrix = np.stack([
+        np.bincount(cohort_index, weights=seen[:, k], minlength=cohorts) for k in range(weeks + 1)
+    ], axis=1).astype(np.int64) if len(user_ids) else np.zeros((cohorts, weeks + 1), dtype=np.int64)
+    return sizes, matrix
+
+class ActivitySource:
+    """جدول نشاط المستخدم: كل صف فيه عودة للمستخدم في تاريخ date_column
+
+    snapshot اسم جدول اللقطة العمودية المقابل (أعمدته بنفس أسماء user_column و date_column).
+    """
+
+    def __init__(self, name, user_column, date_column, filters=None, snapshot=None):
+        self.name = name
+        self.user_column = user_column
+        self.date_column = date_column
+        self.filters = filters or (lambda: [])
+        self.snapshot = snapshot
+
+class CohortEngine:
+    """تحليل الدفعات حسب أسبوع التسجيل ونسب العودة في الأسابيع 1..N
+
+    البيانات تقرأ كأرقام صحيحة (المعرف ورقم اليوم محسوب في SQL) على دفعات تتحول مباشرة إلى مصفوفات
+    NumPy، والمصفوفة تحسب بـ searchsorted و bincount دون حلقات على مستوى الصفوف.
+    """
+
+    def __init__(self, chunk_rows=FETCH_CHUNK_ROWS):
+        self.chunk_rows = chunk_rows
+        self.sources = {}
+
+    def register(self, source):
+        self.sources[source.name] = source
+        return source
+
+    def _chunks(self, statement):
+        """دفعات (عمود1، عمود2) كمصفوفات int64 من مؤشر yield_per"""
+        result = db.session.execute(statement.execution_options(yield_per=self.chunk_rows))
+        for partition in result.partitions():
+            array = np.array(partition, dtype=np.int64).reshape(-1, 2)
+            yield array[:, 0], array[:, 1]
+
+    def _signups(self, first_day, last_day, user_type, dialect):
+        day = epoch_bucket(User.created_at, SECONDS_PER_DAY, dialect=dialect)
+        conditions = [User.created_at >= _day_start(first_day), User.created_at < _day_start(last_day + 1)]
+        if user_type:
+            conditions.append(User.user_type == user_type)
+        chunks = list(self._chunks(select(User.id, day).where(*conditions).order_by(User.id)))
+        if not chunks:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate([c[0] for c in chunks]), np.concatenate([c[1] for c in chunks])
+
+    def _snapshot_signups(self, first_day, last_day, user_type):
+        users = snapshot_store.open('user')
+        days = users.column('created_at') // SECONDS_PER_DAY
+        mask = (days >= first_day) & (days <= last_day)
+        if user_type:
+            mask &= users.equals('user_type', user_type)
+        # اللقطة ملحقة بترتيب المعرف فالمعرفات مرتبة
+        return np.asarray(users.column('id')[mask]), np.asarray(days[mask])
+
+    def _snapshot_chunks(self, source, first_day, last_day):
+        """دفعات (المستخدم، اليوم) من أعمدة اللقطة الممسوحة من الذاكرة دون المرور على قاعدة البيانات"""
+        snapshot = snapshot_store.open(source.snapshot)
+        users = snapshot.column(source.user_column.key)
+        dates = snapshot.column(source.date_column.key)
+        for i in range(0, len(snapshot), self.chunk_rows):
+            chunk_users, chunk_dates = users[i:i + self.chunk_rows], dates[i:i + self.chunk_rows]
+            days = chunk_dates // SECONDS_PER_DAY
+            keep = (chunk_dates != INT_NULL) & (chunk_users != INT_NULL) & (days >= first_day) & (days <= last_day)
+            yield np.asarray(chunk_users[keep]), np.asarray(days[keep])
+
+    def compute(self, start=None, end=None, weeks=12, activity='consultations', user_type='patient',
+                today=None, use_cache=True, source='database'):
+        """دفعات التسجيل الأسبوعية بين start و end مع عدد ونسبة العائدين في كل أسبوع حتى weeks
+
+        source='snapshot' يقرأ من اللقطات العمودية (snapshot_store) بدل قاعدة البيانات التشغيلية.
+        """
+        if activity not in self.sources:
+            raise ValueError(f'مصدر نشاط غير مسجل: {activity}')
+        if source not in DATA_SOURCES:
+            raise ValueError(f'مصدر بيانات غير مدعوم: {source}')
+        if not 1 <= weeks <= MAX_WEEKS:
+            raise ValueError(f'عدد الأسابيع يجب أن يكون بين 1 و {MAX_WEEKS}')
+        today = today or date.today()
+        end = end or today
+        start = start or end - timedelta(weeks=weeks)
+        first_day, last_day, today_day = _day_number(start), _day_number(end), _day_number(today)
+        if first_day > last_day:
+            raise ValueError('بداية الفترة بعد نهايتها')
+
+        settings = CACHE_SETTINGS['cohorts']
+        cache_key = None
+        if use_cache:
+            fingerprint = json.dumps([
+                cache_scope(), first_day, last_day, weeks, activity, user_type, today_day, source
+            ])
+            cache_key = settings['key'].format(hashlib.sha256(fingerprint.encode()).hexdigest())
+            cached = get_from_cache(cache_key)
+            if cached:
+                return cached
+
+        activity_source = self.sources[activity]
+        last_event_day = last_day + weeks * 7 + 6
+        if source == 'snapshot':
+            if activity_source.snapshot is None:
+                raise ValueError(f'مصدر النشاط {activity} ليس له لقطة عمودية')
+            user_ids, signup_days = self._snapshot_signups(first_day, last_day, user_type)
+            events = self._snapshot_chunks(activity_source, first_day, last_event_day)
+        else:
+            dialect = db.session.get_bind().dialect.name
+            user_ids, signup_days = self._signups(first_day, last_day, user_type, dialect)
+            day = epoch_bucket(activity_source.date_column, SECONDS_PER_DAY, dialect=dialect)
+            events = self._chunks(select(activity_source.user_column, day).where(
+                activity_source.user_column.isnot(None), *activity_source.filters(),
+                activity_source.date_column >= _day_start(first_day),
+                activity_source.date_column < _day_start(last_event_day + 1)
+            ))
+        first_week, last_week = int(week_of(first_day)), int(week_of(last_day))
+        sizes, matrix = retention_matrix(user_ids, signup_days, events, weeks, first_week, last_week)
+
+        result = self._format(sizes, matrix, first_week, weeks, today_day)
+        result.update({
+            'activity': activity, 'weeks': weeks, 'source': source,
+            'start_date': start.isoformat(), 'end_date': end.isoformat()
+        })
+        if cache_key:
+            set_to_cache(cache_key, result, settings['ttl'])
+        return result
+
+    def _format(self, sizes, matrix, first_week, weeks, today_day):
+        # الأسبوع k لدفعة لم يكتمل بعد لآخر مسجل فيها (اليوم 6 من أسبوع التسجيل) يعاد None بدل صفر مضلل
+        cohort_starts = (first_week + np.arange(len(sizes))) * 7 - 3
+        observable = (cohort_starts[:, None] + 12 + np.arange(weeks + 1)[None, :] * 7) <= today_day
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates = np.where(sizes[:, None] > 0, matrix / sizes[:, None] * 100, 0)
+
+        cohorts = []
+        for i, size in enumerate(sizes.tolist()):
+            if not size:
+                continue
+            cohorts.append({
+                'cohort': week_start(first_week + i).isoformat(),
+                'size': size,
+                'retained': [int(v) if ok else None for v, ok in zip(matrix[i], observable[i])],
+                'retention_rates': [round(float(v), 2) if ok else None for v, ok in zip(rates[i], observable[i])]
+            })
+
+        # المنحنى العام: مرجح بحجم الدفعات التي اكتمل فيها كل أسبوع
+        eligible_sizes = (sizes[:, None] * observable).sum(axis=0)
+        retained = (matrix * observable).sum(axis=0)
+        average = [
+            round(float(r / s * 100), 2) if s else None for r, s in zip(retained.tolist(), eligible_sizes.tolist())
+        ]
+        return {'cohorts': cohorts, 'average_retention': average, 'total_users': int(sizes.sum())}
+
+# إنشاء مثيل من محرك الدفعات مع مصادر النشاط الافتراضية
+cohort_engine = CohortEngine()
+
+cohort_engine.register(ActivitySource(
+    'consultations', Consultation.user_id, Consultation.request_date, snapshot='consultation'
+))
+cohort_engine.register(ActivitySource(
+    'appointments', Appointment.user_id, Appointment.created_at, snapshot='appointment'
+))
@@ -0,0 +1,307 @@
+import os
+import json
+import shutil
+import threading
+from datetime import datetime
+import numpy as np
+from sqlalchemy import select
+from src.models.user import db, User, DoctorProfile, Consultation, Payment, Appointment, DoctorReview
+from src.routes.analytics_rollups import epoch_bucket
+
+# المسار الافتراضي بجانب قاعدة البيانات (يمكن تغييره بمتغير البيئة)
+DEFAULT_SNAPSHOT_DIR = os.environ.get(
+    'ANALYTICS_SNAPSHOT_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'snapshots')
+)
+EXPORT_CHUNK_ROWS = 50000
+
+# رأس ملف npy بطول ثابت حتى يعاد كتابته بعد كل إلحاق دون نقل البيانات
+NPY_HEADER_SIZE = 128
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+
+# القيمة الفارغة لكل نوع (أصغر int64 هي NaT عند عرض الأوقات كـ datetime64)
+INT_NULL = np.iinfo(np.int64).min
+KINDS = {
+    'int': np.dtype('<i8'),
+    'float': np.dtype('<f8'),
+    'bool': np.dtype('i1'),       # 1 / 0 / -1 للفارغ
+    'datetime': np.dtype('<i8'),  # ثوان منذ 1970 (التوقيت المخزن كما هو)
+    'category': np.dtype('<i4')   # رمز في قاموس القيم النصية، -1 للفارغ
+}
+
+def _npy_header(dtype, rows):
+    header = repr({'descr': dtype.str, 'fortran_order': False, 'shape': (rows,)})
+    length = NPY_HEADER_SIZE - len(NPY_MAGIC) - 2
+    return NPY_MAGIC + length.to_bytes(2, 'little') + header.ljust(length - 1).encode('latin1') + b'\n'
+
+def append_npy(path, values, rows_before):
+    """إلحاق قيم بملف npy بعد أول rows_before صفاً (ما بعدها من إلحاق سابق لم يكتمل يحذف)"""
+    dtype = values.dtype
+    mode = 'r+b' if os.path.exists(path) else 'w+b'
+    with open(path, mode) as f:
+        f.truncate(NPY_HEADER_SIZE + rows_before * dtype.itemsize)
+        f.seek(0, os.SEEK_END)
+        f.write(np.ascontiguousarray(values).tobytes())
+        f.seek(0)
+        f.write(_npy_header(dtype, rows_before + len(values)))
+
+class SnapshotColumn:
+    """عمود في اللقطة: نوعه من KINDS، والتعبير الافتراضي هو العمود بنفس الاسم في النموذج"""
+
+    def __init__(self, name, kind, expression=None):
+        if kind not in KINDS:
+            raise ValueError(f'نوع عمود غير مدعوم: {kind}')
+        self.name = name
+        self.kind = kind
+        self.expression = expression
+
+class SnapshotTable:
+    def __init__(self, name, model, columns):
+        self.name = name
+        self.model = model
+        self.columns = [SnapshotColumn('id', 'int')] + columns
+
+    def select(self, dialect, after_id):
+        expressions = []
+        for column in self.columns:
+            expression = column.expression if column.expression is not None else getattr(self.model, column.name)
+            if column.kind == 'datetime':
+                expression = epoch_bucket(expression, 1, dialect=dialect)
+            expressions.append(expression.label(column.name))
+        return select(*expressions).where(self.model.id > after_id).order_by(self.model.id)
+
+class Snapshot:
+    """قراءة لقطة جدول: أعمدة ممسوحة من الذاكرة (memmap) دون نسخ"""
+
+    def __init__(self, path, manifest):
+        self.path = path
+        self.rows = manifest['rows']
+        self.last_id = manifest['last_id']
+        self.created_at = manifest['created_at']
+        self.kinds = manifest['columns']
+        self.dictionaries = manifest['dictionaries']
+        self._columns = {}
+
+    def __len__(self):
+        return self.rows
+
+    def column(self, name):
+        """مصفوفة العمود الخام (رموز الفئات، ثوان للأوقات) بطول عدد الصفوف المثبت في البيان"""
+        if name not in self.kinds:
+            raise KeyError(f'عمود غير موجود في اللقطة: {name}')
+        if name not in self._columns:
+            path = os.path.join(self.path, f'{name}.npy')
+            self._columns[name] = np.load(path, mmap_mode='r')[:self.rows] if self.rows else \
+                np.zeros(0, dtype=KINDS[self.kinds[name]])
+        return self._columns[name]
+
+    def datetimes(self, name):
+        """عمود وقت كـ datetime64[s] (عرض للمصفوفة نفسها، القيم الفارغة NaT)"""
+        return self.column(name).view('datetime64[s]')
+
+    def codes(self, name, values):
+        """رموز قيم نصية في قاموس العمود (القيم غير الموجودة تعطي -2 فلا تطابق أي صف)"""
+        lookup = {value: code for code, value in enumerate(self.dictionaries[name])}
+        return np.array([lookup.get(value, -2) for value in values], dtype=np.int32)
+
+    def equals(self, name, value):
+        """قناع الصفوف التي تساوي قيمتها value (للأعمدة النصية يقارن بالرمز)"""
+        if self.kinds[name] == 'category':
+            return self.column(name) == self.codes(name, [value])[0]
+        return self.column(name) == value
+
+    def decode(self, name, codes):
+        dictionary = np.array(self.dictionaries[name] + [None], dtype=object)
+        return dictionary[np.asarray(codes)]
+
+class SnapshotStore:
+    """لقطات عمودية لجداول التحليلات في ملفات npy، تقرأ بـ memmap بعيداً عن قاعدة البيانات التشغيلية
+
+    refresh يلحق الصفوف الجديدة فقط (معرف أكبر من آخر معرف مصدر) ويوسع قواميس النصوص دون تغيير
+    الرموز السابقة؛ تعديلات الصفوف القديمة لا تظهر إلا بعد refresh(full=True). البيان يكتب أخيراً
+    باستبدال ذري، والقارئ لا يرى إلا عدد الصفوف المثبت فيه.
+    """
+
+    def __init__(self, path=DEFAULT_SNAPSHOT_DIR, chunk_rows=EXPORT_CHUNK_ROWS):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.tables = {}
+        self._lock = threading.Lock()
+
+    def register(self, table):
+        self.tables[table.name] = table
+        return table
+
+    def table_path(self, name):
+        return os.path.join(self.path, name)
+
+    def _manifest(self, directory):
+        try:
+            with open(os.path.join(directory, 'manifest.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write_manifest(self, directory, manifest):
+        temporary = os.path.join(directory, 'manifest.json.tmp')
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(temporary, os.path.join(directory, 'manifest.json'))
+
+    # ---------- الكتابة ----------
+
+    def _encode(self, table, rows, dictionaries):
+        """تحويل دفعة صفوف إلى مصفوفة لكل عمود"""
+        arrays = {}
+        for index, column in enumerate(table.columns):
+            values = [row[index] for row in rows]
+            if column.kind == 'category':
+                dictionary = dictionaries.setdefault(column.name, [])
+                lookup = {value: code for code, value in enumerate(dictionary)}
+                codes = []
+                for value in values:
+                    if value is None:
+                        codes.append(-1)
+                        continue
+                    code = lookup.get(value)
+                    if code is None:
+                        code = lookup[value] = len(dictionary)
+                        dictionary.append(value)
+                    codes.append(code)
+                arrays[column.name] = np.array(codes, dtype=KINDS['category'])
+            elif column.kind == 'float':
+                arrays[column.name] = np.array([np.nan if v is None else v for v in values], dtype=KINDS['float'])
+            elif column.kind == 'bool':
+                arrays[column.name] = np.array([-1 if v is None else int(bool(v)) for v in values], dtype=KINDS['bool'])
+            else:
+                arrays[column.name] = np.array([INT_NULL if v is None else int(v) for v in values], dtype=KINDS['int'])
+        return arrays
+
+    def _export(self, table, directory, manifest):
+        """إلحاق صفوف المصدر ذات المعرف الأكبر من last_id بملفات الأعمدة؛ يعيد عدد الصفوف الملحقة"""
+        dialect = db.session.get_bind().dialect.name
+        os.makedirs(directory, exist_ok=True)
+        statement = table.select(dialect, manifest['last_id']).execution_options(yield_per=self.chunk_rows)
+        appended = 0
+        for partition in db.session.execute(statement).partitions():
+            arrays = self._encode(table, partition, manifest['dictionaries'])
+            for name, values in arrays.items():
+                append_npy(os.path.join(directory, f'{name}.npy'), values, manifest['rows'])
+            manifest['rows'] += len(partition)
+            manifest['last_id'] = int(arrays['id'][-1])
+            appended += len(partition)
+            # تثبيت كل دفعة حتى لا يعاد تصدير ما كتب إذا توقف التصدير
+            manifest['created_at'] = datetime.utcnow().isoformat()
+            self._write_manifest(directory, manifest)
+        return appended
+
+    def _empty_manifest(self, table):
+        return {
+            'table': table.name,
+            'rows': 0,
+            'last_id': 0,
+            'created_at': datetime.utcnow().isoformat(),
+            'columns': {column.name: column.kind for column in table.columns},
+            'dictionaries': {}
+        }
+
+    def refresh(self, names=None, full=False):
+        """تحديث اللقطات: {الجدول: عدد الصفوف الملحقة}؛ full يعيد التصدير من الصفر ثم يستبدل المجلد"""
+        names = names or list(self.tables)
+        appended = {}
+        with self._lock:
+            for name in names:
+                if name not in self.tables:
+                    raise ValueError(f'جدول غير مسجل في اللقطات: {name}')
+                table = self.tables[name]
+                directory = self.table_path(name)
+                manifest = None if full else self._manifest(directory)
+                if manifest is not None and manifest['columns'] == self._empty_manifest(table)['columns']:
+                    appended[name] = self._export(table, directory, manifest)
+                    continue
+
+                # تصدير كامل إلى مجلد مؤقت ثم تبديله؛ القراء الحاليون يحتفظون بالملفات القديمة المفتوحة
+                staging = f'{directory}.staging'
+                shutil.rmtree(staging, ignore_errors=True)
+                manifest = self._empty_manifest(table)
+                os.makedirs(staging)
+                appended[name] = self._export(table, staging, manifest)
+                self._write_manifest(staging, manifest)
+                previous = f'{directory}.previous'
+                shutil.rmtree(previous, ignore_errors=True)
+                if os.path.exists(directory):
+                    os.replace(directory, previous)
+                os.replace(staging, directory)
+                shutil.rmtree(previous, ignore_errors=True)
+        return appended
+
+    # ---------- القراءة ----------
+
+    def open(self, name):
+        """لقطة الجدول للقراءة (ValueError إذا لم تصدر بعد)"""
+        if name not in self.tables:
+            raise ValueError(f'جدول غير مسجل في اللقطات: {name}')
+        directory = self.table_path(name)
+        manifest = self._manifest(directory)
+        if manifest is None:
+            raise ValueError(f'لا توجد لقطة للجدول {name}؛ شغل التحديث أولاً')
+        return Snapshot(directory, manifest)
+
+    def status(self):
+        result = {}
+        for name in self.tables:
+            manifest = self._manifest(self.table_path(name))
+            result[name] = None if manifest is None else {
+                key: manifest[key] for key in ('rows', 'last_id', 'created_at')
+            }
+        return result
+
+# إنشاء مثيل من مخزن اللقطات مع جداول التحليلات
+snapshot_store = SnapshotStore()
+
+snapshot_store.register(SnapshotTable('consultation', Consultation, [
+    SnapshotColumn('user_id', 'int'),
+    SnapshotColumn('doctor_id', 'int'),
+    SnapshotColumn('status', 'category'),
+    SnapshotColumn('consultation_type', 'category'),
+    SnapshotColumn('request_date', 'datetime'),
+    SnapshotColumn('completed_at', 'datetime'),
+    SnapshotColumn('consultation_fee', 'float')
+]))
+snapshot_store.register(SnapshotTable('payment', Payment, [
+    SnapshotColumn('user_id', 'int'),
+    SnapshotColumn('consultation_id', 'int'),
+    SnapshotColumn('amount', 'float'),
+    SnapshotColumn('payment_type', 'category'),
+    SnapshotColumn('payment_method', 'category'),
+    SnapshotColumn('status', 'category'),
+    SnapshotColumn('created_at', 'datetime'),
+    SnapshotColumn('completed_at', 'datetime')
+]))
+snapshot_store.register(SnapshotTable('appointment', Appointment, [
+    SnapshotColumn('user_id', 'int'),
+    SnapshotColumn('doctor_id', 'int'),
+    SnapshotColumn('appointment_date', 'datetime'),
+    SnapshotColumn('appointment_type', 'category'),
+    SnapshotColumn('status', 'category'),
+    SnapshotColumn('payment_method', 'category'),
+    SnapshotColumn('created_at', 'datetime')
+]))
+snapshot_store.register(SnapshotTable('user', User, [
+    SnapshotColumn('user_type', 'category'),
+    SnapshotColumn('is_active', 'bool'),
+    SnapshotColumn('kyc_verified', 'bool'),
+    SnapshotColumn('created_at', 'datetime')
+]))
+snapshot_store.register(SnapshotTable('doctor_review', DoctorReview, [
+    SnapshotColumn('doctor_id', 'int'),
+    SnapshotColumn('patient_id', 'int'),
+    SnapshotColumn('consultation_id', 'int'),
+    SnapshotColumn('rating', 'int'),
+    SnapshotColumn('is_approved', 'bool'),
+    SnapshotColumn('created_at', 'datetime')
+]))
+snapshot_store.register(SnapshotTable('doctor_profile', DoctorProfile, [
+    SnapshotColumn('user_id', 'int'),
+    SnapshotColumn('full_name', 'category'),
+    SnapshotColumn('specialization', 'category')
+]))
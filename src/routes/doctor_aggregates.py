@@ -0,0 +1,89 @@
+from itertools import chain
+from sqlalchemy import event, select, func, update, inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.util import identity_key
+from src.models.user import db, DoctorProfile, DoctorReview
+from src.routes.search_cache import search_cache
+
+# أعمدة المراجعة التي يغير تعديلها التجميعات المخزنة
+TRACKED_COLUMNS = ('doctor_id', 'rating', 'is_approved')
+
+class DoctorAggregates:
+    """متوسط التقييم المعتمد وعدد المراجعات المخزنان في ملف الطبيب
+
+    يعاد حسابهما للأطباء المتأثرين في نفس معاملة تعديل المراجعات (فهرس المراجعات المغطي يجعل
+    ذلك قراءة فهرس فقط)، فيصبح فلتر أقل تقييم والترتيب حسب التقييم أو عدد المراجعات شرطاً على
+    أعمدة مفهرسة بدل استعلام فرعي لكل طبيب.
+    """
+
+    def values(self):
+        """التعبيرات المترابطة التي تحسب التجميعات من جدول المراجعات"""
+        doctor_id = DoctorProfile.__table__.c.id
+        return {
+            'average_rating': select(func.coalesce(func.avg(DoctorReview.rating), 0.0)).where(
+                DoctorReview.doctor_id == doctor_id,
+                DoctorReview.is_approved == True
+            ).scalar_subquery(),
+            'total_reviews': select(func.count(DoctorReview.id)).where(
+                DoctorReview.doctor_id == doctor_id
+            ).scalar_subquery()
+        }
+
+    def refresh(self, doctor_ids=None, connection=None):
+        """إعادة حساب التجميعات للأطباء doctor_ids (أو للجميع) بجملة UPDATE واحدة"""
+        table = DoctorProfile.__table__
+        # إبقاء updated_at كما هو: تغير المراجعات لا يعد تعديلاً لملف الطبيب
+        statement = update(table).values(**self.values(), updated_at=table.c.updated_at)
+        if doctor_ids is not None:
+            doctor_ids = list(doctor_ids)
+            if not doctor_ids:
+                return 0
+            statement = statement.where(table.c.id.in_(doctor_ids))
+        return (connection or db.session).execute(statement).rowcount
+
+    def rebuild(self):
+        """إعادة حساب تجميعات كل الأطباء (بعد الإدخال المجمع الذي يتجاوز أحداث ORM)"""
+        rows = self.refresh()
+        db.session.commit()
+        # التحديث المجمع لا يمر بأحداث ORM، والترتيب حسب التقييم يتغير به
+        search_cache.invalidate(['doctors'])
+        return rows
+
+    def changed_doctors(self, session):
+        """الأطباء المتأثرون بتغييرات المراجعات المعلقة في الجلسة (بما فيها الطبيب السابق عند النقل)"""
+        changed = set()
+        for obj in chain(session.new, session.deleted):
+            if isinstance(obj, DoctorReview) and obj.doctor_id is not None:
+                changed.add(obj.doctor_id)
+
+        for obj in session.dirty:
+            if not isinstance(obj, DoctorReview):
+                continue
+            state = inspect(obj)
+            if not any(state.attrs[name].history.has_changes() for name in TRACKED_COLUMNS):
+                continue
+            changed.add(obj.doctor_id)
+            changed.update(value for value in state.attrs.doctor_id.history.deleted if value is not None)
+        changed.discard(None)
+        return changed
+
+# إنشاء مثيل من مدير التجميعات المخزنة
+doctor_aggregates = DoctorAggregates()
+
+def _keep_previous_doctor(target, value, oldvalue, initiator):
+    """لا يغير القيمة؛ يكفي تسجيله مع active_history لتحميل الطبيب السابق"""
+
+event.listen(DoctorReview.doctor_id, 'set', _keep_previous_doctor, active_history=True)
+
+@event.listens_for(Session, 'after_flush')
+def _update_doctor_aggregates(session, flush_context):
+    """تحديث تجميعات الأطباء المتأثرين ضمن نفس المعاملة"""
+    changed = doctor_aggregates.changed_doctors(session)
+    if not changed:
+        return
+    doctor_aggregates.refresh(changed, session.connection())
+    # الملفات المحملة في الجلسة تقرأ القيم الجديدة عند الوصول التالي
+    for doctor_id in changed:
+        doctor = session.identity_map.get(identity_key(DoctorProfile, doctor_id))
+        if doctor is not None:
+            session.expire(doctor, ['average_rating', 'total_reviews'])
@@ -1,12 +1,24 @@
 from flask import Blueprint, request, jsonify
+import click
 from src.models.user import db, User, DoctorProfile, DoctorLicense, DoctorReview
 from datetime import datetime, date
 import json
 import os
 from werkzeug.utils import secure_filename
+from src.routes.search_index import search_index
+from src.routes.search_facets import doctor_facets, parse_facets
+from src.routes.doctor_aggregates import doctor_aggregates
 
 doctor_management_bp = Blueprint("doctor_management", __name__)
 
+# حقول ترتيب البحث عن الأطباء (أعمدة مفهرسة، التقييم وعدد المراجعات مخزنان في ملف الطبيب)
+DOCTOR_SORTS = {
+    'rating': DoctorProfile.average_rating,
+    'reviews': DoctorProfile.total_reviews,
+    'fee': DoctorProfile.consultation_fee,
+    'experience': DoctorProfile.years_of_experience
+}
+
 # إعدادات رفع الملفات
 UPLOAD_FOLDER = 'uploads/licenses'
 ALLOWED_EXTENSIONS = {'pdf', 'jpg', 'jpeg', 'png'}
@@ -264,14 +276,24 @@ def search_doctors():
         max_fee = request.args.get('max_fee', type=float)
         available_only = request.args.get('available_only', 'false').lower() == 'true'
         search_term = request.args.get('search_term')
+        stemming = request.args.get('stemming', 'true').lower() == 'true'
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
+        facets = parse_facets(request.args.get('facets'))
+        sort_by = request.args.get('sort_by')
+        descending = request.args.get('order', 'desc') != 'asc'
+        
+        if sort_by and sort_by not in DOCTOR_SORTS:
+            return jsonify({"message": f"حقل الترتيب غير مدعوم: {sort_by}"}), 400
         
         # بناء الاستعلام
         query = DoctorProfile.query
         
         if specialization:
-            query = query.filter(DoctorProfile.specialization.ilike(f'%{specialization}%'))
+            query = query.filter(search_index.condition('doctors', specialization, ['specialization']))
+        
+        if min_rating:
+            query = query.filter(DoctorProfile.average_rating >= min_rating)
         
         if max_fee:
             query = query.filter(DoctorProfile.consultation_fee <= max_fee)
@@ -281,13 +303,27 @@ def search_doctors():
         
         if search_term:
             query = query.filter(
-                db.or_(
-                    DoctorProfile.full_name.ilike(f'%{search_term}%'),
-                    DoctorProfile.specialization.ilike(f'%{search_term}%'),
-                    DoctorProfile.bio.ilike(f'%{search_term}%')
-                )
+                search_index.condition('doctors', search_term, ['full_name', 'specialization', 'bio'], stemming)
             )
         
+        # أعداد الواجهات لنفس الفلاتر باستعلام واحد
+        facet_counts = None
+        if facets:
+            criteria = [] if query.whereclause is None else [query.whereclause]
+            try:
+                facet_counts = doctor_facets(criteria, facets)
+            except ValueError as e:
+                return jsonify({"message": str(e)}), 400
+        
+        # الترتيب بالمعرف في نفس الاتجاه حتى يخدم فهرس (العمود، id) الترتيب كاملاً
+        if sort_by:
+            column = DOCTOR_SORTS[sort_by]
+            query = query.order_by(*(
+                [column.desc(), DoctorProfile.id.desc()] if descending else [column.asc(), DoctorProfile.id.asc()]
+            ))
+        else:
+            query = query.order_by(DoctorProfile.id)
+        
         # تطبيق التصفح
         doctors = query.paginate(
             page=page, 
@@ -295,18 +331,11 @@ def search_doctors():
             error_out=False
         )
         
-        # تحضير النتائج
-        results = []
-        for doctor in doctors.items:
-            doctor_data = doctor.to_dict()
-            
-            # تصفية النتائج حسب التقييم إذا تم تحديده
-            if min_rating and doctor_data['average_rating'] < min_rating:
-                continue
-                
-            results.append(doctor_data)
+        # تحضير النتائج (التقييم وعدد المراجعات من الأعمدة المخزنة، والتراخيص باستعلام مجمع)
+        statistics = DoctorProfile.get_stored_statistics_for(doctors.items)
+        results = [doctor.to_dict(statistics[doctor.id]) for doctor in doctors.items]
         
-        return jsonify({
+        response = {
             "doctors": results,
             "pagination": {
                 "page": doctors.page,
@@ -316,7 +345,10 @@ def search_doctors():
                 "has_next": doctors.has_next,
                 "has_prev": doctors.has_prev
             }
-        }), 200
+        }
+        if facet_counts is not None:
+            response["facets"] = facet_counts
+        return jsonify(response), 200
         
     except Exception as e:
         return jsonify({"message": f"خطأ في البحث: {str(e)}"}), 500
@@ -370,3 +402,8 @@ def get_doctor_statistics():
     except Exception as e:
         return jsonify({"message": f"خطأ في جلب الإحصائيات: {str(e)}"}), 500
 
+
+@doctor_management_bp.cli.command('refresh-ratings')
+def refresh_ratings_command():
+    """flask doctor_management refresh-ratings: إعادة حساب التقييم وعدد المراجعات المخزنين"""
+    click.echo(f'doctors: {doctor_aggregates.rebuild()}')
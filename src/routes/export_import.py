@@ -1,9 +1,9 @@
 from flask import Blueprint, request, jsonify, send_file, current_app
 from src.models.user import db, User, DoctorProfile, Consultation, DoctorReview
 from src.routes.permissions_system import require_permission
+from src.routes.tabular_stream import split_dict_rows, iter_xlsx, iter_csv, stream_file, XLSX_MIMETYPE, CSV_MIMETYPE
 import pandas as pd
 import json
-import csv
 import io
 import os
 from datetime import datetime
@@ -39,31 +39,25 @@ def export_users():
             end_date = datetime.strptime(filters['date_range']['end'], '%Y-%m-%d')
             query = query.filter(User.created_at.between(start_date, end_date))
         
-        users = query.all()
-        
-        # تحضير البيانات
-        users_data = []
-        for user in users:
-            users_data.append({
-                'ID': user.id,
-                'الاسم الكامل': user.full_name,
-                'البريد الإلكتروني': user.email,
-                'رقم الهاتف': user.phone,
-                'نوع المستخدم': user.user_type,
-                'العمر': user.age,
-                'الجنس': user.gender,
-                'تاريخ التسجيل': user.created_at.strftime('%Y-%m-%d %H:%M:%S') if user.created_at else '',
-                'آخر تحديث': user.updated_at.strftime('%Y-%m-%d %H:%M:%S') if user.updated_at else ''
-            })
+        # قراءة المستخدمين على دفعات من مؤشر الخادم
+        users_data = ({
+            'ID': user.id,
+            'اسم المستخدم': user.username,
+            'البريد الإلكتروني': user.email,
+            'نوع المستخدم': user.user_type,
+            'موثق': 'نعم' if user.kyc_verified else 'لا',
+            'نشط': 'نعم' if user.is_active else 'لا',
+            'تاريخ التسجيل': user.created_at.strftime('%Y-%m-%d %H:%M:%S') if user.created_at else ''
+        } for user in query.order_by(User.id).yield_per(1000))
         
         if export_format == 'excel':
             return export_to_excel(users_data, 'المستخدمين')
         elif export_format == 'csv':
             return export_to_csv(users_data, 'المستخدمين')
         elif export_format == 'pdf':
-            return export_to_pdf(users_data, 'تقرير المستخدمين')
+            return export_to_pdf(list(users_data), 'تقرير المستخدمين')
         elif export_format == 'json':
-            return export_to_json(users_data, 'المستخدمين')
+            return export_to_json(list(users_data), 'المستخدمين')
         else:
             return jsonify({
                 'status': 'error',
@@ -93,32 +87,29 @@ def export_doctors():
         if filters.get('is_verified') is not None:
             query = query.filter(Doctor.is_verified == filters['is_verified'])
         
-        doctors = query.all()
-        
-        doctors_data = []
-        for doctor in doctors:
-            doctors_data.append({
-                'ID': doctor.id,
-                'الاسم': doctor.name,
-                'التخصص': doctor.specialization,
-                'سنوات الخبرة': doctor.experience_years,
-                'التقييم': doctor.rating,
-                'سعر الاستشارة': doctor.consultation_price,
-                'متحقق': 'نعم' if doctor.is_verified else 'لا',
-                'متاح': 'نعم' if doctor.is_available else 'لا',
-                'اللغات': doctor.languages,
-                'المؤهلات': doctor.qualifications,
-                'تاريخ التسجيل': doctor.created_at.strftime('%Y-%m-%d %H:%M:%S') if doctor.created_at else ''
-            })
+        # قراءة السجلات على دفعات من مؤشر الخادم
+        doctors_data = ({
+            'ID': doctor.id,
+            'الاسم': doctor.name,
+            'التخصص': doctor.specialization,
+            'سنوات الخبرة': doctor.experience_years,
+            'التقييم': doctor.rating,
+            'سعر الاستشارة': doctor.consultation_price,
+            'متحقق': 'نعم' if doctor.is_verified else 'لا',
+            'متاح': 'نعم' if doctor.is_available else 'لا',
+            'اللغات': doctor.languages,
+            'المؤهلات': doctor.qualifications,
+            'تاريخ التسجيل': doctor.created_at.strftime('%Y-%m-%d %H:%M:%S') if doctor.created_at else ''
+        } for doctor in query.yield_per(1000))
         
         if export_format == 'excel':
             return export_to_excel(doctors_data, 'الأطباء')
         elif export_format == 'csv':
             return export_to_csv(doctors_data, 'الأطباء')
         elif export_format == 'pdf':
-            return export_to_pdf(doctors_data, 'تقرير الأطباء')
+            return export_to_pdf(list(doctors_data), 'تقرير الأطباء')
         elif export_format == 'json':
-            return export_to_json(doctors_data, 'الأطباء')
+            return export_to_json(list(doctors_data), 'الأطباء')
             
     except Exception as e:
         return jsonify({
@@ -148,31 +139,28 @@ def export_consultations():
             end_date = datetime.strptime(filters['date_range']['end'], '%Y-%m-%d')
             query = query.filter(Consultation.created_at.between(start_date, end_date))
         
-        consultations = query.all()
-        
-        consultations_data = []
-        for consultation in consultations:
-            consultations_data.append({
-                'ID': consultation.id,
-                'المريض': consultation.patient.full_name if consultation.patient else 'غير محدد',
-                'الطبيب': consultation.doctor.name if consultation.doctor else 'غير محدد',
-                'نوع الاستشارة': consultation.consultation_type,
-                'الحالة': consultation.status,
-                'الأعراض': consultation.symptoms,
-                'التشخيص': consultation.diagnosis,
-                'المبلغ': consultation.amount,
-                'تاريخ الإنشاء': consultation.created_at.strftime('%Y-%m-%d %H:%M:%S') if consultation.created_at else '',
-                'تاريخ التحديث': consultation.updated_at.strftime('%Y-%m-%d %H:%M:%S') if consultation.updated_at else ''
-            })
+        # قراءة السجلات على دفعات من مؤشر الخادم
+        consultations_data = ({
+            'ID': consultation.id,
+            'المريض': consultation.patient.full_name if consultation.patient else 'غير محدد',
+            'الطبيب': consultation.doctor.name if consultation.doctor else 'غير محدد',
+            'نوع الاستشارة': consultation.consultation_type,
+            'الحالة': consultation.status,
+            'الأعراض': consultation.symptoms,
+            'التشخيص': consultation.diagnosis,
+            'المبلغ': consultation.amount,
+            'تاريخ الإنشاء': consultation.created_at.strftime('%Y-%m-%d %H:%M:%S') if consultation.created_at else '',
+            'تاريخ التحديث': consultation.updated_at.strftime('%Y-%m-%d %H:%M:%S') if consultation.updated_at else ''
+        } for consultation in query.yield_per(1000))
         
         if export_format == 'excel':
             return export_to_excel(consultations_data, 'الاستشارات')
         elif export_format == 'csv':
             return export_to_csv(consultations_data, 'الاستشارات')
         elif export_format == 'pdf':
-            return export_to_pdf(consultations_data, 'تقرير الاستشارات')
+            return export_to_pdf(list(consultations_data), 'تقرير الاستشارات')
         elif export_format == 'json':
-            return export_to_json(consultations_data, 'الاستشارات')
+            return export_to_json(list(consultations_data), 'الاستشارات')
             
     except Exception as e:
         return jsonify({
@@ -197,28 +185,25 @@ def export_reviews():
         if filters.get('is_verified') is not None:
             query = query.filter(Review.is_verified == filters['is_verified'])
         
-        reviews = query.all()
-        
-        reviews_data = []
-        for review in reviews:
-            reviews_data.append({
-                'ID': review.id,
-                'المريض': review.patient.full_name if review.patient else 'غير محدد',
-                'الطبيب': review.doctor.name if review.doctor else 'غير محدد',
-                'التقييم': review.rating,
-                'التعليق': review.comment,
-                'متحقق': 'نعم' if review.is_verified else 'لا',
-                'تاريخ الإنشاء': review.created_at.strftime('%Y-%m-%d %H:%M:%S') if review.created_at else ''
-            })
+        # قراءة السجلات على دفعات من مؤشر الخادم
+        reviews_data = ({
+            'ID': review.id,
+            'المريض': review.patient.full_name if review.patient else 'غير محدد',
+            'الطبيب': review.doctor.name if review.doctor else 'غير محدد',
+            'التقييم': review.rating,
+            'التعليق': review.comment,
+            'متحقق': 'نعم' if review.is_verified else 'لا',
+            'تاريخ الإنشاء': review.created_at.strftime('%Y-%m-%d %H:%M:%S') if review.created_at else ''
+        } for review in query.yield_per(1000))
         
         if export_format == 'excel':
             return export_to_excel(reviews_data, 'المراجعات')
         elif export_format == 'csv':
             return export_to_csv(reviews_data, 'المراجعات')
         elif export_format == 'pdf':
-            return export_to_pdf(reviews_data, 'تقرير المراجعات')
+            return export_to_pdf(list(reviews_data), 'تقرير المراجعات')
         elif export_format == 'json':
-            return export_to_json(reviews_data, 'المراجعات')
+            return export_to_json(list(reviews_data), 'المراجعات')
             
     except Exception as e:
         return jsonify({
@@ -353,42 +338,24 @@ def import_users():
             'message': f'خطأ في استيراد البيانات: {str(e)}'
         }), 500
 
-def export_to_excel(data, sheet_name):
-    """تصدير البيانات إلى Excel"""
-    output = io.BytesIO()
+def export_to_excel(rows, sheet_name):
+    """تصدير البيانات إلى Excel كملف متدفق (rows: قائمة أو مولد قواميس)"""
+    headers, values = split_dict_rows(rows)
     
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df = pd.DataFrame(data)
-        df.to_excel(writer, sheet_name=sheet_name, index=False)
-    
-    output.seek(0)
-    
-    return send_file(
-        output,
-        as_attachment=True,
-        download_name=f'{sheet_name}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx',
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    return stream_file(
+        iter_xlsx([(sheet_name, headers, values)]),
+        f'{sheet_name}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx',
+        XLSX_MIMETYPE
     )
 
-def export_to_csv(data, filename):
-    """تصدير البيانات إلى CSV"""
-    output = io.StringIO()
-    
-    if data:
-        fieldnames = data[0].keys()
-        writer = csv.DictWriter(output, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(data)
+def export_to_csv(rows, filename):
+    """تصدير البيانات إلى CSV كملف متدفق (rows: قائمة أو مولد قواميس)"""
+    headers, values = split_dict_rows(rows)
     
-    response_output = io.BytesIO()
-    response_output.write(output.getvalue().encode('utf-8-sig'))
-    response_output.seek(0)
-    
-    return send_file(
-        response_output,
-        as_attachment=True,
-        download_name=f'{filename}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
-        mimetype='text/csv'
+    return stream_file(
+        iter_csv(headers, values),
+        f'{filename}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+        CSV_MIMETYPE
     )
 
 def export_to_pdf(data, title):
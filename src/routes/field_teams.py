@@ -1,8 +1,65 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime
+from src.models.user import db, FieldTeamMember
+from src.routes.geo_index import location_index, parse_coordinates
 
 field_teams_bp = Blueprint("field_teams", __name__)
 
+# أقصى بعد لعضو الفريق الذي يعين تلقائياً، وعدد المرشحين في كل محاولة، والسرعة لتقدير الوصول
+DEFAULT_ASSIGN_RADIUS_KM = 30
+ASSIGN_CANDIDATES = 5
+AVERAGE_SPEED_KMH = 30
+# أقصى عدد جولات البحث عن مرشحين عندما يسبق طلب آخر إليهم
+MAX_ASSIGN_ROUNDS = 3
+# الحالات التي تنهي الطلب فيعود العضو متاحاً
+RELEASE_STATUSES = ("completed", "cancelled")
+
+def reserve_member(member_id, request_id):
+    """حجز العضو للطلب بتحديث مشروط على is_available (commit عند النجاح فقط)؛ يعيد True إذا حجز
+
+    العضو يحذف من الفهرس في الحالتين: محجوز الآن أو سبق حجزه والفهرس متأخر.
+    """
+    claimed = FieldTeamMember.query.filter_by(id=member_id, is_available=True).update(
+        {"is_available": False, "current_request_id": request_id}, synchronize_session=False
+    )
+    if claimed:
+        db.session.commit()
+    location_index.apply_changes(db.engine, {"field_teams": {member_id: None}})
+    return bool(claimed)
+
+def release_member(member_id, request_id):
+    """إتاحة العضو فقط إذا كان معيناً للطلب request_id (تحديث مشروط)؛ يعيد True إذا حرر
+
+    التحديث المجمع لا يمر بأحداث ORM، فيعاد العضو إلى الفهرس بعد commit يدوياً.
+    """
+    released = FieldTeamMember.query.filter_by(id=member_id, current_request_id=request_id).update(
+        {"is_available": True, "current_request_id": None}, synchronize_session=False
+    )
+    if not released:
+        db.session.rollback()
+        return False
+    db.session.commit()
+    member = db.session.get(FieldTeamMember, member_id)
+    location = location_index.source_for(member).location(member)
+    location_index.apply_changes(db.engine, {"field_teams": {member_id: location}})
+    return True
+
+def claim_nearest_member(latitude, longitude, max_km, request_id):
+    """حجز أقرب عضو متاح: (العضو، المسافة) أو (None, None)
+
+    إذا سبق طلب آخر إلى المرشح (أو كان الفهرس متأخراً) ينتقل البحث إلى التالي، لمدة MAX_ASSIGN_ROUNDS
+    جولة على الأكثر.
+    """
+    for _ in range(MAX_ASSIGN_ROUNDS):
+        candidates = location_index.nearest("field_teams", latitude, longitude, ASSIGN_CANDIDATES, max_km)
+        if not candidates:
+            break
+        for member_id, distance in candidates:
+            if reserve_member(member_id, request_id):
+                return db.session.get(FieldTeamMember, member_id), distance
+    db.session.rollback()
+    return None, None
+
 @field_teams_bp.route("/sample_collection", methods=["POST"])
 def request_sample_collection():
     """طلب إرسال فريق ميداني لأخذ العينات"""
@@ -41,14 +98,37 @@ def request_sample_collection():
 
 @field_teams_bp.route("/assign_team", methods=["POST"])
 def assign_team():
-    """تعيين فريق ميداني لطلب معين"""
+    """تعيين فريق ميداني لطلب معين: العضو المحدد أو أقرب عضو متاح إلى موقع الطلب"""
     data = request.get_json()
     request_id = data.get("request_id")
-    team_member_id = data.get("team_member_id")
+    team_member_id = data.get("team_member_id")  # معرف FieldTeamMember؛ بدونه يعين أقرب عضو متاح إلى location
     estimated_arrival = data.get("estimated_arrival")
     
-    if not request_id or not team_member_id:
-        return jsonify({"message": "Request ID and team member ID are required"}), 400
+    if not request_id:
+        return jsonify({"message": "Request ID is required"}), 400
+    
+    distance = None
+    member = None
+    if team_member_id:
+        # العضو المحدد يحجز بنفس التحديث المشروط حتى لا يعين لطلبين
+        if db.session.get(FieldTeamMember, team_member_id) is None:
+            return jsonify({"message": "Team member not found"}), 404
+        if not reserve_member(team_member_id, request_id):
+            db.session.rollback()
+            return jsonify({"message": "Team member is not available"}), 409
+    else:
+        try:
+            latitude, longitude = parse_coordinates(data.get("location"))
+            max_km = float(data.get("max_distance_km", DEFAULT_ASSIGN_RADIUS_KM))
+        except (TypeError, ValueError) as e:
+            return jsonify({"message": f"Team member ID or a valid location is required: {str(e)}"}), 400
+        
+        member, distance = claim_nearest_member(latitude, longitude, max_km, request_id)
+        if member is None:
+            return jsonify({"message": f"No available team member within {max_km:g} km"}), 404
+        team_member_id = member.id
+        if not estimated_arrival:
+            estimated_arrival = f"{max(5, round(distance / AVERAGE_SPEED_KMH * 60))} minutes"
     
     assignment = {
         "request_id": request_id,
@@ -57,27 +137,69 @@ def assign_team():
         "estimated_arrival": estimated_arrival,
         "status": "assigned"
     }
+    if member is not None:
+        assignment["team_member_name"] = member.name
+        assignment["distance_km"] = round(distance, 2)
     
     return jsonify({
         "message": "Team member assigned successfully",
         "assignment": assignment
     }), 200
 
+@field_teams_bp.route("/members/<int:member_id>/location", methods=["POST"])
+def update_member_location(member_id):
+    """تحديث موقع عضو الفريق الميداني وإتاحته (يحدث الفهرس المكاني بعد الحفظ)"""
+    data = request.get_json()
+    member = db.session.get(FieldTeamMember, member_id)
+    if not member:
+        return jsonify({"message": "Team member not found"}), 404
+    
+    try:
+        member.latitude, member.longitude = parse_coordinates(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({"message": f"Valid location is required: {str(e)}"}), 400
+    if "is_available" in data:
+        member.is_available = bool(data["is_available"])
+        if member.is_available:
+            # الإتاحة اليدوية تلغي التعيين الحالي
+            member.current_request_id = None
+    member.location_updated_at = datetime.utcnow()
+    db.session.commit()
+    
+    return jsonify({
+        "message": "Team member location updated successfully",
+        "member": {
+            "id": member.id,
+            "latitude": member.latitude,
+            "longitude": member.longitude,
+            "is_available": member.is_available,
+            "location_updated_at": member.location_updated_at.isoformat()
+        }
+    }), 200
+
 @field_teams_bp.route("/update_status", methods=["POST"])
 def update_field_request_status():
     """تحديث حالة طلب الفريق الميداني"""
     data = request.get_json()
     request_id = data.get("request_id")
-    status = data.get("status")  # assigned, in_progress, samples_collected, delivered_to_lab, completed
+    status = data.get("status")  # assigned, in_progress, samples_collected, delivered_to_lab, completed, cancelled
+    team_member_id = data.get("team_member_id")  # معرف FieldTeamMember المعين، يعود متاحاً عند الإكمال أو الإلغاء
     notes = data.get("notes", "")
     lab_location = data.get("lab_location")  # موقع المختبر
     
     if not request_id or not status:
         return jsonify({"message": "Request ID and status are required"}), 400
     
+    if team_member_id and status in RELEASE_STATUSES:
+        if db.session.get(FieldTeamMember, team_member_id) is None:
+            return jsonify({"message": "Team member not found"}), 404
+        if not release_member(team_member_id, request_id):
+            return jsonify({"message": "Team member is not assigned to this request"}), 409
+    
     status_update = {
         "request_id": request_id,
         "status": status,
+        "team_member_id": team_member_id,
         "notes": notes,
         "lab_location": lab_location,
         "updated_at": datetime.utcnow().isoformat()
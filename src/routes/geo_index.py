@@ -0,0 +1,343 @@
+import heapq
+import math
+import threading
+import time
+import weakref
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from src.models.user import db, Pharmacy, FieldTeamMember
+from src.routes import performance_cache
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+
+# ضلع خلية الشبكة بالدرجات (~1.1 كم): كل خلية دلو من النقاط كخلايا geohash. الخلايا الأكبر تبطئ
+# البحث في المدن المزدحمة (نقاط أكثر لكل خلية) والأصغر تبطئه في المناطق المتفرقة (حلقات فارغة أكثر)
+CELL_DEGREES = 0.01
+
+# مسافة الدائرة العظمى بين نقطتين على نفس خط العرض أقصر قليلاً من المسافة على الخط نفسه،
+# فيخفض حد قطع البحث بهذا المعامل حتى لا تفوت نقطة أقرب
+GREAT_CIRCLE_FACTOR = 0.95
+
+# إصدار مشترك في Redis يزاد عند كل تغيير لتعيد العمال الأخرى بناء فهارسها
+VERSION_KEY = 'locations:version'
+VERSION_CHECK_SECONDS = 5
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """مسافة الدائرة العظمى بالكيلومتر بين نقطتين بالدرجات"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+def parse_coordinates(value):
+    """(خط العرض، خط الطول) من {'latitude', 'longitude'} أو {'lat', 'lng'} أو [lat, lng]"""
+    if isinstance(value, dict):
+        latitude = value.get('latitude', value.get('lat'))
+        longitude = value.get('longitude', value.get('lng', value.get('lon')))
+    elif isinstance(value, (list, tuple)) and len(value) == 2:
+        latitude, longitude = value
+    else:
+        raise ValueError('الموقع مطلوب بخط العرض وخط الطول')
+    latitude, longitude = float(latitude), float(longitude)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError('إحداثيات خارج النطاق')
+    return latitude, longitude
+
+class GridIndex:
+    """نقاط (المعرف، خط العرض، خط الطول) في دلاء شبكة ثابتة بالدرجات
+
+    الإضافة والحذف والنقل O(1). أقرب k نقطة تفحص حلقات الخلايا حول نقطة البحث وتتوقف عندما تصبح
+    أقرب مسافة ممكنة لأي خلية لم تفحص أكبر من أبعد نقطة في أفضل k، والبحث في نصف قطر يفحص خلايا
+    المستطيل المحيط بالدائرة فقط. المقارنة بقيمة haversine نفسها (a) والجذر يحسب للنتائج فقط.
+    """
+
+    def __init__(self, cell_degrees=CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self.cells = {}
+        self.points = {}
+        # حدود الخلايا المستخدمة (تتسع فقط) لإيقاف توسع الحلقات خارج البيانات
+        self.min_row = self.max_row = self.min_col = self.max_col = None
+
+    def __len__(self):
+        return len(self.points)
+
+    def __contains__(self, item_id):
+        return item_id in self.points
+
+    def _cell(self, latitude, longitude):
+        return math.floor(latitude / self.cell_degrees), math.floor(longitude / self.cell_degrees)
+
+    def add(self, item_id, latitude, longitude):
+        """إضافة نقطة أو نقلها إلى موقع جديد"""
+        if item_id in self.points:
+            self.remove(item_id)
+        row, col = cell = self._cell(latitude, longitude)
+        phi = math.radians(latitude)
+        self.cells.setdefault(cell, {})[item_id] = (phi, math.radians(longitude), math.cos(phi))
+        self.points[item_id] = (cell, latitude, longitude)
+        if self.min_row is None:
+            self.min_row = self.max_row = row
+            self.min_col = self.max_col = col
+        else:
+            self.min_row, self.max_row = min(self.min_row, row), max(self.max_row, row)
+            self.min_col, self.max_col = min(self.min_col, col), max(self.max_col, col)
+
+    def remove(self, item_id):
+        entry = self.points.pop(item_id, None)
+        if entry is None:
+            return False
+        bucket = self.cells[entry[0]]
+        del bucket[item_id]
+        if not bucket:
+            del self.cells[entry[0]]
+        return True
+
+    def location(self, item_id):
+        entry = self.points.get(item_id)
+        return None if entry is None else entry[1:]
+
+    @staticmethod
+    def _a(km):
+        return math.sin(km / (2 * EARTH_RADIUS_KM)) ** 2
+
+    @staticmethod
+    def _km(a):
+        return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, a)))
+
+    def _ring(self, row, col, radius):
+        """خلايا الحلقة radius حول (row, col) داخل حدود البيانات"""
+        if radius == 0:
+            yield row, col
+            return
+        top, bottom, left, right = row - radius, row + radius, col - radius, col + radius
+        for c in range(max(left, self.min_col), min(right, self.max_col) + 1):
+            if self.min_row <= top <= self.max_row:
+                yield top, c
+            if self.min_row <= bottom <= self.max_row:
+                yield bottom, c
+        for r in range(max(top + 1, self.min_row), min(bottom - 1, self.max_row) + 1):
+            if self.min_col <= left <= self.max_col:
+                yield r, left
+            if self.min_col <= right <= self.max_col:
+                yield r, right
+
+    def _ring_bound_km(self, latitude, radius):
+        """أقل مسافة ممكنة لنقطة خارج الحلقات 0..radius: تبعد أكثر من radius خلية عرضاً أو طولاً"""
+        degrees = radius * self.cell_degrees
+        widest = min(90.0, abs(latitude) + degrees + self.cell_degrees)
+        return degrees * KM_PER_DEGREE * math.cos(math.radians(widest)) * GREAT_CIRCLE_FACTOR
+
+    def _scan(self, cells, phi, lam, cos_phi, max_a, accept):
+        for cell in cells:
+            bucket = self.cells.get(cell)
+            if not bucket:
+                continue
+            for item_id, (p_phi, p_lam, p_cos) in bucket.items():
+                a = math.sin((p_phi - phi) / 2) ** 2 + cos_phi * p_cos * math.sin((p_lam - lam) / 2) ** 2
+                if a <= max_a and (accept is None or accept(item_id)):
+                    yield a, item_id
+
+    def nearest(self, latitude, longitude, k=5, max_km=None, accept=None):
+        """أقرب k نقطة [(المعرف، المسافة كم)] بالأقرب أولاً، ضمن max_km إن حدد وبشرط accept(المعرف)"""
+        if not self.points or k <= 0:
+            return []
+        row, col = self._cell(latitude, longitude)
+        phi, lam = math.radians(latitude), math.radians(longitude)
+        cos_phi = math.cos(phi)
+        max_a = math.inf if max_km is None else self._a(max_km)
+        last_ring = max(row - self.min_row, self.max_row - row, col - self.min_col, self.max_col - col, 0)
+
+        best = []  # كومة عظمى بـ -a لأفضل k
+        for radius in range(last_ring + 1):
+            for a, item_id in self._scan(self._ring(row, col, radius), phi, lam, cos_phi, max_a, accept):
+                if len(best) < k:
+                    heapq.heappush(best, (-a, -item_id))
+                elif (-a, -item_id) > best[0]:
+                    heapq.heapreplace(best, (-a, -item_id))
+            bound = self._ring_bound_km(latitude, radius)
+            if max_km is not None and bound > max_km:
+                break
+            if len(best) == k and bound >= self._km(-best[0][0]):
+                break
+        return [(-neg_id, self._km(-neg_a)) for neg_a, neg_id in sorted(best, reverse=True)]
+
+    def within(self, latitude, longitude, radius_km, limit=None, accept=None):
+        """النقاط ضمن radius_km [(المعرف، المسافة كم)] بالأقرب أولاً (أول limit منها بحلقات الأقرب)"""
+        if not self.points or radius_km < 0:
+            return []
+        if limit is not None:
+            return self.nearest(latitude, longitude, limit, radius_km, accept)
+        phi, lam = math.radians(latitude), math.radians(longitude)
+        angular = radius_km / EARTH_RADIUS_KM
+        # المستطيل المحيط بالدائرة على الكرة؛ إذا بلغت الدائرة القطب تشمل كل خطوط الطول
+        if abs(phi) + angular >= math.pi / 2:
+            min_col, max_col = self.min_col, self.max_col
+        else:
+            delta = math.degrees(math.asin(min(1.0, math.sin(angular) / math.cos(phi))))
+            min_col = max(self.min_col, self._cell(latitude, longitude - delta)[1])
+            max_col = min(self.max_col, self._cell(latitude, longitude + delta)[1])
+        degrees = math.degrees(angular)
+        min_row = max(self.min_row, self._cell(latitude - degrees, longitude)[0])
+        max_row = min(self.max_row, self._cell(latitude + degrees, longitude)[0])
+
+        cells = ((r, c) for r in range(min_row, max_row + 1) for c in range(min_col, max_col + 1))
+        found = sorted(self._scan(cells, phi, lam, math.cos(phi), self._a(radius_km), accept))
+        return [(item_id, self._km(a)) for a, item_id in found]
+
+class LocationSource:
+    """نموذج بموقع (latitude, longitude) وعمود إتاحة: الصفوف المتاحة ذات الموقع فقط تفهرس"""
+
+    def __init__(self, name, model, active_column):
+        self.name = name
+        self.model = model
+        self.active_column = active_column
+
+    def location(self, instance):
+        """موقع الصف في الفهرس أو None إذا لم يكن متاحاً"""
+        if not getattr(instance, self.active_column.key) or instance.latitude is None or instance.longitude is None:
+            return None
+        return instance.latitude, instance.longitude
+
+    def rows(self):
+        model = self.model
+        return db.session.query(model.id, model.latitude, model.longitude).filter(
+            self.active_column == True, model.latitude.isnot(None), model.longitude.isnot(None)
+        )
+
+class LocationState:
+    def __init__(self, names, cell_degrees):
+        self.grids = {name: GridIndex(cell_degrees) for name in names}
+        self.built_at = None
+        self.version = None
+        self.checked_at = 0
+
+class LocationIndex:
+    """فهرس مكاني في ذاكرة كل عامل للصيدليات النشطة وأعضاء الفرق الميدانية المتاحين
+
+    يبنى مرة من قاعدة البيانات ثم يحدث بعد كل commit يغير موقع صف أو إتاحته، فالبحث عن الأقرب لا
+    يصل إلى قاعدة البيانات. الفهرس مرشح للنتائج لا مصدر الحقيقة: تعيين عضو الفريق يحجزه بتحديث مشروط.
+    """
+
+    def __init__(self, cell_degrees=CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self.sources = {}
+        self._states = weakref.WeakKeyDictionary()
+        self._lock = threading.RLock()
+
+    def register(self, source):
+        self.sources[source.name] = source
+        return source
+
+    def source_for(self, instance):
+        for source in self.sources.values():
+            if isinstance(instance, source.model):
+                return source
+        return None
+
+    def _state(self, engine=None):
+        engine = engine or db.engine
+        with self._lock:
+            state = self._states.get(engine)
+            if state is None or self._stale(state):
+                state = self._build()
+                self._states[engine] = state
+            return state
+
+    def _shared_version(self):
+        if not performance_cache.REDIS_AVAILABLE:
+            return None
+        try:
+            return performance_cache.redis_client.get(VERSION_KEY)
+        except Exception:
+            return None
+
+    def _stale(self, state):
+        now = time.monotonic()
+        if now - state.checked_at < VERSION_CHECK_SECONDS:
+            return False
+        state.checked_at = now
+        return self._shared_version() != state.version
+
+    def _build(self):
+        state = LocationState(self.sources, self.cell_degrees)
+        state.version = self._shared_version()
+        state.checked_at = time.monotonic()
+        for name, source in self.sources.items():
+            grid = state.grids[name]
+            for item_id, latitude, longitude in source.rows():
+                grid.add(item_id, latitude, longitude)
+        state.built_at = time.time()
+        return state
+
+    def warm(self):
+        """بناء الفهرس مسبقاً (عند بدء العامل) حتى لا يدفع أول طلب كلفة البناء"""
+        return self._state()
+
+    def invalidate(self):
+        with self._lock:
+            self._states.pop(db.engine, None)
+
+    def apply_changes(self, engine, changes):
+        """تطبيق التغييرات بعد commit: {الاسم: {المعرف: (خط العرض، خط الطول) أو None للحذف}}"""
+        version = None
+        if performance_cache.REDIS_AVAILABLE:
+            try:
+                version = str(performance_cache.redis_client.incr(VERSION_KEY))
+            except Exception:
+                pass
+        with self._lock:
+            state = self._states.get(engine)
+            if state is None:
+                return
+            for name, items in changes.items():
+                grid = state.grids[name]
+                for item_id, location in items.items():
+                    if location is None:
+                        grid.remove(item_id)
+                    else:
+                        grid.add(item_id, *location)
+            if version is not None:
+                state.version = version
+
+    def nearest(self, name, latitude, longitude, k=5, max_km=None, accept=None):
+        state = self._state()
+        with self._lock:
+            return state.grids[name].nearest(latitude, longitude, k, max_km, accept)
+
+    def within(self, name, latitude, longitude, radius_km, limit=None, accept=None):
+        state = self._state()
+        with self._lock:
+            return state.grids[name].within(latitude, longitude, radius_km, limit, accept)
+
+    def status(self):
+        state = self._state()
+        return {
+            'built_at': state.built_at,
+            'entries': {name: len(grid) for name, grid in state.grids.items()}
+        }
+
+# إنشاء مثيل من الفهرس المكاني مع مصادر المواقع
+location_index = LocationIndex()
+location_index.register(LocationSource('pharmacies', Pharmacy, Pharmacy.is_active))
+location_index.register(LocationSource('field_teams', FieldTeamMember, FieldTeamMember.is_available))
+
+@event.listens_for(Session, 'after_flush')
+def _collect_location_changes(session, flush_context):
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        source = location_index.source_for(instance)
+        if source is None:
+            continue
+        location = None if instance in session.deleted else source.location(instance)
+        changes = session.info.setdefault('location_changes', {})
+        changes.setdefault(source.name, {})[instance.id] = location
+
+@event.listens_for(Session, 'after_commit')
+def _apply_location_changes(session):
+    changes = session.info.pop('location_changes', None)
+    if changes:
+        location_index.apply_changes(session.get_bind(), changes)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_location_changes(session):
+    session.info.pop('location_changes', None)
@@ -0,0 +1,286 @@
+import json
+import hashlib
+from datetime import datetime, timedelta
+from sqlalchemy import func, and_, or_, case, select, true
+from src.models.user import db, Consultation, Payment, DoctorReview
+from src.routes.analytics_rollups import rollup_manager
+from src.routes.performance_cache import CACHE_SETTINGS, get_from_cache, set_to_cache, cache_scope
+
+class KPISource:
+    """جدول تقاس عليه المؤشرات: عمود التاريخ وشروط الصفوف وجدول التجميع اليومي المطابق إن وجد"""
+
+    def __init__(self, name, model, date_column, filters=None, rollup_source=None):
+        self.name = name
+        self.model = model
+        self.date_column = date_column
+        self.filters = filters or (lambda: [])
+        self.rollup_source = rollup_source  # اسم المصدر في rollup_manager
+
+    @classmethod
+    def from_rollup(cls, name):
+        source = rollup_manager.sources[name]
+        return cls(name, source.model, source.date_column, source.filters, rollup_source=name)
+
+    def conditions(self):
+        return [self.date_column.isnot(None)] + self.filters()
+
+class SumMetric:
+    """مقياس تجميعي قابل للجمع: مجموع value لكل صف (أو عدد الصفوف إذا كان None)
+
+    rollup_column اسم العمود المقابل في جدول التجميع اليومي، ويسمح بقراءة الأيام الكاملة منه.
+    """
+
+    def __init__(self, name, source, value=None, rollup_column=None):
+        self.name = name
+        self.source = source
+        self.value = value
+        self.rollup_column = rollup_column
+        self.depends = ()
+
+    def row_value(self):
+        return 1 if self.value is None else self.value
+
+class DistinctMetric:
+    """عدد الكيانات (مثل المرضى) التي لها min_events صفاً على الأقل في الفترة"""
+
+    def __init__(self, name, source, entity_column, min_events=1):
+        self.name = name
+        self.source = source
+        self.entity_column = entity_column
+        self.min_events = min_events
+        self.depends = ()
+
+class RatioMetric:
+    """مؤشر مشتق: numerator / denominator * scale لكل فترة (يحسب بعد الاستعلام)"""
+
+    def __init__(self, name, numerator, denominator, scale=1):
+        self.name = name
+        self.depends = (numerator, denominator)
+        self.scale = scale
+
+    def compute(self, values, index):
+        numerator, denominator = (values[name][index] or 0 for name in self.depends)
+        return numerator / denominator * self.scale if denominator else 0
+
+class Periods:
+    """N فترات متتالية بطول period_days تنتهي عند now؛ الفترة 0 هي الحالية ومفتوحة النهاية"""
+
+    def __init__(self, period_days, count, now):
+        self.period_days = period_days
+        self.count = count
+        self.boundaries = [now - timedelta(days=period_days * k) for k in range(count + 1)]
+
+    @property
+    def start(self):
+        return self.boundaries[-1]
+
+    def raw_condition(self, column, index):
+        condition = column >= self.boundaries[index + 1]
+        if index > 0:
+            condition = and_(condition, column < self.boundaries[index])
+        return condition
+
+    def edge_days(self):
+        """الأيام التي تقع فيها حدود الفترات داخلها (تقرأ من الجدول الخام)"""
+        days = set()
+        for boundary in self.boundaries[1:]:
+            if boundary != datetime.combine(boundary.date(), datetime.min.time()):
+                days.add(boundary.date())
+        return sorted(days)
+
+    def rollup_condition(self, day_column, index):
+        # الأيام الحدية مستبعدة من جزء التجميع لذلك تكفي مقارنة الأيام
+        condition = day_column >= self.boundaries[index + 1].date()
+        if index > 0:
+            condition = and_(condition, day_column < self.boundaries[index].date())
+        return condition
+
+class KPIEngine:
+    """حساب أي مجموعة من المؤشرات المسجلة لعدة فترات مقارنة في استعلام واحد
+
+    كل فترة تحسب بتجميع شرطي (CASE WHEN) على اتحاد نطاقها الزمني: الأيام الكاملة من جداول التجميع
+    اليومية والأيام الحدية من الجداول الخام، وكل جدول يمسح مرة واحدة لكل الفترات.
+    """
+
+    def __init__(self):
+        self.sources = {}
+        self.metrics = {}
+
+    def register_source(self, source):
+        self.sources[source.name] = source
+        return source
+
+    def register(self, metric):
+        for name in metric.depends:
+            if name not in self.metrics:
+                raise ValueError(f'المؤشر {metric.name} يعتمد على مؤشر غير مسجل: {name}')
+        if getattr(metric, 'source', None) is not None and metric.source not in self.sources:
+            raise ValueError(f'مصدر غير مسجل: {metric.source}')
+        self.metrics[metric.name] = metric
+        return metric
+
+    def _resolve(self, names):
+        """المؤشرات المطلوبة مع ما تعتمد عليه بترتيب الاعتماد"""
+        ordered = []
+        def visit(name):
+            if name not in self.metrics:
+                raise ValueError(f'مؤشر غير مسجل: {name}')
+            metric = self.metrics[name]
+            for dependency in metric.depends:
+                visit(dependency)
+            if metric not in ordered:
+                ordered.append(metric)
+        for name in names:
+            visit(name)
+        return ordered
+
+    # ---------- بناء الاستعلام ----------
+
+    def _sum_parts(self, source, metrics, periods):
+        """استعلامات فرعية بصف واحد لمقاييس الجمع على مصدر واحد"""
+        parts = []
+        rollup_metrics = [m for m in metrics if m.rollup_column] if source.rollup_source else []
+        raw_metrics = [m for m in metrics if m not in rollup_metrics]
+        column = source.date_column
+
+        if rollup_metrics:
+            rollup = rollup_manager.sources[source.rollup_source].rollup
+            edge_days = periods.edge_days()
+            conditions = [rollup.day >= periods.start.date()]
+            if edge_days:
+                conditions.append(rollup.day.notin_(edge_days))
+            parts.append(select(*[
+                func.sum(case((periods.rollup_condition(rollup.day, k), getattr(rollup, m.rollup_column)), else_=0))
+                .label(f'{m.name}__{k}')
+                for m in rollup_metrics for k in range(periods.count)
+            ]).where(*conditions))
+
+            if edge_days:
+                edges = or_(*[
+                    and_(column >= datetime.combine(day, datetime.min.time()),
+                         column < datetime.combine(day + timedelta(days=1), datetime.min.time()))
+                    for day in edge_days
+                ])
+                parts.append(select(*[
+                    func.sum(case((periods.raw_condition(column, k), m.row_value()), else_=0))
+                    .label(f'{m.name}__{k}')
+                    for m in rollup_metrics for k in range(periods.count)
+                ]).where(*source.conditions(), edges))
+
+        if raw_metrics:
+            parts.append(select(*[
+                func.sum(case((periods.raw_condition(column, k), m.row_value()), else_=0))
+                .label(f'{m.name}__{k}')
+                for m in raw_metrics for k in range(periods.count)
+            ]).where(*source.conditions(), column >= periods.start))
+        return parts
+
+    def _distinct_part(self, source, entity_column, metrics, periods):
+        """عدد الصفوف لكل كيان في كل فترة ثم عدّ الكيانات التي تحقق الحد الأدنى"""
+        column = source.date_column
+        per_entity = select(*[
+            func.sum(case((periods.raw_condition(column, k), 1), else_=0)).label(f'events__{k}')
+            for k in range(periods.count)
+        ]).where(*source.conditions(), column >= periods.start).group_by(entity_column).subquery()
+        return select(*[
+            func.sum(case((per_entity.c[f'events__{k}'] >= m.min_events, 1), else_=0)).label(f'{m.name}__{k}')
+            for m in metrics for k in range(periods.count)
+        ])
+
+    def statement(self, metrics, periods):
+        """استعلام واحد يعيد صفاً واحداً بعمود لكل (مؤشر، فترة)"""
+        parts = []
+        by_source = {}
+        distinct_groups = {}
+        for metric in metrics:
+            if isinstance(metric, SumMetric):
+                by_source.setdefault(metric.source, []).append(metric)
+            elif isinstance(metric, DistinctMetric):
+                distinct_groups.setdefault((metric.source, metric.entity_column.key), []).append(metric)
+
+        for source_name, source_metrics in by_source.items():
+            parts.extend(self._sum_parts(self.sources[source_name], source_metrics, periods))
+        for (source_name, _), group in distinct_groups.items():
+            parts.append(self._distinct_part(self.sources[source_name], group[0].entity_column, group, periods))
+
+        if not parts:
+            return None
+        subqueries = [part.subquery() for part in parts]
+        joined = subqueries[0]
+        for subquery in subqueries[1:]:
+            joined = joined.join(subquery, true())
+        # نفس المؤشر قد يظهر في أكثر من جزء (التجميع والأيام الحدية) فيوسم كل عمود برقم جزئه
+        return select(*[
+            column.label(f'{column.name}__{i}') for i, subquery in enumerate(subqueries) for column in subquery.c
+        ]).select_from(joined)
+
+    # ---------- الحساب ----------
+
+    def compute(self, names=None, period_days=30, periods=2, now=None, use_cache=True):
+        """قيم المؤشرات {الاسم: [الفترة الحالية، السابقة، ...]}"""
+        names = sorted(names or self.metrics)
+        if period_days <= 0 or periods <= 0:
+            raise ValueError('طول الفترة وعددها يجب أن يكونا موجبين')
+
+        now = now or datetime.now()
+        settings = CACHE_SETTINGS['kpi']
+        cache_key = None
+        if use_cache:
+            # نفس مجموعة المؤشرات ونفس الفترة خلال نافذة ttl تشترك في النتيجة
+            bucket = int(now.timestamp() // settings['ttl'])
+            fingerprint = json.dumps([cache_scope(), names, period_days, periods, bucket])
+            cache_key = settings['key'].format(hashlib.sha256(fingerprint.encode()).hexdigest())
+            cached = get_from_cache(cache_key)
+            if cached:
+                return {name: list(values) for name, values in cached.items()}
+
+        metrics = self._resolve(names)
+        window = Periods(period_days, periods, now)
+        if any(self.sources[m.source].rollup_source for m in metrics if not isinstance(m, RatioMetric)):
+            rollup_manager.ensure_fresh()
+
+        values = {}
+        statement = self.statement(metrics, window)
+        if statement is not None:
+            row = db.session.execute(statement).one()._mapping
+            for key, value in row.items():
+                name, index, _ = key.rsplit('__', 2)
+                values.setdefault(name, [0] * periods)[int(index)] += value or 0
+
+        for metric in metrics:
+            if isinstance(metric, RatioMetric):
+                values[metric.name] = [metric.compute(values, k) for k in range(periods)]
+            else:
+                values.setdefault(metric.name, [0] * periods)
+
+        result = {name: values[name] for name in names}
+        if cache_key:
+            set_to_cache(cache_key, result, settings['ttl'])
+        return result
+
+def growth_rate(current, previous):
+    """نسبة النمو بين فترتين"""
+    if previous == 0:
+        return 100 if current > 0 else 0
+    return ((current - previous) / previous) * 100
+
+# إنشاء مثيل من محرك المؤشرات مع المؤشرات الافتراضية
+kpi_engine = KPIEngine()
+
+kpi_engine.register_source(KPISource.from_rollup('consultation'))
+kpi_engine.register_source(KPISource.from_rollup('payment'))
+kpi_engine.register_source(KPISource.from_rollup('user'))
+kpi_engine.register_source(KPISource(
+    'review', DoctorReview, DoctorReview.created_at, filters=lambda: [DoctorReview.is_approved == True]
+))
+
+kpi_engine.register(SumMetric('consultations', 'consultation', rollup_column='total'))
+kpi_engine.register(SumMetric('revenue', 'payment', Payment.amount, rollup_column='amount'))
+kpi_engine.register(SumMetric('new_users', 'user', rollup_column='total'))
+kpi_engine.register(SumMetric('approved_reviews', 'review'))
+kpi_engine.register(SumMetric('rating_sum', 'review', DoctorReview.rating))
+kpi_engine.register(DistinctMetric('active_customers', 'consultation', Consultation.user_id))
+kpi_engine.register(DistinctMetric('repeat_customers', 'consultation', Consultation.user_id, min_events=2))
+kpi_engine.register(RatioMetric('avg_consultation_value', 'revenue', 'consultations'))
+kpi_engine.register(RatioMetric('customer_satisfaction', 'rating_sum', 'approved_reviews'))
+kpi_engine.register(RatioMetric('retention_rate', 'repeat_customers', 'active_customers', scale=100))
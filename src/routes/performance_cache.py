@@ -1,12 +1,16 @@
 from flask import Blueprint, request, jsonify, current_app
 from src.models.user import db, User, DoctorProfile, Consultation, DoctorReview
 from functools import wraps
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 import redis
 import json
 import hashlib
 from datetime import datetime, timedelta
 import time
 import threading
+import uuid
+import weakref
 from collections import defaultdict
 
 performance_cache_bp = Blueprint('performance_cache', __name__)
@@ -30,12 +34,64 @@ CACHE_SETTINGS = {
     'reviews_stats': {'ttl': 300, 'key': 'stats:reviews'},  # 5 دقائق
     'popular_doctors': {'ttl': 900, 'key': 'doctors:popular'},  # 15 دقيقة
     'search_results': {'ttl': 120, 'key': 'search:{}'},  # 2 دقيقة
+    'chart_images': {'ttl': 3600, 'key': 'chart:{}'},  # ساعة (المفتاح بصمة محتوى الرسم)
+    'report_jobs': {'ttl': 3600, 'key': 'report_job:{}'},  # ساعة (حالة المهمة ونتيجتها)
+    'kpi': {'ttl': 300, 'key': 'kpi:{}'},  # 5 دقائق (مفتاح لكل مجموعة مؤشرات وفترة زمنية)
+    'cohorts': {'ttl': 3600, 'key': 'cohort:{}'},  # ساعة (مصفوفات الاحتفاظ تتغير يومياً)
+    'search_telemetry': {'ttl': 86700, 'key': 'search_telemetry:{}'},  # يوم وشريحة (نافذة الشائع الأطول)
+    'range_segments': {'ttl': None, 'key': 'range:{}'},  # بلا انتهاء في Redis (أجزاء الأيام المغلقة تبطل صراحة عند تغيرها)
 }
 
 # متغيرات مراقبة الأداء
 performance_metrics = defaultdict(list)
 request_times = defaultdict(list)
 
+# معرفات قواعد البيانات في الذاكرة (لكل محرك)
+_memory_cache_scopes = weakref.WeakKeyDictionary()
+_cache_scopes_lock = threading.Lock()
+
+# عدادات الاستعلامات النشطة (تُستخدم في الاختبارات وقياسات الأداء)
+_active_query_counters = []
+_query_counters_lock = threading.Lock()
+
+class QueryCounter:
+    """عداد استعلامات SQL المنفذة عبر أي محرك SQLAlchemy داخل كتلة with"""
+    
+    def __init__(self, keep_statements=True):
+        self.count = 0
+        self.keep_statements = keep_statements
+        self.statements = []
+    
+    def record(self, statement):
+        self.count += 1
+        if self.keep_statements:
+            self.statements.append(statement)
+    
+    def __enter__(self):
+        with _query_counters_lock:
+            _active_query_counters.append(self)
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        with _query_counters_lock:
+            if self in _active_query_counters:
+                _active_query_counters.remove(self)
+        return False
+
+def count_queries(keep_statements=True):
+    """إنشاء عداد استعلامات للاستخدام مع with"""
+    return QueryCounter(keep_statements=keep_statements)
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    """تسجيل كل استعلام منفذ في العدادات النشطة"""
+    if not _active_query_counters:
+        return
+    with _query_counters_lock:
+        counters = list(_active_query_counters)
+    for counter in counters:
+        counter.record(statement)
+
 def cache_key_generator(prefix, *args, **kwargs):
     """إنشاء مفتاح فريد للتخزين المؤقت"""
     key_data = f"{prefix}:{':'.join(map(str, args))}"
@@ -43,6 +99,21 @@ def cache_key_generator(prefix, *args, **kwargs):
         key_data += f":{hashlib.md5(json.dumps(kwargs, sort_keys=True).encode()).hexdigest()}"
     return key_data
 
+def cache_scope():
+    """معرف قاعدة البيانات الحالية لمفاتيح البيانات المشتقة منها
+
+    قواعد البيانات في الذاكرة خاصة بكل محرك فتأخذ معرفاً فريداً له، وغيرها يعرف برابطها
+    (فتتشارك عمليات الخادم نفس المفاتيح في Redis).
+    """
+    engine = db.engine
+    if engine.url.database in (None, '', ':memory:'):
+        with _cache_scopes_lock:
+            scope = _memory_cache_scopes.get(engine)
+            if scope is None:
+                scope = _memory_cache_scopes[engine] = uuid.uuid4().hex[:12]
+        return scope
+    return hashlib.md5(str(engine.url).encode()).hexdigest()[:12]
+
 def get_from_cache(key):
     """الحصول على البيانات من التخزين المؤقت"""
     if REDIS_AVAILABLE:
@@ -1,8 +1,15 @@
 from flask import Blueprint, request, jsonify
-from src.models.user import db, PharmacyOrder, Consultation
+from src.models.user import db, PharmacyOrder, Consultation, Pharmacy, PharmacyNotification
+from src.routes.geo_index import location_index, parse_coordinates
+import json
 
 pharmacy_bp = Blueprint("pharmacy", __name__)
 
+# عدد الصيدليات التي تشعر افتراضياً وأقصاه، ونصف قطر البحث الافتراضي بالكيلومتر
+DEFAULT_PHARMACIES_NOTIFIED = 3
+MAX_PHARMACIES_NOTIFIED = 20
+DEFAULT_PHARMACY_RADIUS_KM = 10
+
 @pharmacy_bp.route("/order", methods=["POST"])
 def create_pharmacy_order():
     data = request.get_json()
@@ -63,34 +70,60 @@ def notify_nearby_pharmacies():
     data = request.get_json()
     consultation_id = data.get("consultation_id")
     prescription_details = data.get("prescription_details")
-    user_location = data.get("user_location")  # إحداثيات المستخدم
+    user_location = data.get("user_location")  # إحداثيات المستخدم {"latitude", "longitude"}
     
     if not consultation_id or not prescription_details:
         return jsonify({"message": "Consultation ID and prescription details are required"}), 400
     
-    # محاكاة العثور على الصيدليات القريبة
-    nearby_pharmacies = [
-        {"id": 1, "name": "صيدلية النور", "distance": "0.5 km", "phone": "+967123456789"},
-        {"id": 2, "name": "صيدلية الشفاء", "distance": "1.2 km", "phone": "+967987654321"},
-        {"id": 3, "name": "صيدلية الحياة", "distance": "2.0 km", "phone": "+967555666777"}
-    ]
+    try:
+        latitude, longitude = parse_coordinates(user_location)
+        radius_km = float(data.get("radius_km", DEFAULT_PHARMACY_RADIUS_KM))
+        limit = min(int(data.get("limit", DEFAULT_PHARMACIES_NOTIFIED)), MAX_PHARMACIES_NOTIFIED)
+        if radius_km <= 0 or limit <= 0:
+            raise ValueError("radius_km and limit must be positive")
+    except (TypeError, ValueError) as e:
+        return jsonify({"message": f"Valid user location is required: {str(e)}"}), 400
+    
+    # أقرب الصيدليات النشطة من الفهرس المكاني ثم بياناتها باستعلام واحد
+    nearby = location_index.nearest("pharmacies", latitude, longitude, limit, radius_km)
+    pharmacies = {}
+    if nearby:
+        pharmacies = {p.id: p for p in Pharmacy.query.filter(Pharmacy.id.in_([i for i, _ in nearby]))}
+    
+    if not isinstance(prescription_details, str):
+        prescription_details = json.dumps(prescription_details, ensure_ascii=False)
     
     # إرسال إشعارات للصيدليات
+    sent_at = datetime.utcnow()
     notifications_sent = []
-    for pharmacy in nearby_pharmacies:
-        # محاكاة إرسال الإشعار
-        notification = {
-            "pharmacy_id": pharmacy["id"],
-            "pharmacy_name": pharmacy["name"],
+    for pharmacy_id, distance in nearby:
+        pharmacy = pharmacies.get(pharmacy_id)
+        if pharmacy is None:
+            continue
+        db.session.add(PharmacyNotification(
+            consultation_id=consultation_id,
+            pharmacy_id=pharmacy.id,
+            prescription_details=prescription_details,
+            created_at=sent_at
+        ))
+        notifications_sent.append({
+            "pharmacy_id": pharmacy.id,
+            "pharmacy_name": pharmacy.name,
+            "phone": pharmacy.phone,
+            "distance_km": round(distance, 2),
             "prescription_details": prescription_details,
             "consultation_id": consultation_id,
             "status": "sent",
-            "sent_at": datetime.utcnow().isoformat()
-        }
-        notifications_sent.append(notification)
+            "sent_at": sent_at.isoformat()
+        })
+    db.session.commit()
     
+    if not notifications_sent:
+        message = f"No active pharmacies found within {radius_km:g} km"
+    else:
+        message = "Notifications sent to nearby pharmacies"
     return jsonify({
-        "message": "Notifications sent to nearby pharmacies",
+        "message": message,
         "pharmacies_notified": len(notifications_sent),
         "notifications": notifications_sent
     }), 200
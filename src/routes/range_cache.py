@@ -0,0 +1,304 @@
+import json
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import datetime, date, timedelta
+from sqlalchemy import event, select, union_all
+from sqlalchemy.orm import Session
+from src.models.user import db
+from src.routes.analytics_rollups import rollup_manager
+from src.routes import performance_cache
+from src.routes.performance_cache import CACHE_SETTINGS, cache_scope
+
+END_OF_DAY = datetime.max.time()
+
+# أقصى عدد مقاطع في الذاكرة المحلية عند غياب Redis (الأقدم استخداماً يحذف أولاً)
+MAX_LOCAL_SEGMENTS = 20000
+
+# صلاحية الأجزاء في الذاكرة المحلية بالثواني: الإبطال لا يصل إلا إلى العملية التي كتبت البيانات،
+# فالعمليات الأخرى تعيد حساب الجزء بعد هذه المدة على الأكثر
+LOCAL_SEGMENT_TTL = 60
+
+class RangeSegment:
+    """جزء من الفترة المطلوبة [start, end)؛ key مفتاح التخزين للأجزاء المغلقة و None للأجزاء التي تحسب دائماً"""
+
+    def __init__(self, start, end, key=None, inclusive_end=False):
+        self.start = start  # None يعني بلا حد أدنى
+        self.end = end
+        self.key = key
+        self.inclusive_end = inclusive_end
+
+    @property
+    def first_day(self):
+        return '' if self.start is None else self.start.date().isoformat()
+
+    def __repr__(self):
+        return f'<RangeSegment {self.key or "open"} {self.start} {self.end}>'
+
+def _midnight(day):
+    return datetime.combine(day, datetime.min.time())
+
+def _month_start(day):
+    return day.replace(day=1)
+
+def _next_month(day):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+def split_segments(start, end, now):
+    """تقسيم [start, end] إلى أجزاء: أيام وأشهر مغلقة قابلة للتخزين، وجزء اليوم الحالي والأطراف الجزئية
+
+    الشهر الكامل المنتهي قبل اليوم يصبح جزءاً واحداً (m2024-01)، وبقية الأيام الكاملة قبل اليوم أيام
+    (d2024-02-03). بدون start يبدأ بجزء "كل ما قبل الشهر الحالي" (u2024-03) ثم أيام الشهر الحالي.
+    """
+    end = end or now
+    today = now.date()
+    if start is not None and start > end:
+        return []
+    segments = []
+
+    if start is None:
+        boundary = _month_start(min(today, end.date()))
+        segments.append(RangeSegment(None, _midnight(boundary), f'u{boundary.isoformat()[:7]}'))
+        cursor = boundary
+    elif start == _midnight(start.date()):
+        cursor = start.date()
+    else:
+        # بداية جزئية داخل يوم: تحسب حتى نهاية ذلك اليوم (أو end إن كان في نفس اليوم)
+        day_end = _midnight(start.date() + timedelta(days=1))
+        if end < day_end:
+            return [RangeSegment(start, end, inclusive_end=True)]
+        segments.append(RangeSegment(start, day_end))
+        cursor = start.date() + timedelta(days=1)
+
+    # الأيام الكاملة المغلقة قبل هذا اليوم (نهاية عند آخر لحظة من اليوم تجعله كاملاً)
+    end_day = end.date() + timedelta(days=1) if end.time() == END_OF_DAY else end.date()
+    last_full = min(end_day, today)
+    while cursor < last_full:
+        month_end = _next_month(cursor)
+        if cursor.day == 1 and month_end <= last_full:
+            segments.append(RangeSegment(_midnight(cursor), _midnight(month_end), f'm{cursor.isoformat()[:7]}'))
+            cursor = month_end
+        else:
+            segments.append(RangeSegment(_midnight(cursor), _midnight(cursor + timedelta(days=1)), f'd{cursor.isoformat()}'))
+            cursor += timedelta(days=1)
+
+    # الباقي: اليوم الحالي (مفتوح) أو جزء من يوم منتهٍ قبل end
+    if _midnight(cursor) <= end:
+        segments.append(RangeSegment(_midnight(cursor), end, inclusive_end=True))
+    return segments
+
+def merge_totals(target, source):
+    """جمع قاموسين متداخلين من الأرقام"""
+    for key, value in source.items():
+        if isinstance(value, dict):
+            merge_totals(target.setdefault(key, {}), value)
+        else:
+            target[key] = target.get(key, 0) + (value or 0)
+    return target
+
+def add_total(totals, *path_and_value):
+    """totals[a][b]... += value"""
+    *path, key, value = path_and_value
+    for part in path:
+        totals = totals.setdefault(part, {})
+    totals[key] = totals.get(key, 0) + (value or 0)
+
+class RangeComputation:
+    """مجاميع قابلة للدمج على فترة زمنية
+
+    statement(start, end, inclusive_end) يعيد استعلاماً بعمود period (اليوم 'YYYY-MM-DD')، و accumulate(totals, row)
+    يضيف صفاً إلى قاموس المجاميع. sources مصادر التجميع التي يبطل تغيير أيامها الأجزاء المخزنة.
+    """
+
+    def __init__(self, name, sources, statement, accumulate):
+        self.name = name
+        self.sources = sources
+        self.statement = statement
+        self.accumulate = accumulate
+
+class SegmentStore:
+    """تخزين الأجزاء المغلقة: في Redis بلا انتهاء (الإبطال مشترك)، وإلا ذاكرة محلية محدودة الحجم والصلاحية"""
+
+    def __init__(self, max_local=MAX_LOCAL_SEGMENTS, local_ttl=LOCAL_SEGMENT_TTL):
+        self.max_local = max_local
+        self.local_ttl = local_ttl
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        if not keys:
+            return {}
+        if performance_cache.REDIS_AVAILABLE:
+            try:
+                values = performance_cache.redis_client.mget(keys)
+                return {key: json.loads(value) for key, value in zip(keys, values) if value}
+            except Exception:
+                return {}
+        now = time.time()
+        with self._lock:
+            found = {}
+            for key in keys:
+                item = self._local.get(key)
+                if item is None:
+                    continue
+                expires_at, value = item
+                if expires_at <= now:
+                    del self._local[key]
+                    continue
+                self._local.move_to_end(key)
+                found[key] = value
+            return found
+
+    def set_many(self, items):
+        if not items:
+            return
+        if performance_cache.REDIS_AVAILABLE:
+            try:
+                performance_cache.redis_client.mset({key: json.dumps(value) for key, value in items.items()})
+            except Exception:
+                pass
+            return
+        expires_at = time.time() + self.local_ttl
+        with self._lock:
+            for key, value in items.items():
+                self._local[key] = (expires_at, value)
+                self._local.move_to_end(key)
+            while len(self._local) > self.max_local:
+                self._local.popitem(last=False)
+
+    def delete_matching(self, prefix, suffixes=None):
+        """حذف مفاتيح prefix + suffix (أو كل ما يبدأ بـ prefix إذا كانت suffixes None)"""
+        if performance_cache.REDIS_AVAILABLE:
+            try:
+                if suffixes is None:
+                    keys = list(performance_cache.redis_client.scan_iter(f'{prefix}*'))
+                else:
+                    keys = [f'{prefix}{suffix}' for suffix in suffixes]
+                if keys:
+                    performance_cache.redis_client.delete(*keys)
+            except Exception:
+                pass
+            return
+        with self._lock:
+            if suffixes is None:
+                doomed = [key for key in self._local if key.startswith(prefix)]
+            else:
+                doomed = [f'{prefix}{suffix}' for suffix in suffixes]
+            for key in doomed:
+                self._local.pop(key, None)
+
+class RangeCache:
+    """نتائج التحليلات للفترات الاعتباطية من أجزاء مغلقة مخزنة + اليوم الحالي محسوباً
+
+    الأجزاء الناقصة كلها تحسب في استعلام UNION ALL واحد مجمع حسب اليوم ثم توزع على أجزائها، فتحديث
+    لوحة المعلومات يعيد حساب اليوم الحالي والأطراف الجزئية فقط. الأجزاء تبطل عند إعادة حساب أيامها في
+    جداول التجميع اليومية (flush أو catch_up) وتبطل كلها عند rebuild.
+    """
+
+    def __init__(self, store=None):
+        self.store = store or SegmentStore()
+        self.computations = {}
+
+    def register(self, computation):
+        self.computations[computation.name] = computation
+        return computation
+
+    def _prefix(self, name):
+        return CACHE_SETTINGS['range_segments']['key'].format(f'{cache_scope()}:{name}:')
+
+    def get(self, name, start=None, end=None, now=None):
+        """مجاميع الفترة [start, end] بعد دمج أجزائها"""
+        computation = self.computations[name]
+        now = now or datetime.now()
+        segments = split_segments(start, end, now)
+        prefix = self._prefix(name)
+        cached = self.store.get_many([prefix + s.key for s in segments if s.key])
+
+        totals = {}
+        missing = []
+        for segment in segments:
+            if segment.key and prefix + segment.key in cached:
+                merge_totals(totals, cached[prefix + segment.key])
+            else:
+                missing.append(segment)
+        if not missing:
+            return totals
+
+        computed = self._compute(computation, missing)
+        self.store.set_many({prefix + s.key: computed[i] for i, s in enumerate(missing) if s.key})
+        for values in computed:
+            merge_totals(totals, values)
+        return totals
+
+    def _compute(self, computation, segments):
+        """مجاميع الأجزاء الناقصة باستعلام واحد: الأجزاء المتجاورة تدمج في نطاق واحد والصفوف توزع باليوم"""
+        runs = []
+        for segment in segments:
+            if runs and runs[-1][-1].end == segment.start and not runs[-1][-1].inclusive_end:
+                runs[-1].append(segment)
+            else:
+                runs.append([segment])
+
+        parts = []
+        for run in runs:
+            statement = computation.statement(run[0].start, run[-1].end, run[-1].inclusive_end).subquery()
+            parts.append(select(*statement.c))
+        statement = parts[0] if len(parts) == 1 else union_all(*parts)
+
+        firsts = [segment.first_day for segment in segments]
+        totals = [{} for _ in segments]
+        for row in db.session.execute(statement):
+            index = bisect_right(firsts, str(row.period)[:10]) - 1
+            computation.accumulate(totals[max(index, 0)], row)
+        return totals
+
+    def invalidate(self, source_name, days=None):
+        """إبطال أجزاء الحسابات المعتمدة على المصدر: أيام days وأشهرها وجزء "ما قبل الشهر" (أو الكل)"""
+        for computation in self.computations.values():
+            if source_name not in computation.sources:
+                continue
+            prefix = self._prefix(computation.name)
+            if days is None:
+                self.store.delete_matching(prefix)
+                continue
+            suffixes = set()
+            for day in days:
+                suffixes.add(f'd{day.isoformat()}')
+                suffixes.add(f'm{day.isoformat()[:7]}')
+                # أجزاء "ما قبل الشهر" التي تحتوي هذا اليوم حتى الشهر الحالي
+                month = _next_month(day)
+                while month <= _next_month(date.today()):
+                    suffixes.add(f'u{month.isoformat()[:7]}')
+                    month = _next_month(month)
+            self.store.delete_matching(prefix, suffixes)
+
+    def record(self, source_name, days=None, committed=False):
+        """إبطال فوري وتسجيل الأيام في الجلسة لإبطالها مرة أخرى بعد commit
+
+        الإبطال الثاني يمنع قارئاً متزامناً من تخزين بيانات ما قبل المعاملة بعد الإبطال الأول. المعاملات
+        المستقلة (catch_up و rebuild) تستدعي بـ committed=True بعد تثبيتها فيكفي الإبطال دون تسجيل.
+        """
+        self.invalidate(source_name, days)
+        if committed:
+            return
+        pending = db.session.info.setdefault('range_cache_pending', {})
+        if days is None or pending.get(source_name, ()) is None:
+            pending[source_name] = None
+        else:
+            pending.setdefault(source_name, set()).update(days)
+
+# إنشاء مثيل من ذاكرة الفترات وربطه بإعادة حساب جداول التجميع
+range_cache = RangeCache()
+rollup_manager.listeners.append(range_cache.record)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_after_commit(session):
+    pending = session.info.pop('range_cache_pending', None)
+    if pending:
+        for source_name, days in pending.items():
+            range_cache.invalidate(source_name, days)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop('range_cache_pending', None)
@@ -0,0 +1,240 @@
+import os
+import json
+import uuid
+import hashlib
+import tempfile
+import threading
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from src.routes.performance_cache import CACHE_SETTINGS, REDIS_AVAILABLE, redis_client
+
+try:
+    from celery import Celery
+except ImportError:
+    Celery = None
+
+REPORT_FORMATS = {
+    'json': ('application/json', 'json'),
+    'excel': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'pdf': ('application/pdf', 'pdf')
+}
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+# أقل فاصل بالثواني بين مسحين للعناصر المنتهية في الذاكرة المحلية
+SWEEP_INTERVAL = 30
+
+# مجلد ملفات نتائج التقارير (يجب أن يكون مشتركاً بين عمال Celery والويب عند تشغيلهم على أجهزة مختلفة)
+RESULTS_DIR = os.environ.get('REPORT_RESULTS_DIR', os.path.join(tempfile.gettempdir(), 'healthcare_reports'))
+
+class JobStore:
+    """تخزين حالة المهام ونتائجها مع انتهاء صلاحية: Redis عند توفره وإلا الذاكرة المحلية
+
+    في الذاكرة المحلية تحذف العناصر المنتهية عند الكتابة (مسح كل sweep_interval ثانية على الأكثر)،
+    فلا تبقى نتائج التقارير التي لا يقرؤها أحد بعد انتهاء صلاحيتها.
+    """
+
+    def __init__(self, use_redis=REDIS_AVAILABLE, sweep_interval=SWEEP_INTERVAL):
+        self.use_redis = use_redis
+        self.sweep_interval = sweep_interval
+        self._items = {}
+        self._next_sweep = 0
+        self._lock = threading.Lock()
+
+    def _sweep(self, now):
+        """حذف العناصر المنتهية (يستدعى مع القفل)"""
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self.sweep_interval
+        for key in [key for key, (expires_at, _) in self._items.items() if expires_at <= now]:
+            del self._items[key]
+
+    def get(self, key):
+        if self.use_redis:
+            return redis_client.get(key)
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.time():
+                del self._items[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl):
+        if self.use_redis:
+            redis_client.setex(key, ttl, value)
+            return
+        now = time.time()
+        with self._lock:
+            self._sweep(now)
+            self._items[key] = (now + ttl, value)
+
+    def add(self, key, value, ttl):
+        """الحفظ فقط إذا لم يكن المفتاح موجوداً (للدمج الذري للطلبات المتطابقة)"""
+        if self.use_redis:
+            return bool(redis_client.set(key, value, ex=ttl, nx=True))
+        now = time.time()
+        with self._lock:
+            self._sweep(now)
+            item = self._items.get(key)
+            if item is not None and item[0] > now:
+                return False
+            self._items[key] = (now + ttl, value)
+            return True
+
+    def delete(self, key):
+        if self.use_redis:
+            redis_client.delete(key)
+            return
+        with self._lock:
+            self._items.pop(key, None)
+
+class ReportJobManager:
+    """إنشاء التقارير في الخلفية: رقم مهمة، تحديثات تقدم، ونتيجة قابلة للتنزيل حتى انتهاء صلاحيتها
+
+    التقرير يكتب مباشرة إلى ملف في results_dir ويحفظ في المهمة مساره فقط، فلا يبقى الملف في الذاكرة
+    ولا في Redis، والتنزيل يقرؤه على أجزاء. الملفات الأقدم من result_ttl تحذف عند تشغيل كل مهمة.
+    """
+
+    def __init__(self, store=None, executor=None, celery_app=None, result_ttl=None, results_dir=RESULTS_DIR):
+        self.store = store or JobStore()
+        self.result_ttl = result_ttl or CACHE_SETTINGS['report_jobs']['ttl']
+        self.results_dir = results_dir
+        self.key = CACHE_SETTINGS['report_jobs']['key']
+        self.celery_app = celery_app
+        self._executor = executor
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=int(os.environ.get('REPORT_JOB_WORKERS', 2)), thread_name_prefix='report-job'
+            )
+        return self._executor
+
+    @staticmethod
+    def fingerprint(params):
+        return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def get(self, job_id):
+        data = self.store.get(self.key.format(job_id))
+        return json.loads(data) if data else None
+
+    def _save(self, job):
+        job['updated_at'] = datetime.now().isoformat()
+        self.store.set(self.key.format(job['id']), json.dumps(job, default=str), self.result_ttl)
+
+    def update(self, job_id, **changes):
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.update(changes)
+        self._save(job)
+        return job
+
+    def submit(self, params):
+        """إنشاء مهمة جديدة أو إرجاع المهمة النشطة المطابقة لنفس المعاملات؛ يعيد (المهمة، مكررة؟)"""
+        fingerprint = self.fingerprint(params)
+        dedupe_key = self.key.format(f'fingerprint:{fingerprint}')
+        job_id = uuid.uuid4().hex
+
+        while not self.store.add(dedupe_key, job_id, self.result_ttl):
+            existing = self.get(self.store.get(dedupe_key) or '')
+            if existing and existing['status'] in ACTIVE_STATUSES:
+                return existing, True
+            # المهمة السابقة انتهت أو انتهت صلاحيتها: تحرير المفتاح والمحاولة مجدداً
+            self.store.delete(dedupe_key)
+
+        job = {
+            'id': job_id,
+            'status': 'queued',
+            'progress': 0,
+            'stage': 'في الانتظار',
+            'params': params,
+            'fingerprint': fingerprint,
+            'created_at': datetime.now().isoformat(),
+            'error': None,
+            'filename': None,
+            'content_type': None,
+            'result_path': None
+        }
+        self._save(job)
+
+        if self.celery_app is not None:
+            self.celery_app.send_task('report_jobs.run', args=[job_id])
+        else:
+            app = current_app._get_current_object()
+            self._get_executor().submit(self._run_in_app, app, job_id)
+        return job, False
+
+    def _run_in_app(self, app, job_id):
+        with app.app_context():
+            self.run(job_id)
+
+    def run(self, job_id):
+        """تنفيذ المهمة (داخل سياق التطبيق) وحفظ النتيجة في ملف أو تسجيل الخطأ"""
+        # استيراد متأخر لتفادي الاستيراد الدائري مع analytics_reports
+        from src.routes.analytics_reports import analytics_engine
+
+        job = self.update(job_id, status='running', stage='بدء التنفيذ')
+        if job is None:
+            return
+        os.makedirs(self.results_dir, exist_ok=True)
+        self._sweep_results()
+        path = os.path.join(self.results_dir, job_id)
+        try:
+            def progress(percent, stage):
+                self.update(job_id, progress=percent, stage=stage)
+
+            # الكتابة إلى ملف جزئي ثم إعادة التسمية: لا يرى التنزيل ملفاً ناقصاً
+            with open(f'{path}.part', 'wb') as target:
+                content_type, filename = analytics_engine.build_report(target, progress=progress, **job['params'])
+            os.replace(f'{path}.part', path)
+            self.update(job_id, status='completed', progress=100, stage='اكتمل',
+                        filename=filename, content_type=content_type, result_path=path)
+        except Exception as e:
+            if os.path.exists(f'{path}.part'):
+                os.remove(f'{path}.part')
+            self.update(job_id, status='failed', stage='فشل', error=str(e))
+        finally:
+            self.store.delete(self.key.format(f"fingerprint:{job['fingerprint']}"))
+
+    def _sweep_results(self):
+        """حذف ملفات النتائج التي انتهت صلاحية مهامها"""
+        expired = time.time() - self.result_ttl
+        for entry in os.scandir(self.results_dir):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < expired:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    def get_result(self, job_id):
+        """مسار ملف نتيجة المهمة المكتملة أو None إذا انتهت صلاحيتها"""
+        job = self.get(job_id)
+        path = job and job.get('result_path')
+        return path if path and os.path.exists(path) else None
+
+def _create_celery_app():
+    """Celery عند ضبط CELERY_BROKER_URL (يتطلب Redis لمشاركة حالة المهام بين العمليات)"""
+    broker_url = os.environ.get('CELERY_BROKER_URL')
+    if not broker_url or Celery is None or not REDIS_AVAILABLE:
+        return None
+    celery = Celery('report_jobs', broker=broker_url)
+
+    @celery.task(name='report_jobs.run')
+    def run_report_job(job_id):
+        from src.main import app
+        with app.app_context():
+            report_jobs.run(job_id)
+
+    return celery
+
+# تطبيق Celery (للتشغيل: celery -A src.routes.report_jobs:celery_app worker)
+celery_app = _create_celery_app()
+
+# إنشاء مثيل من مدير مهام التقارير
+report_jobs = ReportJobManager(celery_app=celery_app)
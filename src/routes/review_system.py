@@ -1,6 +1,8 @@
 from flask import Blueprint, request, jsonify
 from src.models.user import db, DoctorReview, ServiceReview, DoctorProfile, User, Consultation
 from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
 import json
 
 review_system_bp = Blueprint("review_system", __name__)
@@ -96,8 +98,8 @@ def get_doctor_reviews(doctor_id):
         if min_rating:
             query = query.filter(DoctorReview.rating >= min_rating)
         
-        # ترتيب حسب التاريخ
-        query = query.order_by(DoctorReview.created_at.desc())
+        # ترتيب حسب التاريخ مع تحميل المريض في نفس الاستعلام
+        query = query.options(joinedload(DoctorReview.patient)).order_by(DoctorReview.created_at.desc())
         
         # تطبيق التصفح
         reviews = query.paginate(
@@ -106,19 +108,22 @@ def get_doctor_reviews(doctor_id):
             error_out=False
         )
         
-        # حساب الإحصائيات
-        all_reviews = DoctorReview.query.filter_by(
+        # حساب الإحصائيات (توزيع التقييمات باستعلام مجمع واحد)
+        rating_counts = dict(db.session.query(
+            DoctorReview.rating,
+            func.count(DoctorReview.id)
+        ).filter_by(
             doctor_id=doctor_id,
             is_approved=True
-        ).all()
+        ).group_by(DoctorReview.rating).all())
         
-        total_reviews = len(all_reviews)
-        average_rating = sum(r.rating for r in all_reviews) / total_reviews if total_reviews > 0 else 0
+        total_reviews = sum(rating_counts.values())
+        average_rating = sum(rating * count for rating, count in rating_counts.items()) / total_reviews if total_reviews > 0 else 0
         
         # توزيع التقييمات
         rating_distribution = {}
         for i in range(1, 6):
-            rating_distribution[str(i)] = len([r for r in all_reviews if r.rating == i])
+            rating_distribution[str(i)] = rating_counts.get(i, 0)
         
         return jsonify({
             "reviews": [review.to_dict() for review in reviews.items],
@@ -0,0 +1,252 @@
+import json
+import time
+import hashlib
+import threading
+from math import ceil
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from src.models.user import db, User, DoctorProfile, DoctorLicense, Consultation, DoctorReview
+from src.routes import performance_cache
+from src.routes.performance_cache import CACHE_SETTINGS, cache_scope
+from src.routes.arabic_text import tokenize
+
+# عدد المعرفات في كل نافذة مخزنة من الترتيب الكامل (الصفحات بأي حجم تقتطع من النوافذ)
+WINDOW_SIZE = 200
+
+# أقصى عدد نوافذ في الذاكرة المحلية عند غياب Redis (الأقدم استخداماً يحذف أولاً)
+MAX_LOCAL_ENTRIES = 5000
+
+# أنواع الكيانات التي يرفع تغييرها (بعد commit) إصدار بياناتها فتبطل نتائج الأقسام المعتمدة عليها
+ENTITY_MODELS = {
+    DoctorProfile: 'doctors',
+    DoctorLicense: 'licenses',
+    DoctorReview: 'reviews',
+    User: 'users',
+    Consultation: 'consultations'
+}
+
+PENDING_KEY = 'search_cache_pending'
+
+def canonical_query(query, stemming=True):
+    """الصيغة الموحدة لنص البحث: كلمات موحدة (ومجذعة) مرتبة، فـ"أطباء القلب" و"قلب  اطباء" مفتاح واحد
+
+    تصلح فقط للأقسام التي تطابق عبر فهارس FTS (المطابقة فيها لكل كلمة بحد ذاتها).
+    """
+    return ' '.join(sorted(tokenize(query or '', stemming)))
+
+class ResultStore:
+    """قيم JSON بمدة صلاحية وعدادات إصدار: Redis إن توفر وإلا ذاكرة محلية محدودة الحجم"""
+
+    def __init__(self, max_local=MAX_LOCAL_ENTRIES):
+        self.max_local = max_local
+        self._local = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        if performance_cache.REDIS_AVAILABLE:
+            try:
+                values = performance_cache.redis_client.mget(keys)
+                return {key: json.loads(value) for key, value in zip(keys, values) if value}
+            except Exception:
+                return {}
+        now = time.time()
+        with self._lock:
+            found = {}
+            for key in keys:
+                item = self._local.get(key)
+                if item is None:
+                    continue
+                if item[0] <= now:
+                    del self._local[key]
+                    continue
+                self._local.move_to_end(key)
+                found[key] = item[1]
+            return found
+
+    def set_many(self, items, ttl):
+        if not items:
+            return
+        if performance_cache.REDIS_AVAILABLE:
+            try:
+                pipeline = performance_cache.redis_client.pipeline()
+                for key, value in items.items():
+                    pipeline.setex(key, ttl, json.dumps(value))
+                pipeline.execute()
+            except Exception:
+                pass
+            return
+        expires_at = time.time() + ttl
+        with self._lock:
+            for key, value in items.items():
+                self._local[key] = (expires_at, value)
+                self._local.move_to_end(key)
+            while len(self._local) > self.max_local:
+                self._local.popitem(last=False)
+
+    def counters(self, keys):
+        if performance_cache.REDIS_AVAILABLE:
+            try:
+                return [int(value or 0) for value in performance_cache.redis_client.mget(keys)]
+            except Exception:
+                return [0] * len(keys)
+        with self._lock:
+            return [self._counters.get(key, 0) for key in keys]
+
+    def increment(self, keys):
+        if performance_cache.REDIS_AVAILABLE:
+            try:
+                pipeline = performance_cache.redis_client.pipeline()
+                for key in keys:
+                    pipeline.incr(key)
+                pipeline.execute()
+            except Exception:
+                pass
+            return
+        with self._lock:
+            for key in keys:
+                self._counters[key] = self._counters.get(key, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+
+class SearchResultCache:
+    """ذاكرة نتائج البحث: الترتيب الكامل لمعرفات كل بحث موحد في نوافذ، لا الصفحات المعروضة
+
+    المفتاح بصمة (القسم، الصيغة الموحدة للاستعلام والفلاتر، إصدارات الكيانات التي يعتمد عليها القسم،
+    رقم النافذة). الصفحات بأحجام مختلفة والصفحات التالية تقتطع من نفس النوافذ، والصفوف نفسها تحمل
+    من القاعدة بمعرفاتها فتبقى حقولها حديثة. تغيير كيان (بعد commit) يرفع إصداره فتصبح المفاتيح القديمة
+    غير قابلة للوصول وتنتهي بمدة الصلاحية. العدد الكلي يحسب مع أول جلب للمعرفات (دالة نافذة) ويخزن
+    بجانب النوافذ، فلا يحتاج البحث استعلام COUNT منفصلاً.
+    """
+
+    def __init__(self, store=None, window_size=WINDOW_SIZE, ttl=None):
+        self.store = store or ResultStore()
+        self.window_size = window_size
+        self.ttl = ttl or CACHE_SETTINGS['search_results']['ttl']
+        self.key = CACHE_SETTINGS['search_results']['key']
+        self.hits = 0
+        self.misses = 0
+
+    def _version_keys(self, entities):
+        scope = cache_scope()
+        return [self.key.format(f'{scope}:version:{entity}') for entity in entities]
+
+    def versions(self, entities):
+        entities = sorted(entities)
+        return dict(zip(entities, self.store.counters(self._version_keys(entities))))
+
+    def invalidate(self, entities=None):
+        """رفع إصدار الكيانات (أو كلها) بعد تغييرات لا تمر بجلسة ORM مثل الإدخال المجمع"""
+        self.store.increment(self._version_keys(sorted(entities or ENTITY_MODELS.values())))
+
+    def prefix(self, section, canonical, entities):
+        """بادئة مفاتيح نوافذ البحث الموحد canonical (قاموس قابل للتحويل إلى JSON)"""
+        digest = hashlib.md5(json.dumps(
+            [section, canonical, self.versions(entities)], sort_keys=True, default=str
+        ).encode()).hexdigest()
+        return self.key.format(f'{cache_scope()}:{section}:{digest}:')
+
+    def page(self, section, canonical, entities, page, per_page, fetch_ids, count=None):
+        """معرفات الصفحة وبيانات التصفح (total, pages, current_page, has_next)
+
+        fetch_ids(offset, limit, with_total) يعيد (معرفات الترتيب الكامل من offset، العدد الكلي أو None)
+        والعدد يحسب في نفس الاستعلام. count() للعدد عندما لا يعرف من النوافذ، و None لتأجيل العد
+        (total و pages تكون None). التغييرات غير المثبتة في الجلسة الحالية تتجاوز الذاكرة.
+        """
+        size = self.window_size
+        start = (page - 1) * per_page
+        needed = list(range(start // size, (start + per_page - 1) // size + 1))
+        prefix = None if db.session.info.get(PENDING_KEY) else self.prefix(section, canonical, entities)
+        total_key = f'{prefix}total'
+
+        cached = {}
+        if prefix:
+            cached = self.store.get_many([f'{prefix}w{window}' for window in needed] + [total_key])
+        windows = {window: cached[f'{prefix}w{window}'] for window in needed if f'{prefix}w{window}' in cached}
+        total = cached.get(total_key)
+
+        # النوافذ الناقصة من أولها حتى آخر نافذة مطلوبة باستعلام واحد (صف إضافي يبين ما بعدها)
+        missing = []
+        for index, window in enumerate(needed):
+            if window not in windows:
+                missing = needed[index:]
+                break
+            if not windows[window]['more']:
+                break
+        fresh = {}
+        if missing:
+            first = missing[0]
+            ids, fetched_total = fetch_ids(first * size, (needed[-1] - first + 1) * size + 1,
+                                           count is not None and total is None)
+            for window in range(first, needed[-1] + 1):
+                chunk = ids[(window - first) * size:(window - first + 1) * size]
+                fresh[window] = {'ids': chunk, 'more': len(ids) > (window - first + 1) * size}
+            windows.update(fresh)
+            total = total if fetched_total is None else fetched_total
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        ids, more = [], True
+        for window in needed:
+            ids.extend(windows[window]['ids'])
+            more = windows[window]['more']
+            if not more:
+                # نافذة غير فارغة انتهى الترتيب داخلها تعطي العدد الكلي دون COUNT
+                if total is None and (windows[window]['ids'] or window == 0):
+                    total = window * size + len(windows[window]['ids'])
+                break
+        offset = start - needed[0] * size
+        page_ids = ids[offset:offset + per_page]
+        has_next = more or len(ids) > offset + per_page
+
+        if count is None:
+            total = None
+        elif total is None:
+            total = count()
+        if prefix:
+            stored = {f'{prefix}w{window}': value for window, value in fresh.items()}
+            if total is not None and total_key not in cached:
+                stored[total_key] = total
+            self.store.set_many(stored, self.ttl)
+        return page_ids, {
+            'total': total,
+            'pages': None if total is None else ceil(total / per_page),
+            'current_page': page,
+            'has_next': has_next
+        }
+
+    def status(self):
+        return {
+            'backend': 'redis' if performance_cache.REDIS_AVAILABLE else 'local',
+            'window_size': self.window_size,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+# إنشاء مثيل من ذاكرة نتائج البحث
+search_cache = SearchResultCache()
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_entities(session, flush_context):
+    changed = {
+        ENTITY_MODELS[type(instance)]
+        for instance in (*session.new, *session.dirty, *session.deleted)
+        if type(instance) in ENTITY_MODELS
+    }
+    if changed:
+        session.info.setdefault(PENDING_KEY, set()).update(changed)
+
+@event.listens_for(Session, 'after_commit')
+def _bump_versions_after_commit(session):
+    pending = session.info.pop(PENDING_KEY, None)
+    if pending:
+        search_cache.invalidate(pending)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop(PENDING_KEY, None)
@@ -0,0 +1,84 @@
+from sqlalchemy import select, func, case, literal, union_all, String
+from src.models.user import db, DoctorProfile
+
+# حدود فئات رسوم الاستشارة (الحد الأدنى شامل) وفئات متوسط التقييم
+FEE_BUCKETS = [(0, 50, '0-50'), (50, 100, '50-100'), (100, 200, '100-200'), (200, None, '200+')]
+RATING_BUCKETS = [(4, '4-5'), (3, '3-4'), (2, '2-3'), (0, '0-2')]
+UNRATED = 'unrated'
+FACETS = ('specialization', 'fee', 'rating', 'language', 'availability')
+
+def doctor_facets(criteria=(), facets=FACETS):
+    """أعداد الأطباء المطابقين لـ criteria حسب التخصص وفئة الرسوم وفئة التقييم واللغة والإتاحة
+
+    استعلام واحد: الأطباء المطابقون يحسبون مرة في CTE مادي، ثم UNION ALL من تجميع لكل واجهة.
+    اللغات مخزنة مصفوفة JSON فتفك بـ json_each (الطبيب يعد في كل لغة يتحدثها).
+    """
+    unknown = [facet for facet in facets if facet not in FACETS]
+    if unknown:
+        raise ValueError(f'واجهات غير معروفة: {", ".join(unknown)}')
+    if not facets:
+        return {}
+
+    matched = select(
+        DoctorProfile.id, DoctorProfile.specialization, DoctorProfile.consultation_fee,
+        DoctorProfile.available_for_consultation, DoctorProfile.languages,
+        DoctorProfile.average_rating.label('rating')
+    ).where(*criteria).cte('matched').prefix_with('MATERIALIZED')
+
+    fee = case(*[
+        (matched.c.consultation_fee < high, label) for _, high, label in FEE_BUCKETS if high is not None
+    ], else_=FEE_BUCKETS[-1][2])
+    # المتوسط المخزن صفر للطبيب بلا مراجعات معتمدة (التقييمات من 1 إلى 5)
+    rating = case((matched.c.rating <= 0, UNRATED), *[
+        (matched.c.rating >= low, label) for low, label in RATING_BUCKETS
+    ], else_=UNRATED)
+    availability = case((matched.c.available_for_consultation == True, 'available'), else_='unavailable')
+
+    parts = []
+    for facet, value in (('specialization', matched.c.specialization), ('fee', fee), ('rating', rating),
+                         ('availability', availability)):
+        if facet in facets:
+            parts.append(select(
+                literal(facet).label('facet'), value.label('value'), func.count().label('count')
+            ).select_from(matched).group_by(value))
+    if 'language' in facets:
+        languages = func.json_each(matched.c.languages).table_valued('value')
+        parts.append(select(
+            literal('language').label('facet'), languages.c.value.cast(String).label('value'),
+            func.count().label('count')
+        ).select_from(matched).join(languages, literal(True)).where(
+            func.json_valid(matched.c.languages)
+        ).group_by(languages.c.value))
+
+    counts = {facet: {} for facet in facets}
+    statement = parts[0] if len(parts) == 1 else union_all(*parts)
+    for facet, value, count in db.session.execute(statement):
+        if value is not None:
+            counts[facet][str(value)] = count
+    return format_facets(counts)
+
+def format_facets(counts):
+    """قوائم {value, count}: الفئات بترتيبها الثابت، والتخصصات واللغات الأكثر أولاً"""
+    order = {
+        'fee': [label for _, _, label in FEE_BUCKETS],
+        'rating': [label for _, label in RATING_BUCKETS] + [UNRATED],
+        'availability': ['available', 'unavailable']
+    }
+    result = {}
+    for facet, values in counts.items():
+        if facet in order:
+            items = [(value, values[value]) for value in order[facet] if value in values]
+        else:
+            items = sorted(values.items(), key=lambda item: (-item[1], item[0]))
+        result[facet] = [{'value': value, 'count': count} for value, count in items]
+    return result
+
+def parse_facets(value):
+    """قيمة الطلب: true لكل الواجهات أو قائمة/نص مفصول بفواصل، وغير ذلك لا واجهات"""
+    if value in (True, 'true', '1', 'all'):
+        return FACETS
+    if isinstance(value, str):
+        value = [item.strip() for item in value.split(',') if item.strip()]
+    if isinstance(value, (list, tuple)):
+        return tuple(value)
+    return ()
@@ -0,0 +1,118 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from flask import current_app
+from sqlalchemy.pool import StaticPool, SingletonThreadPool
+from src.models.user import db
+
+# عدد العمال المشترك بين كل الطلبات، ومهلة القسم الافتراضية والقصوى بالثواني
+MAX_WORKERS = 4
+DEFAULT_SECTION_TIMEOUT = 5.0
+MAX_SECTION_TIMEOUT = 30.0
+
+class FanoutResult:
+    """نتائج الأقسام المكتملة مع الأقسام التي تجاوزت مهلتها أو فشلت وزمن كل قسم"""
+
+    def __init__(self):
+        self.results = {}
+        self.timed_out = []
+        self.errors = {}
+        self.elapsed_ms = {}
+
+    @property
+    def partial(self):
+        return bool(self.timed_out or self.errors)
+
+class SearchFanout:
+    """تنفيذ أقسام البحث المستقلة بالتوازي على مجمع خيوط محدود
+
+    كل قسم يعمل في سياق تطبيق خاص به (جلسة واتصال مستقلان) وله مهلته: عند انتهائها يعاد ما اكتمل
+    ويعلم القسم المتأخر، فيصبح زمن الطلب أطول الأقسام لا مجموعها. القسم المتأخر لا يقطع بل يكمل
+    في الخلفية وتهمل نتيجته، والمجمع المحدود يمنع تراكم هذه الأقسام تحت الضغط.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='search-fanout')
+            return self._executor
+
+    def parallel(self):
+        """قاعدة SQLite في الذاكرة تشترك في اتصال واحد بين الخيوط، فتنفذ أقسامها بالتتابع"""
+        return self.max_workers > 1 and not isinstance(db.engine.pool, (StaticPool, SingletonThreadPool))
+
+    def run(self, tasks, timeouts=None, default_timeout=DEFAULT_SECTION_TIMEOUT):
+        """تنفيذ tasks ({الاسم: دالة بلا معاملات}) وإرجاع FanoutResult
+
+        timeouts: مهلة لكل قسم بالثواني تبدأ من بداية التنفيذ (الافتراضي default_timeout).
+        """
+        timeouts = timeouts or {}
+        outcome = FanoutResult()
+        if not self.parallel():
+            for name, task in tasks.items():
+                started = time.perf_counter()
+                try:
+                    outcome.results[name] = task()
+                except Exception as e:
+                    outcome.errors[name] = e
+                outcome.elapsed_ms[name] = round((time.perf_counter() - started) * 1000, 2)
+            return outcome
+
+        app = current_app._get_current_object()
+        started = time.perf_counter()
+        deadlines = {name: started + timeouts.get(name, default_timeout) for name in tasks}
+        futures = {self.executor().submit(self._call, app, task): name for name, task in tasks.items()}
+        pending = set(futures)
+        while pending:
+            now = time.perf_counter()
+            expired = {future for future in pending if deadlines[futures[future]] <= now}
+            for future in expired:
+                future.cancel()
+                outcome.timed_out.append(futures[future])
+                outcome.elapsed_ms[futures[future]] = round((now - started) * 1000, 2)
+            pending -= expired
+            if not pending:
+                break
+            done, pending = wait(pending, timeout=min(deadlines[futures[f]] for f in pending) - now,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                name = futures[future]
+                try:
+                    outcome.results[name], outcome.elapsed_ms[name] = future.result()
+                except Exception as e:
+                    outcome.errors[name] = e
+                    outcome.elapsed_ms[name] = round((time.perf_counter() - started) * 1000, 2)
+        outcome.timed_out.sort(key=list(tasks).index)
+        return outcome
+
+    @staticmethod
+    def _call(app, task):
+        started = time.perf_counter()
+        with app.app_context():
+            result = task()
+        return result, round((time.perf_counter() - started) * 1000, 2)
+
+def section_timeouts(value, sections):
+    """المهلة من الطلب: رقم لكل الأقسام أو قاموس لكل قسم، محصورة بين 0 و MAX_SECTION_TIMEOUT"""
+    if value is None:
+        return {}
+    if not isinstance(value, dict):
+        value = {name: value for name in sections}
+    timeouts = {}
+    for name, seconds in value.items():
+        if name not in sections:
+            raise ValueError(f'قسم غير معروف في المهلة: {name}')
+        seconds = float(seconds)
+        if seconds <= 0:
+            raise ValueError('المهلة يجب أن تكون أكبر من صفر')
+        timeouts[name] = min(seconds, MAX_SECTION_TIMEOUT)
+    return timeouts
+
+# إنشاء مثيل مشترك من منفذ الأقسام
+search_fanout = SearchFanout()
@@ -0,0 +1,229 @@
+import weakref
+from sqlalchemy import event, inspect, select, table, column, literal_column, or_, false, text, Integer
+from sqlalchemy.orm import Session
+from src.models.user import db, User, DoctorProfile, Consultation, DoctorReview
+from src.routes.arabic_text import tokenize, index_text
+
+# خيارات الفهرس: بادئات من حرفين وثلاثة مفهرسة مسبقاً لتسريع البحث أثناء الكتابة
+FTS_TOKENIZER = 'unicode61 remove_diacritics 2'
+FTS_PREFIXES = '2 3'
+# عدد الصفوف المقروءة في كل دفعة عند إعادة بناء الفهرس
+REBUILD_BATCH = 2000
+
+def build_match(query, columns=None, prefix=True, stemming=False):
+    """تحويل نص المستخدم إلى تعبير MATCH آمن: كل كلمة موحدة بين علامتي تنصيص وكلها مطلوبة
+
+    prefix يجعل آخر حرف في كل كلمة مفتوحاً ("قلب"*)، و columns يحصر البحث في أعمدة محددة، و stemming
+    يبحث بجذع الكلمة (الجذوع مفهرسة مع الكلمات). يعيد None إذا لم يحتوِ النص على كلمات.
+    """
+    tokens = tokenize(query, stemming)
+    if not tokens:
+        return None
+    suffix = '*' if prefix else ''
+    expression = ' '.join('"{}"{}'.format(token.replace('"', '""'), suffix) for token in tokens)
+    if columns:
+        expression = '{%s} : (%s)' % (' '.join(columns), expression)
+    return expression
+
+class FtsTable:
+    """جدول FTS5 يعكس أعمدة نصية من جدول نموذج (rowid = معرف الصف)
+
+    المشغلات SQL خالصة تفهرس النص الخام (بلا تشكيل) فيبقى الفهرس متزامناً مع أي كاتب، حتى اتصال sqlite3
+    عادي. التوحيد الكامل (index_text) يكتب من Python: بعد flush لصفوف ORM وعند إعادة البناء.
+    """
+
+    def __init__(self, name, model, columns):
+        self.name = name
+        self.model = model
+        self.columns = columns
+        self.source = model.__tablename__
+        self.fts_name = f'{self.source}_fts'
+        self.table = table(self.fts_name, column('rowid', Integer))
+
+    def ddl(self):
+        """أوامر إنشاء الجدول الافتراضي ومشغلات المزامنة (إدراج، تعديل الأعمدة المفهرسة، حذف)"""
+        names = ', '.join(self.columns)
+        values = ', '.join(f'new.{name}' for name in self.columns)
+        insert = f'INSERT INTO {self.fts_name} (rowid, {names}) VALUES (new.id, {values});'
+        delete = f'DELETE FROM {self.fts_name} WHERE rowid = old.id;'
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.fts_name} USING fts5("
+            f"{names}, tokenize='{FTS_TOKENIZER}', prefix='{FTS_PREFIXES}')",
+            f'CREATE TRIGGER IF NOT EXISTS {self.fts_name}_ai AFTER INSERT ON "{self.source}" BEGIN {insert} END',
+            f'CREATE TRIGGER IF NOT EXISTS {self.fts_name}_ad AFTER DELETE ON "{self.source}" BEGIN {delete} END',
+            f'CREATE TRIGGER IF NOT EXISTS {self.fts_name}_au AFTER UPDATE OF id, {names} ON "{self.source}" '
+            f'BEGIN {delete} {insert} END'
+        ]
+
+    def replace(self, connection, rows):
+        """استبدال صفوف الفهرس بالنص الموحد؛ rows صفوف (id، الأعمدة بالترتيب)"""
+        if not rows:
+            return
+        names = ', '.join(self.columns)
+        placeholders = ', '.join('?' for _ in self.columns)
+        connection.exec_driver_sql(
+            f'INSERT OR REPLACE INTO {self.fts_name} (rowid, {names}) VALUES (?, {placeholders})',
+            [(row[0], *map(index_text, row[1:])) for row in rows]
+        )
+
+    def rebuild(self, connection):
+        """إعادة تعبئة الفهرس من الجدول الأصلي بالنص الموحد على دفعات"""
+        connection.exec_driver_sql(f'DELETE FROM {self.fts_name}')
+        result = connection.exec_driver_sql(f'SELECT id, {", ".join(self.columns)} FROM "{self.source}"')
+        for rows in iter(lambda: result.fetchmany(REBUILD_BATCH), []):
+            self.replace(connection, rows)
+        connection.exec_driver_sql(f"INSERT INTO {self.fts_name} ({self.fts_name}) VALUES ('optimize')")
+
+class SearchIndex:
+    """فهارس النص الكامل (SQLite FTS5) للأطباء والاستشارات والمراجعات والمستخدمين
+
+    الجداول تنشأ مع db.create_all وتبقى متزامنة بمشغلات على مستوى قاعدة البيانات، فتشمل الإدخال
+    المجمع والتعديلات خارج ORM بالنص الخام، وصفوف ORM توحد بعد flush (والباقي بعد rebuild). البحث يستخدم MATCH مع البادئات بدل LIKE '%...%' الذي يمسح الجدول
+    كاملاً، ومع قواعد بيانات أخرى أو SQLite بلا FTS5 يعود إلى LIKE بنفس الدلالة السابقة.
+    """
+
+    def __init__(self):
+        self.tables = {}
+        # الجداول المتوفرة لكل محرك قاعدة بيانات (تفحص مرة واحدة)
+        self._available = weakref.WeakKeyDictionary()
+
+    def register(self, fts_table):
+        self.tables[fts_table.name] = fts_table
+        return fts_table
+
+    def create(self, connection, rebuild=True):
+        """إنشاء الجداول الناقصة ومشغلاتها وتعبئتها من البيانات الحالية
+
+        المشغلات التي تغير تعريفها (مثل تغيير طريقة التوحيد) تستبدل ويعاد بناء جدولها.
+        """
+        if connection.dialect.name != 'sqlite':
+            return []
+        existing = self._existing(connection)
+        triggers = dict(connection.exec_driver_sql(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'trigger'"
+        ).fetchall())
+        created = []
+        try:
+            for fts_table in self.tables.values():
+                stale = fts_table.fts_name not in existing
+                for statement in fts_table.ddl():
+                    name = statement.split()[5] if statement.startswith('CREATE TRIGGER') else None
+                    if name in triggers and triggers[name] != statement:
+                        connection.exec_driver_sql(f'DROP TRIGGER {name}')
+                        stale = True
+                    connection.exec_driver_sql(statement)
+                if stale:
+                    created.append(fts_table.name)
+                    if rebuild:
+                        fts_table.rebuild(connection)
+        except Exception:
+            # نسخة SQLite بدون FTS5: يبقى البحث على LIKE
+            self._available[connection.engine] = set()
+            return []
+        self._available[connection.engine] = {t.name for t in self.tables.values()}
+        return created
+
+    def drop(self, connection):
+        if connection.dialect.name != 'sqlite':
+            return
+        for fts_table in self.tables.values():
+            connection.exec_driver_sql(f'DROP TABLE IF EXISTS {fts_table.fts_name}')
+        self._available.pop(connection.engine, None)
+
+    def rebuild(self, names=None):
+        """إعادة تعبئة الفهارس من الجداول الأصلية (بعد استيراد مباشر أو تعطيل المشغلات)"""
+        names = names or list(self.tables)
+        unknown = [name for name in names if name not in self.tables]
+        if unknown:
+            raise ValueError(f'فهارس غير معروفة: {", ".join(unknown)}')
+        connection = db.session.connection()
+        if connection.dialect.name != 'sqlite':
+            return {}
+        self.create(connection, rebuild=False)
+        counts = {}
+        for name in names:
+            if not self.available(name):
+                continue
+            fts_table = self.tables[name]
+            fts_table.rebuild(connection)
+            counts[name] = connection.execute(text(f'SELECT count(*) FROM {fts_table.fts_name}')).scalar()
+        db.session.commit()
+        return counts
+
+    def _existing(self, connection):
+        rows = connection.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+        return {row[0] for row in rows}
+
+    def available(self, name, connection=None):
+        engine = connection.engine if connection is not None else db.engine
+        if engine.dialect.name != 'sqlite':
+            return False
+        if engine not in self._available:
+            existing = self._existing(connection if connection is not None else db.session.connection())
+            self._available[engine] = {t.name for t in self.tables.values() if t.fts_name in existing}
+        return name in self._available[engine]
+
+    def index_flushed(self, session):
+        """كتابة النص الموحد لصفوف ORM المضافة أو المعدلة أعمدتها المفهرسة (بعد أن فهرستها المشغلات خاماً)"""
+        changed = {}
+        for instance in list(session.new) + list(session.dirty):
+            for fts_table in self.tables.values():
+                if not isinstance(instance, fts_table.model):
+                    continue
+                state = inspect(instance)
+                if instance in session.new or any(state.attrs[c].history.has_changes() for c in fts_table.columns):
+                    changed.setdefault(fts_table.name, []).append(instance)
+        if not changed:
+            return
+        connection = session.connection()
+        for name, instances in changed.items():
+            if not self.available(name, connection):
+                continue
+            fts_table = self.tables[name]
+            fts_table.replace(connection, [
+                (instance.id, *(getattr(instance, c) for c in fts_table.columns)) for instance in instances
+            ])
+
+    def status(self):
+        return {name: self.available(name) for name in self.tables}
+
+    def matching_ids(self, name, query, columns=None, stemming=True):
+        """استعلام فرعي بمعرفات الصفوف المطابقة عبر MATCH (يتطلب available(name))"""
+        fts_table = self.tables[name]
+        expression = build_match(query, columns, stemming=stemming)
+        return select(fts_table.table.c.rowid).where(
+            literal_column(fts_table.fts_name).op('MATCH')(expression)
+        )
+
+    def condition(self, name, query, columns=None, stemming=True):
+        """شرط WHERE لمطابقة النص في أعمدة الفهرس (columns جزء منها أو الكل)"""
+        fts_table = self.tables[name]
+        if not self.available(name):
+            return or_(*(getattr(fts_table.model, c).contains(query) for c in columns or fts_table.columns))
+        if build_match(query) is None:
+            return false()
+        return fts_table.model.id.in_(self.matching_ids(name, query, columns, stemming))
+
+# إنشاء مثيل من فهارس البحث مع الجداول الافتراضية
+search_index = SearchIndex()
+
+search_index.register(FtsTable(
+    'doctors', DoctorProfile, ['full_name', 'specialization', 'sub_specialization', 'bio']
+))
+search_index.register(FtsTable(
+    'consultations', Consultation, ['doctor_notes', 'prescription', 'additional_tests']
+))
+search_index.register(FtsTable('reviews', DoctorReview, ['review_text']))
+search_index.register(FtsTable('users', User, ['username', 'email']))
+
+@event.listens_for(Session, 'after_flush')
+def _index_flushed_rows(session, flush_context):
+    search_index.index_flushed(session)
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_search_tables(target, connection, **kw):
+    search_index.create(connection)
+
+@event.listens_for(db.metadata, 'before_drop')
+def _drop_search_tables(target, connection, **kw):
+    search_index.drop(connection)
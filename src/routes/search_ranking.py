@@ -0,0 +1,130 @@
+from math import ceil
+from sqlalchemy import select, func, literal_column, case
+from src.models.user import db, DoctorProfile
+from src.routes.search_index import search_index, build_match
+
+# أوزان حقول الأطباء في BM25: الاسم أهم من التخصص، والتخصص أهم من النبذة
+DOCTOR_FIELD_WEIGHTS = {'full_name': 10.0, 'specialization': 5.0, 'sub_specialization': 3.0, 'bio': 1.0}
+
+# التعزيزات الافتراضية: rating يضاعف الدرجة حتى (1 + rating) لتقييم 5، و availability معامل الطبيب المتاح
+DEFAULT_BOOSTS = {'rating': 0.3, 'availability': 1.2}
+
+def normalize_boosts(boosts):
+    """دمج التعزيزات المطلوبة مع الافتراضية؛ False يلغيها كلها"""
+    if boosts is False:
+        return {'rating': 0.0, 'availability': 1.0}
+    merged = dict(DEFAULT_BOOSTS)
+    for name, value in (boosts or {}).items():
+        if name not in merged:
+            raise ValueError(f'تعزيز غير معروف: {name}')
+        value = float(value)
+        if value < 0:
+            raise ValueError(f'قيمة التعزيز {name} يجب ألا تكون سالبة')
+        merged[name] = value
+    return merged
+
+class RankedPage:
+    """صفحة من نتائج مرتبة بنفس حقول paginate مع درجة كل عنصر"""
+
+    def __init__(self, items, scores, total, page, per_page, has_next=None):
+        self.items = items
+        self.scores = scores
+        self.total = total
+        self.page = page
+        self.per_page = per_page
+        # total يكون None عند تأجيل العد، وعندها تحدد الصفحة التالية من صف إضافي
+        self.pages = None if total is None else (ceil(total / per_page) if per_page else 0)
+        self.has_next = self.page < self.pages if has_next is None else has_next
+
+    @property
+    def ids(self):
+        return [item.id for item in self.items]
+
+class DoctorRanker:
+    """ترتيب نتائج البحث عن الأطباء حسب الصلة
+
+    الدرجة = BM25 من فهرس FTS5 بأوزان الحقول × (1 + rating × التقييم/5) × availability للطبيب المتاح.
+    الدرجة والاختيار يحسبان داخل SQLite: ORDER BY ... LIMIT يحتفظ بأفضل (الإزاحة + الصفحة) صف فقط
+    في أثناء المرور على المطابقات (كومة بحجم k، أي O(n log k))، فلا تنقل كل المطابقات إلى Python.
+    """
+
+    def __init__(self, weights=DOCTOR_FIELD_WEIGHTS):
+        self.fts_table = search_index.tables['doctors']
+        self.weights = [weights.get(column, 1.0) for column in self.fts_table.columns]
+
+    def available(self):
+        return search_index.available('doctors')
+
+    def matches(self, query, stemming=True):
+        """استعلام فرعي (id, relevance) للأطباء المطابقين، relevance = -bm25 (الأكبر أنسب)"""
+        fts_name = self.fts_table.fts_name
+        bm25 = func.bm25(literal_column(fts_name), *self.weights)
+        return select(
+            self.fts_table.table.c.rowid.label('id'),
+            (-bm25).label('relevance')
+        ).where(
+            literal_column(fts_name).op('MATCH')(build_match(query, stemming=stemming))
+        ).subquery()
+
+    def score(self, matches, boosts):
+        score = matches.c.relevance
+        if boosts['rating']:
+            score = score * (1 + boosts['rating'] * DoctorProfile.average_rating / 5)
+        if boosts['availability'] != 1:
+            score = score * case((DoctorProfile.available_for_consultation == True, boosts['availability']), else_=1)
+        return score
+
+    def rank(self, query, criteria=(), page=1, per_page=20, boosts=None, stemming=True, count=True):
+        """صفحة مرتبة من الأطباء المطابقين لـ query والشروط الإضافية criteria (استعلامان: الصفحة والعدد)
+
+        count=False يلغي استعلام العدد: total يكون None و has_next من صف إضافي.
+        """
+        boosts = normalize_boosts(boosts)
+        page, per_page = max(int(page), 1), max(int(per_page), 1)
+        if build_match(query) is None:
+            return RankedPage([], [], 0 if count else None, page, per_page, has_next=False)
+
+        matches = self.matches(query, stemming)
+        score = self.score(matches, boosts).label('score')
+        rows = db.session.execute(
+            select(DoctorProfile, score).join(matches, matches.c.id == DoctorProfile.id).where(*criteria)
+            .order_by(score.desc(), DoctorProfile.id).limit(per_page if count else per_page + 1)
+            .offset((page - 1) * per_page)
+        ).all()
+        if not count:
+            return RankedPage([row[0] for row in rows[:per_page]], [round(row[1], 6) for row in rows[:per_page]],
+                              None, page, per_page, has_next=len(rows) > per_page)
+        return RankedPage([row[0] for row in rows], [round(row[1], 6) for row in rows],
+                          self.count(query, criteria, stemming, matches), page, per_page)
+
+    def ranked_ids(self, query, criteria=(), offset=0, limit=20, boosts=None, stemming=True, with_total=False):
+        """معرفات الأطباء المطابقين بترتيب rank من offset دون تحميل الصفوف (لذاكرة نتائج البحث)
+
+        يعيد (المعرفات، العدد الكلي)؛ with_total يحسب العدد كدالة نافذة في نفس الاستعلام وإلا فهو None.
+        """
+        boosts = normalize_boosts(boosts)
+        if build_match(query) is None:
+            return [], (0 if with_total else None)
+        matches = self.matches(query, stemming)
+        columns = [DoctorProfile.id, func.count().over()] if with_total else [DoctorProfile.id]
+        rows = db.session.execute(
+            select(*columns).join(matches, matches.c.id == DoctorProfile.id).where(*criteria)
+            .order_by(self.score(matches, boosts).desc(), DoctorProfile.id).limit(limit).offset(offset)
+        ).all()
+        return [row[0] for row in rows], (rows[0][1] if with_total and rows else None)
+
+    def count(self, query, criteria=(), stemming=True, matches=None):
+        """عدد الأطباء المطابقين لـ query والشروط criteria"""
+        if build_match(query) is None:
+            return 0
+        matches = self.matches(query, stemming) if matches is None else matches
+        if criteria:
+            count = select(func.count()).select_from(DoctorProfile).join(
+                matches, matches.c.id == DoctorProfile.id
+            ).where(*criteria)
+        else:
+            count = select(func.count()).select_from(matches)
+        return db.session.execute(count).scalar()
+
+# إنشاء مثيل من مرتب الأطباء
+doctor_ranker = DoctorRanker()
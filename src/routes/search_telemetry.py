@@ -0,0 +1,397 @@
+import time
+import zlib
+import threading
+from collections import Counter, OrderedDict, deque
+from datetime import datetime
+import numpy as np
+from src.routes import performance_cache
+from src.routes.arabic_text import tokenize
+from src.routes.performance_cache import CACHE_SETTINGS, REDIS_AVAILABLE
+from src.routes.suggestion_index import suggestion_index
+
+# الدفع الدوري من الذاكرة إلى الرسوم بالثواني، وحجم المخزن الذي يوقظ الدفع مبكراً (ضعفه يسقط الأحداث)
+FLUSH_INTERVAL = 5
+MAX_BUFFER = 10000
+
+# نوافذ الشائع من شرائح زمنية بخمس دقائق، لكل شريحة Space-Saving و Count-Min
+BUCKET_SECONDS = 300
+WINDOWS = {'hour': 3600, 'day': 86400}
+HEAVY_HITTERS_CAPACITY = 500
+SKETCH_WIDTH = 1024
+SKETCH_DEPTH = 4
+# أقصى عدد مفاتيح لكل شريحة في Redis (الأقل تكراراً يحذف أولاً)
+MAX_SHARED_BUCKET_KEYS = 5000
+# صلاحية اتحاد شرائح النافذة المحسوب في Redis بالثواني (يعاد حسابه بعد كل دفع)
+WINDOW_CACHE_SECONDS = FLUSH_INTERVAL
+
+# آخر عمليات بحث كل مستخدم، وعدد المستخدمين المحتفظ بهم (الأقدم نشاطاً يحذف أولاً)
+RECENT_PER_USER = 20
+MAX_TRACKED_USERS = 10000
+MAX_DISPLAY_FORMS = 50000
+
+# عدد الاستعلامات الأشهر في نافذة اليوم التي تغذي ترتيب الاقتراحات
+SUGGESTION_FEED_SIZE = 100
+
+def query_key(query):
+    """مفتاح الاستعلام الموحد: "أطباء  القلب" و"اطباء القلب" استعلام واحد"""
+    return ' '.join(tokenize(query or ''))
+
+class SpaceSaving:
+    """أكثر العناصر تكراراً بذاكرة ثابتة: capacity عداد، والعنصر الجديد يرث عداد الأقل ويحل محله
+
+    العدد المقدر لا يقل عن الحقيقي ولا يزيد عليه بأكثر من errors[item]، وكل عنصر تكراره أكبر من
+    المجموع/capacity موجود حتماً. الدمج (جمع العدادات ثم الإبقاء على الأكبر) يعطي ملخص اتحاد الشرائح.
+    """
+
+    def __init__(self, capacity=HEAVY_HITTERS_CAPACITY):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+
+    def __len__(self):
+        return len(self.counts)
+
+    def add(self, item, count=1):
+        if item in self.counts:
+            self.counts[item] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = count
+            self.errors[item] = 0
+        else:
+            victim = min(self.counts, key=self.counts.get)
+            floor = self.counts.pop(victim)
+            del self.errors[victim]
+            self.counts[item] = floor + count
+            self.errors[item] = floor
+
+    def floor(self):
+        """أقصى تكرار ممكن لعنصر غير موجود في ملخص ممتلئ"""
+        return min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+
+    def merge(self, other):
+        # العنصر الغائب عن أحد الملخصين يأخذ منه أدنى عداد فيه (حده الأعلى) حتى يبقى التقدير لا يقل عن الحقيقي
+        own_floor, other_floor = self.floor(), other.floor()
+        counts, errors = {}, {}
+        for item in set(self.counts) | set(other.counts):
+            counts[item] = self.counts.get(item, own_floor) + other.counts.get(item, other_floor)
+            errors[item] = self.errors.get(item, own_floor) + other.errors.get(item, other_floor)
+        self.counts, self.errors = counts, errors
+        if len(self.counts) > self.capacity:
+            keep = sorted(self.counts, key=self.counts.get, reverse=True)[:self.capacity]
+            self.counts = {item: self.counts[item] for item in keep}
+            self.errors = {item: self.errors[item] for item in keep}
+        return self
+
+    def copy(self):
+        summary = SpaceSaving(self.capacity)
+        summary.counts = dict(self.counts)
+        summary.errors = dict(self.errors)
+        return summary
+
+class CountMinSketch:
+    """تقدير تكرار أي عنصر بمصفوفة depth×width: أقل عداد من صفوف التجزئة (لا يقل عن الحقيقي)"""
+
+    def __init__(self, width=SKETCH_WIDTH, depth=SKETCH_DEPTH, table=None):
+        self.width = width
+        self.depth = depth
+        self.table = table if table is not None else np.zeros((depth, width), dtype=np.int64)
+        # بذرة مختلفة لـ crc32 في كل صف تعطي دوال تجزئة مستقلة عملياً
+        self.seeds = [(row * 0x9E3779B1) & 0xFFFFFFFF for row in range(1, depth + 1)]
+
+    def positions(self, item):
+        data = item.encode('utf-8')
+        return [zlib.crc32(data, seed) % self.width for seed in self.seeds]
+
+    def add_many(self, counts):
+        """إضافة {العنصر: العدد} دفعة واحدة"""
+        if not counts:
+            return self
+        columns = np.array([self.positions(item) for item in counts], dtype=np.int64)
+        values = np.fromiter(counts.values(), dtype=np.int64, count=len(counts))
+        for row in range(self.depth):
+            np.add.at(self.table[row], columns[:, row], values)
+        return self
+
+    def estimate(self, item):
+        return int(min(self.table[row, column] for row, column in enumerate(self.positions(item))))
+
+    def merge(self, other):
+        self.table += other.table
+        return self
+
+    def copy(self):
+        return CountMinSketch(self.width, self.depth, self.table.copy())
+
+class WindowBucket:
+    __slots__ = ('heavy_hitters', 'sketch', 'total')
+
+    def __init__(self):
+        self.heavy_hitters = SpaceSaving()
+        self.sketch = CountMinSketch()
+        self.total = 0
+
+class SearchTelemetry:
+    """أحداث البحث في ذاكرة العامل: مخزن يدفع دورياً إلى رسوم نوافذ منزلقة وحلقات آخر البحث لكل مستخدم
+
+    التسجيل إضافة إلى قائمة تحت قفل (بلا قاعدة بيانات)، وخيط خلفي يدفع المخزن كل FLUSH_INTERVAL
+    ثانية: يجمع الدفعة بعداد واحد ثم يحدث Space-Saving و Count-Min لشريحتها الزمنية. الشائع في نافذة
+    هو اتحاد ملخصات شرائحها، وعدد كل مرشح أقل تقديري الملخص والرسم (كلاهما لا يقل عن الحقيقي).
+    القراءة لا تكتب شيئاً: ترى ما دفعه الخيط الخلفي (أو flush صريح).
+
+    مع Redis تكتب كل دفعة مجمعة أيضاً إلى Redis (مجموعة مرتبة لكل شريحة وحلقة لكل مستخدم)، والشائع
+    يقرأ من اتحاد شرائح النافذة (ZUNIONSTORE في مفتاح قصير الصلاحية)، فترى كل العمال نفس الشائع وآخر
+    البحث. إذا فشل Redis تبقى الدفعة لتكتب مع الدفع التالي وتقرأ النتائج من الرسوم المحلية.
+    """
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL, max_buffer=MAX_BUFFER, use_redis=REDIS_AVAILABLE):
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.use_redis = use_redis
+        self.key = CACHE_SETTINGS['search_telemetry']['key']
+        self.ttl = CACHE_SETTINGS['search_telemetry']['ttl']
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.clear()
+
+    def clear(self):
+        with self._buffer_lock, self._lock:
+            self._buffer = []
+            # أحداث دفعت إلى الرسوم المحلية ولم تكتب إلى Redis بعد (بسبب فشله)
+            self._unpersisted = []
+            self.buckets = {}
+            self.recent = OrderedDict()
+            self.display = OrderedDict()
+            self.recorded = 0
+            self.dropped = 0
+            self.flushes = 0
+
+    # ---------- التسجيل والدفع ----------
+
+    def record(self, query, user_id=None, timestamp=None):
+        """تسجيل عملية بحث (يعيد False إذا تجاهلها لفراغها أو لامتلاء المخزن)"""
+        key = query_key(query)
+        if not key:
+            return False
+        event = (timestamp or time.time(), key, query.strip(), user_id)
+        with self._buffer_lock:
+            if len(self._buffer) >= self.max_buffer * 2:
+                self.dropped += 1
+                return False
+            self._buffer.append(event)
+            self.recorded += 1
+            full = len(self._buffer) >= self.max_buffer
+        self._ensure_flusher()
+        if full:
+            self._wake.set()
+        return True
+
+    def _ensure_flusher(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._flush_loop, name='search-telemetry', daemon=True)
+                self._thread.start()
+
+    def _flush_loop(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                # القياس لا يوقف البحث؛ الدفعة الفاشلة تهمل
+                pass
+
+    def flush(self):
+        """دفع الأحداث المخزنة إلى الرسوم والحلقات (و Redis) وتغذية الاقتراحات؛ يعيد عدد الأحداث"""
+        with self._buffer_lock:
+            events, self._buffer = self._buffer, []
+        if not events and not self._unpersisted:
+            return 0
+
+        if events:
+            self._apply(events)
+        feed = None
+        if self.use_redis:
+            with self._lock:
+                batch, self._unpersisted = self._unpersisted + events, []
+            try:
+                self._persist(batch)
+                feed = self._shared_popular('day', SUGGESTION_FEED_SIZE, refresh=True)
+            except Exception:
+                # Redis غير متاح: تعاد الدفعة لتكتب مع الدفع التالي (بحد المخزن نفسه)
+                with self._lock:
+                    keep = self.max_buffer * 2
+                    self.dropped += max(0, len(batch) - keep)
+                    self._unpersisted = batch[-keep:] + self._unpersisted
+        if feed is None:
+            feed = self.popular('day', SUGGESTION_FEED_SIZE, shared=False)
+
+        suggestion_index.set_search_counts({item['key']: item['count'] for item in feed})
+        return len(events)
+
+    def _apply(self, events):
+        """تحديث رسوم الشرائح وحلقات المستخدمين المحلية بالدفعة"""
+        per_bucket = {}
+        for timestamp, key, text, user_id in events:
+            per_bucket.setdefault(int(timestamp // BUCKET_SECONDS), Counter())[key] += 1
+
+        with self._lock:
+            for bucket_id, counts in per_bucket.items():
+                bucket = self.buckets.get(bucket_id)
+                if bucket is None:
+                    bucket = self.buckets[bucket_id] = WindowBucket()
+                for key, count in counts.items():
+                    bucket.heavy_hitters.add(key, count)
+                bucket.sketch.add_many(counts)
+                bucket.total += sum(counts.values())
+
+            for timestamp, key, text, user_id in events:
+                self._remember_display(key, text)
+                if user_id is not None:
+                    self._remember_recent(user_id, key, timestamp)
+
+            self._expire(max(max(per_bucket), int(time.time() // BUCKET_SECONDS)))
+            self.flushes += 1
+
+    def _persist(self, events):
+        """كتابة الدفعة المجمعة إلى Redis في جولة واحدة: عدادات الشرائح، الصيغ المعروضة، وحلقات المستخدمين"""
+        per_bucket, display, recent = {}, {}, {}
+        for timestamp, key, text, user_id in events:
+            per_bucket.setdefault(int(timestamp // BUCKET_SECONDS), Counter())[key] += 1
+            display[key] = text
+            if user_id is not None:
+                ring = recent.setdefault(user_id, {})
+                ring[key] = max(timestamp, ring.get(key, 0))
+
+        pipeline = performance_cache.redis_client.pipeline(transaction=False)
+        for bucket_id, counts in per_bucket.items():
+            bucket_key = self.key.format(f'bucket:{bucket_id}')
+            for key, count in counts.items():
+                pipeline.zincrby(bucket_key, count, key)
+            pipeline.zremrangebyrank(bucket_key, 0, -MAX_SHARED_BUCKET_KEYS - 1)
+            pipeline.expire(bucket_key, self.ttl)
+        for key, text in display.items():
+            pipeline.setex(self.key.format(f'display:{key}'), self.ttl, text)
+        for user_id, ring in recent.items():
+            ring_key = self.key.format(f'recent:{user_id}')
+            pipeline.zadd(ring_key, ring)
+            pipeline.zremrangebyrank(ring_key, 0, -RECENT_PER_USER - 1)
+            pipeline.expire(ring_key, self.ttl)
+        pipeline.execute()
+
+    def _shared_display(self, keys):
+        if not keys:
+            return {}
+        values = performance_cache.redis_client.mget([self.key.format(f'display:{key}') for key in keys])
+        return {key: value for key, value in zip(keys, values) if value}
+
+    def _remember_display(self, key, text):
+        """آخر صيغة مكتوبة لكل مفتاح تعرض للمستخدم بدل الصيغة الموحدة"""
+        self.display[key] = text
+        self.display.move_to_end(key)
+        if len(self.display) > MAX_DISPLAY_FORMS:
+            self.display.popitem(last=False)
+
+    def _remember_recent(self, user_id, key, timestamp):
+        ring = self.recent.get(user_id)
+        if ring is None:
+            ring = self.recent[user_id] = deque(maxlen=RECENT_PER_USER)
+        else:
+            self.recent.move_to_end(user_id)
+            for item in list(ring):
+                if item[0] == key:
+                    ring.remove(item)
+        ring.appendleft((key, timestamp))
+        if len(self.recent) > MAX_TRACKED_USERS:
+            self.recent.popitem(last=False)
+
+    def _expire(self, newest_bucket):
+        oldest = newest_bucket - max(WINDOWS.values()) // BUCKET_SECONDS
+        for bucket_id in [bucket_id for bucket_id in self.buckets if bucket_id <= oldest]:
+            del self.buckets[bucket_id]
+
+    # ---------- القراءة ----------
+
+    def popular(self, window='day', limit=10, now=None, shared=True):
+        """أكثر الاستعلامات في النافذة: [{'key', 'query', 'count'}] بالأكثر أولاً"""
+        if window not in WINDOWS:
+            raise ValueError(f'نافذة غير مدعومة: {window}')
+        current = int((now or time.time()) // BUCKET_SECONDS)
+        if self.use_redis and shared:
+            try:
+                return self._shared_popular(window, limit, current)
+            except Exception:
+                pass
+        first = current - WINDOWS[window] // BUCKET_SECONDS + 1
+        with self._lock:
+            buckets = [bucket for bucket_id, bucket in self.buckets.items() if first <= bucket_id <= current]
+            if not buckets:
+                return []
+            heavy_hitters = buckets[0].heavy_hitters.copy()
+            sketch = buckets[0].sketch.copy()
+            for bucket in buckets[1:]:
+                heavy_hitters.merge(bucket.heavy_hitters)
+                sketch.merge(bucket.sketch)
+            counts = {key: min(count, sketch.estimate(key)) for key, count in heavy_hitters.counts.items()}
+            top = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+            return [{'key': key, 'query': self.display.get(key, key), 'count': count} for key, count in top]
+
+    def _shared_popular(self, window, limit, current=None, refresh=False):
+        """الأكثر من اتحاد شرائح النافذة في Redis (يحسب بـ ZUNIONSTORE ويخزن WINDOW_CACHE_SECONDS ثانية)"""
+        client = performance_cache.redis_client
+        current = current if current is not None else int(time.time() // BUCKET_SECONDS)
+        window_key = self.key.format(f'window:{window}:{current}')
+        if refresh or not client.exists(window_key):
+            first = current - WINDOWS[window] // BUCKET_SECONDS + 1
+            pipeline = client.pipeline(transaction=False)
+            pipeline.zunionstore(window_key, [self.key.format(f'bucket:{b}') for b in range(first, current + 1)])
+            pipeline.expire(window_key, WINDOW_CACHE_SECONDS)
+            pipeline.execute()
+        top = [(key, int(count)) for key, count in client.zrevrange(window_key, 0, limit - 1, withscores=True)]
+        top.sort(key=lambda item: (-item[1], item[0]))
+        display = self._shared_display([key for key, _ in top])
+        return [{'key': key, 'query': display.get(key, key), 'count': count} for key, count in top]
+
+    def recent_for(self, user_id, limit=RECENT_PER_USER):
+        """آخر عمليات بحث المستخدم بدون تكرار، الأحدث أولاً"""
+        if self.use_redis:
+            try:
+                ring = performance_cache.redis_client.zrevrange(
+                    self.key.format(f'recent:{user_id}'), 0, limit - 1, withscores=True
+                )
+                display = self._shared_display([key for key, _ in ring])
+                return [{
+                    'query': display.get(key, key),
+                    'timestamp': datetime.utcfromtimestamp(timestamp).isoformat()
+                } for key, timestamp in ring]
+            except Exception:
+                pass
+        with self._lock:
+            ring = list(self.recent.get(user_id, ()))[:limit]
+            return [{
+                'query': self.display.get(key, key),
+                'timestamp': datetime.utcfromtimestamp(timestamp).isoformat()
+            } for key, timestamp in ring]
+
+    def status(self):
+        with self._buffer_lock:
+            buffered = len(self._buffer)
+        with self._lock:
+            return {
+                'buffered': buffered,
+                'recorded': self.recorded,
+                'dropped': self.dropped,
+                'flushes': self.flushes,
+                'buckets': len(self.buckets),
+                'tracked_users': len(self.recent),
+                'shared': self.use_redis,
+                'unpersisted': len(self._unpersisted)
+            }
+
+# إنشاء مثيل من قياس البحث
+search_telemetry = SearchTelemetry()
@@ -0,0 +1,298 @@
+from datetime import datetime, timedelta
+import numpy as np
+from src.routes.columnar_snapshots import snapshot_store, INT_NULL
+from src.routes.timeseries import TimeSeries
+
+SECONDS_PER_DAY = 86400
+
+def _seconds(value):
+    """ثوان منذ 1970 لتاريخ محلي بنفس تفسير أعمدة الأوقات في اللقطة"""
+    return int(np.datetime64(value, 's').astype(np.int64))
+
+def _in_range(seconds, start=None, end=None):
+    """قناع [start, end] شاملاً لعمود أوقات (الفارغ خارج أي فترة؛ بدقة الثانية المخزنة)"""
+    mask = seconds != INT_NULL
+    if start is not None:
+        mask &= seconds >= _seconds(start)
+    if end is not None:
+        mask &= seconds <= _seconds(end)
+    return mask
+
+def _day_labels(seconds):
+    return np.datetime_as_string((seconds // SECONDS_PER_DAY).astype('datetime64[D]'), unit='D')
+
+def _sum_by(labels, weights=None):
+    """{التسمية: المجموع} (أو العدد دون أوزان) مرتبة بالتسمية"""
+    keys, inverse = np.unique(np.asarray(labels), return_inverse=True)
+    totals = np.bincount(inverse, weights=weights, minlength=len(keys))
+    return {key: total for key, total in zip(keys.tolist(), totals.tolist())}
+
+def _category_totals(snapshot, name, mask, weights=None, null_label=None):
+    """مجاميع عمود نصي مرمز بالقاموس {القيمة: المجموع} للقيم الموجودة فقط"""
+    codes = np.asarray(snapshot.column(name)[mask]).astype(np.int64)
+    size = len(snapshot.dictionaries.get(name, [])) + 1
+    totals = np.bincount(codes + 1, weights=weights, minlength=size)
+    present = np.bincount(codes + 1, minlength=size) > 0
+    labels = [null_label] + snapshot.dictionaries.get(name, [])
+    return {labels[i]: totals[i].item() for i in np.flatnonzero(present)}
+
+def _grouped(keys, *weights):
+    """(المفاتيح الفريدة، العدد، ومجموع كل مصفوفة أوزان) لكل مفتاح"""
+    unique, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(unique))
+    return (unique, counts) + tuple(np.bincount(inverse, weights=w, minlength=len(unique)) for w in weights)
+
+def _lookup(unique, values, keys):
+    """قيم values للمفاتيح keys بعد ربطها بـ unique المرتبة (صفر للمفاتيح غير الموجودة)"""
+    result = np.zeros(len(keys), dtype=np.asarray(values).dtype if len(values) else np.float64)
+    if not len(unique):
+        return result
+    positions = np.clip(np.searchsorted(unique, keys), 0, len(unique) - 1)
+    found = unique[positions] == keys
+    result[found] = np.asarray(values)[positions[found]]
+    return result
+
+class SnapshotAnalytics:
+    """تحليلات التقارير من اللقطات العمودية (snapshot_store) دون أي استعلام على قاعدة البيانات التشغيلية
+
+    نفس مخرجات دوال AnalyticsEngine لمصدر 'database' بحداثة آخر تحديث للقطات، وبيانات الطبيب في
+    أداء الأطباء والأعلى دخلاً مختصرة إلى (المعرف، معرف المستخدم، الاسم، التخصص) من لقطة doctor_profile.
+    """
+
+    # ---------- الاستشارات ----------
+
+    def _consultation_mask(self, consultations, start, end):
+        return _in_range(consultations.column('request_date'), start, end)
+
+    def consultation_analytics(self, start_date=None, end_date=None):
+        consultations = snapshot_store.open('consultation')
+        mask = self._consultation_mask(consultations, start_date, end_date)
+        total = int(mask.sum())
+        status_counts = {key: int(value) for key, value in _category_totals(consultations, 'status', mask).items()}
+        types = {
+            key: int(value)
+            for key, value in _category_totals(consultations, 'consultation_type', mask, null_label='غير محدد').items()
+        }
+        fees = np.nan_to_num(np.asarray(consultations.column('consultation_fee')[mask]))
+        requested = np.asarray(consultations.column('request_date')[mask])
+        completed_at = np.asarray(consultations.column('completed_at')[mask])
+        responded = completed_at != INT_NULL
+        responses = int(responded.sum())
+        response_hours = float(((completed_at[responded] - requested[responded]) / 3600.0).sum())
+        total_revenue = float(fees.sum())
+
+        completed = status_counts.get('completed', 0)
+        daily = _sum_by(_day_labels(requested)) if total else {}
+        return {
+            'total_consultations': total,
+            'completed_consultations': completed,
+            'pending_consultations': status_counts.get('pending', 0),
+            'cancelled_consultations': status_counts.get('cancelled', 0),
+            'completion_rate': round(completed / total * 100, 2) if total else 0,
+            'consultation_types': types,
+            'daily_distribution': TimeSeries.from_totals(
+                'consultations', daily, 'day', start_date, end_date or datetime.now()
+            ).to_dict(),
+            'avg_response_time_hours': round(response_hours / responses, 2) if responses else 0,
+            'total_revenue': total_revenue,
+            'avg_consultation_fee': round(total_revenue / total, 2) if total else 0
+        }
+
+    # ---------- المالية ----------
+
+    def financial_analytics(self, start_date=None, end_date=None, top_n=5, doctors_offset=0):
+        payments = snapshot_store.open('payment')
+        completed = payments.equals('status', 'completed')
+        mask = completed & _in_range(payments.column('completed_at'), start_date, end_date)
+        amounts = np.nan_to_num(np.asarray(payments.column('amount')[mask]))
+        days = _day_labels(np.asarray(payments.column('completed_at')[mask]))
+
+        daily_revenue = _sum_by(days, amounts) if len(days) else {}
+        monthly_revenue = {}
+        for day, amount in daily_revenue.items():
+            monthly_revenue[day[:7]] = monthly_revenue.get(day[:7], 0) + amount
+        total_revenue = float(amounts.sum())
+        total_transactions = int(mask.sum())
+
+        # إيرادات الأطباء: الفلاتر الزمنية فقط عند تحديدها كما في الاستعلام المباشر
+        revenue_mask = completed.copy()
+        completed_at = payments.column('completed_at')
+        if start_date is not None:
+            revenue_mask &= (completed_at != INT_NULL) & (completed_at >= _seconds(start_date))
+        if end_date is not None:
+            revenue_mask &= (completed_at != INT_NULL) & (completed_at <= _seconds(end_date))
+        top_earning_doctors, doctors_total = self.doctor_revenues(payments, revenue_mask, top_n, doctors_offset)
+
+        return {
+            'total_revenue': total_revenue,
+            'total_transactions': total_transactions,
+            'avg_transaction_value': round(total_revenue / total_transactions, 2) if total_transactions else 0,
+            'payment_types': _category_totals(payments, 'payment_type', mask, amounts),
+            'payment_methods': _category_totals(payments, 'payment_method', mask, amounts, null_label='غير محدد'),
+            'daily_revenue': daily_revenue,
+            'monthly_revenue': monthly_revenue,
+            'top_earning_doctors': top_earning_doctors,
+            'doctor_revenue_pagination': {'offset': doctors_offset, 'limit': top_n, 'total': doctors_total}
+        }
+
+    def doctor_revenues(self, payments, mask, limit=5, offset=0):
+        """إيرادات الأطباء مرتبة تنازلياً (ثم بأول دفعة) عبر ربط الدفعات باستشاراتها بمعرفاتها المرتبة"""
+        consultations = snapshot_store.open('consultation')
+        profiles = self._profiles()
+        consultation_ids = np.asarray(consultations.column('id'))
+        linked = np.asarray(payments.column('consultation_id')[mask])
+        payment_ids = np.asarray(payments.column('id')[mask])
+        amounts = np.nan_to_num(np.asarray(payments.column('amount')[mask]))
+
+        doctors = _lookup(consultation_ids, np.asarray(consultations.column('doctor_id')), linked)
+        doctors[linked == INT_NULL] = INT_NULL
+        keep = (doctors != INT_NULL) & (doctors != 0) & np.isin(doctors, profiles['user_id'])
+        doctors, payment_ids, amounts = doctors[keep], payment_ids[keep], amounts[keep]
+        if not len(doctors):
+            return [], 0
+
+        unique, counts, revenue = _grouped(doctors, amounts)
+        first_payment = np.full(len(unique), np.iinfo(np.int64).max)
+        np.minimum.at(first_payment, np.searchsorted(unique, doctors), payment_ids)
+        order = np.lexsort((first_payment, -revenue))[offset:offset + limit]
+        by_user = {user_id: index for index, user_id in enumerate(profiles['user_id'].tolist())}
+        return [
+            {
+                'doctor': self._doctor(profiles, by_user[int(unique[i])]),
+                'revenue': float(revenue[i]),
+                'transactions': int(counts[i])
+            }
+            for i in order
+        ], len(unique)
+
+    # ---------- المستخدمون ----------
+
+    def user_analytics(self, start_date=None, end_date=None):
+        users = snapshot_store.open('user')
+        mask = _in_range(users.column('created_at'), start_date, end_date)
+        total = int(mask.sum())
+        verified = int((users.column('kyc_verified')[mask] == 1).sum())
+        created = np.asarray(users.column('created_at')[mask])
+        monthly = {day: int(count) for day, count in _sum_by(_day_labels(created).astype('<U7')).items()} if total else {}
+
+        consultations = snapshot_store.open('consultation')
+        recent = _in_range(consultations.column('request_date'), datetime.now() - timedelta(days=30))
+        patients = np.asarray(consultations.column('user_id')[recent])
+        doctors = np.asarray(consultations.column('doctor_id')[recent])
+        return {
+            'total_users': total,
+            'active_users': int((users.column('is_active')[mask] == 1).sum()),
+            'verified_users': verified,
+            'verification_rate': (verified / total * 100) if total else 0,
+            'user_types': {key: int(value) for key, value in _category_totals(users, 'user_type', mask).items()},
+            'monthly_registrations': monthly,
+            'active_patients_30d': len(np.unique(patients[patients != INT_NULL])),
+            'active_doctors_30d': len(np.unique(doctors[doctors != INT_NULL]))
+        }
+
+    # ---------- أداء الأطباء ----------
+
+    def _profiles(self):
+        profiles = snapshot_store.open('doctor_profile')
+        return {
+            'snapshot': profiles,
+            'id': np.asarray(profiles.column('id')),
+            'user_id': np.asarray(profiles.column('user_id'))
+        }
+
+    def _doctor(self, profiles, index):
+        snapshot = profiles['snapshot']
+        return {
+            'id': int(profiles['id'][index]),
+            'user_id': int(profiles['user_id'][index]),
+            'full_name': snapshot.decode('full_name', snapshot.column('full_name')[index:index + 1])[0],
+            'specialization': snapshot.decode('specialization', snapshot.column('specialization')[index:index + 1])[0]
+        }
+
+    def doctor_performance(self, doctor_id=None, start_date=None, end_date=None, sort_by=None, descending=True,
+                           limit=None, offset=0):
+        """نفس صفوف iter_doctor_performance: كل الأطباء مع مجاميع استشاراتهم ومواعيدهم وتقييماتهم المعتمدة"""
+        profiles = self._profiles()
+        user_ids = profiles['user_id']
+
+        consultations = snapshot_store.open('consultation')
+        mask = self._consultation_mask(consultations, start_date, end_date)
+        doctors = np.asarray(consultations.column('doctor_id')[mask])
+        requested = np.asarray(consultations.column('request_date')[mask])
+        completed_at = np.asarray(consultations.column('completed_at')[mask])
+        responded = completed_at != INT_NULL
+        unique, totals, completed, revenue, response_hours, responses = _grouped(
+            doctors,
+            np.asarray(consultations.equals('status', 'completed')[mask], dtype=np.float64),
+            np.nan_to_num(np.asarray(consultations.column('consultation_fee')[mask])),
+            np.where(responded, (completed_at - requested) / 3600.0, 0),
+            responded.astype(np.float64)
+        )
+        metrics = {
+            'total_consultations': _lookup(unique, totals, user_ids),
+            'completed_consultations': _lookup(unique, completed, user_ids).astype(np.int64),
+            'revenue': _lookup(unique, revenue, user_ids),
+            'response_hours': _lookup(unique, response_hours, user_ids),
+            'responses': _lookup(unique, responses, user_ids).astype(np.int64)
+        }
+
+        appointments = snapshot_store.open('appointment')
+        dates = appointments.column('appointment_date')
+        appointment_mask = np.ones(len(appointments), dtype=bool)
+        if start_date is not None:
+            appointment_mask &= (dates != INT_NULL) & (dates >= _seconds(start_date))
+        if end_date is not None:
+            appointment_mask &= (dates != INT_NULL) & (dates <= _seconds(end_date))
+        unique, totals, completed = _grouped(
+            np.asarray(appointments.column('doctor_id')[appointment_mask]),
+            np.asarray(appointments.equals('status', 'completed')[appointment_mask], dtype=np.float64)
+        )
+        metrics['total_appointments'] = _lookup(unique, totals, user_ids)
+        metrics['completed_appointments'] = _lookup(unique, completed, user_ids).astype(np.int64)
+
+        reviews = snapshot_store.open('doctor_review')
+        approved = np.asarray(reviews.column('is_approved')) == 1
+        unique, totals, ratings = _grouped(
+            np.asarray(reviews.column('doctor_id')[approved]),
+            np.asarray(reviews.column('rating')[approved], dtype=np.float64)
+        )
+        metrics['total_reviews'] = _lookup(unique, totals, profiles['id'])
+        metrics['avg_rating'] = np.divide(
+            _lookup(unique, ratings, profiles['id']), metrics['total_reviews'],
+            out=np.zeros(len(user_ids)), where=metrics['total_reviews'] > 0
+        )
+
+        total = metrics['total_consultations']
+        metrics['completion_rate'] = np.divide(metrics['completed_consultations'] * 100.0, total,
+                                               out=np.zeros(len(user_ids)), where=total > 0)
+        metrics['avg_response_time_hours'] = np.divide(metrics['response_hours'], metrics['responses'],
+                                                       out=np.zeros(len(user_ids)), where=metrics['responses'] > 0)
+
+        rows = np.arange(len(user_ids))
+        if doctor_id:
+            rows = rows[profiles['id'] == doctor_id]
+        if sort_by:
+            ranking = metrics[sort_by][rows]
+            rows = rows[np.lexsort((profiles['id'][rows], -ranking if descending else ranking))]
+        else:
+            rows = rows[np.argsort(profiles['id'][rows], kind='stable')]
+        rows = rows[offset:offset + limit if limit else None]
+
+        for i in rows:
+            responses = int(metrics['responses'][i])
+            total, completed = int(metrics['total_consultations'][i]), int(metrics['completed_consultations'][i])
+            yield {
+                'doctor': self._doctor(profiles, i),
+                'total_consultations': total,
+                'completed_consultations': completed,
+                'completion_rate': (completed / total * 100) if total > 0 else 0,
+                'total_appointments': int(metrics['total_appointments'][i]),
+                'completed_appointments': int(metrics['completed_appointments'][i]),
+                'avg_rating': round(float(metrics['avg_rating'][i]), 2),
+                'total_reviews': int(metrics['total_reviews'][i]),
+                'revenue': float(metrics['revenue'][i]),
+                'avg_response_time_hours': float(round(metrics['response_hours'][i] / responses, 2)) if responses else 0
+            }
+
+# إنشاء مثيل من تحليلات اللقطات
+snapshot_analytics = SnapshotAnalytics()
@@ -0,0 +1,348 @@
+import heapq
+import threading
+import time
+import weakref
+from bisect import bisect_left, insort
+from collections import Counter, OrderedDict
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from src.models.user import db, DoctorProfile, DoctorReview
+from src.routes import performance_cache
+from src.routes.arabic_text import tokenize, index_text
+
+# قاموس الأعراض الشائعة مع وزن أولي (يرتفع مع تكرار البحث عنها)
+SYMPTOMS = {
+    'صداع': 10, 'حمى': 9, 'سعال': 8, 'ألم في الصدر': 7, 'ضيق تنفس': 6,
+    'ألم في البطن': 5, 'غثيان': 4, 'دوخة': 3, 'ألم في الظهر': 2, 'أرق': 1
+}
+
+# أقصى عدد اقتراحات من كل نوع وترتيب الأنواع في الاستجابة
+SUGGESTION_LIMITS = {'doctor': 5, 'specialization': 5, 'symptom': 3}
+MAX_SUGGESTIONS = 10
+SUBTITLES = {'specialization': 'تخصص طبي', 'symptom': 'عرض طبي'}
+
+# أفضل النتائج لكل بادئة كلمة واحدة تحفظ بعد أول حساب (الأقدم استخداماً يحذف أولاً)
+MAX_CACHED_PREFIXES = 50000
+VERSION_KEY = 'suggestions:version'
+VERSION_CHECK_SECONDS = 5
+
+class SuggestionEntry:
+    __slots__ = ('key', 'text', 'subtitle', 'id', 'popularity', 'tokens')
+
+    def __init__(self, key, text, subtitle=None, id=None, popularity=0):
+        self.key = key
+        self.text = text
+        self.subtitle = subtitle
+        self.id = id
+        self.popularity = popularity
+        self.tokens = sorted(set(index_text(text).split()))
+
+class PrefixIndex:
+    """مصفوفة مرتبة من (كلمة موحدة، مفتاح العنصر) يبحث فيها بـ bisect عن نطاق البادئة
+
+    كل كلمة في النص (وجذعها) مدخل مستقل، فـ"عمر" تطابق "د. أحمد العمري". أفضل k لكل بادئة تحفظ
+    فتخدم الضغطات التالية بقراءة واحدة، وتبطل عند تعديل عنصر يحتوي كلمة تبدأ بها.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.keys = []
+        self._top = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def load(self, entries):
+        """تحميل دفعة عناصر بترتيب واحد بدل إدراج كل كلمة على حدة"""
+        for entry in entries:
+            self.entries[entry.key] = entry
+        self.keys = sorted((token, entry.key) for entry in self.entries.values() for token in entry.tokens)
+        self._top.clear()
+
+    def add(self, entry):
+        self.remove(entry.key)
+        self.entries[entry.key] = entry
+        for token in entry.tokens:
+            insort(self.keys, (token, entry.key))
+        self._forget(entry.tokens)
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return None
+        for token in entry.tokens:
+            position = bisect_left(self.keys, (token, key))
+            if position < len(self.keys) and self.keys[position] == (token, key):
+                del self.keys[position]
+        self._forget(entry.tokens)
+        return entry
+
+    def bump(self, key, amount=1):
+        entry = self.entries.get(key)
+        if entry is not None:
+            entry.popularity += amount
+            self._forget(entry.tokens)
+
+    def _forget(self, tokens):
+        for token in tokens:
+            for length in range(1, len(token) + 1):
+                self._top.pop(token[:length], None)
+
+    def matching_text(self, text_key):
+        """مفاتيح العناصر التي نصها الموحد يساوي text_key (مثل "طب الاطفال")"""
+        tokens = text_key.split()
+        if not tokens:
+            return []
+        return [key for key in self._range(max(tokens, key=len))
+                if ' '.join(tokenize(self.entries[key].text)) == text_key]
+
+    def _range(self, prefix):
+        """مفاتيح العناصر التي لها كلمة تبدأ بـ prefix (بدون تكرار)"""
+        found = set()
+        position = bisect_left(self.keys, (prefix,))
+        keys = self.keys
+        while position < len(keys) and keys[position][0].startswith(prefix):
+            found.add(keys[position][1])
+            position += 1
+        return found
+
+    def _best(self, keys, limit):
+        entries = (self.entries[key] for key in keys)
+        return heapq.nsmallest(limit, entries, key=lambda e: (-e.popularity, e.text))
+
+    def search(self, query, limit):
+        """أفضل limit عنصر (حسب الشعبية) تبدأ كل كلمة من الاستعلام كلمةً فيه"""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        if len(tokens) == 1:
+            prefix = tokens[0]
+            computed_limit, cached = self._top.get(prefix, (0, None))
+            if cached is None or limit > computed_limit:
+                computed_limit = max(limit, MAX_SUGGESTIONS)
+                cached = self._best(self._range(prefix), computed_limit)
+                self._top[prefix] = (computed_limit, cached)
+                if len(self._top) > MAX_CACHED_PREFIXES:
+                    self._top.popitem(last=False)
+            else:
+                self._top.move_to_end(prefix)
+            return cached[:limit]
+
+        # الكلمة الأطول أكثر انتقائية فتحدد النطاق، والبقية تصفي المرشحين
+        tokens.sort(key=len, reverse=True)
+        candidates = self._range(tokens[0])
+        rest = tokens[1:]
+        if rest:
+            candidates = [key for key in candidates if all(
+                any(word.startswith(token) for word in self.entries[key].tokens) for token in rest
+            )]
+        return self._best(candidates, limit)
+
+class SuggestionState:
+    def __init__(self):
+        self.indexes = {kind: PrefixIndex() for kind in SUGGESTION_LIMITS}
+        self.specialization_counts = Counter()
+        self.doctor_specializations = {}
+        self.built_at = None
+        self.version = None
+        self.checked_at = 0
+        # أعداد البحث المطبقة على هذا الفهرس وإصدارها
+        self.search_counts = {}
+        self.search_version = 0
+
+class SuggestionIndex:
+    """فهرس بادئات في ذاكرة كل عامل لاقتراحات البحث: أسماء الأطباء والتخصصات والأعراض
+
+    يبنى مرة واحدة من قاعدة البيانات ثم يحدث تدريجياً بعد كل commit يغير DoctorProfile، فالاقتراح
+    نفسه لا يصل إلى قاعدة البيانات. إذا توفر Redis يزاد رقم إصدار مشترك عند التغيير لتعيد العمال
+    الأخرى بناء فهارسها.
+    """
+
+    def __init__(self):
+        self._states = weakref.WeakKeyDictionary()
+        self._lock = threading.RLock()
+        self._search_counts = {}
+        self._search_version = 0
+
+    def _state(self, engine=None):
+        engine = engine or db.engine
+        with self._lock:
+            state = self._states.get(engine)
+            if state is None or self._stale(state):
+                state = self._build()
+                self._states[engine] = state
+            if state.search_version != self._search_version:
+                self._apply_search_counts(state)
+            return state
+
+    def _shared_version(self):
+        if not performance_cache.REDIS_AVAILABLE:
+            return None
+        try:
+            return performance_cache.redis_client.get(VERSION_KEY)
+        except Exception:
+            return None
+
+    def _stale(self, state):
+        now = time.monotonic()
+        if now - state.checked_at < VERSION_CHECK_SECONDS:
+            return False
+        state.checked_at = now
+        return self._shared_version() != state.version
+
+    def _build(self):
+        state = SuggestionState()
+        state.version = self._shared_version()
+        state.checked_at = time.monotonic()
+        popularity = dict(db.session.query(DoctorReview.doctor_id, func.count(DoctorReview.id)).filter(
+            DoctorReview.is_approved == True
+        ).group_by(DoctorReview.doctor_id).all())
+        rows = db.session.query(DoctorProfile.id, DoctorProfile.full_name, DoctorProfile.specialization).all()
+        doctors = []
+        for doctor_id, full_name, specialization in rows:
+            doctors.append(SuggestionEntry(doctor_id, full_name or '', specialization, doctor_id,
+                                           popularity.get(doctor_id, 0)))
+            if specialization:
+                state.doctor_specializations[doctor_id] = specialization
+                state.specialization_counts[specialization] += 1
+        state.indexes['doctor'].load(doctors)
+        state.indexes['specialization'].load(
+            SuggestionEntry(text, text, SUBTITLES['specialization'], popularity=count)
+            for text, count in state.specialization_counts.items()
+        )
+        state.indexes['symptom'].load(
+            SuggestionEntry(text, text, SUBTITLES['symptom'], popularity=weight) for text, weight in SYMPTOMS.items()
+        )
+        state.built_at = time.time()
+        return state
+
+    def _put_doctor(self, state, doctor_id, full_name, specialization, popularity=None):
+        doctors = state.indexes['doctor']
+        previous = doctors.entries.get(doctor_id)
+        if popularity is None:
+            popularity = previous.popularity if previous else 0
+        doctors.add(SuggestionEntry(doctor_id, full_name or '', specialization, doctor_id, popularity))
+        self._move_specialization(state, doctor_id, specialization)
+
+    def _move_specialization(self, state, doctor_id, specialization):
+        """تحديث عدد أطباء كل تخصص (شعبيته) عند إضافة طبيب أو حذفه أو تغيير تخصصه"""
+        specializations = state.indexes['specialization']
+        old = state.doctor_specializations.pop(doctor_id, None)
+        if old:
+            state.specialization_counts[old] -= 1
+            if state.specialization_counts[old] <= 0:
+                del state.specialization_counts[old]
+                specializations.remove(old)
+            else:
+                specializations.bump(old, -1)
+        if specialization:
+            state.doctor_specializations[doctor_id] = specialization
+            state.specialization_counts[specialization] += 1
+            if specialization in specializations.entries:
+                specializations.bump(specialization, 1)
+            else:
+                specializations.add(SuggestionEntry(
+                    specialization, specialization, SUBTITLES['specialization'], popularity=1
+                ))
+
+    def warm(self):
+        """بناء الفهرس مسبقاً (عند بدء العامل) حتى لا يدفع أول طلب كلفة البناء"""
+        return self._state()
+
+    def invalidate(self):
+        with self._lock:
+            self._states.pop(db.engine, None)
+
+    def apply_changes(self, engine, changes):
+        """تطبيق تغييرات الأطباء بعد commit: {المعرف: (الاسم، التخصص) أو None للحذف}"""
+        version = None
+        if performance_cache.REDIS_AVAILABLE:
+            try:
+                version = str(performance_cache.redis_client.incr(VERSION_KEY))
+            except Exception:
+                pass
+        with self._lock:
+            state = self._states.get(engine)
+            if state is None:
+                return
+            for doctor_id, values in changes.items():
+                if values is None:
+                    state.indexes['doctor'].remove(doctor_id)
+                    self._move_specialization(state, doctor_id, None)
+                else:
+                    self._put_doctor(state, doctor_id, *values)
+            if version is not None:
+                state.version = version
+
+    def set_search_counts(self, counts):
+        """أعداد البحث الحالية {النص الموحد: العدد} من قياس البحث؛ تضاف إلى شعبية العناصر المطابقة نصاً
+
+        القيم مطلقة (نافذة منزلقة)، فيطبق الفرق عن آخر أعداد طبقت على كل فهرس عند استخدامه التالي.
+        """
+        with self._lock:
+            self._search_counts = dict(counts)
+            self._search_version += 1
+
+    def _apply_search_counts(self, state):
+        counts = self._search_counts
+        for text_key in set(state.search_counts) | set(counts):
+            delta = counts.get(text_key, 0) - state.search_counts.get(text_key, 0)
+            if delta:
+                for index in state.indexes.values():
+                    for key in index.matching_text(text_key):
+                        index.bump(key, delta)
+        state.search_counts = counts
+        state.search_version = self._search_version
+
+    def bump(self, kind, key, amount=1):
+        """رفع شعبية عنصر (مثل عرض أو تخصص يكثر البحث عنه)"""
+        with self._lock:
+            self._state().indexes[kind].bump(key, amount)
+
+    def suggest(self, query, limits=None):
+        """الاقتراحات بالترتيب: أطباء ثم تخصصات ثم أعراض، الأشهر أولاً في كل نوع"""
+        limits = limits or SUGGESTION_LIMITS
+        state = self._state()
+        suggestions = []
+        with self._lock:
+            for kind, limit in limits.items():
+                for entry in state.indexes[kind].search(query, limit):
+                    suggestions.append({
+                        'type': kind,
+                        'text': entry.text,
+                        'subtitle': entry.subtitle,
+                        'id': entry.id if kind == 'doctor' else None
+                    })
+        return suggestions[:MAX_SUGGESTIONS]
+
+    def status(self):
+        state = self._state()
+        return {
+            'built_at': state.built_at,
+            'entries': {kind: len(index) for kind, index in state.indexes.items()}
+        }
+
+# إنشاء مثيل من فهرس الاقتراحات
+suggestion_index = SuggestionIndex()
+
+@event.listens_for(Session, 'after_flush')
+def _collect_doctor_changes(session, flush_context):
+    changes = None
+    for instance in list(session.new) + list(session.dirty):
+        if isinstance(instance, DoctorProfile):
+            changes = session.info.setdefault('suggestion_changes', {})
+            changes[instance.id] = (instance.full_name, instance.specialization)
+    for instance in session.deleted:
+        if isinstance(instance, DoctorProfile):
+            changes = session.info.setdefault('suggestion_changes', {})
+            changes[instance.id] = None
+
+@event.listens_for(Session, 'after_commit')
+def _apply_doctor_changes(session):
+    changes = session.info.pop('suggestion_changes', None)
+    if changes:
+        suggestion_index.apply_changes(session.get_bind(), changes)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_doctor_changes(session):
+    session.info.pop('suggestion_changes', None)
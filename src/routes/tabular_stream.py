@@ -0,0 +1,88 @@
+import csv
+import io
+import tempfile
+from itertools import chain
+from urllib.parse import quote
+from flask import Response, stream_with_context
+from openpyxl import Workbook
+
+STREAM_CHUNK_SIZE = 64 * 1024
+CSV_ROWS_PER_CHUNK = 1000
+XLSX_SPOOL_SIZE = 8 * 1024 * 1024  # حجم الملف المحتفظ به في الذاكرة قبل النقل إلى القرص
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+CSV_MIMETYPE = 'text/csv'
+
+def iter_query_rows(query, columns, batch_size=1000):
+    """توليد صفوف من مؤشر الخادم (yield_per) حسب أعمدة [(العنوان، دالة القيمة)] دون تحميل النتائج كاملة"""
+    for item in query.yield_per(batch_size):
+        yield [getter(item) for _, getter in columns]
+
+def split_dict_rows(rows):
+    """تحويل مولد قواميس إلى (العناوين، مولد قوائم) بقراءة الصف الأول فقط"""
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return [], iter(())
+    headers = list(first.keys())
+    return headers, ([row.get(key) for key in headers] for row in chain([first], rows))
+
+def write_xlsx(sheets, target):
+    """كتابة مصنف Excel بوضع الكتابة فقط (ذاكرة ثابتة)؛ sheets قائمة (الاسم، العناوين، الصفوف)"""
+    workbook = Workbook(write_only=True)
+    for name, headers, rows in sheets:
+        # أسماء الأوراق في Excel محدودة بـ 31 حرفاً
+        worksheet = workbook.create_sheet(title=name[:31])
+        if headers:
+            worksheet.append(list(headers))
+        for row in rows:
+            worksheet.append(row)
+    workbook.save(target)
+
+def iter_xlsx(sheets, chunk_size=STREAM_CHUNK_SIZE):
+    """توليد ملف Excel على أجزاء؛ الملف يُبنى في ملف مؤقت يُنقل إلى القرص عند تجاوز حد الذاكرة"""
+    with tempfile.SpooledTemporaryFile(max_size=XLSX_SPOOL_SIZE) as spool:
+        write_xlsx(sheets, spool)
+        spool.seek(0)
+        while True:
+            chunk = spool.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+def iter_file(path, chunk_size=STREAM_CHUNK_SIZE):
+    """توليد ملف من القرص على أجزاء (لتنزيل النتائج المحفوظة دون تحميلها في الذاكرة)"""
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+def iter_csv(headers, rows, rows_per_chunk=CSV_ROWS_PER_CHUNK, encoding='utf-8-sig'):
+    """توليد ملف CSV على أجزاء من مولد الصفوف (مع BOM ليفتحه Excel بالعربية بشكل صحيح)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if headers:
+        writer.writerow(headers)
+    # BOM مرة واحدة في بداية الملف فقط
+    chunk_encoding = encoding
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= rows_per_chunk:
+            yield buffer.getvalue().encode(chunk_encoding)
+            chunk_encoding = 'utf-8'
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if pending or chunk_encoding == encoding:
+        yield buffer.getvalue().encode(chunk_encoding)
+
+def stream_file(chunks, filename, mimetype):
+    """استجابة تنزيل متدفقة (تبقي سياق الطلب لقراءة مؤشرات قاعدة البيانات أثناء الإرسال)"""
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    # أسماء الملفات العربية تُرسل بترميز RFC 5987 كما يفعل send_file
+    response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(filename)}"
+    return response
@@ -0,0 +1,299 @@
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import numpy as np
+from sqlalchemy import func, select, literal, union_all
+from src.models.user import db, Appointment, DoctorReview
+from src.routes.analytics_rollups import rollup_manager, epoch_bucket
+
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+
+# الفترة الافتراضية عند عدم تحديد البداية
+DEFAULT_SPANS = {
+    'hour': timedelta(days=2),
+    'day': timedelta(days=30),
+    'week': timedelta(weeks=26),
+    'month': timedelta(days=365)
+}
+MAX_BUCKETS = 20000
+DOWNSAMPLE_METHODS = ('sum', 'lttb')
+
+SECONDS_PER_DAY = 86400
+
+def bucket_keys(timestamps, granularity):
+    """بداية الفترة لكل توقيت (مصفوفة datetime64[s]) حسب الدقة؛ الأسبوع يبدأ يوم الاثنين"""
+    if granularity == 'hour':
+        return timestamps.astype('datetime64[h]').astype('datetime64[s]')
+    if granularity == 'month':
+        return timestamps.astype('datetime64[M]').astype('datetime64[s]')
+    days = timestamps.astype('datetime64[D]')
+    if granularity == 'week':
+        # 1970-01-01 يوم خميس: (رقم اليوم + 3) % 7 يعطي ترتيب اليوم من الاثنين
+        days = days - ((days.astype(np.int64) + 3) % 7).astype('timedelta64[D]')
+    return days.astype('datetime64[s]')
+
+def bucket_grid(start, end, granularity):
+    """جميع بدايات الفترات من الفترة التي تحتوي start حتى التي تحتوي end"""
+    first, last = bucket_keys(np.array([start, end], dtype='datetime64[s]'), granularity)
+    if granularity == 'month':
+        months = np.arange(first.astype('datetime64[M]'), last.astype('datetime64[M]') + 1)
+        return months.astype('datetime64[s]')
+    step = {'hour': np.timedelta64(1, 'h'), 'day': np.timedelta64(1, 'D'), 'week': np.timedelta64(7, 'D')}
+    return np.arange(first, last + 1, step[granularity].astype('timedelta64[s]'))
+
+def resolve_timezone(name):
+    """تحويل اسم المنطقة الزمنية إلى ZoneInfo (None يعني التواريخ كما هي مخزنة)"""
+    if not name:
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f'منطقة زمنية غير معروفة: {name}')
+
+def _to_utc(value, zone):
+    if zone is None:
+        return value
+    return value.replace(tzinfo=zone).astimezone(dt_timezone.utc).replace(tzinfo=None)
+
+def _offsets(zone, start, end):
+    """إزاحات المنطقة الزمنية (بالثواني) خلال الفترة، بعينة أسبوعية تكفي لرصد التوقيت الصيفي"""
+    if zone is None:
+        return {0}
+    offsets = set()
+    moment = start
+    while moment <= end:
+        offsets.add(int(moment.replace(tzinfo=zone).utcoffset().total_seconds()))
+        moment += timedelta(days=7)
+    offsets.add(int(end.replace(tzinfo=zone).utcoffset().total_seconds()))
+    return offsets
+
+class TimeSeries:
+    """سلسلة زمنية مكتملة الفترات (الفترات الفارغة أصفار) بمصفوفات NumPy"""
+
+    def __init__(self, metric, granularity, timestamps, values, timezone=None):
+        self.metric = metric
+        self.granularity = granularity
+        self.timestamps = timestamps  # بدايات الفترات datetime64[s] بالتوقيت المحلي
+        self.values = values
+        self.timezone = timezone
+
+    @classmethod
+    def from_totals(cls, metric, totals, granularity, start=None, end=None, timezone=None):
+        """بناء سلسلة مكتملة من مجاميع جاهزة {التاريخ أو نصه: القيمة}"""
+        stamps = np.array(list(totals), dtype='datetime64[s]')
+        weights = np.array(list(totals.values()), dtype=np.float64)
+        if start is None or end is None:
+            if not len(stamps):
+                return cls(metric, granularity, np.array([], dtype='datetime64[s]'), np.zeros(0), timezone)
+            start = start or stamps.min().astype(datetime)
+            end = end or stamps.max().astype(datetime)
+        grid = bucket_grid(start, end, granularity)
+        return cls(metric, granularity, grid, accumulate(grid, stamps, weights, granularity), timezone)
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def total(self):
+        return self.values.sum().item()
+
+    def labels(self):
+        if self.granularity == 'month':
+            return np.datetime_as_string(self.timestamps, unit='M').tolist()
+        if self.granularity == 'hour':
+            return [f'{label.replace("T", " ")}:00' for label in np.datetime_as_string(self.timestamps, unit='h').tolist()]
+        return np.datetime_as_string(self.timestamps, unit='D').tolist()
+
+    def value_list(self):
+        values = self.values.tolist()
+        if self.values.dtype.kind == 'f' and all(float(v).is_integer() for v in values):
+            return [int(v) for v in values]
+        return values
+
+    def to_dict(self):
+        return dict(zip(self.labels(), self.value_list()))
+
+    def to_list(self):
+        return [{'period': label, 'value': value} for label, value in zip(self.labels(), self.value_list())]
+
+    def downsample(self, max_points, method='sum'):
+        """تقليل عدد النقاط للرسم: sum يدمج الفترات المتجاورة (يحفظ المجموع)، lttb يختار نقاطاً تحفظ الشكل"""
+        if method not in DOWNSAMPLE_METHODS:
+            raise ValueError(f'طريقة تقليل غير مدعومة: {method}')
+        if max_points and method == 'lttb' and max_points < 3:
+            raise ValueError('طريقة lttb تتطلب 3 نقاط على الأقل')
+        count = len(self)
+        if not max_points or count <= max_points:
+            return self
+        if method == 'sum':
+            size = math.ceil(count / max_points)
+            groups = np.arange(count) // size
+            values = np.bincount(groups, weights=self.values)
+            return TimeSeries(self.metric, self.granularity, self.timestamps[::size], values, self.timezone)
+        indices = lttb_indices(self.timestamps.astype(np.int64).astype(np.float64), self.values, max_points)
+        return TimeSeries(self.metric, self.granularity, self.timestamps[indices], self.values[indices], self.timezone)
+
+def accumulate(grid, stamps, weights, granularity):
+    """جمع القيم في فترات الشبكة عبر searchsorted و bincount (ما خارج الشبكة يتجاهل)"""
+    values = np.zeros(len(grid))
+    if not len(stamps) or not len(grid):
+        return values
+    keys = bucket_keys(stamps, granularity)
+    positions = np.searchsorted(grid, keys)
+    inside = positions < len(grid)
+    inside[inside] = grid[positions[inside]] == keys[inside]
+    return np.bincount(positions[inside], weights=weights[inside], minlength=len(grid)).astype(np.float64)
+
+def lttb_indices(x, y, threshold):
+    """خوارزمية Largest-Triangle-Three-Buckets: فهارس النقاط المختارة (الأولى والأخيرة دائماً)"""
+    count = len(x)
+    if threshold >= count:
+        return np.arange(count)
+    selected = [0]
+    edges = np.linspace(1, count - 1, threshold - 1).astype(int)
+    previous = 0
+    for i in range(threshold - 2):
+        low, high = edges[i], edges[i + 1]
+        # متوسط الحاوية التالية كرأس ثالث للمثلث
+        next_low, next_high = high, (edges[i + 2] if i + 2 < len(edges) else count)
+        avg_x = x[next_low:next_high].mean()
+        avg_y = y[next_low:next_high].mean()
+        areas = np.abs(
+            (x[previous] - avg_x) * (y[low:high] - y[previous]) - (x[previous] - x[low:high]) * (avg_y - y[previous])
+        )
+        previous = low + int(np.argmax(areas))
+        selected.append(previous)
+    selected.append(count - 1)
+    return np.array(selected)
+
+class TimeSeriesMetric:
+    """مقياس زمني: مجموع value (أو عدد الصفوف) على عمود التاريخ، مع مصدر تجميع يومي اختياري"""
+
+    def __init__(self, name, model=None, date_column=None, value=None, filters=None, rollup=None):
+        self.name = name
+        self.rollup = rollup  # (اسم المصدر في rollup_manager، اسم المقياس)
+        if rollup is not None:
+            source = rollup_manager.sources[rollup[0]]
+            model, date_column = source.model, source.date_column
+            filters = source.filters
+        self.model = model
+        self.date_column = date_column
+        self.value = value
+        self.filters = filters or (lambda: [])
+
+    def raw_aggregate(self, dialect):
+        if self.rollup is not None:
+            return rollup_manager.sources[self.rollup[0]].measures(dialect)[self.rollup[1]]
+        return func.count(self.model.id) if self.value is None else func.sum(self.value)
+
+class TimeSeriesEngine:
+    """سلاسل زمنية لأي مقياس مسجل بدقة ومنطقة زمنية قابلتين للاختيار
+
+    الأيام الكاملة تقرأ من جداول التجميع اليومية عندما تكون الدقة يوماً فأكثر دون إزاحة زمنية، وإلا
+    يجمع الجدول الخام بـ GROUP BY واحد على رقم الفترة. المقاييس المطلوبة معاً تنفذ في UNION ALL واحد.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def series(self, name, start=None, end=None, granularity='day', timezone=None):
+        return self.series_many([name], start, end, granularity, timezone)[name]
+
+    def series_many(self, names, start=None, end=None, granularity='day', timezone=None):
+        """{اسم المقياس: TimeSeries}؛ start و end بالتوقيت المحلي للمنطقة الزمنية المطلوبة"""
+        if granularity not in GRANULARITIES:
+            raise ValueError(f'دقة غير مدعومة: {granularity}')
+        for name in names:
+            if name not in self.metrics:
+                raise ValueError(f'مقياس غير مسجل: {name}')
+        zone = resolve_timezone(timezone)
+
+        if end is None:
+            end = datetime.now(zone).replace(tzinfo=None) if zone else datetime.now()
+        start = start or end - DEFAULT_SPANS[granularity]
+        if start > end:
+            raise ValueError('بداية الفترة بعد نهايتها')
+        grid = bucket_grid(start, end, granularity)
+        if len(grid) > MAX_BUCKETS:
+            raise ValueError(f'عدد الفترات {len(grid)} يتجاوز الحد ({MAX_BUCKETS})')
+
+        offsets = _offsets(zone, start, end)
+        use_rollups = granularity != 'hour' and offsets == {0}
+        dialect = db.session.get_bind().dialect.name
+
+        rollup_parts, raw_parts = [], []
+        for name in names:
+            metric = self.metrics[name]
+            if use_rollups and metric.rollup is not None:
+                rollup_parts.append(self._rollup_part(metric, start, end))
+            else:
+                raw_parts.append(metric)
+
+        samples = {name: ([], []) for name in names}
+        if rollup_parts:
+            rollup_manager.ensure_fresh()
+            for row in db.session.execute(union_all(*rollup_parts) if len(rollup_parts) > 1 else rollup_parts[0]):
+                samples[row.metric][0].append(np.datetime64(row.bucket, 's'))
+                samples[row.metric][1].append(row.value or 0)
+
+        if raw_parts:
+            self._read_raw(raw_parts, start, end, granularity, zone, offsets, dialect, samples)
+
+        result = {}
+        for name in names:
+            stamps = np.array(samples[name][0], dtype='datetime64[s]')
+            weights = np.array(samples[name][1], dtype=np.float64)
+            result[name] = TimeSeries(name, granularity, grid, accumulate(grid, stamps, weights, granularity), timezone)
+        return result
+
+    def _rollup_part(self, metric, start, end):
+        source_name, measure = metric.rollup
+        aggregated = rollup_manager.aggregate_statement(source_name, start, end, period='%Y-%m-%d').subquery()
+        return select(
+            literal(metric.name).label('metric'), aggregated.c.period.label('bucket'), aggregated.c[measure].label('value')
+        )
+
+    def _read_raw(self, metrics, start, end, granularity, zone, offsets, dialect, samples):
+        # إزاحة ثابتة ودقة يوم فأكثر: التجميع مباشرة على الأيام المحلية، وإلا على ساعات UTC ثم التحويل
+        if granularity != 'hour' and len(offsets) == 1:
+            step, shift = SECONDS_PER_DAY, next(iter(offsets))
+        else:
+            step = 3600 if all(offset % 3600 == 0 for offset in offsets) else 900
+            shift = 0
+        low, high = _to_utc(start, zone), _to_utc(end, zone)
+
+        parts = []
+        for metric in metrics:
+            bucket = epoch_bucket(metric.date_column, step, shift, dialect)
+            parts.append(
+                select(literal(metric.name).label('metric'), bucket.label('bucket'),
+                       metric.raw_aggregate(dialect).label('value'))
+                .where(metric.date_column >= low, metric.date_column <= high, *metric.filters())
+                .group_by(bucket)
+            )
+
+        for row in db.session.execute(union_all(*parts) if len(parts) > 1 else parts[0]):
+            seconds = int(row.bucket) * step
+            if shift or zone is None:
+                stamp = np.datetime64(seconds, 's')
+            else:
+                local = datetime.fromtimestamp(seconds, zone).replace(tzinfo=None)
+                stamp = np.datetime64(local, 's')
+            samples[row.metric][0].append(stamp)
+            samples[row.metric][1].append(row.value or 0)
+
+# إنشاء مثيل من محرك السلاسل الزمنية مع المقاييس الافتراضية
+timeseries_engine = TimeSeriesEngine()
+
+timeseries_engine.register(TimeSeriesMetric('consultations', rollup=('consultation', 'total')))
+timeseries_engine.register(TimeSeriesMetric('consultation_revenue', rollup=('consultation', 'revenue')))
+timeseries_engine.register(TimeSeriesMetric('revenue', rollup=('payment', 'amount')))
+timeseries_engine.register(TimeSeriesMetric('new_users', rollup=('user', 'total')))
+timeseries_engine.register(TimeSeriesMetric('appointments', Appointment, Appointment.created_at))
+timeseries_engine.register(TimeSeriesMetric(
+    'reviews', DoctorReview, DoctorReview.created_at, filters=lambda: [DoctorReview.is_approved == True]
+))
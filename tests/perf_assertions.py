@@ -0,0 +1,49 @@
+import os
+import sys
+import tracemalloc
+from contextlib import contextmanager
+
+# إضافة جذر المشروع إلى sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.routes.performance_cache import count_queries
+
+class PeakMemory:
+    """نتيجة قياس ذروة الذاكرة داخل كتلة with"""
+
+    def __init__(self):
+        self.peak_bytes = 0
+
+    @property
+    def peak_kb(self):
+        return self.peak_bytes / 1024
+
+@contextmanager
+def assert_max_queries(limit):
+    """التحقق من أن الكتلة لا تنفذ أكثر من limit استعلام SQL عبر db"""
+    with count_queries() as counter:
+        yield counter
+    if counter.count > limit:
+        statements = '\n'.join(f'  {i + 1}. {s}' for i, s in enumerate(counter.statements))
+        raise AssertionError(f'تم تنفيذ {counter.count} استعلام والحد المسموح {limit}:\n{statements}')
+
+@contextmanager
+def assert_peak_memory(max_kb):
+    """التحقق من أن ذروة تخصيص الذاكرة (tracemalloc) داخل الكتلة لا تتجاوز max_kb"""
+    result = PeakMemory()
+    already_tracing = tracemalloc.is_tracing()
+    if already_tracing:
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+    else:
+        tracemalloc.start()
+        baseline = 0
+    try:
+        yield result
+        _, peak = tracemalloc.get_traced_memory()
+        result.peak_bytes = max(0, peak - baseline)
+    finally:
+        if not already_tracing:
+            tracemalloc.stop()
+    if result.peak_kb > max_kb:
+        raise AssertionError(f'ذروة الذاكرة {result.peak_kb:.1f}KB تتجاوز الحد {max_kb}KB')
@@ -0,0 +1,159 @@
+import unittest
+import sys
+import os
+from unittest import mock
+from datetime import datetime, date, timedelta
+
+# إضافة جذر المشروع إلى sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import numpy as np
+from benchmarks.harness import create_app, seed_platform
+from perf_assertions import assert_max_queries
+from src.models.user import db, Consultation, Appointment, ActivitySketch
+from src.routes.activity_sketches import HyperLogLog, activity_sketches
+
+class HyperLogLogTestCase(unittest.TestCase):
+    """دقة التقدير والدمج والتخزين"""
+
+    def test_accuracy(self):
+        for cardinality in (10, 1000, 200000):
+            with self.subTest(cardinality=cardinality):
+                sketch = HyperLogLog().add_many(np.arange(cardinality))
+                self.assertLess(abs(sketch.count() - cardinality) / cardinality, 0.02)
+
+    def test_duplicates_and_merge(self):
+        first = HyperLogLog().add_many(np.arange(0, 60000))
+        self.assertEqual(HyperLogLog().add_many(np.tile(np.arange(0, 60000), 3)).count(), first.count())
+        second = HyperLogLog().add_many(np.arange(40000, 100000))
+        union = HyperLogLog().add_many(np.arange(0, 100000))
+        np.testing.assert_array_equal(first.merge(second).registers, union.registers)
+
+    def test_serialization(self):
+        sketch = HyperLogLog().add_many(np.arange(500))
+        data = sketch.to_bytes()
+        self.assertLess(len(data), 4096)
+        restored = HyperLogLog.from_bytes(data, sketch.precision)
+        np.testing.assert_array_equal(restored.registers, sketch.registers)
+        with self.assertRaises(ValueError):
+            restored.merge(HyperLogLog(precision=10))
+
+class ActivitySketchManagerTestCase(unittest.TestCase):
+    """رسوم النشاط اليومية: مطابقة العد الدقيق تقريباً وتحديثها مع البيانات"""
+
+    def setUp(self):
+        self.app = create_app()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        self.fixture = seed_platform(doctors=10, patients=120, reviews_per_doctor=1,
+                                     consultations_per_doctor=40, appointments_per_doctor=8)
+        self.today = date.today()
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def assertClose(self, estimate, exact):
+        self.assertAlmostEqual(estimate, exact, delta=exact * 0.02 + 1)
+
+    def test_summary_matches_exact(self):
+        with assert_max_queries(1):
+            approximate = activity_sketches.summary()
+        exact = activity_sketches.summary(exact=True)
+        self.assertEqual(set(approximate), {'active_patients', 'active_doctors', 'bookers'})
+        for name, values in exact.items():
+            for window in ('dau', 'wau', 'mau'):
+                self.assertClose(approximate[name][window], values[window])
+
+        recent = Consultation.query.filter(
+            Consultation.request_date >= datetime.combine(self.today - timedelta(days=29), datetime.min.time())
+        ).all()
+        self.assertEqual(exact['active_patients']['mau'], len({c.user_id for c in recent}))
+
+    def test_rolling_and_unique(self):
+        first = self.today - timedelta(days=20)
+        approximate = activity_sketches.rolling('active_patients', 7, first, self.today)
+        exact = activity_sketches.rolling('active_patients', 7, first, self.today, exact=True)
+        self.assertEqual(list(approximate), list(exact))
+        self.assertEqual(len(approximate), 21)
+        for day, count in exact.items():
+            self.assertClose(approximate[day], count)
+
+        start = self.today - timedelta(days=90)
+        self.assertClose(activity_sketches.unique('bookers', start, self.today),
+                         activity_sketches.unique('bookers', start, self.today, exact=True))
+
+    def test_flush_updates_todays_sketch(self):
+        before = activity_sketches.summary(['active_patients'], exact=True)['active_patients']['dau']
+        for patient_id in self.fixture['patient_ids'][:30]:
+            db.session.add(Consultation(user_id=patient_id, doctor_id=self.fixture['doctor_user_ids'][0],
+                                        request_date=datetime.combine(self.today, datetime.min.time()),
+                                        status='pending'))
+        db.session.commit()
+        after = activity_sketches.summary(['active_patients'])['active_patients']['dau']
+        exact = activity_sketches.summary(['active_patients'], exact=True)['active_patients']['dau']
+        self.assertGreater(exact, before)
+        self.assertClose(after, exact)
+
+    def sketch_registers(self, metric, day):
+        row = ActivitySketch.query.filter_by(metric=metric, day=day).one()
+        return HyperLogLog.from_bytes(row.registers, row.precision).registers
+
+    def test_inserts_merge_into_stored_sketch(self):
+        """الإدخال يدمج في رسم اليوم دون إعادة بنائه، والنتيجة تطابق إعادة البناء الكاملة"""
+        start = datetime.combine(self.today, datetime.min.time())
+        new_day = self.today + timedelta(days=2)
+        with mock.patch.object(activity_sketches, 'recompute_days', wraps=activity_sketches.recompute_days) as recompute:
+            for index, patient_id in enumerate(self.fixture['patient_ids'][:20]):
+                db.session.add(Consultation(user_id=patient_id, doctor_id=self.fixture['doctor_user_ids'][0],
+                                            request_date=start + timedelta(minutes=index), status='pending'))
+                db.session.commit()
+            # يوم بلا رسم ينشأ رسمه من الإضافة
+            moved = Consultation(user_id=self.fixture['patient_ids'][0], doctor_id=self.fixture['doctor_user_ids'][1],
+                                 request_date=datetime.combine(new_day, datetime.min.time()), status='pending')
+            db.session.add(moved)
+            db.session.commit()
+            recompute.assert_not_called()
+
+            # نقل الصف إلى يوم آخر يعيد بناء اليومين
+            moved.request_date = start
+            db.session.commit()
+            self.assertEqual(recompute.call_count, 2)
+
+        incremental = {day: self.sketch_registers('active_patients', day) for day in (self.today,)}
+        self.assertEqual(ActivitySketch.query.filter_by(metric='active_patients', day=new_day).count(), 0)
+        activity_sketches.rebuild()
+        for day, registers in incremental.items():
+            np.testing.assert_array_equal(registers, self.sketch_registers('active_patients', day))
+
+    def test_catch_up_after_bulk_insert(self):
+        day = self.today - timedelta(days=3)
+        db.session.bulk_insert_mappings(Appointment, [
+            {'user_id': patient_id, 'appointment_date': datetime.now(), 'created_at': datetime.combine(day, datetime.min.time())}
+            for patient_id in self.fixture['patient_ids']
+        ])
+        db.session.commit()
+        processed = activity_sketches.catch_up()
+        self.assertEqual(processed['bookers'], 1)
+        self.assertEqual(processed['active_patients'], 0)
+        self.assertClose(activity_sketches.unique('bookers', day, day),
+                         activity_sketches.unique('bookers', day, day, exact=True))
+
+        rows = activity_sketches.rebuild()
+        self.assertEqual(rows['bookers'], ActivitySketch.query.filter_by(metric='bookers').count())
+
+    def test_endpoint(self):
+        client = self.app.test_client()
+        response = client.get('/api/analytics/active-users?window=7&days=14')
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual(len(body['rolling']['bookers']), 14)
+        self.assertIn('stickiness', body['metrics']['active_doctors'])
+
+        exact = client.get('/api/analytics/active-users?exact=true&metrics=active_doctors').get_json()
+        self.assertEqual(list(exact['metrics']), ['active_doctors'])
+        self.assertEqual(client.get('/api/analytics/active-users?metrics=unknown').status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
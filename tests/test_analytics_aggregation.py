@@ -0,0 +1,291 @@
+import unittest
+import sys
+import os
+from datetime import datetime, date, timedelta
+
+# إضافة جذر المشروع إلى sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from benchmarks.harness import create_app, seed_platform
+from perf_assertions import assert_max_queries
+from src.models.user import db, User, Consultation, Payment, DoctorProfile, Appointment, DoctorReview
+from src.routes.analytics_reports import analytics_engine
+from src.routes.activity_sketches import activity_sketches
+
+def reference_consultation_analytics(start_date=None, end_date=None):
+    """التنفيذ المرجعي السابق (حلقات بايثون على كل الصفوف) للمقارنة"""
+    query = Consultation.query
+    if start_date:
+        query = query.filter(Consultation.request_date >= start_date)
+    if end_date:
+        query = query.filter(Consultation.request_date <= end_date)
+    consultations = query.all()
+
+    total = len(consultations)
+    completed = len([c for c in consultations if c.status == 'completed'])
+    types = {}
+    daily = {}
+    response_times = []
+    for c in consultations:
+        type_name = c.consultation_type or 'غير محدد'
+        types[type_name] = types.get(type_name, 0) + 1
+        date_key = c.request_date.strftime('%Y-%m-%d')
+        daily[date_key] = daily.get(date_key, 0) + 1
+        if c.completed_at and c.request_date:
+            response_times.append((c.completed_at - c.request_date).total_seconds() / 3600)
+    revenue = sum([c.consultation_fee or 0 for c in consultations])
+    return {
+        'total_consultations': total,
+        'completed_consultations': completed,
+        'pending_consultations': len([c for c in consultations if c.status == 'pending']),
+        'cancelled_consultations': len([c for c in consultations if c.status == 'cancelled']),
+        'completion_rate': round(completed / total * 100, 2) if total else 0,
+        'consultation_types': types,
+        'daily_distribution': daily,
+        'avg_response_time_hours': round(sum(response_times) / len(response_times), 2) if response_times else 0,
+        'total_revenue': revenue,
+        'avg_consultation_fee': round(revenue / total, 2) if total else 0
+    }
+
+def reference_financial_analytics(start_date=None, end_date=None):
+    query = Payment.query.filter_by(status='completed')
+    if start_date:
+        query = query.filter(Payment.completed_at >= start_date)
+    if end_date:
+        query = query.filter(Payment.completed_at <= end_date)
+    # ترتيب صريح بالمعرف: تساوي الإيرادات يحسم بأول دفعة كما في التنفيذ السابق على ترتيب الإدخال
+    payments = query.order_by(Payment.id).all()
+
+    total = sum([p.amount for p in payments])
+    types = {}
+    methods = {}
+    monthly = {}
+    daily = {}
+    doctor_revenues = {}
+    for p in payments:
+        types[p.payment_type] = types.get(p.payment_type, 0) + p.amount
+        method = p.payment_method or 'غير محدد'
+        methods[method] = methods.get(method, 0) + p.amount
+        if p.completed_at:
+            month_key = p.completed_at.strftime('%Y-%m')
+            monthly[month_key] = monthly.get(month_key, 0) + p.amount
+            day_key = p.completed_at.strftime('%Y-%m-%d')
+            daily[day_key] = daily.get(day_key, 0) + p.amount
+        if p.consultation_id:
+            consultation = db.session.get(Consultation, p.consultation_id)
+            if consultation and consultation.doctor_id:
+                doctor_revenues[consultation.doctor_id] = doctor_revenues.get(consultation.doctor_id, 0) + p.amount
+    top = sorted(doctor_revenues.items(), key=lambda x: x[1], reverse=True)[:5]
+    return {
+        'total_revenue': total,
+        'total_transactions': len(payments),
+        'avg_transaction_value': round(total / len(payments), 2) if payments else 0,
+        'payment_types': types,
+        'payment_methods': methods,
+        'daily_revenue': daily,
+        'monthly_revenue': monthly,
+        'top_earning_doctors': [
+            {'doctor_user_id': doctor_id, 'revenue': revenue} for doctor_id, revenue in top
+        ],
+        'doctors_with_revenue': len(doctor_revenues)
+    }
+
+def reference_user_analytics(start_date=None, end_date=None):
+    query = User.query
+    if start_date:
+        query = query.filter(User.created_at >= start_date)
+    if end_date:
+        query = query.filter(User.created_at <= end_date)
+    users = query.all()
+
+    types = {}
+    monthly = {}
+    for u in users:
+        types[u.user_type] = types.get(u.user_type, 0) + 1
+        month_key = u.created_at.strftime('%Y-%m')
+        monthly[month_key] = monthly.get(month_key, 0) + 1
+    recent = Consultation.query.filter(Consultation.request_date >= datetime.now() - timedelta(days=30)).all()
+    verified = len([u for u in users if u.kyc_verified])
+    return {
+        'total_users': len(users),
+        'active_users': len([u for u in users if u.is_active]),
+        'verified_users': verified,
+        'verification_rate': (verified / len(users) * 100) if users else 0,
+        'user_types': types,
+        'monthly_registrations': monthly,
+        'active_patients_30d': len(set([c.user_id for c in recent])),
+        'active_doctors_30d': len(set([c.doctor_id for c in recent if c.doctor_id]))
+    }
+
+def reference_doctor_performance(start_date=None, end_date=None):
+    """التنفيذ المرجعي السابق: ثلاثة استعلامات لكل طبيب"""
+    results = []
+    for doctor in DoctorProfile.query.all():
+        consultation_query = Consultation.query.filter_by(doctor_id=doctor.user_id)
+        appointment_query = Appointment.query.filter_by(doctor_id=doctor.user_id)
+        if start_date:
+            consultation_query = consultation_query.filter(Consultation.request_date >= start_date)
+            appointment_query = appointment_query.filter(Appointment.appointment_date >= start_date)
+        if end_date:
+            consultation_query = consultation_query.filter(Consultation.request_date <= end_date)
+            appointment_query = appointment_query.filter(Appointment.appointment_date <= end_date)
+        consultations = consultation_query.all()
+        appointments = appointment_query.all()
+        reviews = DoctorReview.query.filter_by(doctor_id=doctor.id, is_approved=True).all()
+
+        total = len(consultations)
+        completed = len([c for c in consultations if c.status == 'completed'])
+        response_times = [
+            (c.completed_at - c.request_date).total_seconds() / 3600
+            for c in consultations if c.completed_at and c.request_date
+        ]
+        results.append({
+            'doctor_id': doctor.id,
+            'total_consultations': total,
+            'completed_consultations': completed,
+            'completion_rate': (completed / total * 100) if total > 0 else 0,
+            'total_appointments': len(appointments),
+            'completed_appointments': len([a for a in appointments if a.status == 'completed']),
+            'avg_rating': round(sum(r.rating for r in reviews) / len(reviews), 2) if reviews else 0,
+            'total_reviews': len(reviews),
+            'revenue': sum([c.consultation_fee or 0 for c in consultations]),
+            'avg_response_time_hours': round(sum(response_times) / len(response_times), 2) if response_times else 0
+        })
+    return results
+
+class AnalyticsAggregationTestCase(unittest.TestCase):
+    """مطابقة نتائج التجميع في SQL مع التنفيذ المرجعي بحلقات بايثون"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+        with cls.app.app_context():
+            cls.fixture = seed_platform(doctors=30, patients=150, reviews_per_doctor=2,
+                                        consultations_per_doctor=12, appointments_per_doctor=1)
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        now = self.fixture['now']
+        self.ranges = [(None, None), (now - timedelta(days=30), None), (now - timedelta(days=90), now - timedelta(days=20))]
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def assertMappingAlmostEqual(self, first, second):
+        self.assertEqual(set(first), set(second))
+        for key in first:
+            self.assertAlmostEqual(first[key], second[key], places=6, msg=key)
+
+    def test_consultation_analytics_matches_reference(self):
+        for start_date, end_date in self.ranges:
+            with self.subTest(start_date=start_date, end_date=end_date):
+                expected = reference_consultation_analytics(start_date, end_date)
+                with assert_max_queries(1):
+                    result = analytics_engine.get_consultation_analytics(start_date, end_date)
+                self.assertGreater(result['total_consultations'], 0)
+                self.assertEqual(result.pop('consultation_types'), expected.pop('consultation_types'))
+                # التوزيع اليومي مكتمل الأيام: نفس القيم غير الصفرية وأيام متتالية بلا فجوات
+                daily = result.pop('daily_distribution')
+                self.assertEqual({day: count for day, count in daily.items() if count}, expected.pop('daily_distribution'))
+                days = [datetime.strptime(day, '%Y-%m-%d') for day in daily]
+                self.assertEqual(days, [days[0] + timedelta(days=i) for i in range(len(days))])
+                # بلا نهاية للفترة تمتد الأيام الفارغة الأخيرة حتى اليوم
+                self.assertEqual(days[-1].date(), (end_date or datetime.now()).date())
+                self.assertMappingAlmostEqual(result, expected)
+
+    def test_financial_analytics_matches_reference(self):
+        for start_date, end_date in self.ranges:
+            with self.subTest(start_date=start_date, end_date=end_date):
+                expected = reference_financial_analytics(start_date, end_date)
+                with assert_max_queries(4):
+                    result = analytics_engine.get_financial_analytics(start_date, end_date)
+                self.assertGreater(result['total_transactions'], 0)
+                self.assertEqual(result.pop('doctor_revenue_pagination'),
+                                 {'offset': 0, 'limit': 5, 'total': expected.pop('doctors_with_revenue')})
+                for key in ('payment_types', 'payment_methods', 'daily_revenue', 'monthly_revenue'):
+                    self.assertMappingAlmostEqual(result.pop(key), expected.pop(key))
+
+                top = result.pop('top_earning_doctors')
+                expected_top = expected.pop('top_earning_doctors')
+                profiles = {p.id: p.user_id for p in DoctorProfile.query.all()}
+                self.assertEqual([profiles[item['doctor']['id']] for item in top],
+                                 [item['doctor_user_id'] for item in expected_top])
+                for item, expected_item in zip(top, expected_top):
+                    self.assertAlmostEqual(item['revenue'], expected_item['revenue'], places=6)
+
+                self.assertMappingAlmostEqual(result, expected)
+
+    def test_doctor_performance_matches_reference(self):
+        for start_date, end_date in self.ranges:
+            with self.subTest(start_date=start_date, end_date=end_date):
+                expected = reference_doctor_performance(start_date, end_date)
+                with assert_max_queries(3):
+                    result = analytics_engine.get_doctor_performance_analytics(None, start_date, end_date)
+                self.assertEqual(len(result), len(expected))
+                for item, expected_item in zip(result, expected):
+                    self.assertEqual(item.pop('doctor')['id'], expected_item.pop('doctor_id'))
+                    self.assertMappingAlmostEqual(item, expected_item)
+
+    def test_doctor_performance_ranking(self):
+        """الترتيب والحد الأعلى يطبقان في قاعدة البيانات"""
+        expected = sorted(reference_doctor_performance(), key=lambda item: (-item['revenue'], item['doctor_id']))[:5]
+        result = analytics_engine.get_doctor_performance_analytics(sort_by='revenue', limit=5)
+        self.assertEqual([item['doctor']['id'] for item in result], [item['doctor_id'] for item in expected])
+
+        ascending = analytics_engine.get_doctor_performance_analytics(sort_by='completion_rate', descending=False)
+        rates = [item['completion_rate'] for item in ascending]
+        self.assertEqual(rates, sorted(rates))
+
+        page = analytics_engine.get_doctor_performance_analytics(sort_by='revenue', limit=2, offset=3)
+        self.assertEqual([item['doctor']['id'] for item in page], [item['doctor_id'] for item in expected[3:5]])
+
+    def test_doctor_performance_endpoint_streams_json(self):
+        client = self.app.test_client()
+        response = client.get('/api/analytics/doctors/performance?sort_by=avg_rating&limit=3')
+        self.assertEqual(response.status_code, 200)
+        ratings = [item['avg_rating'] for item in response.get_json()['doctor_performance']]
+        self.assertEqual(len(ratings), 3)
+        self.assertEqual(ratings, sorted(ratings, reverse=True))
+
+        response = client.get('/api/analytics/doctors/performance?sort_by=unknown')
+        self.assertEqual(response.status_code, 400)
+
+    def test_financial_doctor_pagination(self):
+        """صفحات إيرادات الأطباء متتالية ولا تتداخل"""
+        client = self.app.test_client()
+        first = client.get('/api/analytics/financial?top_n=4&page=1').get_json()
+        second = client.get('/api/analytics/financial?top_n=4&page=2').get_json()
+        revenues = [item['revenue'] for item in first['top_earning_doctors'] + second['top_earning_doctors']]
+        self.assertEqual(len(revenues), 8)
+        self.assertEqual(revenues, sorted(revenues, reverse=True))
+        first_ids = {item['doctor']['id'] for item in first['top_earning_doctors']}
+        self.assertFalse(first_ids & {item['doctor']['id'] for item in second['top_earning_doctors']})
+        self.assertEqual(second['doctor_revenue_pagination']['offset'], 4)
+
+        beyond = analytics_engine.get_financial_analytics(top_n=5, doctors_offset=10000)
+        self.assertEqual(beyond['top_earning_doctors'], [])
+        self.assertEqual(beyond['doctor_revenue_pagination']['total'], first['doctor_revenue_pagination']['total'])
+
+    def test_user_analytics_matches_reference(self):
+        for start_date, end_date in self.ranges:
+            with self.subTest(start_date=start_date, end_date=end_date):
+                expected = reference_user_analytics(start_date, end_date)
+                with assert_max_queries(2):
+                    result = analytics_engine.get_user_analytics(start_date, end_date, exact=True)
+                self.assertGreater(result['total_users'], 0)
+                self.assertEqual(result, expected)
+
+                # المسار التقديري من رسوم HyperLogLog اليومية: آخر 30 يوماً كاملة بما فيها اليوم
+                with assert_max_queries(2):
+                    approximate = analytics_engine.get_user_analytics(start_date, end_date)
+                today = date.today()
+                for key, metric in (('active_patients_30d', 'active_patients'), ('active_doctors_30d', 'active_doctors')):
+                    exact = activity_sketches.unique(metric, today - timedelta(days=29), today, exact=True)
+                    self.assertAlmostEqual(approximate.pop(key), exact, delta=exact * 0.02 + 1)
+                    expected.pop(key)
+                self.assertEqual(approximate, expected)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,188 @@
+import unittest
+import sys
+import os
+from unittest import mock
+from sqlalchemy.exc import OperationalError
+from datetime import datetime, timedelta
+
+# إضافة جذر المشروع إلى sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from benchmarks.harness import create_app, seed_platform
+from perf_assertions import assert_max_queries
+from src.models.user import db, Consultation, Payment, ConsultationDailyRollup
+from src.routes.analytics_rollups import rollup_manager, split_range
+
+def rollup_snapshot(model):
+    """محتوى جدول التجميع كمجموعة صفوف قابلة للمقارنة (بدون المعرف)"""
+    columns = [c.name for c in model.__table__.columns if c.name != 'id']
+    rows = set()
+    for item in model.query.all():
+        rows.add(tuple(round(v, 6) if isinstance(v, float) else v for v in (getattr(item, c) for c in columns)))
+    return rows
+
+class SplitRangeTestCase(unittest.TestCase):
+    """تقسيم الفترات إلى أيام كاملة وأطراف جزئية"""
+
+    def test_partial_edges(self):
+        full_days, edges = split_range(datetime(2024, 1, 1, 10), datetime(2024, 1, 5, 8))
+        self.assertEqual(full_days, (datetime(2024, 1, 2).date(), datetime(2024, 1, 5).date()))
+        self.assertEqual(edges, [
+            (datetime(2024, 1, 1, 10), datetime(2024, 1, 2), False),
+            (datetime(2024, 1, 5), datetime(2024, 1, 5, 8), True)
+        ])
+
+    def test_exclusive_midnight_end_has_no_edge(self):
+        full_days, edges = split_range(datetime(2024, 1, 1), datetime(2024, 1, 3), inclusive_end=False)
+        self.assertEqual(full_days, (datetime(2024, 1, 1).date(), datetime(2024, 1, 3).date()))
+        self.assertEqual(edges, [])
+
+    def test_same_day_range_reads_raw_rows(self):
+        full_days, edges = split_range(datetime(2024, 1, 1, 8), datetime(2024, 1, 1, 20))
+        self.assertIsNone(full_days)
+        self.assertEqual(edges, [(datetime(2024, 1, 1, 8), datetime(2024, 1, 1, 20), True)])
+
+    def test_open_ranges(self):
+        self.assertEqual(split_range(), ((None, None), []))
+        full_days, edges = split_range(start=datetime(2024, 1, 1, 12))
+        self.assertEqual(full_days, (datetime(2024, 1, 2).date(), None))
+        self.assertEqual(len(edges), 1)
+
+class RollupMaintenanceTestCase(unittest.TestCase):
+    """صيانة جداول التجميع اليومية وتطابقها مع إعادة البناء الكاملة"""
+
+    def setUp(self):
+        self.app = create_app()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        self.fixture = seed_platform(doctors=6, patients=30, reviews_per_doctor=1,
+                                     consultations_per_doctor=8, appointments_per_doctor=1)
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def assertMatchesRebuild(self):
+        incremental = {m: rollup_snapshot(m) for m in (ConsultationDailyRollup,)}
+        rollup_manager.rebuild()
+        self.assertEqual(incremental, {m: rollup_snapshot(m) for m in (ConsultationDailyRollup,)})
+
+    def day_total(self, day, status=None):
+        query = db.session.query(db.func.sum(ConsultationDailyRollup.total)).filter(ConsultationDailyRollup.day == day)
+        if status:
+            query = query.filter(ConsultationDailyRollup.status == status)
+        return query.scalar() or 0
+
+    def test_orm_writes_update_rollups(self):
+        """الإضافة والتعديل والحذف عبر ORM تحدث الأيام المتأثرة مباشرة"""
+        request_date = self.fixture['now'] - timedelta(days=3)
+        day = request_date.date()
+        before = self.day_total(day)
+
+        consultation = Consultation(
+            user_id=self.fixture['patient_ids'][0], doctor_id=self.fixture['doctor_user_ids'][0],
+            status='pending', consultation_type='video', request_date=request_date, consultation_fee=120
+        )
+        db.session.add(consultation)
+        db.session.commit()
+        self.assertEqual(self.day_total(day), before + 1)
+
+        completed_before = self.day_total(day, 'completed')
+        consultation.status = 'completed'
+        consultation.completed_at = request_date + timedelta(hours=2)
+        db.session.commit()
+        self.assertEqual(self.day_total(day, 'completed'), completed_before + 1)
+        self.assertMatchesRebuild()
+
+        # نقل الاستشارة إلى يوم آخر يحدث اليومين
+        new_day = (request_date - timedelta(days=10)).date()
+        new_day_before = self.day_total(new_day)
+        consultation.request_date = request_date - timedelta(days=10)
+        db.session.commit()
+        self.assertEqual(self.day_total(day), before)
+        self.assertEqual(self.day_total(new_day), new_day_before + 1)
+
+        db.session.delete(consultation)
+        db.session.commit()
+        self.assertEqual(self.day_total(new_day), new_day_before)
+        self.assertMatchesRebuild()
+
+    def test_catch_up_picks_up_bulk_inserts(self):
+        """الإدخال المجمع يلتقط عبر آخر معرف معالج"""
+        payment_day = (self.fixture['now'] - timedelta(days=2)).replace(hour=9)
+        revenue_before = rollup_manager.total('payment', 'amount')
+        last_id = db.session.query(db.func.max(Payment.id)).scalar()
+        db.session.bulk_insert_mappings(Payment, [{
+            'id': last_id + 1, 'payment_id': 'BULK-1', 'user_id': self.fixture['patient_ids'][0],
+            'amount': 75.0, 'payment_type': 'tests', 'payment_method': 'credit_card',
+            'status': 'completed', 'created_at': payment_day, 'completed_at': payment_day
+        }])
+        db.session.commit()
+        self.assertEqual(rollup_manager.total('payment', 'amount'), revenue_before)
+
+        processed = rollup_manager.catch_up()
+        self.assertEqual(processed['payment'], 1)
+        self.assertAlmostEqual(rollup_manager.total('payment', 'amount'), revenue_before + 75.0)
+        self.assertEqual(rollup_manager.catch_up()['payment'], 0)
+
+    def test_read_path_catch_up_leaves_request_session_alone(self):
+        """التحديث عند القراءة في معاملة مستقلة: لا يثبت تغييرات الطلب المعلقة وفشله لا يفسد الجلسة"""
+        before = Consultation.query.count()
+        db.session.add(Consultation(user_id=self.fixture['patient_ids'][0], status='pending',
+                                    request_date=self.fixture['now']))
+        rollup_manager._checked.clear()
+        rollup_manager.ensure_fresh()
+        db.session.rollback()
+        self.assertEqual(Consultation.query.count(), before)
+
+        last_id = db.session.query(db.func.max(Payment.id)).scalar()
+        db.session.bulk_insert_mappings(Payment, [{
+            'id': last_id + 1, 'payment_id': 'BULK-2', 'user_id': self.fixture['patient_ids'][0],
+            'amount': 10.0, 'payment_type': 'tests', 'status': 'completed', 'completed_at': self.fixture['now']
+        }])
+        db.session.commit()
+        rollup_manager._checked.clear()
+        with mock.patch.object(rollup_manager, 'recompute_days', side_effect=OperationalError('', {}, 'locked')):
+            rollup_manager.ensure_fresh()
+        # الجلسة صالحة والمعرف المعالج لم يتقدم فيعاد المحاولة في القراءة التالية
+        self.assertEqual(Consultation.query.count(), before)
+        self.assertEqual(rollup_manager.catch_up()['payment'], 1)
+
+    def test_range_cost_independent_of_length(self):
+        """فترة سنتين تكلف نفس عدد الاستعلامات لفترة يومين"""
+        now = self.fixture['now']
+        for days in (2, 730):
+            with self.subTest(days=days):
+                with assert_max_queries(1):
+                    rows = rollup_manager.aggregate('consultation', now - timedelta(days=days), now,
+                                                    dimensions=['status'], period='%Y-%m')
+                expected = Consultation.query.filter(
+                    Consultation.request_date >= now - timedelta(days=days), Consultation.request_date <= now
+                ).count()
+                self.assertEqual(sum(row.total for row in rows), expected)
+
+    def test_kpi_and_trends_endpoints(self):
+        """نقطتا المؤشرات والاتجاهات تقرآن من التجميعات بنفس النتائج"""
+        client = self.app.test_client()
+        kpi = client.get('/api/analytics/kpi?current_period=30').get_json()
+        current_start = datetime.now() - timedelta(days=30)
+        self.assertEqual(kpi['consultations']['current'],
+                         Consultation.query.filter(Consultation.request_date >= current_start).count())
+
+        trends = client.get('/api/analytics/trends?months_back=6').get_json()
+        start_date = datetime.now() - timedelta(days=180)
+        expected = {}
+        for consultation in Consultation.query.filter(Consultation.request_date >= start_date):
+            period = consultation.request_date.strftime('%Y-%m')
+            expected[period] = expected.get(period, 0) + 1
+        trend = {item['period']: item['value'] for item in trends['consultation_trend']}
+        self.assertEqual({period: value for period, value in trend.items() if value}, expected)
+        # كل الأشهر من بداية الفترة حتى نهايتها حاضرة ومرتبة حتى الفارغة منها
+        periods = [item['period'] for item in trends['consultation_trend']]
+        self.assertEqual(periods[0], start_date.strftime('%Y-%m'))
+        self.assertEqual(periods[-1], datetime.now().strftime('%Y-%m'))
+        self.assertEqual(periods, sorted(set(periods)))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,84 @@
+import unittest
+import sys
+import os
+
+# إضافة جذر المشروع إلى sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from benchmarks.harness import create_app, seed_platform
+from src.models.user import db, DoctorProfile
+from src.routes.arabic_text import normalize, stem, tokenize, index_text, matches
+
+class ArabicTextTestCase(unittest.TestCase):
+    """توحيد النص العربي وتقطيعه والتجذيع الخفيف"""
+
+    def test_normalize_variants(self):
+        self.assertEqual(normalize('أحمد إبراهيم آمنة'), 'احمد ابراهيم امنه')
+        self.assertEqual(normalize('مُسْتَشْفَى'), 'مستشفي')
+        self.assertEqual(normalize('الأطـــفال'), 'الاطفال')
+        self.assertEqual(normalize('عيادة ١٢ Clinic'), 'عياده 12 clinic')
+        self.assertEqual(normalize(None), '')
+
+    def test_stem_and_tokenize(self):
+        self.assertEqual(stem('القلب'), 'قلب')
+        self.assertEqual(stem('والقلب'), 'قلب')
+        self.assertEqual(stem('للأطفال'.translate({ord('أ'): 'ا'})), 'اطفال')
+        self.assertEqual(stem('قلبي'), 'قلب')
+        self.assertEqual(stem('عيادات'), 'عياد')
+        # الكلمات القصيرة لا تجذع إلى أقل من حرفين
+        self.assertEqual(stem('ال'), 'ال')
+        self.assertEqual(stem('ولد'), 'ولد')
+        self.assertEqual(tokenize('طبُّ_الأطفال، العيادة!'), ['طب', 'الاطفال', 'العياده'])
+        self.assertEqual(tokenize('طب الأطفال', stemming=True), ['طب', 'اطفال'])
+        self.assertEqual(index_text('أمراض القلب'), 'امراض القلب قلب')
+        self.assertEqual(index_text('الأسنان'), 'الاسنان اسنان اسن')
+
+    def test_matches(self):
+        self.assertTrue(matches('الم', 'ألم في الصدر'))
+        self.assertTrue(matches('صدري', 'ألم في الصدر'))
+        self.assertFalse(matches('بطن', 'ألم في الصدر'))
+
+class NormalizedSearchTestCase(unittest.TestCase):
+    """البحث يطابق أشكال الكتابة المختلفة لنفس الكلمة"""
+
+    def setUp(self):
+        self.app = create_app()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        seed_platform(doctors=12, patients=20, reviews_per_doctor=1,
+                      consultations_per_doctor=1, appointments_per_doctor=1)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def test_variants_find_same_doctors(self):
+        doctor = db.session.get(DoctorProfile, 1)
+        doctor.bio = 'أخصائيّة أمراض الغُدّة الدَّرَقيّة'
+        db.session.commit()
+
+        for query in ('اخصائيه الغده', 'أخصائية الغدة', 'الدرقيه', 'درقية', 'غدة', 'الدرقيات'):
+            with self.subTest(query=query):
+                response = self.client.post('/api/search/search', json={'query': query, 'type': 'doctors'})
+                ids = [item['id'] for item in response.get_json()['data']['doctors']['items']]
+                self.assertEqual(ids, [1])
+
+        response = self.client.post('/api/search/search', json={'query': 'الدرقيات', 'type': 'doctors', 'stemming': False})
+        self.assertEqual(response.get_json()['data']['doctors']['total'], 0)
+
+        response = self.client.get('/api/doctors/search?search_term=الاطفال')
+        self.assertGreater(response.get_json()['pagination']['total'], 0)
+
+    def test_suggestions_normalized(self):
+        response = self.client.get('/api/search/suggestions?q=حمي')
+        symptoms = [s['text'] for s in response.get_json()['data'] if s['type'] == 'symptom']
+        self.assertEqual(symptoms, ['حمى'])
+
+        response = self.client.get('/api/search/suggestions?q=الأطفال')
+        specializations = [s['text'] for s in response.get_json()['data'] if s['type'] == 'specialization']
+        self.assertEqual(specializations, ['طب الأطفال'])
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,60 @@
+import unittest
+import sys
+import os
+import tempfile
+
+# إضافة جذر المشروع إلى sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.runner import compare_results, run
+
+def make_result(p50=10.0, p95=12.0, mad=0.5, queries=5, peak=100.0):
+    return {
+        'iterations': 10,
+        'latency_ms': {'p50': p50, 'p95': p95, 'p99': p95, 'mean': p50, 'mad': mad},
+        'queries_per_request': queries,
+        'peak_memory_kb': peak
+    }
+
+class CompareResultsTestCase(unittest.TestCase):
+    """اختبارات مقارنة النتائج بخط الأساس"""
+
+    def test_within_noise_passes(self):
+        """الفروقات الصغيرة ضمن هامش الضوضاء لا تعتبر تراجعاً"""
+        checks = compare_results(make_result(), make_result(p50=11.5, p95=13.0, peak=110.0))
+        self.assertTrue(all(c['passed'] for c in checks))
+
+    def test_latency_regression_fails(self):
+        """تضاعف التأخير يفشل الفحص"""
+        checks = compare_results(make_result(), make_result(p50=25.0, p95=30.0))
+        failed = {c['metric'] for c in checks if not c['passed']}
+        self.assertEqual(failed, {'latency_ms.p50', 'latency_ms.p95'})
+
+    def test_noisy_baseline_widens_limit(self):
+        """خط الأساس المتذبذب يسمح بهامش أكبر"""
+        checks = compare_results(make_result(mad=5.0), make_result(p50=25.0, p95=27.0))
+        self.assertTrue(all(c['passed'] for c in checks if c['metric'].startswith('latency')))
+
+    def test_extra_query_fails(self):
+        """أي استعلام إضافي يعتبر تراجعاً"""
+        checks = compare_results(make_result(queries=5), make_result(queries=6))
+        failed = [c['metric'] for c in checks if not c['passed']]
+        self.assertEqual(failed, ['queries_per_request'])
+
+class RunnerTestCase(unittest.TestCase):
+    """اختبار تشغيل مجموعة فرعية من السيناريوهات على SQLite في الذاكرة"""
+
+    def test_update_then_compare(self):
+        with tempfile.TemporaryDirectory() as baselines_dir:
+            report = run(patterns=['availability.engine_day'], iterations=3, warmup=1,
+                         update_baseline=True, baselines_dir=baselines_dir)
+            self.assertEqual(report['scenarios'][0]['status'], 'BASELINE_UPDATED')
+
+            report = run(patterns=['availability.engine_day'], iterations=3, warmup=1,
+                         baselines_dir=baselines_dir,
+                         thresholds={'latency_relative': 10.0, 'memory_relative': 10.0})
+            self.assertEqual(report['scenarios'][0]['status'], 'PASS')
+            self.assertTrue(report['passed'])
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
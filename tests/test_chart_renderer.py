@@ -0,0 +1,121 @@
+import unittest
+import sys
+import os
+import base64
+import threading
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+
+# إضافة جذر المشروع إلى sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.harness import create_app
+from src.routes.chart_renderer import ChartRenderer, ChartRendererBusy, chart_cache_key, normalize_chart_request
+from src.routes.performance_cache import invalidate_cache
+
+SAMPLE = {'يناير': 12, 'فبراير': 30, 'مارس': 7}
+
+class ChartRendererTestCase(unittest.TestCase):
+    """الرسم في الذاكرة مع التخزين المؤقت حسب بصمة المحتوى"""
+
+    def setUp(self):
+        invalidate_cache('chart:*')
+        self.renderer = ChartRenderer(max_workers=0)
+
+    def test_png_and_svg_in_memory(self):
+        before = set(os.listdir('/tmp'))
+        png = self.renderer.render('bar', SAMPLE, 'استشارات')
+        svg = self.renderer.render('line', SAMPLE, 'استشارات', image_format='svg')
+        self.assertTrue(png['content'].startswith(b'\x89PNG'))
+        self.assertEqual(png['content_type'], 'image/png')
+        self.assertIn(b'<svg', svg['content'])
+        self.assertEqual(svg['content_type'], 'image/svg+xml')
+        self.assertEqual(set(os.listdir('/tmp')) - before, set())
+
+    def test_dpi_changes_resolution(self):
+        low = self.renderer.render('pie', SAMPLE, 'توزيع', size=(4, 3), dpi=50)
+        high = self.renderer.render('pie', SAMPLE, 'توزيع', size=(4, 3), dpi=200)
+        self.assertGreater(len(high['content']), len(low['content']))
+
+    def test_identical_request_hits_cache(self):
+        first = self.renderer.render('bar', SAMPLE, 'استشارات')
+        second = self.renderer.render('bar', dict(SAMPLE), 'استشارات')
+        self.assertFalse(first['cached'])
+        self.assertTrue(second['cached'])
+        self.assertEqual(first['content'], second['content'])
+
+    def test_cache_key_covers_content(self):
+        base = chart_cache_key(normalize_chart_request('bar', SAMPLE, 'أ'))
+        self.assertNotEqual(base, chart_cache_key(normalize_chart_request('bar', SAMPLE, 'ب')))
+        self.assertNotEqual(base, chart_cache_key(normalize_chart_request('bar', SAMPLE, 'أ', size=(8, 6))))
+        self.assertNotEqual(base, chart_cache_key(normalize_chart_request('bar', {'يناير': 13}, 'أ')))
+
+    def test_invalid_requests(self):
+        for kwargs in [
+            {'chart_type': 'radar'},
+            {'data': {}},
+            {'data': {'أ': 'كثير'}},
+            {'image_format': 'gif'},
+            {'dpi': 1000},
+            {'size': (100, 3)}
+        ]:
+            with self.subTest(**kwargs):
+                params = {'chart_type': 'bar', 'data': SAMPLE, 'title': 'ت', **kwargs}
+                with self.assertRaises(ValueError):
+                    self.renderer.render(**params)
+
+    def test_process_pool(self):
+        renderer = ChartRenderer(max_workers=1)
+        try:
+            chart = renderer.render('bar', {'أ': 1, 'ب': 2}, 'مجمع العمليات', size=(3, 2), dpi=50)
+            self.assertTrue(chart['content'].startswith(b'\x89PNG'))
+        finally:
+            renderer.shutdown()
+
+    def test_timed_out_render_keeps_its_slot(self):
+        """انتهاء مهلة الانتظار لا يحرر المقعد ما دام الرسم جارياً فيبقى max_pending حداً فعلياً"""
+        renderer = ChartRenderer(max_workers=1, max_pending=1, timeout=0.2)
+        renderer._executor = ThreadPoolExecutor(max_workers=1)
+        finished = threading.Event()
+        slow = lambda **chart: finished.wait(5) and b'png'
+        try:
+            with mock.patch('src.routes.chart_renderer.render_chart', side_effect=slow):
+                with self.assertRaises(TimeoutError):
+                    renderer.render('bar', {'أ': 1}, 'بطيء')
+                with self.assertRaises(ChartRendererBusy):
+                    renderer.render('bar', {'ب': 2}, 'ينتظر')
+                finished.set()
+            self.assertTrue(renderer._slots.acquire(timeout=2))
+            renderer._slots.release()
+        finally:
+            finished.set()
+            renderer.shutdown()
+
+class ChartEndpointTestCase(unittest.TestCase):
+    """نقطة /api/analytics/charts/generate"""
+
+    def setUp(self):
+        invalidate_cache('chart:*')
+        self.client = create_app().test_client()
+
+    def test_data_uri_and_binary(self):
+        payload = {'chart_type': 'bar', 'data': SAMPLE, 'title': 'ت', 'format': 'svg',
+                   'width': 4, 'height': 3, 'dpi': 72}
+        response = self.client.post('/api/analytics/charts/generate', json=payload)
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        prefix = 'data:image/svg+xml;base64,'
+        self.assertTrue(body['chart_data'].startswith(prefix))
+        self.assertIn(b'<svg', base64.b64decode(body['chart_data'][len(prefix):]))
+        self.assertFalse(body['cached'])
+
+        response = self.client.post('/api/analytics/charts/generate?binary=true', json=payload)
+        self.assertEqual(response.mimetype, 'image/svg+xml')
+        self.assertEqual(response.headers['X-Chart-Cache'], 'HIT')
+
+    def test_invalid_chart_type(self):
+        response = self.client.post('/api/analytics/charts/generate', json={'chart_type': 'radar', 'data': SAMPLE})
+        self.assertEqual(response.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,106 @@
+import unittest
+import sys
+import os
+from datetime import date, timedelta
+
+# إضافة جذر المشروع إلى sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import numpy as np
+from benchmarks.harness import create_app, seed_platform
+from perf_assertions import assert_max_queries
+from src.models.user import db, User, Consultation
+from src.routes.cohort_engine import cohort_engine, retention_matrix, week_of
+
+def reference_cohorts(start, end, weeks):
+    """التنفيذ المرجعي بحلقات على الصفوف: {بداية الأسبوع: (الحجم، [العائدون في كل أسبوع])}"""
+    signups = {}
+    for user in User.query.filter(User.user_type == 'patient'):
+        if start <= user.created_at.date() <= end:
+            signups[user.id] = user.created_at.date()
+    cohorts = {}
+    for user_id, signup in signups.items():
+        cohort = signup - timedelta(days=signup.weekday())
+        cohorts.setdefault(cohort, [0, [set() for _ in range(weeks + 1)]])[0] += 1
+    for consultation in Consultation.query.filter(Consultation.request_date.isnot(None)):
+        signup = signups.get(consultation.user_id)
+        if signup is None:
+            continue
+        offset = (consultation.request_date.date() - signup).days // 7
+        if 0 <= offset <= weeks:
+            cohort = signup - timedelta(days=signup.weekday())
+            cohorts[cohort][1][offset].add(consultation.user_id)
+    return {cohort.isoformat(): (size, [len(users) for users in retained]) for cohort, (size, retained) in cohorts.items()}
+
+class CohortEngineTestCase(unittest.TestCase):
+    """مصفوفات الاحتفاظ المتجهة: مطابقة الحلقات المرجعية والتخزين المؤقت"""
+
+    def setUp(self):
+        self.app = create_app()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        seed_platform(doctors=10, patients=200, reviews_per_doctor=1,
+                      consultations_per_doctor=60, appointments_per_doctor=2)
+        self.today = date.today()
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def test_matches_reference(self):
+        start, end, weeks = self.today - timedelta(days=400), self.today, 8
+        result = cohort_engine.compute(start, end, weeks=weeks, use_cache=False)
+        expected = reference_cohorts(start, end, weeks)
+        self.assertEqual({c['cohort'] for c in result['cohorts']}, set(expected))
+        self.assertEqual(result['total_users'], sum(size for size, _ in expected.values()))
+        for cohort in result['cohorts']:
+            size, retained = expected[cohort['cohort']]
+            self.assertEqual(cohort['size'], size)
+            self.assertEqual(date.fromisoformat(cohort['cohort']).weekday(), 0)
+            for actual, reference in zip(cohort['retained'], retained):
+                # الأسابيع التي لم تكتمل بعد تعاد None
+                if actual is not None:
+                    self.assertEqual(actual, reference)
+
+        # آخر دفعة لم تكتمل أسابيعها اللاحقة
+        self.assertIsNone(result['cohorts'][-1]['retained'][-1])
+
+    def test_chunking_does_not_change_result(self):
+        rng = np.random.default_rng(7)
+        user_ids = np.arange(1, 5001, 2)
+        signup_days = rng.integers(19000, 19100, len(user_ids))
+        event_users = rng.choice(np.arange(1, 5001), 50000)
+        event_days = rng.integers(19000, 19200, len(event_users))
+        first_week, last_week = int(week_of(19000)), int(week_of(19099))
+
+        whole = retention_matrix(user_ids, signup_days, [(event_users, event_days)], 10, first_week, last_week)
+        chunks = [(event_users[i:i + 7000], event_days[i:i + 7000]) for i in range(0, len(event_users), 7000)]
+        chunked = retention_matrix(user_ids, signup_days, iter(chunks), 10, first_week, last_week)
+        np.testing.assert_array_equal(whole[0], chunked[0])
+        np.testing.assert_array_equal(whole[1], chunked[1])
+        self.assertEqual(whole[0].sum(), len(user_ids))
+        self.assertTrue((whole[1] <= whole[0][:, None]).all())
+
+        # معرفات متباعدة تستخدم searchsorted بدل جدول البحث ويجب أن تعطي نفس النتيجة
+        scale = 1000
+        sparse = retention_matrix(user_ids * scale, signup_days, [(event_users * scale, event_days)], 10,
+                                  first_week, last_week)
+        np.testing.assert_array_equal(sparse[1], whole[1])
+
+    def test_cached_and_endpoint(self):
+        first = cohort_engine.compute(weeks=4)
+        with assert_max_queries(0):
+            self.assertEqual(cohort_engine.compute(weeks=4), first)
+
+        client = self.app.test_client()
+        response = client.get('/api/analytics/cohorts?weeks=6&activity=appointments')
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual(len(body['average_retention']), 7)
+        for query in ('weeks=0', 'weeks=53', 'activity=unknown', 'start_date=2025-02-01&end_date=2025-01-01'):
+            with self.subTest(query=query):
+                self.assertEqual(client.get(f'/api/analytics/cohorts?{query}').status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,178 @@
+import unittest
+import sys
+import os
+import io
+import json
+import shutil
+import tempfile
+from datetime import datetime, date, timedelta
+
+# إضافة جذر المشروع إلى sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import numpy as np
+from benchmarks.harness import create_app, seed_platform
+from perf_assertions import assert_max_queries
+from src.models.user import db, Consultation, Payment
+from src.routes.columnar_snapshots import snapshot_store, SnapshotStore, SnapshotTable, SnapshotColumn
+from src.routes.cohort_engine import cohort_engine
+from src.routes.analytics_reports import analytics_engine
+from src.routes.snapshot_analytics import snapshot_analytics
+
+class ColumnarSnapshotTestCase(unittest.TestCase):
+    """اللقطات العمودية: مطابقة الجداول، والإلحاق بالمعرف، والقراءة دون قاعدة البيانات"""
+
+    def setUp(self):
+        self.app = create_app()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        self.fixture = seed_platform(doctors=8, patients=80, reviews_per_doctor=3,
+                                     consultations_per_doctor=20, appointments_per_doctor=3)
+        self.directory = tempfile.mkdtemp()
+        self.previous_path = snapshot_store.path
+        snapshot_store.path = self.directory
+
+    def tearDown(self):
+        snapshot_store.path = self.previous_path
+        shutil.rmtree(self.directory, ignore_errors=True)
+        db.session.remove()
+        self.ctx.pop()
+
+    def test_export_matches_database(self):
+        appended = snapshot_store.refresh()
+        self.assertEqual(appended['consultation'], Consultation.query.count())
+
+        snapshot = snapshot_store.open('consultation')
+        consultations = Consultation.query.order_by(Consultation.id).all()
+        self.assertIsInstance(snapshot.column('id').base, np.memmap)
+        np.testing.assert_array_equal(snapshot.column('id'), [c.id for c in consultations])
+        np.testing.assert_allclose(snapshot.column('consultation_fee'), [c.consultation_fee for c in consultations])
+        self.assertEqual(list(snapshot.decode('status', snapshot.column('status'))), [c.status for c in consultations])
+        self.assertEqual(snapshot.datetimes('request_date').astype('datetime64[s]').tolist(),
+                         [c.request_date.replace(microsecond=0) for c in consultations])
+        self.assertEqual(int(snapshot.equals('status', 'completed').sum()),
+                         sum(1 for c in consultations if c.status == 'completed'))
+
+        # الملفات npy قياسية تقرأ بـ np.load مباشرة
+        fees = np.load(os.path.join(self.directory, 'consultation', 'consultation_fee.npy'))
+        self.assertEqual(len(fees), len(consultations))
+
+        reviews = snapshot_store.open('doctor_review')
+        self.assertEqual(set(np.unique(reviews.column('is_approved')).tolist()) - {0, 1}, set())
+
+    def test_incremental_append(self):
+        snapshot_store.refresh(['payment'])
+        before = snapshot_store.open('payment')
+        old_codes = np.array(before.column('payment_method'))
+        old_dictionary = list(before.dictionaries['payment_method'])
+
+        db.session.bulk_insert_mappings(Payment, [
+            {'payment_id': f'new-{i}', 'user_id': self.fixture['patient_ids'][0], 'amount': 10.0 + i,
+             'payment_type': 'consultation', 'payment_method': 'crypto_wallet', 'status': 'completed',
+             'completed_at': datetime.now()}
+            for i in range(5)
+        ])
+        db.session.commit()
+
+        self.assertEqual(snapshot_store.refresh(['payment']), {'payment': 5})
+        self.assertEqual(snapshot_store.refresh(['payment']), {'payment': 0})
+        after = snapshot_store.open('payment')
+        self.assertEqual(len(after), len(before) + 5)
+        self.assertEqual(after.dictionaries['payment_method'][:len(old_dictionary)], old_dictionary)
+        np.testing.assert_array_equal(after.column('payment_method')[:len(before)], old_codes)
+        self.assertEqual(list(after.decode('payment_method', after.column('payment_method')[-5:])), ['crypto_wallet'] * 5)
+        self.assertEqual(after.last_id, db.session.query(db.func.max(Payment.id)).scalar())
+
+    def test_interrupted_append_is_discarded(self):
+        snapshot_store.refresh(['consultation'])
+        path = os.path.join(self.directory, 'consultation', 'consultation_fee.npy')
+        with open(path, 'ab') as f:
+            f.write(np.ones(7).tobytes())
+        # القارئ لا يرى الصفوف غير المثبتة في البيان
+        self.assertEqual(len(snapshot_store.open('consultation').column('consultation_fee')), Consultation.query.count())
+
+        db.session.add(Consultation(user_id=self.fixture['patient_ids'][0], status='pending',
+                                    consultation_fee=123.0, request_date=datetime.now()))
+        db.session.commit()
+        snapshot_store.refresh(['consultation'])
+        fees = np.load(path)
+        self.assertEqual(len(fees), Consultation.query.count())
+        self.assertEqual(fees[-1], 123.0)
+
+    def test_schema_change_triggers_full_export(self):
+        store = SnapshotStore(self.directory)
+        table = store.register(SnapshotTable('payment', Payment, [SnapshotColumn('amount', 'float')]))
+        store.refresh()
+        table.columns.append(SnapshotColumn('status', 'category'))
+        self.assertEqual(store.refresh(), {'payment': Payment.query.count()})
+        self.assertIn('status', store.open('payment').dictionaries)
+        with self.assertRaises(ValueError):
+            SnapshotColumn('x', 'text')
+        with self.assertRaises(ValueError):
+            SnapshotStore(os.path.join(self.directory, 'missing')).open('payment')
+
+    def test_cohorts_from_snapshot_without_database(self):
+        snapshot_store.refresh()
+        start = date.today() - timedelta(days=300)
+        expected = cohort_engine.compute(start, weeks=6, use_cache=False)
+        with assert_max_queries(0):
+            result = cohort_engine.compute(start, weeks=6, use_cache=False, source='snapshot')
+        self.assertEqual(result.pop('source'), 'snapshot')
+        expected.pop('source')
+        self.assertEqual(result, expected)
+
+    def test_report_analytics_from_snapshot_match_database(self):
+        snapshot_store.refresh()
+        now = self.fixture['now']
+        doctor = lambda row: {**row, 'doctor': row['doctor']['id']}
+        for start_date, end_date in [(None, None), (now - timedelta(days=30), None),
+                                     (now - timedelta(days=90), now - timedelta(days=20))]:
+            with self.subTest(start_date=start_date, end_date=end_date):
+                self.assertEqual(snapshot_analytics.consultation_analytics(start_date, end_date),
+                                 analytics_engine.get_consultation_analytics(start_date, end_date))
+                self.assertEqual(snapshot_analytics.user_analytics(start_date, end_date),
+                                 analytics_engine.get_user_analytics(start_date, end_date, exact=True))
+
+                expected = analytics_engine.get_financial_analytics(start_date, end_date)
+                result = snapshot_analytics.financial_analytics(start_date, end_date)
+                self.assertEqual([doctor(row) for row in result.pop('top_earning_doctors')],
+                                 [doctor(row) for row in expected.pop('top_earning_doctors')])
+                self.assertEqual(result, expected)
+
+                for sort_by in (None, 'revenue', 'avg_rating', 'completion_rate'):
+                    expected = analytics_engine.get_doctor_performance_analytics(None, start_date, end_date, sort_by)
+                    result = analytics_engine.get_doctor_performance_analytics(None, start_date, end_date, sort_by,
+                                                                               source='snapshot')
+                    self.assertEqual([doctor(row) for row in result], [doctor(row) for row in expected])
+                    self.assertEqual({key: result[0]['doctor'][key] for key in ('full_name', 'specialization')},
+                                     {key: expected[0]['doctor'][key] for key in ('full_name', 'specialization')})
+
+    def test_report_from_snapshot_without_database(self):
+        snapshot_store.refresh()
+        target = io.BytesIO()
+        with assert_max_queries(0):
+            analytics_engine.build_report(target, format_type='json', source='snapshot')
+            analytics_engine.build_report(io.BytesIO(), format_type='excel', source='snapshot')
+        report = json.loads(target.getvalue())
+        self.assertEqual(report['report_info']['source'], 'snapshot')
+        self.assertEqual(len(report['doctor_performance']), 8)
+        self.assertNotIn('error', report['consultation_analytics'])
+
+    def test_endpoints(self):
+        client = self.app.test_client()
+        self.assertIsNone(client.get('/api/analytics/snapshots').get_json()['snapshots']['user'])
+        self.assertEqual(client.get('/api/analytics/cohorts?source=snapshot').status_code, 400)
+
+        response = client.post('/api/analytics/snapshots/refresh', json={'tables': ['user', 'consultation']})
+        self.assertEqual(response.status_code, 200)
+        status = client.get('/api/analytics/snapshots').get_json()['snapshots']
+        self.assertEqual(status['consultation']['rows'], Consultation.query.count())
+        self.assertIsNone(status['payment'])
+        self.assertEqual(client.get('/api/analytics/cohorts?source=snapshot&weeks=4').status_code, 200)
+        self.assertEqual(client.post('/api/analytics/snapshots/refresh', json={'tables': ['nope']}).status_code, 400)
+        self.assertEqual(client.get('/api/analytics/doctors/performance?source=cache').status_code, 400)
+        self.assertEqual(client.post('/api/analytics/reports/generate', json={'source': 'cache'}).status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,122 @@
+import unittest
+import sys
+import os
+
+# إضافة جذر المشروع إلى sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from sqlalchemy import text
+from benchmarks.harness import create_app, seed_platform
+from perf_assertions import assert_max_queries
+from src.models.user import db, DoctorProfile, DoctorReview
+from src.routes.doctor_aggregates import doctor_aggregates
+
+class DoctorSearchTestCase(unittest.TestCase):
+    """فلتر أقل تقييم والترتيب في /api/doctors/search داخل SQL من التجميعات المخزنة"""
+
+    def setUp(self):
+        self.app = create_app()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        seed_platform(doctors=40, patients=60, reviews_per_doctor=3,
+                      consultations_per_doctor=1, appointments_per_doctor=1)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def assert_aggregates_fresh(self):
+        doctors = DoctorProfile.query.all()
+        expected = DoctorProfile.get_statistics_for(doctor.id for doctor in doctors)
+        for doctor in doctors:
+            self.assertAlmostEqual(doctor.average_rating, expected[doctor.id]['average_rating'])
+            self.assertEqual(doctor.total_reviews, expected[doctor.id]['total_reviews'])
+
+    def search(self, **params):
+        response = self.client.get('/api/doctors/search', query_string=params)
+        return response.status_code, response.get_json()
+
+    def test_aggregates_follow_review_changes(self):
+        self.assert_aggregates_fresh()
+        doctor = db.session.get(DoctorProfile, 3)
+        before = doctor.total_reviews
+
+        review = DoctorReview(doctor_id=3, patient_id=1, rating=1, is_approved=False)
+        db.session.add(review)
+        db.session.flush()
+        # الملف المحمل في الجلسة يقرأ القيمة الجديدة ضمن نفس المعاملة
+        self.assertEqual(doctor.total_reviews, before + 1)
+        db.session.commit()
+
+        review.is_approved = True
+        db.session.commit()
+        self.assert_aggregates_fresh()
+
+        review.doctor_id = 4
+        db.session.commit()
+        self.assert_aggregates_fresh()
+        self.assertEqual(db.session.get(DoctorProfile, 3).total_reviews, before)
+
+        db.session.delete(review)
+        db.session.commit()
+        self.assert_aggregates_fresh()
+
+        # الإدخال المجمع يتجاوز الأحداث ويعاد حسابه بـ rebuild
+        db.session.execute(DoctorReview.__table__.insert(), [
+            {'doctor_id': 5, 'patient_id': 1, 'rating': 5, 'is_approved': True}
+        ])
+        db.session.commit()
+        self.assertEqual(doctor_aggregates.rebuild(), 40)
+        self.assert_aggregates_fresh()
+
+    def test_min_rating_filters_before_paging(self):
+        expected = [doctor.id for doctor in DoctorProfile.query.order_by(DoctorProfile.id)
+                    if doctor.average_rating >= 3.5]
+        ids = []
+        for page in range(1, 20):
+            with assert_max_queries(3):
+                status, body = self.search(min_rating=3.5, page=page, per_page=4)
+            self.assertEqual(status, 200)
+            self.assertEqual(body['pagination']['total'], len(expected))
+            if not body['doctors']:
+                break
+            if body['pagination']['has_next']:
+                self.assertEqual(len(body['doctors']), 4)
+            ids.extend(doctor['id'] for doctor in body['doctors'])
+            self.assertTrue(all(doctor['average_rating'] >= 3.5 for doctor in body['doctors']))
+        self.assertEqual(ids, expected)
+
+    def test_sorting(self):
+        doctors = DoctorProfile.query.all()
+        keys = {
+            'rating': lambda d: d.average_rating, 'reviews': lambda d: d.total_reviews,
+            'fee': lambda d: d.consultation_fee, 'experience': lambda d: d.years_of_experience or 0
+        }
+        for sort_by, key in keys.items():
+            for order in ('desc', 'asc'):
+                status, body = self.search(sort_by=sort_by, order=order, per_page=40)
+                self.assertEqual(status, 200)
+                expected = sorted(doctors, key=lambda d: (key(d), d.id), reverse=order == 'desc')
+                self.assertEqual([d['id'] for d in body['doctors']], [d.id for d in expected], sort_by)
+
+        status, body = self.search(sort_by='rating', min_rating=4, available_only='true', per_page=5)
+        ratings = [doctor['average_rating'] for doctor in body['doctors']]
+        self.assertEqual(ratings, sorted(ratings, reverse=True))
+        self.assertEqual(self.search(sort_by='name')[0], 400)
+
+    def test_sorted_pages_use_index(self):
+        for sort_by, index in (('rating', 'ix_doctor_profile_rating'), ('fee', 'ix_doctor_profile_fee'),
+                               ('experience', 'ix_doctor_profile_experience'),
+                               ('reviews', 'ix_doctor_profile_reviews')):
+            column = {'rating': 'average_rating', 'fee': 'consultation_fee',
+                      'experience': 'years_of_experience', 'reviews': 'total_reviews'}[sort_by]
+            plan = ' '.join(row[-1] for row in db.session.execute(text(
+                f'EXPLAIN QUERY PLAN SELECT * FROM doctor_profile ORDER BY {column} DESC, id DESC LIMIT 10'
+            )))
+            self.assertIn(index, plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,192 @@
+import unittest
+import sys
+import os
+import random
+
+# إضافة جذر المشروع إلى sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from benchmarks.harness import create_app
+from perf_assertions import assert_max_queries
+from src.models.user import db, User, Pharmacy, FieldTeamMember, PharmacyNotification
+from src.routes.geo_index import GridIndex, haversine_km, location_index
+
+SANAA = (15.3694, 44.1910)
+
+class GridIndexTestCase(unittest.TestCase):
+    """أقرب k والبحث في نصف قطر مطابقان للمرور على كل النقاط"""
+
+    def setUp(self):
+        rng = random.Random(3)
+        self.points = {}
+        for item_id in range(1, 3001):
+            if item_id % 3 == 0:
+                point = (rng.gauss(SANAA[0], 0.05), rng.gauss(SANAA[1], 0.05))
+            elif item_id % 3 == 1:
+                point = (rng.uniform(12.5, 19), rng.uniform(42.5, 53))
+            else:
+                # خطوط عرض عالية حيث تضيق خلايا الطول
+                point = (rng.uniform(60, 70), rng.uniform(10, 30))
+            self.points[item_id] = point
+        self.index = GridIndex()
+        for item_id, point in self.points.items():
+            self.index.add(item_id, *point)
+        self.queries = [SANAA, (16.0, 47.0), (65.0, 20.0), (69.9, 29.5), (15.3, 44.25), (0.0, 0.0)]
+
+    def brute_force(self, latitude, longitude, accept=lambda item_id: True):
+        return sorted(
+            (haversine_km(latitude, longitude, *point), item_id)
+            for item_id, point in self.points.items() if accept(item_id)
+        )
+
+    def test_nearest_matches_brute_force(self):
+        for latitude, longitude in self.queries:
+            expected = self.brute_force(latitude, longitude)
+            found = self.index.nearest(latitude, longitude, 7)
+            self.assertEqual([item_id for item_id, _ in found], [item_id for _, item_id in expected[:7]])
+            for (item_id, km), (expected_km, _) in zip(found, expected):
+                self.assertAlmostEqual(km, expected_km, places=6)
+
+            even = self.brute_force(latitude, longitude, lambda item_id: item_id % 2 == 0)
+            found = self.index.nearest(latitude, longitude, 3, accept=lambda item_id: item_id % 2 == 0)
+            self.assertEqual([item_id for item_id, _ in found], [item_id for _, item_id in even[:3]])
+
+            limited = self.index.nearest(latitude, longitude, 50, max_km=20)
+            self.assertEqual([item_id for item_id, _ in limited],
+                             [item_id for km, item_id in expected[:50] if km <= 20])
+
+    def test_within_matches_brute_force(self):
+        for latitude, longitude in self.queries:
+            for radius_km in (2, 25, 150):
+                expected = [item_id for km, item_id in self.brute_force(latitude, longitude) if km <= radius_km]
+                self.assertEqual([item_id for item_id, _ in self.index.within(latitude, longitude, radius_km)],
+                                 expected)
+                self.assertEqual([item_id for item_id, _ in self.index.within(latitude, longitude, radius_km, 4)],
+                                 expected[:4])
+
+    def test_move_and_remove(self):
+        self.index.add(10, SANAA[0] + 0.0001, SANAA[1])
+        self.assertEqual(self.index.nearest(*SANAA, 1)[0][0], 10)
+        self.assertEqual(len(self.index), 3000)
+        self.assertTrue(self.index.remove(10))
+        self.assertFalse(self.index.remove(10))
+        self.assertNotIn(10, self.index)
+        self.assertNotEqual(self.index.nearest(*SANAA, 1)[0][0], 10)
+        self.assertEqual(GridIndex().nearest(*SANAA), [])
+
+class NearbyEndpointsTestCase(unittest.TestCase):
+    """الصيدليات القريبة وتعيين أقرب عضو فريق ميداني من الفهرس المكاني"""
+
+    def setUp(self):
+        self.app = create_app()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        # صيدليات على خط عرض صنعاء شرقاً بمسافات متزايدة (~1.07 كم لكل 0.01 درجة)
+        for index, offset in enumerate([0.01, 0.02, 0.03, 0.05, 0.5], start=1):
+            db.session.add(Pharmacy(id=index, name=f'صيدلية {index}', phone=f'+96700000{index}',
+                                    latitude=SANAA[0], longitude=SANAA[1] + offset))
+        db.session.add(Pharmacy(id=6, name='صيدلية مغلقة', latitude=SANAA[0], longitude=SANAA[1],
+                                is_active=False))
+        for index, offset in enumerate([0.02, 0.04, 0.3], start=1):
+            db.session.add(User(id=100 + index, username=f'field{index}', email=f'field{index}@example.com',
+                                password_hash='x', user_type='field_team'))
+            db.session.add(FieldTeamMember(id=index, user_id=100 + index, name=f'فريق {index}',
+                                           latitude=SANAA[0] + offset, longitude=SANAA[1]))
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def notify(self, **payload):
+        response = self.client.post('/pharmacy/notify_nearby', json={
+            'consultation_id': 1, 'prescription_details': 'باراسيتامول 500',
+            'user_location': {'latitude': SANAA[0], 'longitude': SANAA[1]}, **payload
+        })
+        return response.status_code, response.get_json()
+
+    def test_notify_nearest_active_pharmacies(self):
+        location_index.warm()
+        # البحث من الذاكرة: استعلام بيانات الصيدليات ثم إدخال الإشعارات فقط
+        with assert_max_queries(4):
+            status, body = self.notify()
+        self.assertEqual(status, 200)
+        self.assertEqual([item['pharmacy_id'] for item in body['notifications']], [1, 2, 3])
+        self.assertAlmostEqual(body['notifications'][0]['distance_km'], 1.07, places=2)
+        self.assertEqual(PharmacyNotification.query.count(), 3)
+
+        status, body = self.notify(radius_km=4, limit=10)
+        self.assertEqual([item['pharmacy_id'] for item in body['notifications']], [1, 2, 3])
+
+        # التغييرات المثبتة تحدث الفهرس: صيدلية تفتح وأخرى تغلق
+        db.session.get(Pharmacy, 6).is_active = True
+        db.session.get(Pharmacy, 1).is_active = False
+        db.session.commit()
+        status, body = self.notify(limit=2)
+        self.assertEqual([item['pharmacy_id'] for item in body['notifications']], [6, 2])
+
+        status, body = self.notify(user_location={'lat': 13.0, 'lng': 45.0})
+        self.assertEqual(body['pharmacies_notified'], 0)
+        self.assertEqual(self.notify(user_location=None)[0], 400)
+        self.assertEqual(self.notify(user_location={'latitude': 95, 'longitude': 44})[0], 400)
+
+    def assign(self, request_id='FIELD-1-1', **payload):
+        response = self.client.post('/field_teams/assign_team', json={'request_id': request_id, **payload})
+        return response.status_code, response.get_json()
+
+    def update_status(self, request_id, status, team_member_id):
+        response = self.client.post('/field_teams/update_status', json={
+            'request_id': request_id, 'status': status, 'team_member_id': team_member_id
+        })
+        return response.status_code
+
+    def test_assign_nearest_available_member(self):
+        location = {'latitude': SANAA[0], 'longitude': SANAA[1]}
+        status, body = self.assign('FIELD-1-1', location=location)
+        self.assertEqual(status, 200, body)
+        self.assertEqual(body['assignment']['team_member_id'], 1)
+        self.assertEqual(body['assignment']['team_member_name'], 'فريق 1')
+        member = db.session.get(FieldTeamMember, 1)
+        self.assertEqual((member.is_available, member.current_request_id), (False, 'FIELD-1-1'))
+
+        # العضو المعين محجوز فيعين التالي، والبعيد خارج المسافة القصوى
+        self.assertEqual(self.assign('FIELD-2-1', location=location)[1]['assignment']['team_member_id'], 2)
+        self.assertEqual(self.assign('FIELD-3-1', location=location, max_distance_km=10)[0], 404)
+
+        # فهرس متأخر (العضو محجوز في القاعدة) لا يعين العضو مرتين
+        location_index.apply_changes(db.engine, {'field_teams': {2: (SANAA[0], SANAA[1])}})
+        status, body = self.assign('FIELD-3-1', location=location, max_distance_km=50)
+        self.assertEqual(body['assignment']['team_member_id'], 3)
+        self.assertAlmostEqual(body['assignment']['distance_km'], 33.36, places=1)
+
+        # تحديث الموقع والإتاحة يعيد العضو إلى الفهرس ويلغي تعيينه
+        response = self.client.post('/field_teams/members/1/location',
+                                    json={'latitude': SANAA[0], 'longitude': SANAA[1] + 0.001, 'is_available': True})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(db.session.get(FieldTeamMember, 1).current_request_id)
+        self.assertEqual(self.assign('FIELD-4-1', location=location)[1]['assignment']['team_member_id'], 1)
+
+        # إكمال طلب أو إلغاؤه يحرر العضو المعين له فقط
+        self.assertEqual(self.update_status('FIELD-4-1', 'cancelled', 2), 409)
+        self.assertFalse(db.session.get(FieldTeamMember, 2).is_available)
+        self.assertEqual(self.update_status('FIELD-2-1', 'cancelled', 2), 200)
+        member = db.session.get(FieldTeamMember, 2)
+        self.assertEqual((member.is_available, member.current_request_id), (True, None))
+        self.assertEqual(self.update_status('FIELD-2-1', 'completed', 2), 409)
+        self.assertEqual(self.update_status('FIELD-2-1', 'completed', 55), 404)
+        self.assertEqual(self.assign('FIELD-5-1', location=location)[1]['assignment']['team_member_id'], 2)
+
+        # التعيين اليدوي يحجز العضو المحدد بنفس الشرط
+        status, body = self.assign('FIELD-6-1', team_member_id=2, estimated_arrival='1 hour')
+        self.assertEqual(status, 409)
+        self.assertEqual(self.update_status('FIELD-5-1', 'completed', 2), 200)
+        status, body = self.assign('FIELD-6-1', team_member_id=2, estimated_arrival='1 hour')
+        self.assertEqual((status, body['assignment']['team_member_id']), (200, 2))
+        self.assertEqual(db.session.get(FieldTeamMember, 2).current_request_id, 'FIELD-6-1')
+        self.assertEqual(self.assign(team_member_id=55)[0], 404)
+        self.assertEqual(self.assign()[0], 400)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
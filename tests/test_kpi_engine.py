@@ -0,0 +1,109 @@
+import unittest
+import sys
+import os
+from datetime import datetime, timedelta
+
+# إضافة جذر المشروع إلى sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from benchmarks.harness import create_app, seed_platform
+from perf_assertions import assert_max_queries
+from src.models.user import db, User, Consultation, Payment, DoctorReview
+from src.routes.kpi_engine import KPIEngine, KPISource, SumMetric, RatioMetric, kpi_engine
+
+def reference_values(now, period_days, periods):
+    """المؤشرات الافتراضية لكل فترة باستعلامات منفصلة ساذجة"""
+    values = {name: [] for name in (
+        'consultations', 'revenue', 'new_users', 'customer_satisfaction', 'retention_rate'
+    )}
+    for k in range(periods):
+        start = now - timedelta(days=period_days * (k + 1))
+        end = None if k == 0 else now - timedelta(days=period_days * k)
+
+        def in_period(column):
+            return [column >= start] + ([column < end] if end is not None else [])
+
+        values['consultations'].append(Consultation.query.filter(*in_period(Consultation.request_date)).count())
+        values['revenue'].append(sum(
+            p.amount or 0 for p in Payment.query.filter(Payment.status == 'completed', *in_period(Payment.completed_at))
+        ))
+        values['new_users'].append(User.query.filter(*in_period(User.created_at)).count())
+
+        ratings = [r.rating for r in DoctorReview.query.filter(
+            DoctorReview.is_approved == True, *in_period(DoctorReview.created_at)
+        )]
+        values['customer_satisfaction'].append(sum(ratings) / len(ratings) if ratings else 0)
+
+        counts = {}
+        for consultation in Consultation.query.filter(*in_period(Consultation.request_date)):
+            counts[consultation.user_id] = counts.get(consultation.user_id, 0) + 1
+        repeat = sum(1 for count in counts.values() if count > 1)
+        values['retention_rate'].append(repeat / len(counts) * 100 if counts else 0)
+    return values
+
+class KPIEngineTestCase(unittest.TestCase):
+    """محرك المؤشرات: تطابق النتائج مع الاستعلامات المنفصلة في استعلام واحد"""
+
+    def setUp(self):
+        self.app = create_app()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        self.fixture = seed_platform(doctors=8, patients=40, reviews_per_doctor=6,
+                                     consultations_per_doctor=15, appointments_per_doctor=1)
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def test_matches_reference_for_n_periods(self):
+        names = ['consultations', 'revenue', 'new_users', 'customer_satisfaction', 'retention_rate']
+        for now, period_days, periods in [
+            (datetime.now(), 30, 2),
+            (self.fixture['now'].replace(hour=0, minute=0), 7, 6),
+            (datetime.now(), 90, 4)
+        ]:
+            with self.subTest(period_days=period_days, periods=periods):
+                with assert_max_queries(1):
+                    values = kpi_engine.compute(names, period_days=period_days, periods=periods,
+                                                now=now, use_cache=False)
+                expected = reference_values(now, period_days, periods)
+                for name in names:
+                    for actual, reference in zip(values[name], expected[name]):
+                        self.assertAlmostEqual(actual, reference, places=6, msg=name)
+
+    def test_results_cached_per_metric_set_and_bucket(self):
+        now = datetime.now()
+        first = kpi_engine.compute(['consultations', 'revenue'], now=now)
+        with assert_max_queries(0):
+            self.assertEqual(kpi_engine.compute(['revenue', 'consultations'], now=now), first)
+        with assert_max_queries(1):
+            kpi_engine.compute(['consultations'], now=now)
+
+    def test_custom_metrics(self):
+        engine = KPIEngine()
+        engine.register_source(KPISource.from_rollup('consultation'))
+        engine.register(SumMetric('fees', 'consultation', Consultation.consultation_fee, rollup_column='revenue'))
+        engine.register(SumMetric('raw_count', 'consultation'))
+        engine.register(RatioMetric('avg_fee', 'fees', 'raw_count'))
+        with self.assertRaises(ValueError):
+            engine.register(RatioMetric('broken', 'fees', 'missing'))
+
+        now = datetime.now()
+        values = engine.compute(['avg_fee'], period_days=60, periods=1, now=now, use_cache=False)
+        consultations = Consultation.query.filter(Consultation.request_date >= now - timedelta(days=60)).all()
+        expected = sum(c.consultation_fee or 0 for c in consultations) / len(consultations)
+        self.assertAlmostEqual(values['avg_fee'][0], expected)
+
+    def test_kpi_endpoint_history(self):
+        response = self.app.test_client().get('/api/analytics/kpi?current_period=15&periods=4')
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual(len(body['consultations']['history']), 4)
+        self.assertEqual(body['consultations']['current'], body['consultations']['history'][0])
+
+        response = self.app.test_client().get('/api/analytics/kpi/metrics?names=consultations,unknown')
+        self.assertEqual(response.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
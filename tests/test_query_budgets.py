@@ -0,0 +1,114 @@
+import unittest
+import sys
+import os
+
+# إضافة جذر المشروع إلى sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from benchmarks.harness import create_app, seed_platform
+from perf_assertions import assert_max_queries, assert_peak_memory
+
+# حجمان للبيانات: عدد الاستعلامات يجب أن يبقى ثابتاً بينهما
+DATASETS = {
+    'small': {
+        'doctors': 8,
+        'patients': 40,
+        'reviews_per_doctor': 3,
+        'consultations_per_doctor': 3,
+        'appointments_per_doctor': 3
+    },
+    'large': {
+        'doctors': 40,
+        'patients': 200,
+        'reviews_per_doctor': 15,
+        'consultations_per_doctor': 12,
+        'appointments_per_doctor': 6
+    }
+}
+
+class QueryBudgetTestCase(unittest.TestCase):
+    """اختبارات ثبات عدد الاستعلامات (منع N+1) عند تضاعف حجم البيانات"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.datasets = []
+        for name, size in DATASETS.items():
+            app = create_app()
+            with app.app_context():
+                fixture = seed_platform(**size)
+            cls.datasets.append((name, app, fixture))
+
+    def check_budget(self, max_queries, call, max_kb=None):
+        """تنفيذ الطلب على الحجمين والتحقق من الحد الأعلى وثبات عدد الاستعلامات"""
+        counts = {}
+        responses = {}
+        for name, app, fixture in self.datasets:
+            client = app.test_client()
+            with assert_max_queries(max_queries) as counter:
+                response = call(client, fixture)
+            self.assertLess(response.status_code, 400, response.get_data(as_text=True))
+            counts[name] = counter.count
+            responses[name] = response.get_json()
+
+            if max_kb is not None:
+                with assert_peak_memory(max_kb):
+                    call(client, fixture)
+
+        self.assertEqual(counts['small'], counts['large'],
+                         f'عدد الاستعلامات يعتمد على حجم البيانات: {counts}')
+        return responses
+
+    def test_doctor_list(self):
+        """قائمة الأطباء: عدد ثابت من الاستعلامات لكل صفحة"""
+        responses = self.check_budget(
+            4, lambda client, fixture: client.get('/api/doctors/search?per_page=8'), max_kb=250
+        )
+        self.assertEqual(len(responses['large']['doctors']), 8)
+
+    def test_review_list(self):
+        """قائمة مراجعات الطبيب مع الإحصائيات"""
+        responses = self.check_budget(
+            4,
+            lambda client, fixture: client.get(
+                f"/api/reviews/doctor/{fixture['doctor_ids'][0]}/reviews?approved_only=false&per_page=3"
+            ),
+            max_kb=150
+        )
+        self.assertEqual(len(responses['large']['reviews']), 3)
+
+    def test_search_all_sections(self):
+        """البحث المتقدم في جميع الأقسام"""
+        responses = self.check_budget(
+            11,
+            lambda client, fixture: client.post('/api/search/search', json={
+                'query': 'ا', 'type': 'all', 'per_page': 5
+            })
+        )
+        data = responses['large']['data']
+        self.assertEqual(len(data['doctors']['items']), 5)
+        self.assertEqual(len(data['consultations']['items']), 5)
+        self.assertEqual(len(data['reviews']['items']), 5)
+
+    def test_reminder_sending(self):
+        """إرسال التذكيرات: لا استعلام لكل موعد"""
+        responses = self.check_budget(
+            5, lambda client, fixture: client.post('/api/advanced_appointments/reminders/send')
+        )
+        self.assertGreater(responses['large']['reminders_24h'], responses['small']['reminders_24h'])
+
+    def test_analytics_endpoints(self):
+        """نقاط التحليلات"""
+        for path, max_queries in [
+            ('/api/analytics/consultations', 1),
+            ('/api/analytics/users', 2),
+            ('/api/analytics/kpi', 1),
+            ('/api/analytics/trends', 1),
+            ('/api/analytics/doctors/performance', 3),
+            ('/api/analytics/financial', 4)
+        ]:
+            with self.subTest(path=path):
+                self.check_budget(max_queries, lambda client, fixture: client.get(path))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,170 @@
+import unittest
+import sys
+import os
+from datetime import datetime, timedelta
+from unittest import mock
+
+# إضافة جذر المشروع إلى sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from benchmarks.harness import create_app, seed_platform
+from perf_assertions import assert_max_queries
+from src.models.user import db, Consultation
+from src.routes.analytics_rollups import rollup_manager
+from src.routes.analytics_reports import analytics_engine
+from src.routes.range_cache import SegmentStore, range_cache, split_segments
+
+def keys(segments):
+    return [segment.key for segment in segments]
+
+class SplitSegmentsTestCase(unittest.TestCase):
+    """تقسيم الفترات إلى أيام وأشهر مغلقة وجزء مفتوح"""
+
+    now = datetime(2024, 3, 10, 15, 30)
+
+    def test_months_and_days(self):
+        segments = split_segments(datetime(2024, 1, 30), self.now, self.now)
+        self.assertEqual(keys(segments), ['d2024-01-30', 'd2024-01-31', 'm2024-02'] +
+                         [f'd2024-03-0{d}' for d in range(1, 10)] + [None])
+        self.assertEqual(segments[-1].start, datetime(2024, 3, 10))
+        self.assertTrue(segments[-1].inclusive_end)
+
+    def test_partial_edges(self):
+        segments = split_segments(datetime(2024, 2, 27, 8), datetime(2024, 3, 1, 12), self.now)
+        self.assertEqual(keys(segments), [None, 'd2024-02-28', 'd2024-02-29', None])
+        self.assertEqual((segments[0].start, segments[0].end), (datetime(2024, 2, 27, 8), datetime(2024, 2, 28)))
+        self.assertEqual(keys(split_segments(datetime(2024, 3, 1, 8), datetime(2024, 3, 1, 9), self.now)), [None])
+        # النهاية عند آخر لحظة من اليوم تجعله يوماً كاملاً مغلقاً
+        self.assertEqual(keys(split_segments(datetime(2024, 2, 28), datetime(2024, 2, 29, 23, 59, 59, 999999), self.now)),
+                         ['d2024-02-28', 'd2024-02-29'])
+        self.assertEqual(split_segments(self.now, self.now - timedelta(days=1), self.now), [])
+
+    def test_open_start(self):
+        segments = split_segments(None, None, self.now)
+        self.assertEqual(segments[0].key, 'u2024-03')
+        self.assertIsNone(segments[0].start)
+        self.assertEqual(segments[0].end, datetime(2024, 3, 1))
+        self.assertEqual(len(segments), 11)
+
+class SegmentStoreTestCase(unittest.TestCase):
+    """الأجزاء في الذاكرة المحلية تنتهي صلاحيتها لأن الإبطال لا يصل إلى العمليات الأخرى"""
+
+    def test_local_segments_expire(self):
+        store = SegmentStore(max_local=2, local_ttl=60)
+        with mock.patch('src.routes.range_cache.performance_cache.REDIS_AVAILABLE', False), \
+                mock.patch('src.routes.range_cache.time.time', return_value=1000):
+            store.set_many({'a': {'count': 1}, 'b': {'count': 2}})
+            self.assertEqual(store.get_many(['a', 'b']), {'a': {'count': 1}, 'b': {'count': 2}})
+            store.set_many({'c': {'count': 3}})
+            self.assertEqual(store.get_many(['a', 'b', 'c']), {'b': {'count': 2}, 'c': {'count': 3}})
+        with mock.patch('src.routes.range_cache.performance_cache.REDIS_AVAILABLE', False), \
+                mock.patch('src.routes.range_cache.time.time', return_value=1060):
+            self.assertEqual(store.get_many(['b', 'c']), {})
+            self.assertEqual(len(store._local), 0)
+
+class RangeCacheTestCase(unittest.TestCase):
+    """النتائج المدمجة من الأجزاء تطابق الحساب المباشر، واليوم الحالي وحده يعاد حسابه"""
+
+    def setUp(self):
+        self.app = create_app()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        self.fixture = seed_platform(doctors=8, patients=60, reviews_per_doctor=1,
+                                     consultations_per_doctor=30, appointments_per_doctor=1)
+        self.now = datetime.now()
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def direct_total(self, start, end):
+        query = Consultation.query.filter(Consultation.request_date.isnot(None))
+        if start is not None:
+            query = query.filter(Consultation.request_date >= start)
+        return query.filter(Consultation.request_date <= (end or self.now)).count()
+
+    def test_merged_totals_match_direct_queries(self):
+        for start, end in [
+            (None, None),
+            (self.now - timedelta(days=75, hours=5), None),
+            (self.now - timedelta(days=140), self.now - timedelta(days=12, hours=3)),
+            (self.now - timedelta(days=3, hours=2), self.now - timedelta(days=3, hours=1))
+        ]:
+            with self.subTest(start=start, end=end):
+                for _ in range(2):
+                    totals = range_cache.get('consultation_analytics', start, end, now=self.now)
+                    self.assertEqual(totals.get('total', 0), self.direct_total(start, end))
+                    self.assertEqual(sum(totals.get('daily', {}).values()), totals.get('total', 0))
+
+    def test_only_open_segment_recomputed(self):
+        start = self.now - timedelta(days=90)
+        with assert_max_queries(1):
+            first = analytics_engine.get_consultation_analytics(start)
+        with assert_max_queries(1):
+            second = analytics_engine.get_consultation_analytics(start)
+        self.assertEqual(second, first)
+
+        # فترة من أيام كاملة منتهية في الماضي لا تحتاج قاعدة البيانات بعد حساب أيامها مرة
+        day_start = datetime.combine(start.date() + timedelta(days=1), datetime.min.time())
+        day_end = datetime.combine(self.now.date() - timedelta(days=10), datetime.max.time())
+        with assert_max_queries(0):
+            totals = range_cache.get('consultation_analytics', day_start + timedelta(days=5), day_end, now=self.now)
+        self.assertEqual(totals['total'], self.direct_total(day_start + timedelta(days=5), day_end))
+
+    def test_invalidated_when_past_day_changes(self):
+        start = self.now - timedelta(days=60)
+        before = range_cache.get('consultation_analytics', start, now=self.now)['total']
+        past = self.now - timedelta(days=20)
+
+        # عبر ORM: تعاد حساب اليوم في التجميع ويبطل جزؤه وجزء شهره
+        db.session.add(Consultation(user_id=self.fixture['patient_ids'][0], status='completed', request_date=past))
+        db.session.commit()
+        self.assertEqual(range_cache.get('consultation_analytics', start, now=self.now)['total'], before + 1)
+
+        # إدخال مجمع يلتقط عبر catch_up
+        db.session.bulk_insert_mappings(Consultation, [
+            {'user_id': self.fixture['patient_ids'][1], 'status': 'pending', 'request_date': past - timedelta(days=1)}
+        ])
+        db.session.commit()
+        rollup_manager.catch_up()
+        self.assertEqual(range_cache.get('consultation_analytics', start, now=self.now)['total'], before + 2)
+
+        # تغيير تاريخ استشارة يبطل اليوم القديم والجديد
+        consultation = Consultation.query.filter(Consultation.request_date < start).first()
+        consultation.request_date = past
+        db.session.commit()
+        self.assertEqual(range_cache.get('consultation_analytics', start, now=self.now)['total'], before + 3)
+        self.assertEqual(range_cache.get('consultation_analytics', None, now=self.now)['total'],
+                         self.direct_total(None, None))
+
+    def test_catch_up_invalidates_after_its_commit(self):
+        start = self.now - timedelta(days=60)
+        before = range_cache.get('consultation_analytics', start, now=self.now)['total']
+        past = self.now - timedelta(days=20)
+        db.session.bulk_insert_mappings(Consultation, [
+            {'user_id': self.fixture['patient_ids'][1], 'status': 'pending', 'request_date': past}
+        ])
+        db.session.commit()
+
+        # قارئ متزامن يخزن جزء اليوم القديم بعد الإبطال الأول وقبل تثبيت معاملة catch_up
+        prefix = range_cache._prefix('consultation_analytics')
+        stale_reader = lambda source_name, days, committed=False: committed or range_cache.store.set_many(
+            {f'{prefix}d{past.date().isoformat()}': {'total': 0}, f'{prefix}m{past.date().isoformat()[:7]}': {'total': 0}}
+        )
+        rollup_manager.listeners.append(stale_reader)
+        try:
+            rollup_manager.catch_up()
+        finally:
+            rollup_manager.listeners.remove(stale_reader)
+        self.assertEqual(range_cache.get('consultation_analytics', start, now=self.now)['total'], before + 1)
+
+    def test_user_analytics_and_rebuild(self):
+        expected = analytics_engine.get_user_analytics(exact=True)
+        self.assertEqual(analytics_engine.get_user_analytics(exact=True), expected)
+        rollup_manager.rebuild()
+        with assert_max_queries(2):
+            self.assertEqual(analytics_engine.get_user_analytics(exact=True), expected)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,143 @@
+import unittest
+import sys
+import os
+import time
+import shutil
+import tempfile
+
+# إضافة جذر المشروع إلى sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.harness import create_app, seed_platform
+from src.routes.report_jobs import JobStore, ReportJobManager
+
+class RecordingExecutor:
+    """منفذ لا يشغل المهام فوراً لإبقائها في حالة الانتظار"""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, func, *args):
+        self.submitted.append((func, args))
+
+class ReportJobManagerTestCase(unittest.TestCase):
+    """إدارة مهام التقارير: الدمج وانتهاء الصلاحية"""
+
+    def setUp(self):
+        self.app = create_app()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        seed_platform(doctors=3, patients=10, reviews_per_doctor=1,
+                      consultations_per_doctor=2, appointments_per_doctor=1)
+        self.executor = RecordingExecutor()
+        self.results_dir = tempfile.mkdtemp()
+        self.manager = ReportJobManager(store=JobStore(use_redis=False), executor=self.executor,
+                                        results_dir=self.results_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.results_dir, ignore_errors=True)
+        self.ctx.pop()
+
+    def test_identical_active_requests_are_deduplicated(self):
+        params = {'report_type': 'comprehensive', 'format_type': 'json', 'start_date': None, 'end_date': None}
+        first, first_dup = self.manager.submit(params)
+        second, second_dup = self.manager.submit(dict(params))
+        other, _ = self.manager.submit({**params, 'format_type': 'pdf'})
+        self.assertFalse(first_dup)
+        self.assertTrue(second_dup)
+        self.assertEqual(first['id'], second['id'])
+        self.assertNotEqual(first['id'], other['id'])
+        self.assertEqual(len(self.executor.submitted), 2)
+
+    def test_finished_job_releases_fingerprint(self):
+        params = {'report_type': 'comprehensive', 'format_type': 'json', 'start_date': None, 'end_date': None}
+        first, _ = self.manager.submit(params)
+        self.manager.run(first['id'])
+        job = self.manager.get(first['id'])
+        self.assertEqual(job['status'], 'completed')
+        self.assertEqual(job['progress'], 100)
+        path = self.manager.get_result(first['id'])
+        self.assertEqual(os.path.dirname(path), self.results_dir)
+        with open(path, 'rb') as f:
+            self.assertIn(b'consultation_analytics', f.read())
+
+        second, deduplicated = self.manager.submit(params)
+        self.assertFalse(deduplicated)
+        self.assertNotEqual(first['id'], second['id'])
+
+    def test_failed_job_records_error(self):
+        job, _ = self.manager.submit({'format_type': 'json', 'start_date': 'ليس تاريخاً'})
+        self.manager.run(job['id'])
+        job = self.manager.get(job['id'])
+        self.assertEqual(job['status'], 'failed')
+        self.assertTrue(job['error'])
+        self.assertIsNone(self.manager.get_result(job['id']))
+        self.assertEqual(os.listdir(self.results_dir), [])
+
+    def test_expired_result_files_are_removed(self):
+        params = {'report_type': 'comprehensive', 'format_type': 'json', 'start_date': None, 'end_date': None}
+        first, _ = self.manager.submit(params)
+        self.manager.run(first['id'])
+        path = self.manager.get_result(first['id'])
+        os.utime(path, (time.time() - self.manager.result_ttl - 1,) * 2)
+        second, _ = self.manager.submit({**params, 'format_type': 'excel'})
+        self.manager.run(second['id'])
+        self.assertFalse(os.path.exists(path))
+        self.assertIsNone(self.manager.get_result(first['id']))
+        self.assertIsNotNone(self.manager.get_result(second['id']))
+
+    def test_results_expire(self):
+        store = JobStore(use_redis=False)
+        store.set('key', 'value', 0)
+        self.assertIsNone(store.get('key'))
+        self.assertTrue(store.add('key', 'value', 60))
+        self.assertFalse(store.add('key', 'other', 60))
+
+    def test_expired_entries_are_swept_on_write(self):
+        store = JobStore(use_redis=False, sweep_interval=0)
+        store.set('job', 'status', 0)
+        store.set('result', 'x' * 1024, 0)
+        store.add('live', 'value', 60)
+        self.assertEqual(list(store._items), ['live'])
+
+class ReportJobEndpointTestCase(unittest.TestCase):
+    """إرسال التقرير ومتابعة حالته وتنزيله عبر نقاط النهاية"""
+
+    def setUp(self):
+        self.app = create_app()
+        with self.app.app_context():
+            seed_platform(doctors=3, patients=10, reviews_per_doctor=1,
+                          consultations_per_doctor=2, appointments_per_doctor=1)
+        self.client = self.app.test_client()
+
+    def wait_for(self, status_url, timeout=30):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = self.client.get(status_url).get_json()
+            if job['status'] not in ('queued', 'running'):
+                return job
+            time.sleep(0.05)
+        self.fail('لم تكتمل المهمة في الوقت المحدد')
+
+    def test_generate_and_download(self):
+        for report_format, signature in [('pdf', b'%PDF'), ('excel', b'PK')]:
+            with self.subTest(format=report_format):
+                response = self.client.post('/api/analytics/reports/generate', json={'format': report_format})
+                self.assertEqual(response.status_code, 202)
+                body = response.get_json()
+
+                job = self.wait_for(body['status_url'])
+                self.assertEqual(job['status'], 'completed', job.get('error'))
+                download = self.client.get(job['download_url'])
+                self.assertEqual(download.status_code, 200)
+                self.assertTrue(download.data.startswith(signature))
+
+    def test_invalid_requests(self):
+        response = self.client.post('/api/analytics/reports/generate', json={'format': 'docx'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/analytics/reports/generate', json={'start_date': 'أمس'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/api/analytics/reports/jobs/missing').status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,77 @@
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+
+# إضافة جذر المشروع إلى sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import func, inspect
+from benchmarks.harness import create_app, seed_platform
+from src.models.user import db, DoctorProfile, DoctorReview
+from src.models.schema_upgrade import upgrade_database
+
+# ما أضيف بعد المخطط الأساسي إلى جداول موجودة
+NEW_INDEXES = {
+    'doctor_profile': ['ix_doctor_profile_rating', 'ix_doctor_profile_reviews',
+                       'ix_doctor_profile_fee', 'ix_doctor_profile_experience'],
+    'doctor_review': ['ix_doctor_review_doctor_approved_rating'],
+    'payment': ['ix_payment_status_completed_at', 'ix_payment_consultation_id'],
+}
+NEW_COLUMNS = {'doctor_profile': ['average_rating', 'total_reviews']}
+
+class SchemaUpgradeTestCase(unittest.TestCase):
+    """ترقية قاعدة بيانات منشأة بالمخطط الأساسي (create_all لا يعدل الجداول الموجودة)"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.app = create_app(f"sqlite:///{os.path.join(self.directory, 'app.db')}")
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        seed_platform(doctors=6, patients=20, reviews_per_doctor=4, consultations_per_doctor=3,
+                      appointments_per_doctor=2)
+        # الرجوع إلى المخطط الأساسي: حذف الفهارس ثم الأعمدة الجديدة
+        with db.engine.begin() as connection:
+            for indexes in NEW_INDEXES.values():
+                for name in indexes:
+                    connection.exec_driver_sql(f'DROP INDEX {name}')
+            for table, columns in NEW_COLUMNS.items():
+                for column in columns:
+                    connection.exec_driver_sql(f'ALTER TABLE {table} DROP COLUMN {column}')
+
+    def tearDown(self):
+        db.session.remove()
+        db.engine.dispose()
+        self.ctx.pop()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_upgrade_adds_columns_indexes_and_rebuilds_aggregates(self):
+        added = upgrade_database()
+        self.assertEqual(sorted(added['columns']),
+                         sorted(f'{t}.{c}' for t, columns in NEW_COLUMNS.items() for c in columns))
+        self.assertEqual(sorted(added['indexes']), sorted(n for names in NEW_INDEXES.values() for n in names))
+
+        inspector = inspect(db.engine)
+        columns = {column['name'] for column in inspector.get_columns('doctor_profile')}
+        self.assertTrue({'average_rating', 'total_reviews'} <= columns)
+        for table, names in NEW_INDEXES.items():
+            existing = {index['name'] for index in inspector.get_indexes(table)}
+            self.assertTrue(set(names) <= existing, table)
+
+        # التجميعات أعيد حسابها من المراجعات وليست القيمة الافتراضية
+        expected = dict(
+            db.session.query(DoctorReview.doctor_id, func.count(DoctorReview.id))
+            .group_by(DoctorReview.doctor_id).all()
+        )
+        profiles = DoctorProfile.query.order_by(DoctorProfile.average_rating.desc()).all()
+        self.assertEqual(len(profiles), 6)
+        for profile in profiles:
+            self.assertEqual(profile.total_reviews, expected.get(profile.id, 0))
+        self.assertGreater(sum(profile.average_rating for profile in profiles), 0)
+
+        # الترقية الثانية لا تضيف شيئاً
+        self.assertEqual(upgrade_database(), {'columns': [], 'indexes': []})
+
+if __name__ == '__main__':
+    unittest.main()
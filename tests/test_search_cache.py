@@ -0,0 +1,148 @@
+import unittest
+import sys
+import os
+
+# إضافة جذر المشروع إلى sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from benchmarks.harness import create_app, seed_platform
+from perf_assertions import assert_max_queries
+from src.models.user import db, DoctorProfile, DoctorReview
+from src.routes.search_cache import SearchResultCache, canonical_query
+
+class SearchResultCacheTestCase(unittest.TestCase):
+    """الصفحات بأي حجم من نوافذ الترتيب المخزنة، والعدد من نفس استعلام المعرفات"""
+
+    def setUp(self):
+        self.app = create_app()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        self.cache = SearchResultCache(window_size=4)
+        self.ranking = list(range(100, 111))
+        self.fetches = []
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def fetch_ids(self, offset, limit, with_total):
+        self.fetches.append((offset, limit, with_total))
+        return self.ranking[offset:offset + limit], (len(self.ranking) if with_total else None)
+
+    def page(self, page, per_page, count=True, key=None):
+        return self.cache.page('doctors', key or {'query': 'قلب'}, ['doctors'], page, per_page, self.fetch_ids,
+                               (lambda: self.fail('COUNT غير متوقع')) if count else None)
+
+    def test_pages_of_any_size_share_windows(self):
+        ids, pagination = self.page(1, 3)
+        self.assertEqual(ids, [100, 101, 102])
+        self.assertEqual(pagination, {'total': 11, 'pages': 4, 'current_page': 1, 'has_next': True})
+        self.assertEqual(self.fetches, [(0, 5, True)])
+
+        # نفس النافذة لحجم صفحة آخر، ثم صفحة تمتد على نافذتين تجلب الناقصة فقط
+        self.assertEqual(self.page(2, 2)[0], [102, 103])
+        ids, pagination = self.page(2, 5)
+        self.assertEqual(ids, [105, 106, 107, 108, 109])
+        self.assertTrue(pagination['has_next'])
+        self.assertEqual(self.fetches, [(0, 5, True), (4, 9, False)])
+
+        ids, pagination = self.page(3, 5)
+        self.assertEqual(ids, [110])
+        self.assertEqual(pagination, {'total': 11, 'pages': 3, 'current_page': 3, 'has_next': False})
+        self.assertEqual(len(self.fetches), 2)
+        self.assertEqual(self.cache.hits, 2)
+
+        self.assertEqual(self.page(9, 5), ([], {'total': 11, 'pages': 3, 'current_page': 9, 'has_next': False}))
+
+    def test_lazy_totals_and_invalidation(self):
+        ids, pagination = self.page(1, 4, count=False)
+        self.assertEqual(pagination['total'], None)
+        self.assertTrue(pagination['has_next'])
+        self.assertEqual(self.fetches, [(0, 5, False)])
+
+        # العدد يحسب مرة عند أول طلب غير مؤجل ثم يخزن
+        counts = []
+        self.cache.page('doctors', {'query': 'قلب'}, ['doctors'], 1, 4, self.fetch_ids,
+                        lambda: counts.append(1) or len(self.ranking))
+        self.page(1, 4)
+        self.assertEqual(counts, [1])
+
+        fetched = len(self.fetches)
+        self.cache.invalidate(['users'])
+        self.page(1, 4)
+        self.assertEqual(len(self.fetches), fetched)
+        self.cache.invalidate(['doctors'])
+        self.page(1, 4)
+        self.assertEqual(len(self.fetches), fetched + 1)
+
+    def test_canonical_query(self):
+        self.assertEqual(canonical_query('أطباء  القلب'), canonical_query('قلب اطباء'))
+        self.assertEqual(canonical_query('الاستشاري'), canonical_query('إستشاري'))
+        self.assertNotEqual(canonical_query('الاستشاري', stemming=False), canonical_query('استشاري', stemming=False))
+
+class SearchCacheEndpointTestCase(unittest.TestCase):
+    """البحث المتقدم من ذاكرة النتائج: مفاتيح موحدة وإبطال حسب نوع الكيان بعد commit"""
+
+    def setUp(self):
+        self.app = create_app()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        seed_platform(doctors=30, patients=40, reviews_per_doctor=2,
+                      consultations_per_doctor=2, appointments_per_doctor=1)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def search(self, **payload):
+        response = self.client.post('/api/search/search', json=payload)
+        self.assertEqual(response.status_code, 200, response.get_data(as_text=True))
+        return response.get_json()['data']
+
+    def test_cached_ranking_serves_pages_and_equivalent_queries(self):
+        first = self.search(query='الاستشاري', type='doctors', per_page=10)['doctors']
+        self.assertEqual(first['total'], 30)
+
+        # التحميل بالمعرفات وإحصاءات التراخيص فقط: لا ترتيب ولا عد
+        with assert_max_queries(2):
+            equivalent = self.search(query='إستشاري', type='doctors', per_page=10,
+                                     filters={'min_rating': 0})['doctors']
+        self.assertEqual(equivalent['items'], first['items'])
+
+        with assert_max_queries(2):
+            second = self.search(query='استشاري', type='doctors', per_page=5, page=2)['doctors']
+        self.assertEqual(second['items'], first['items'][5:10])
+        self.assertEqual((second['total'], second['pages']), (30, 6))
+
+        # فلتر مختلف بحث مختلف
+        verified = self.search(query='استشاري', type='doctors', per_page=30, filters={'verified_only': True})
+        self.assertEqual(verified['doctors']['total'], 15)
+
+    def test_invalidation_by_entity_type(self):
+        payload = {'query': 'ا', 'type': 'all', 'per_page': 5}
+        self.search(**payload)
+        consultations = self.search(query='ا', type='consultations', per_page=5)['consultations']
+        self.assertEqual(self.search(query='ممتاز', type='reviews')['reviews']['total'], 0)
+
+        doctor = db.session.get(DoctorProfile, 1)
+        db.session.add(DoctorReview(doctor_id=doctor.id, patient_id=1, rating=5,
+                                    review_text='استشاري ممتاز', is_approved=True))
+        db.session.commit()
+
+        # الاستشارات لم تتغير فتبقى من الذاكرة، والمراجعات والأطباء تعاد
+        with assert_max_queries(2):
+            self.assertEqual(self.search(query='ا', type='consultations', per_page=5)['consultations'],
+                             consultations)
+        reviews = self.search(query='ممتاز', type='reviews', per_page=5)['reviews']
+        self.assertEqual([item['comment'] for item in reviews['items']], ['استشاري ممتاز'])
+
+        # التغيير غير المثبت يتجاوز الذاكرة ولا يخزن فيها
+        doctor.full_name = 'د. زمرد المؤقت'
+        db.session.flush()
+        self.assertEqual(self.search(query='زمرد', type='doctors')['doctors']['total'], 1)
+        db.session.rollback()
+        self.assertEqual(self.search(query='زمرد', type='doctors')['doctors']['total'], 0)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,95 @@
+import unittest
+import sys
+import os
+import json
+from collections import Counter
+
+# إضافة جذر المشروع إلى sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from benchmarks.harness import create_app, seed_platform
+from perf_assertions import assert_max_queries
+from src.models.user import db, DoctorProfile
+from src.routes.search_facets import doctor_facets, FEE_BUCKETS, RATING_BUCKETS, UNRATED
+
+def reference_facets(doctors, statistics):
+    """الأعداد المتوقعة بحلقات على الأطباء"""
+    counts = {name: Counter() for name in ('specialization', 'fee', 'rating', 'language', 'availability')}
+    for doctor in doctors:
+        counts['specialization'][doctor.specialization] += 1
+        counts['fee'][next(label for low, high, label in FEE_BUCKETS
+                            if high is None or doctor.consultation_fee < high)] += 1
+        stats = statistics[doctor.id]
+        rating = stats['average_rating'] if stats['total_reviews'] and stats['average_rating'] else None
+        counts['rating'][UNRATED if rating is None else next(
+            label for low, label in RATING_BUCKETS if rating >= low)] += 1
+        for language in json.loads(doctor.languages or '[]'):
+            counts['language'][language] += 1
+        counts['availability']['available' if doctor.available_for_consultation else 'unavailable'] += 1
+    return {name: dict(values) for name, values in counts.items()}
+
+def as_dict(facets):
+    return {name: {item['value']: item['count'] for item in items} for name, items in facets.items()}
+
+class SearchFacetsTestCase(unittest.TestCase):
+    """أعداد الواجهات تطابق الحساب المرجعي وتحترم البحث والفلاتر"""
+
+    def setUp(self):
+        self.app = create_app()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        seed_platform(doctors=40, patients=60, reviews_per_doctor=3,
+                      consultations_per_doctor=1, appointments_per_doctor=1)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def expected(self, doctors):
+        statistics = DoctorProfile.get_statistics_for(d.id for d in doctors)
+        return reference_facets(doctors, statistics)
+
+    def test_counts_match_reference(self):
+        with assert_max_queries(1):
+            facets = doctor_facets()
+        self.assertEqual(as_dict(facets), self.expected(DoctorProfile.query.all()))
+        self.assertEqual([item['value'] for item in facets['fee']],
+                         [label for _, _, label in FEE_BUCKETS if label in as_dict(facets)['fee']])
+
+        criteria = [DoctorProfile.consultation_fee <= 100, DoctorProfile.available_for_consultation == True]
+        self.assertEqual(as_dict(doctor_facets(criteria)),
+                         self.expected(DoctorProfile.query.filter(*criteria).all()))
+        self.assertEqual(list(doctor_facets(facets=('language',))), ['language'])
+        with self.assertRaises(ValueError):
+            doctor_facets(facets=('gender',))
+
+    def test_search_endpoints(self):
+        specialization = 'طب الأطفال'
+        with assert_max_queries(5):
+            response = self.client.post('/api/search/search', json={
+                'query': 'استشاري', 'type': 'doctors', 'facets': True,
+                'filters': {'specialization': specialization}
+            })
+        body = response.get_json()['data']['doctors']
+        facets = as_dict(body['facets'])
+        self.assertEqual(facets['specialization'], {specialization: body['total']})
+        self.assertEqual(sum(facets['availability'].values()), body['total'])
+        self.assertNotIn('facets', self.client.post('/api/search/search', json={
+            'query': 'استشاري', 'type': 'doctors'
+        }).get_json()['data']['doctors'])
+
+        response = self.client.get('/api/doctors/search?max_fee=100&facets=fee,rating&min_rating=3')
+        body = response.get_json()
+        self.assertEqual(set(body['facets']), {'fee', 'rating'})
+        self.assertNotIn('200+', as_dict(body['facets'])['fee'])
+        self.assertEqual(set(as_dict(body['facets'])['rating']) - {'4-5', '3-4'}, set())
+        self.assertEqual(self.client.get('/api/doctors/search?facets=gender').status_code, 400)
+
+        response = self.client.get('/api/search/filters')
+        data = response.get_json()['data']
+        self.assertEqual(sorted(data['specializations']), sorted(as_dict(data['facets'])['specialization']))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,108 @@
+import unittest
+import sys
+import os
+import time
+import shutil
+import tempfile
+from unittest import mock
+
+# إضافة جذر المشروع إلى sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from benchmarks.harness import create_app, seed_platform
+from src.models.user import db
+from src.routes import advanced_search
+from src.routes.search_fanout import search_fanout, SearchFanout
+
+def sleeping_section(seconds, result=None):
+    def section(params):
+        time.sleep(seconds)
+        return result or {'items': [], 'total': 0}
+    return section
+
+def failing_section(params):
+    raise RuntimeError('تعذر الاتصال')
+
+class SearchFanoutTestCase(unittest.TestCase):
+    """أقسام البحث المتقدم بالتوازي مع المهل والنتائج الجزئية والأعداد المؤجلة"""
+
+    def setUp(self):
+        # قاعدة في ملف: قاعدة الذاكرة تشترك في اتصال واحد فتنفذ أقسامها بالتتابع
+        self.directory = tempfile.mkdtemp()
+        self.app = create_app(f"sqlite:///{os.path.join(self.directory, 'search.db')}")
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        seed_platform(doctors=20, patients=40, reviews_per_doctor=2,
+                      consultations_per_doctor=2, appointments_per_doctor=1)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.engine.dispose()
+        self.ctx.pop()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def search(self, path='/api/search/search', **payload):
+        response = self.client.post(path, json={'query': 'ا', **payload})
+        return response.status_code, response.get_json()
+
+    def test_parallel_matches_single_sections(self):
+        self.assertTrue(search_fanout.parallel())
+        status, body = self.search(type='all', per_page=5)
+        self.assertEqual(status, 200)
+        self.assertNotIn('partial', body)
+        self.assertEqual(set(body['data']), {'doctors', 'patients', 'consultations', 'reviews'})
+        for name, section in body['data'].items():
+            self.assertEqual(self.search(type=name, per_page=5)[1]['data'][name], section)
+        self.assertEqual(body['total_results'], sum(section['total'] for section in body['data'].values()))
+
+        # قاعدة الذاكرة تنفذ بالتتابع
+        memory_app = create_app()
+        with memory_app.app_context():
+            self.assertFalse(SearchFanout().parallel())
+
+    def test_latency_is_max_of_sections(self):
+        sections = {name: sleeping_section(0.3) for name in advanced_search.SEARCH_SECTIONS}
+        with mock.patch.dict(advanced_search.SEARCH_SECTIONS, sections):
+            started = time.perf_counter()
+            status, body = self.search(type='all')
+            elapsed = time.perf_counter() - started
+        self.assertEqual(status, 200)
+        self.assertEqual(len(body['data']), 4)
+        self.assertLess(elapsed, 0.9)
+
+    def test_timeouts_and_failures_return_partial_results(self):
+        with mock.patch.dict(advanced_search.SEARCH_SECTIONS,
+                             {'patients': sleeping_section(1.5), 'reviews': failing_section}):
+            started = time.perf_counter()
+            status, body = self.search(type='all', timeout={'patients': 0.2})
+            elapsed = time.perf_counter() - started
+        self.assertEqual(status, 200)
+        self.assertTrue(body['partial'])
+        self.assertEqual(body['timed_out'], ['patients'])
+        self.assertIn('reviews', body['failed'])
+        self.assertEqual(set(body['data']), {'doctors', 'consultations'})
+        self.assertLess(elapsed, 1.2)
+
+        # أخطاء التحقق داخل الأقسام تبقى 400
+        self.assertEqual(self.search(type='all', boosts={'popularity': 1})[0], 400)
+        self.assertEqual(self.search(type='all', timeout={'pharmacies': 1})[0], 400)
+        self.assertEqual(self.search(type='all', timeout=0)[0], 400)
+
+    def test_lazy_totals(self):
+        _, eager = self.search(type='all', per_page=3, page=2)
+        _, lazy = self.search(type='all', per_page=3, page=2, totals='lazy')
+        self.assertIsNone(lazy['total_results'])
+        for name, section in lazy['data'].items():
+            self.assertIsNone(section['total'])
+            self.assertEqual(section['items'], eager['data'][name]['items'])
+            self.assertEqual(section['has_next'], eager['data'][name]['has_next'])
+
+        status, body = self.search('/api/search/search/totals', type='all', per_page=3, page=2)
+        self.assertEqual(status, 200)
+        self.assertEqual(body['data']['totals'], {name: section['total'] for name, section in eager['data'].items()})
+        self.assertEqual(body['data']['total_results'], eager['total_results'])
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
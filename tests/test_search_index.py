@@ -0,0 +1,144 @@
+import unittest
+import sys
+import os
+import sqlite3
+
+# إضافة جذر المشروع إلى sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from benchmarks.harness import create_app, seed_platform
+from perf_assertions import assert_max_queries
+from src.models.user import db, User, DoctorProfile, Consultation, DoctorReview
+from src.routes.search_index import search_index, build_match
+
+class BuildMatchTestCase(unittest.TestCase):
+    """تحويل نص المستخدم إلى تعبير MATCH"""
+
+    def test_tokens_quoted_with_prefix(self):
+        self.assertEqual(build_match('أمراض القل'), '"امراض"* "القل"*')
+        self.assertEqual(build_match('أمراض القل', stemming=True), '"امراض"* "قل"*')
+        self.assertEqual(build_match('a"b OR c', prefix=False), '"a" "b" "or" "c"')
+        self.assertEqual(build_match('قلب', ['full_name', 'bio']), '{full_name bio} : ("قلب"*)')
+        self.assertIsNone(build_match(' - "" '))
+
+class SearchIndexTestCase(unittest.TestCase):
+    """الفهارس متزامنة بالمشغلات ونتائج MATCH تطابق البحث بالكلمات"""
+
+    def setUp(self):
+        self.app = create_app()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        self.fixture = seed_platform(doctors=20, patients=40, reviews_per_doctor=2,
+                                     consultations_per_doctor=3, appointments_per_doctor=1)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def matching(self, name, query, columns=None):
+        model = search_index.tables[name].model
+        return {row.id for row in model.query.filter(search_index.condition(name, query, columns))}
+
+    def test_bulk_inserted_rows_indexed(self):
+        self.assertTrue(all(search_index.status().values()))
+        cardiology = {d.id for d in DoctorProfile.query.filter(DoctorProfile.specialization == 'أمراض القلب')}
+        self.assertEqual(self.matching('doctors', 'أمراض القل'), cardiology)
+        self.assertEqual(self.matching('doctors', 'القلب', ['specialization']), cardiology)
+        self.assertEqual(len(self.matching('consultations', 'متابع')), self.fixture['counts']['consultations'])
+        self.assertEqual(len(self.matching('reviews', 'تجربة جيد')), self.fixture['counts']['reviews'])
+        self.assertEqual(self.matching('doctors', 'غير-موجود'), set())
+
+    def test_triggers_follow_orm_changes(self):
+        doctor = db.session.get(DoctorProfile, 1)
+        doctor.bio = 'متخصص في زراعة القوقعة'
+        db.session.commit()
+        self.assertEqual(self.matching('doctors', 'زراع'), {1})
+        # صفوف ORM تفهرس بالنص الموحد بعد flush: بلا "ال" والهمزة والتاء المربوطة
+        doctor.bio = 'طبيب الأسنانِ والجراحة'
+        db.session.commit()
+        self.assertEqual(self.matching('doctors', 'اسنان جراحه'), {1})
+
+        consultation = db.session.get(Consultation, 1)
+        db.session.delete(consultation)
+        db.session.commit()
+        self.assertNotIn(1, self.matching('consultations', 'متابعة'))
+
+        db.session.add(DoctorReview(doctor_id=2, patient_id=1, rating=5, review_text='طبيب ممتاز متعاون'))
+        db.session.commit()
+        self.assertEqual(len(self.matching('reviews', 'متعاون')), 1)
+
+    def test_triggers_work_for_plain_sqlite_writers(self):
+        # اتصال sqlite3 عادي بلا دوال التطبيق: المشغلات تفهرس النص الخام ولا تفشل
+        fts_table = search_index.tables['reviews']
+        connection = sqlite3.connect(':memory:')
+        connection.execute('CREATE TABLE doctor_review (id INTEGER PRIMARY KEY, review_text TEXT)')
+        for statement in fts_table.ddl():
+            connection.execute(statement)
+        connection.execute("INSERT INTO doctor_review (id, review_text) VALUES (1, 'طبيبٌ متعاون')")
+        connection.execute("INSERT INTO doctor_review (id, review_text) VALUES (2, 'انتظار طويل')")
+        connection.execute("UPDATE doctor_review SET review_text = 'انتظار قصير' WHERE id = 2")
+        connection.execute('DELETE FROM doctor_review WHERE id = 1')
+        match = 'SELECT rowid FROM doctor_review_fts WHERE doctor_review_fts MATCH ?'
+        self.assertEqual(connection.execute(match, ('"قصير"',)).fetchall(), [(2,)])
+        self.assertEqual(connection.execute(match, ('"طويل" OR "متعاون"',)).fetchall(), [])
+        connection.close()
+
+        # الكتابة خارج ORM تفهرس خاماً، وإعادة البناء توحدها
+        db.session.execute(DoctorReview.__table__.insert(), [
+            {'id': 1000, 'doctor_id': 2, 'patient_id': 1, 'rating': 4, 'review_text': 'علاج الأسنانِ مدهش'}
+        ])
+        db.session.commit()
+        self.assertEqual(self.matching('reviews', 'مدهش'), {1000})
+        self.assertEqual(self.matching('reviews', 'اسنان'), set())
+        search_index.rebuild(['reviews'])
+        self.assertEqual(self.matching('reviews', 'اسنان'), {1000})
+
+    def test_patient_and_reviewer_names_normalized(self):
+        patient = User(username='أسامة_اليمني', email='osama@example.com', password_hash='x', user_type='patient')
+        db.session.add(patient)
+        db.session.flush()
+        db.session.add(DoctorReview(doctor_id=2, patient_id=patient.id, rating=4, review_text='جيد'))
+        db.session.commit()
+
+        for query in ('اسامه', 'أسامة', 'osama'):
+            response = self.client.post('/api/search/search', json={'query': query, 'type': 'patients'})
+            self.assertEqual([item['id'] for item in response.get_json()['data']['patients']['items']],
+                             [patient.id], query)
+        review = DoctorReview.query.filter_by(patient_id=patient.id).one()
+        response = self.client.post('/api/search/search', json={'query': 'اسامه', 'type': 'reviews'})
+        self.assertEqual([item['id'] for item in response.get_json()['data']['reviews']['items']], [review.id])
+
+    def test_rebuild_command_and_endpoint(self):
+        # تعديل مباشر مع تعطيل المشغلات ثم إعادة البناء
+        db.session.execute(db.text('DROP TRIGGER doctor_profile_fts_au'))
+        db.session.execute(db.text("UPDATE doctor_profile SET bio = 'جراحة المناظير' WHERE id = 3"))
+        db.session.commit()
+        self.assertEqual(self.matching('doctors', 'المناظير'), set())
+
+        response = self.client.post('/api/search/index/rebuild', json={'indexes': ['doctors']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['data'], {'doctors': self.fixture['counts']['doctors']})
+        self.assertEqual(self.matching('doctors', 'المناظير'), {3})
+        self.assertEqual(self.client.post('/api/search/index/rebuild', json={'indexes': ['x']}).status_code, 400)
+
+        result = self.app.test_cli_runner().invoke(args=['advanced_search', 'rebuild-index', 'reviews'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn(f"reviews: {self.fixture['counts']['reviews']}", result.output)
+
+    def test_search_endpoints_use_match(self):
+        response = self.client.post('/api/search/search', json={'query': 'القلب', 'type': 'doctors'})
+        self.assertEqual(response.status_code, 200)
+        names = {d['id'] for d in response.get_json()['data']['doctors']['items']}
+        self.assertEqual(names, self.matching('doctors', 'القلب'))
+
+        response = self.client.get('/api/doctors/search?search_term=استشاري&per_page=50')
+        self.assertEqual(response.get_json()['pagination']['total'], self.fixture['counts']['doctors'])
+
+        with assert_max_queries(2) as counter:
+            self.client.post('/api/search/search', json={'query': 'جيدة', 'type': 'reviews'})
+        self.assertTrue(any('doctor_review_fts MATCH' in statement for statement in counter.statements))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,83 @@
+import unittest
+import sys
+import os
+
+# إضافة جذر المشروع إلى sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from benchmarks.harness import create_app, seed_platform
+from perf_assertions import assert_max_queries
+from src.models.user import db, DoctorProfile, DoctorReview
+from src.routes.search_ranking import doctor_ranker
+
+class DoctorRankingTestCase(unittest.TestCase):
+    """ترتيب الأطباء حسب الصلة مع أوزان الحقول والتعزيزات"""
+
+    def setUp(self):
+        self.app = create_app()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        seed_platform(doctors=30, patients=40, reviews_per_doctor=0,
+                      consultations_per_doctor=1, appointments_per_doctor=1)
+        self.client = self.app.test_client()
+        # نفس الكلمة في الاسم والتخصص والنبذة لثلاثة أطباء متاحين بلا مراجعات
+        for doctor_id, field in ((5, 'bio'), (9, 'full_name'), (14, 'specialization')):
+            doctor = db.session.get(DoctorProfile, doctor_id)
+            setattr(doctor, field, f'{getattr(doctor, field)} زمرد')
+            doctor.available_for_consultation = True
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def search(self, **payload):
+        response = self.client.post('/api/search/search', json={'type': 'doctors', **payload})
+        return response.status_code, response.get_json()
+
+    def ids(self, **payload):
+        return [item['id'] for item in self.search(**payload)[1]['data']['doctors']['items']]
+
+    def test_field_weights(self):
+        self.assertEqual(self.ids(query='زمرد'), [9, 14, 5])
+        self.assertEqual(self.ids(query='زمرد', sort='id'), [5, 9, 14])
+
+    def test_boosts(self):
+        db.session.get(DoctorProfile, 9).available_for_consultation = False
+        for rating in (5, 5, 5):
+            db.session.add(DoctorReview(doctor_id=14, patient_id=1, rating=rating, is_approved=True))
+        db.session.commit()
+        page = doctor_ranker.rank('زمرد', boosts={'rating': 0, 'availability': 1})
+        self.assertEqual(page.ids, [9, 14, 5])
+        page = doctor_ranker.rank('زمرد', boosts={'rating': 1, 'availability': 1.5})
+        self.assertEqual(page.ids, [14, 9, 5])
+        self.assertEqual(doctor_ranker.rank('زمرد', boosts=False).ids, [9, 14, 5])
+
+        status, body = self.search(query='زمرد', boosts={'popularity': 2})
+        self.assertEqual(status, 400)
+        self.assertEqual(self.search(query='زمرد', sort='random')[0], 400)
+
+    def test_pages_follow_ranking(self):
+        full = self.ids(query='استشاري', per_page=50)
+        self.assertEqual(len(full), 30)
+        pages = []
+        for page in range(1, 5):
+            with assert_max_queries(4):
+                status, body = self.search(query='استشاري', page=page, per_page=8)
+            pages.extend(item['id'] for item in body['data']['doctors']['items'])
+            self.assertEqual(body['data']['doctors']['total'], 30)
+            self.assertEqual(body['data']['doctors']['pages'], 4)
+        self.assertEqual(pages, full)
+
+        # الصفحات تطابق الفرز الكامل للدرجات
+        ranked = doctor_ranker.rank('استشاري', per_page=30)
+        self.assertEqual(ranked.ids, full)
+        self.assertEqual(ranked.scores, sorted(ranked.scores, reverse=True))
+
+        # الفلاتر تطبق داخل استعلام الترتيب
+        ids = self.ids(query='زمرد', filters={'min_experience': 200})
+        self.assertEqual(ids, [])
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
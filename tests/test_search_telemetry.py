@@ -0,0 +1,310 @@
+import unittest
+import sys
+import os
+import time
+import random
+from collections import Counter
+from unittest import mock
+
+# إضافة جذر المشروع إلى sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from benchmarks.harness import create_app, seed_platform
+from perf_assertions import assert_max_queries
+from src.models.user import db
+from src.routes import performance_cache
+from src.routes.suggestion_index import suggestion_index
+from src.routes.search_telemetry import (
+    SpaceSaving, CountMinSketch, SearchTelemetry, search_telemetry, RECENT_PER_USER
+)
+
+def zipf_stream(events=50000, distinct=5000, seed=5):
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, distinct + 1)]
+    return rng.choices([f'q{rank}' for rank in range(distinct)], weights, k=events)
+
+class SketchTestCase(unittest.TestCase):
+    """حدود الخطأ في Space-Saving و Count-Min على توزيع زيف"""
+
+    def test_space_saving_keeps_heavy_hitters(self):
+        stream = zipf_stream()
+        exact = Counter(stream)
+        first, second = SpaceSaving(200), SpaceSaving(200)
+        for index, item in enumerate(stream):
+            (first if index % 2 else second).add(item)
+        summary = first.copy().merge(second)
+        top = sorted(summary.counts, key=summary.counts.get, reverse=True)[:10]
+        self.assertEqual(top, [item for item, _ in exact.most_common(10)])
+        for item, count in summary.counts.items():
+            self.assertGreaterEqual(count, exact[item])
+            self.assertLessEqual(count - summary.errors[item], exact[item])
+
+    def test_count_min_overestimates_within_bound(self):
+        stream = zipf_stream()
+        exact = Counter(stream)
+        sketch = CountMinSketch(width=1024, depth=4)
+        half = len(stream) // 2
+        sketch.add_many(Counter(stream[:half]))
+        sketch.merge(CountMinSketch(1024, 4).add_many(Counter(stream[half:])))
+        errors = [sketch.estimate(item) - count for item, count in exact.items()]
+        self.assertGreaterEqual(min(errors), 0)
+        # e/width من المجموع حد لخطأ كل عنصر باحتمال كبير
+        self.assertLess(max(errors), 2.72 / 1024 * len(stream) * 2)
+
+class SearchTelemetryTestCase(unittest.TestCase):
+    """النوافذ المنزلقة وحلقات آخر البحث والدفع المجمع"""
+
+    def setUp(self):
+        self.telemetry = SearchTelemetry()
+
+    def tearDown(self):
+        suggestion_index.set_search_counts({})
+
+    def test_popular_over_sliding_windows(self):
+        now = time.time()
+        self.telemetry.record('اطباء  القلب', timestamp=now - 60)
+        for _ in range(5):
+            self.telemetry.record('أطباء القلب', timestamp=now)
+        for _ in range(3):
+            self.telemetry.record('صداع', timestamp=now - 60)
+        for _ in range(10):
+            self.telemetry.record('أرق', timestamp=now - 3 * 3600)
+        self.telemetry.record('؟!', timestamp=now)
+
+        self.assertEqual(self.telemetry.status()['buffered'], 19)
+        self.assertEqual(self.telemetry.flush(), 19)
+        hour = self.telemetry.popular('hour', now=now)
+        self.assertEqual([(item['key'], item['count']) for item in hour], [('اطباء القلب', 6), ('صداع', 3)])
+        self.assertEqual(hour[0]['query'], 'أطباء القلب')
+        self.assertEqual([item['count'] for item in self.telemetry.popular('day', 2, now=now)], [10, 6])
+        self.assertEqual(self.telemetry.popular('hour', now=now + 2 * 3600), [])
+        with self.assertRaises(ValueError):
+            self.telemetry.popular('year')
+
+    def test_recent_ring_per_user(self):
+        now = time.time()
+        for index, query in enumerate(['صداع', 'حمى', 'سعال', 'صداع']):
+            self.telemetry.record(query, user_id=1, timestamp=now + index)
+        self.telemetry.record('أرق', user_id=2, timestamp=now)
+        self.telemetry.record('دوخة', timestamp=now)
+        # القراءة لا تدفع المخزن: لا شيء قبل الدفع
+        self.assertEqual(self.telemetry.recent_for(1), [])
+        self.telemetry.flush()
+        self.assertEqual([item['query'] for item in self.telemetry.recent_for(1)], ['صداع', 'سعال', 'حمى'])
+        self.assertEqual([item['query'] for item in self.telemetry.recent_for(1, 2)], ['صداع', 'سعال'])
+        self.assertEqual([item['query'] for item in self.telemetry.recent_for(2)], ['أرق'])
+
+        for index in range(RECENT_PER_USER + 5):
+            self.telemetry.record(f'بحث {index}', user_id=3, timestamp=now + index)
+        self.telemetry.flush()
+        recent = self.telemetry.recent_for(3)
+        self.assertEqual(len(recent), RECENT_PER_USER)
+        self.assertEqual(recent[0]['query'], f'بحث {RECENT_PER_USER + 4}')
+
+    def test_buffer_is_bounded(self):
+        telemetry = SearchTelemetry(max_buffer=10)
+        telemetry._ensure_flusher = lambda: None
+        accepted = sum(telemetry.record(f'بحث {index}') for index in range(30))
+        self.assertEqual(accepted, 20)
+        self.assertEqual(telemetry.status()['dropped'], 10)
+        self.assertEqual(telemetry.flush(), 20)
+
+class FakeRedis:
+    """أوامر Redis التي يستخدمها القياس المشترك فقط (مجموعات مرتبة ونصوص مع صلاحية مهملة)"""
+
+    def __init__(self):
+        self.sorted_sets = {}
+        self.strings = {}
+        self.failing = False
+        self.commands = []
+
+    def __getattribute__(self, name):
+        if not name.startswith('_') and name not in ('sorted_sets', 'strings', 'failing', 'commands'):
+            if self.failing:
+                raise ConnectionError('Redis غير متاح')
+            self.commands.append(name)
+        return object.__getattribute__(self, name)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def zincrby(self, name, amount, member):
+        members = self.sorted_sets.setdefault(name, {})
+        members[member] = members.get(member, 0) + amount
+
+    def zadd(self, name, mapping):
+        self.sorted_sets.setdefault(name, {}).update(mapping)
+
+    def _ordered(self, name):
+        return sorted(self.sorted_sets.get(name, {}).items(), key=lambda item: (item[1], item[0]))
+
+    def zremrangebyrank(self, name, start, end):
+        ordered = self._ordered(name)
+        end = len(ordered) + end if end < 0 else end
+        for member, _ in ordered[start:end + 1]:
+            del self.sorted_sets[name][member]
+
+    def zrange(self, name, start, end, withscores=False):
+        ordered = self._ordered(name)
+        return ordered[start:None if end == -1 else end + 1]
+
+    def zrevrange(self, name, start, end, withscores=False):
+        ordered = self._ordered(name)[::-1]
+        return ordered[start:None if end == -1 else end + 1]
+
+    def expire(self, name, ttl):
+        pass
+
+    def exists(self, name):
+        return int(name in self.sorted_sets or name in self.strings)
+
+    def zunionstore(self, dest, keys):
+        union = {}
+        for key in keys:
+            for member, score in self.sorted_sets.get(key, {}).items():
+                union[member] = union.get(member, 0) + score
+        self.sorted_sets.pop(dest, None)
+        if union:
+            self.sorted_sets[dest] = union
+        return len(union)
+
+    def setex(self, name, ttl, value):
+        self.strings[name] = value
+
+    def mget(self, names):
+        return [self.strings.get(name) for name in names]
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+    def execute(self):
+        client = self.client
+        if client.failing:
+            raise ConnectionError('Redis غير متاح')
+        return [object.__getattribute__(client, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+class SharedSearchTelemetryTestCase(unittest.TestCase):
+    """مع Redis تكتب كل دفعة إلى Redis فيرى كل عامل شائع الآخرين وآخر بحثهم"""
+
+    def setUp(self):
+        self.redis = FakeRedis()
+        patcher = mock.patch.object(performance_cache, 'redis_client', self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.workers = [SearchTelemetry(use_redis=True) for _ in range(2)]
+        for worker in self.workers:
+            worker._ensure_flusher = lambda: None
+
+    def tearDown(self):
+        suggestion_index.set_search_counts({})
+
+    def test_workers_share_popular_and_recent(self):
+        now = time.time()
+        first, second = self.workers
+        for _ in range(4):
+            first.record('أطباء القلب', user_id=1, timestamp=now - 60)
+        for _ in range(3):
+            second.record('اطباء  القلب', timestamp=now)
+            second.record('صداع', user_id=1, timestamp=now)
+        second.record('أرق', timestamp=now - 3 * 3600)
+        self.assertEqual(first.flush(), 4)
+        self.assertEqual(second.flush(), 7)
+        # الرسوم المحلية تبقى محدثة (احتياطاً عند فشل Redis)
+        self.assertEqual(first.status()['buckets'], 1)
+
+        for worker in self.workers:
+            hour = worker.popular('hour', now=now)
+            self.assertEqual([(item['key'], item['count']) for item in hour], [('اطباء القلب', 7), ('صداع', 3)])
+            self.assertEqual(hour[0]['query'], 'اطباء  القلب')
+            self.assertEqual([item['count'] for item in worker.popular('day', now=now)], [7, 3, 1])
+            self.assertEqual([item['query'] for item in worker.recent_for(1)], ['صداع', 'اطباء  القلب'])
+
+        # النافذة تقرأ من اتحاد محسوب في Redis وليس بجلب كل الشرائح
+        self.redis.commands.clear()
+        second.popular('hour', 1, now=now)
+        self.assertNotIn('zrange', self.redis.commands)
+        self.assertEqual(len(second.popular('hour', 1, now=now)), 1)
+
+        for index in range(RECENT_PER_USER + 5):
+            first.record(f'بحث {index}', user_id=2, timestamp=now + index)
+        recent = second.recent_for(2)
+        self.assertEqual(recent, [])
+        first.flush()
+        recent = second.recent_for(2)
+        self.assertEqual(len(recent), RECENT_PER_USER)
+        self.assertEqual(recent[0]['query'], f'بحث {RECENT_PER_USER + 4}')
+
+    def test_redis_failure_falls_back_to_local_sketches(self):
+        now = time.time()
+        worker = self.workers[0]
+        for _ in range(3):
+            worker.record('صداع', user_id=1, timestamp=now)
+        self.redis.failing = True
+        self.assertEqual(worker.flush(), 3)
+        self.assertEqual(worker.status()['unpersisted'], 3)
+        self.assertEqual([(item['key'], item['count']) for item in worker.popular('hour', now=now)], [('صداع', 3)])
+        self.assertEqual([item['query'] for item in worker.recent_for(1)], ['صداع'])
+
+        # الدفعة المحتفظ بها تكتب مع الدفع التالي دون احتسابها محلياً مرتين
+        self.redis.failing = False
+        worker.record('صداع', timestamp=now)
+        self.assertEqual(worker.flush(), 1)
+        self.assertEqual(worker.status()['unpersisted'], 0)
+        self.assertEqual(self.workers[1].popular('hour', now=now)[0]['count'], 4)
+        self.assertEqual(worker.popular('hour', now=now, shared=False)[0]['count'], 4)
+
+class SearchTelemetryEndpointsTestCase(unittest.TestCase):
+    """/recent و /popular من القياس الفعلي، والبحث الأكثر يرفع ترتيب الاقتراح"""
+
+    def setUp(self):
+        self.app = create_app()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        seed_platform(doctors=10, patients=20, reviews_per_doctor=1,
+                      consultations_per_doctor=1, appointments_per_doctor=1)
+        self.client = self.app.test_client()
+        search_telemetry.clear()
+
+    def tearDown(self):
+        search_telemetry.clear()
+        suggestion_index.set_search_counts({})
+        db.session.remove()
+        self.ctx.pop()
+
+    def test_endpoints_use_recorded_searches(self):
+        with self.client.session_transaction() as session:
+            session['user_id'] = 7
+        for query in ['ألم في الظهر'] * 5 + ['استشاري', 'ألم في الظهر']:
+            self.client.post('/api/search/search', json={'query': query, 'type': 'doctors'})
+        # الخيط الخلفي يدفع كل FLUSH_INTERVAL ثانية؛ الدفع هنا صريح
+        search_telemetry.flush()
+
+        with assert_max_queries(0):
+            response = self.client.get('/api/search/recent')
+        self.assertEqual([item['query'] for item in response.get_json()['data']], ['ألم في الظهر', 'استشاري'])
+        response = self.client.get('/api/search/popular?window=hour')
+        self.assertEqual(response.get_json()['data'], [
+            {'query': 'ألم في الظهر', 'count': 6}, {'query': 'استشاري', 'count': 1}
+        ])
+        self.assertEqual(self.client.get('/api/search/popular?window=year').status_code, 400)
+
+        # المستخدم المجهول لا حلقة له
+        self.assertEqual(self.app.test_client().get('/api/search/recent').get_json()['data'], [])
+
+        # "ألم في الظهر" (وزن 2) تتقدم على "ألم في الصدر" (وزن 7) بعد ست عمليات بحث
+        response = self.client.get('/api/search/suggestions?q=ألم')
+        symptoms = [item['text'] for item in response.get_json()['data'] if item['type'] == 'symptom']
+        self.assertEqual(symptoms[0], 'ألم في الظهر')
+        suggestion_index.set_search_counts({})
+        response = self.client.get('/api/search/suggestions?q=ألم')
+        symptoms = [item['text'] for item in response.get_json()['data'] if item['type'] == 'symptom']
+        self.assertEqual(symptoms[0], 'ألم في الصدر')
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
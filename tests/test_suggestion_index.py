@@ -0,0 +1,122 @@
+import unittest
+import sys
+import os
+import time
+
+# إضافة جذر المشروع إلى sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from benchmarks.harness import create_app, seed_platform, FIRST_NAMES, LAST_NAMES
+from perf_assertions import assert_max_queries
+from src.models.user import db, DoctorProfile
+from src.routes.suggestion_index import suggestion_index, PrefixIndex, SuggestionEntry
+
+class PrefixIndexTestCase(unittest.TestCase):
+    """البحث بالبادئات في المصفوفة المرتبة وترتيب الشعبية"""
+
+    def setUp(self):
+        self.index = PrefixIndex()
+        self.index.load([
+            SuggestionEntry(1, 'د. أحمد العمري', popularity=3),
+            SuggestionEntry(2, 'د. أحمد الشمري', popularity=7),
+            SuggestionEntry(3, 'د. عمر الحسني', popularity=5),
+        ])
+
+    def keys(self, query, limit=10):
+        return [entry.key for entry in self.index.search(query, limit)]
+
+    def test_prefix_and_popularity(self):
+        self.assertEqual(self.keys('احمد'), [2, 1])
+        self.assertEqual(self.keys('أحم', limit=1), [2])
+        self.assertEqual(self.keys('عمر'), [3, 1])  # "عمر" و"العمري" بعد حذف "ال"
+        self.assertEqual(self.keys('أحمد عمر'), [1])
+        self.assertEqual(self.keys('زيد'), [])
+
+    def test_incremental_updates_refresh_cached_prefixes(self):
+        self.assertEqual(self.keys('اح'), [2, 1])
+        self.index.bump(1, 10)
+        self.assertEqual(self.keys('اح'), [1, 2])
+        self.index.add(SuggestionEntry(1, 'د. خالد العمري', popularity=13))
+        self.assertEqual(self.keys('اح'), [2])
+        self.index.remove(2)
+        self.assertEqual(self.keys('اح'), [])
+        self.assertEqual(len(self.index.keys), sum(len(e.tokens) for e in self.index.entries.values()))
+
+    def test_lookup_speed(self):
+        index = PrefixIndex()
+        index.load(SuggestionEntry(i, f'د. {FIRST_NAMES[i % 10]} {LAST_NAMES[i % 8]}{i}', popularity=i % 97)
+                   for i in range(50000))
+        queries = ['اح', 'احمد', 'محمد الع', 'ليلي الشمري12', 'نور']
+        for query in queries:
+            index.search(query, 5)
+        started = time.perf_counter()
+        for _ in range(100):
+            for query in queries[:2]:
+                index.search(query, 5)
+        self.assertLess((time.perf_counter() - started) / 200, 0.001)
+
+class SuggestionIndexTestCase(unittest.TestCase):
+    """الاقتراحات تخدم من الذاكرة وتحدث بعد تعديل ملفات الأطباء"""
+
+    def setUp(self):
+        self.app = create_app()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        seed_platform(doctors=20, patients=40, reviews_per_doctor=3,
+                      consultations_per_doctor=1, appointments_per_doctor=1)
+        self.client = self.app.test_client()
+        suggestion_index.warm()
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def suggest(self, query):
+        with assert_max_queries(0):
+            response = self.client.get(f'/api/search/suggestions?q={query}')
+        self.assertEqual(response.status_code, 200)
+        return response.get_json()['data']
+
+    def test_endpoint_without_queries(self):
+        data = self.suggest('طب')
+        self.assertLessEqual(len(data), 10)
+        specializations = [s['text'] for s in data if s['type'] == 'specialization']
+        self.assertIn('طب الأطفال', specializations)
+        self.assertEqual([s['text'] for s in self.suggest('ألم') if s['type'] == 'symptom'],
+                         ['ألم في الصدر', 'ألم في البطن', 'ألم في الظهر'])
+
+        doctors = [s for s in self.suggest('د') if s['type'] == 'doctor']
+        self.assertEqual(doctors, [])  # حرف واحد لا يقترح
+        doctors = [s for s in self.suggest('العمري') if s['type'] == 'doctor']
+        expected = DoctorProfile.query.filter(DoctorProfile.full_name.contains('العمري')).count()
+        self.assertEqual(len(doctors), min(expected, 5))
+
+    def test_follows_doctor_changes(self):
+        db.session.add(DoctorProfile(user_id=1, full_name='د. زينب الفارسي', specialization='طب الأسنان',
+                                     consultation_fee=100))
+        db.session.commit()
+        doctor = [s for s in self.suggest('زينب') if s['type'] == 'doctor']
+        self.assertEqual([s['subtitle'] for s in doctor], ['طب الأسنان'])
+        self.assertIn('طب الأسنان', [s['text'] for s in self.suggest('اسنان')])
+
+        profile = db.session.get(DoctorProfile, doctor[0]['id'])
+        profile.full_name = 'د. زينب القرشي'
+        profile.specialization = 'طب العيون'
+        db.session.commit()
+        self.assertEqual([s['text'] for s in self.suggest('زينب') if s['type'] == 'doctor'], ['د. زينب القرشي'])
+        self.assertEqual(self.suggest('اسنان'), [])
+
+        db.session.delete(profile)
+        db.session.commit()
+        self.assertEqual(self.suggest('زينب'), [])
+
+        # التعديلات الملغاة لا تصل إلى الفهرس
+        profile = db.session.get(DoctorProfile, 1)
+        profile.full_name = 'د. اسم مؤقت'
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(self.suggest('مؤقت'), [])
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
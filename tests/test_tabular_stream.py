@@ -0,0 +1,92 @@
+import unittest
+import sys
+import os
+import csv
+import io
+from datetime import datetime
+
+# إضافة جذر المشروع إلى sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from openpyxl import load_workbook
+from benchmarks.harness import create_app
+from benchmarks.streaming_export import seed_users, USER_COLUMNS
+from perf_assertions import assert_peak_memory
+from src.models.user import User
+from src.routes.tabular_stream import iter_query_rows, iter_csv, iter_xlsx, split_dict_rows
+from src.routes.export_import import export_to_csv, export_to_excel
+
+HEADERS = [title for title, _ in USER_COLUMNS]
+
+class TabularStreamTestCase(unittest.TestCase):
+    """كتابة Excel و CSV على أجزاء من مؤشرات yield_per"""
+
+    def setUp(self):
+        self.app = create_app()
+        self.ctx = self.app.test_request_context()
+        self.ctx.push()
+
+    def tearDown(self):
+        self.ctx.pop()
+
+    def user_rows(self):
+        return iter_query_rows(User.query.order_by(User.id), USER_COLUMNS, batch_size=100)
+
+    def test_csv_round_trip(self):
+        seed_users(2500)
+        chunks = list(iter_csv(HEADERS, self.user_rows(), rows_per_chunk=1000))
+        self.assertEqual(len(chunks), 3)
+        self.assertTrue(chunks[0].startswith(b'\xef\xbb\xbf'))
+        self.assertFalse(any(chunk.startswith(b'\xef\xbb\xbf') for chunk in chunks[1:]))
+
+        rows = list(csv.reader(io.StringIO(b''.join(chunks).decode('utf-8-sig'))))
+        self.assertEqual(rows[0], HEADERS)
+        self.assertEqual(len(rows), 2501)
+        self.assertEqual(rows[-1][1], 'user_2499')
+
+    def test_xlsx_round_trip(self):
+        seed_users(300)
+        content = b''.join(iter_xlsx([
+            ('ملخص', ['المؤشر', 'القيمة'], [['المستخدمين', 300]]),
+            ('المستخدمين', HEADERS, self.user_rows())
+        ]))
+        workbook = load_workbook(io.BytesIO(content), read_only=True)
+        self.assertEqual(workbook.sheetnames, ['ملخص', 'المستخدمين'])
+        rows = list(workbook['المستخدمين'].values)
+        self.assertEqual(list(rows[0]), HEADERS)
+        self.assertEqual(len(rows), 301)
+        self.assertEqual(rows[1][1], 'user_0')
+
+    def test_memory_independent_of_row_count(self):
+        """ذروة الذاكرة للكتابة لا تنمو مع عدد الصفوف"""
+        seed_users(20000)
+        with assert_peak_memory(8 * 1024) as small:
+            for _ in iter_csv(HEADERS, iter_query_rows(User.query.filter(User.id <= 2000), USER_COLUMNS)):
+                pass
+        with assert_peak_memory(8 * 1024) as large:
+            for _ in iter_csv(HEADERS, iter_query_rows(User.query, USER_COLUMNS)):
+                pass
+        self.assertLess(large.peak_kb, small.peak_kb * 2 + 512)
+
+    def test_split_dict_rows(self):
+        headers, rows = split_dict_rows(iter([{'أ': 1, 'ب': 2}, {'أ': 3, 'ب': 4}]))
+        self.assertEqual(headers, ['أ', 'ب'])
+        self.assertEqual(list(rows), [[1, 2], [3, 4]])
+        headers, rows = split_dict_rows([])
+        self.assertEqual((headers, list(rows)), ([], []))
+
+    def test_export_helpers_stream(self):
+        records = ({'ID': i, 'التاريخ': datetime(2024, 1, 1).isoformat()} for i in range(10))
+        response = export_to_csv(records, 'المستخدمين')
+        self.assertTrue(response.is_streamed)
+        self.assertIn("filename*=UTF-8''", response.headers['Content-Disposition'])
+        self.assertEqual(response.get_data().decode('utf-8-sig').splitlines()[0], 'ID,التاريخ')
+
+        response = export_to_excel([{'ID': 1}], 'المستخدمين')
+        self.assertEqual(response.mimetype,
+                         'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        self.assertTrue(response.get_data().startswith(b'PK'))
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,149 @@
+import unittest
+import sys
+import os
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+# إضافة جذر المشروع إلى sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import numpy as np
+from benchmarks.harness import create_app, seed_platform
+from perf_assertions import assert_max_queries
+from src.models.user import db, Consultation, Payment
+from src.routes.timeseries import (
+    TimeSeries, TimeSeriesEngine, TimeSeriesMetric, timeseries_engine, bucket_grid, lttb_indices
+)
+
+def local_time(value, zone):
+    """التوقيت المخزن (UTC) بالتوقيت المحلي للمنطقة"""
+    return value.replace(tzinfo=timezone.utc).astimezone(zone).replace(tzinfo=None)
+
+def reference_counts(start, end, key, zone=None):
+    counts = {}
+    for consultation in Consultation.query.filter(Consultation.request_date.isnot(None)):
+        moment = local_time(consultation.request_date, zone) if zone else consultation.request_date
+        if start <= moment <= end:
+            counts[key(moment)] = counts.get(key(moment), 0) + 1
+    return counts
+
+class TimeSeriesTestCase(unittest.TestCase):
+    """السلاسل الزمنية: ملء الفترات الفارغة والدقة والمنطقة الزمنية وتقليل النقاط"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app()
+        with cls.app.app_context():
+            cls.fixture = seed_platform(doctors=10, patients=50, reviews_per_doctor=2,
+                                        consultations_per_doctor=20, appointments_per_doctor=1)
+
+    def setUp(self):
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        self.end = self.fixture['now']
+        self.start = self.end - timedelta(days=200)
+
+    def tearDown(self):
+        db.session.remove()
+        self.ctx.pop()
+
+    def nonzero(self, series):
+        return {label: value for label, value in series.to_dict().items() if value}
+
+    def test_zero_filled_grid(self):
+        series = TimeSeries.from_totals('x', {'2024-01-01': 2, '2024-01-04': 3}, 'day')
+        self.assertEqual(series.to_dict(), {'2024-01-01': 2, '2024-01-02': 0, '2024-01-03': 0, '2024-01-04': 3})
+        grid = bucket_grid(datetime(2024, 1, 3), datetime(2024, 1, 16), 'week')
+        # الأسبوع يبدأ يوم الاثنين
+        self.assertEqual(np.datetime_as_string(grid, unit='D').tolist(), ['2024-01-01', '2024-01-08', '2024-01-15'])
+        self.assertEqual(len(bucket_grid(datetime(2024, 1, 31), datetime(2024, 3, 1), 'month')), 3)
+
+    def test_granularities_match_reference(self):
+        keys = {
+            'day': lambda moment: moment.strftime('%Y-%m-%d'),
+            'week': lambda moment: (moment - timedelta(days=moment.weekday())).strftime('%Y-%m-%d'),
+            'month': lambda moment: moment.strftime('%Y-%m'),
+            'hour': lambda moment: moment.strftime('%Y-%m-%d %H:00')
+        }
+        for granularity, key in keys.items():
+            with self.subTest(granularity=granularity):
+                series = timeseries_engine.series('consultations', self.start, self.end, granularity)
+                self.assertEqual(self.nonzero(series), reference_counts(self.start, self.end, key))
+                labels = series.labels()
+                self.assertEqual(labels[0], key(self.start))
+                self.assertEqual(labels[-1], key(self.end))
+
+    def test_rollup_and_raw_paths_agree(self):
+        engine = TimeSeriesEngine()
+        engine.register(TimeSeriesMetric('raw', Consultation, Consultation.request_date))
+        engine.register(TimeSeriesMetric('raw_revenue', Payment, Payment.completed_at, Payment.amount,
+                                         filters=lambda: [Payment.status == 'completed']))
+        for granularity in ('day', 'week', 'month'):
+            with self.subTest(granularity=granularity):
+                rollup = timeseries_engine.series_many(['consultations', 'revenue'], self.start, self.end, granularity)
+                raw = engine.series_many(['raw', 'raw_revenue'], self.start, self.end, granularity)
+                self.assertEqual(rollup['consultations'].to_dict(), raw['raw'].to_dict())
+                np.testing.assert_allclose(rollup['revenue'].values, raw['raw_revenue'].values)
+
+    def test_single_query_for_several_metrics(self):
+        names = ['consultations', 'revenue', 'new_users']
+        timeseries_engine.series_many(names, self.start, self.end, 'month')
+        with assert_max_queries(1):
+            timeseries_engine.series_many(names, self.start, self.end, 'month')
+        with assert_max_queries(1):
+            timeseries_engine.series_many(names + ['appointments', 'reviews'], self.start, self.end, 'hour')
+
+    def test_timezones(self):
+        for name, granularity in [('Asia/Riyadh', 'day'), ('Europe/Berlin', 'day'), ('Europe/Berlin', 'hour')]:
+            with self.subTest(timezone=name, granularity=granularity):
+                zone = ZoneInfo(name)
+                end = local_time(self.end, zone)
+                start = end - timedelta(days=200 if granularity == 'day' else 10)
+                key = (lambda moment: moment.strftime('%Y-%m-%d')) if granularity == 'day' \
+                    else (lambda moment: moment.strftime('%Y-%m-%d %H:00'))
+                series = timeseries_engine.series('consultations', start, end, granularity, name)
+                self.assertEqual(self.nonzero(series), reference_counts(start, end, key, zone))
+
+    def test_downsample(self):
+        series = timeseries_engine.series('consultations', self.start, self.end, 'day')
+        summed = series.downsample(20, 'sum')
+        self.assertLessEqual(len(summed), 20)
+        self.assertEqual(summed.total, series.total)
+
+        shaped = series.downsample(20, 'lttb')
+        self.assertEqual(len(shaped), 20)
+        self.assertEqual(shaped.labels()[0], series.labels()[0])
+        self.assertEqual(shaped.labels()[-1], series.labels()[-1])
+        self.assertIs(series.downsample(len(series) + 1), series)
+
+        indices = lttb_indices(np.arange(10.0), np.array([0, 0, 9, 0, 0, 0, 0, 0, 0, 0.0]), 3)
+        self.assertEqual(indices.tolist(), [0, 2, 9])
+
+    def test_invalid_arguments(self):
+        for kwargs in ({'granularity': 'year'}, {'timezone': 'Mars/Olympus'}, {'start': self.end, 'end': self.start}):
+            with self.subTest(**{key: str(value) for key, value in kwargs.items()}):
+                with self.assertRaises(ValueError):
+                    timeseries_engine.series('consultations', **kwargs)
+        with self.assertRaises(ValueError):
+            timeseries_engine.series('unknown')
+
+    def test_endpoints(self):
+        client = self.app.test_client()
+        response = client.get('/api/analytics/timeseries?metrics=consultations,appointments'
+                              '&granularity=week&tz=Asia/Riyadh&max_points=10')
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()['series']
+        self.assertLessEqual(len(body['consultations']['values']), 10)
+        self.assertEqual(len(body['appointments']['labels']), len(body['appointments']['values']))
+
+        for query in ('metrics=unknown', 'granularity=year', 'tz=Nowhere/City', 'downsample=avg&max_points=3'):
+            with self.subTest(query=query):
+                self.assertEqual(client.get(f'/api/analytics/timeseries?{query}').status_code, 400)
+
+        trends = client.get('/api/analytics/trends?months_back=3&granularity=week').get_json()
+        self.assertEqual(trends['granularity'], 'week')
+        self.assertGreaterEqual(len(trends['consultation_trend']), 13)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)